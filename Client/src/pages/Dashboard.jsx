@@ -9,6 +9,7 @@ import 'react-toastify/dist/ReactToastify.css';
 import { contractABI, contractAddress } from "../contracts/PatientRegistryContract.js";
 import { ethers } from "ethers";
 import { fetchAndDecryptPatient } from "../utils/patients.js";
+import { streamEvents } from "../utils/eventStream.js";
 
 
 export default function Dashboard() {
@@ -17,6 +18,7 @@ export default function Dashboard() {
   const [showAddProviderProfile, setShowAddProviderProfile] = useState(false);
   const [ providers, setProviders ] = useState([])
   const [events, setEvents] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [providerProfile, setProviderProfile] = useState({});
 
   
@@ -79,41 +81,66 @@ async function getProviders() {
 
 }
 
-async function getEvents() {
-
-  if (auth.role === "admin" || auth.role === "provider") {
-
-    const response = await axios.get("http://localhost:8000/api/events/get_events/?related_wallet_address=" + `${auth.walletid}`,
-      {
-      headers: { Authorization: `Bearer ${auth.accessToken}` }
-    });
-    console.log("events", response.data);
-    return response;
-  }
-
-  if (auth.role === "patient") {
+// get_events returns one page, newest first; pass next_cursor back for older events
+async function getEvents(cursor) {
+  const filter = auth.role === "patient" ? "related_patient_wallet_address" : "related_wallet_address";
+  const params = { [filter]: auth.walletid };
+  if (cursor) params.cursor = cursor;
+  const response = await axios.get("http://localhost:8000/api/events/get_events/",
+    {
+    params,
+    headers: { Authorization: `Bearer ${auth.accessToken}` }
+  });
+  console.log("events", response.data);
+  return response;
+}
 
-    const response = await axios.get("http://localhost:8000/api/events/get_events/?related_patient_wallet_address=" + `${auth.walletid}`,
-      {
-      headers: { Authorization: `Bearer ${auth.accessToken}` }
-    });
-    console.log("events", response.data);
-    return response;
+const loadMoreEvents = async () => {
+  try {
+    const response = await getEvents(nextCursor);
+    // Skip rows the live stream already added
+    setEvents((current) => [
+      ...current,
+      ...response.data.events.filter((event) => !current.some((e) => e.id === event.id)),
+    ]);
+    setNextCursor(response.data.next_cursor);
+  } catch (error) {
+    console.error("Error fetching older events:", error);
   }
-}
+};
 
 useEffect(() => {
   const fetchEvents = async () => {
     try {
       const response = await getEvents();
       setEvents(response.data.events);
-      console.log(events);
+      setNextCursor(response.data.next_cursor);
+      return response.data.events.length ? response.data.events[0].id : null;
     } catch (error) {
       console.error("Error fetching events:", error);
+      return null;
     }
   };
 
-  fetchEvents();
+  let cancelled = false;
+  let stopStream = () => {};
+  const filter = auth.role === "patient" ? "related_patient_wallet_address" : "related_wallet_address";
+  // Load the list once, then have new events pushed instead of polling get_events
+  fetchEvents().then((lastEventId) => {
+    if (cancelled) return;
+    stopStream = streamEvents({
+      params: { [filter]: auth.walletid },
+      token: auth.accessToken,
+      lastEventId,
+      onEvent: (event) =>
+        setEvents((current) => current.some((e) => e.id === event.id) ? current : [event, ...current]),
+      onResync: fetchEvents,
+    });
+  });
+  return () => {
+    cancelled = true;
+    stopStream();
+  };
 },[auth.role])
 
 
@@ -223,6 +250,13 @@ useEffect(() => {
                   <p className="text-gray-500">No recent activity</p>
                 </div>
               )}
+              {nextCursor && (
+                <button
+                  onClick={loadMoreEvents}
+                  className="mt-2 py-2 px-2 rounded bg-[#3F72AF] text-white font-semibold text-sm cursor-pointer">
+                  Load older activity
+                </button>
+              )}
             </div>
           </div>
         </div>
@@ -345,6 +379,13 @@ useEffect(() => {
                   <p className="text-gray-500">No recent activity</p>
                 </div>
               )}
+              {nextCursor && (
+                <button
+                  onClick={loadMoreEvents}
+                  className="mt-2 py-2 px-2 rounded bg-[#3F72AF] text-white font-semibold text-sm cursor-pointer">
+                  Load older activity
+                </button>
+              )}
             </div>
           </div>
         </div>
@@ -493,6 +534,13 @@ useEffect(() => {
                   <p className="text-gray-500">No recent activity</p>
                 </div>
               )}
+              {nextCursor && (
+                <button
+                  onClick={loadMoreEvents}
+                  className="mt-2 py-2 px-2 rounded bg-[#3F72AF] text-white font-semibold text-sm cursor-pointer">
+                  Load older activity
+                </button>
+              )}
 
             </div>
           </div>
@@ -0,0 +1,101 @@
+// Live events from the backend's /api/async/events/stream/ (Server-Sent Events).
+// EventSource can't send the Authorization header, so the stream is read
+// with fetch and parsed here. Reconnects resume with Last-Event-ID.
+// A backend served over WSGI answers 501; then get_events is polled instead.
+
+const STREAM_URL = "http://localhost:8000/api/async/events/stream/";
+const EVENTS_URL = "http://localhost:8000/api/events/get_events/";
+const POLL_MS = 5000;
+
+export function streamEvents({ params, token, lastEventId, onEvent, onResync }) {
+  const controller = new AbortController();
+  let retryMs = 3000;
+
+  async function connect() {
+    while (!controller.signal.aborted) {
+      try {
+        const headers = { Authorization: `Bearer ${token}` };
+        if (lastEventId) headers["Last-Event-ID"] = String(lastEventId);
+        const response = await fetch(`${STREAM_URL}?${new URLSearchParams(params)}`, {
+          headers,
+          signal: controller.signal,
+        });
+        if (response.status === 501) {
+          await poll();
+          return;
+        }
+        if (!response.ok) throw new Error(`Event stream returned ${response.status}`);
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = "";
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value;
+          let end;
+          while ((end = buffer.indexOf("\n\n")) !== -1) {
+            const message = parseMessage(buffer.slice(0, end));
+            buffer = buffer.slice(end + 2);
+            if (message.retry) retryMs = message.retry;
+            if (message.event === "event") {
+              lastEventId = message.id;
+              onEvent(JSON.parse(message.data));
+            } else if (message.event === "resync") {
+              // Too far behind to replay: reload the list, then follow from its newest event.
+              lastEventId = await onResync();
+            }
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+        console.error("Event stream error:", error);
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  }
+
+  // The newest page of get_events, delivered oldest first past lastEventId.
+  async function poll() {
+    while (!controller.signal.aborted) {
+      try {
+        const response = await fetch(`${EVENTS_URL}?${new URLSearchParams(params)}`, {
+          headers: { Authorization: `Bearer ${token}` },
+          signal: controller.signal,
+        });
+        if (!response.ok) throw new Error(`get_events returned ${response.status}`);
+        const { events, next_cursor } = await response.json();
+        const fresh = events.filter((event) => !lastEventId || event.id > lastEventId);
+        if (lastEventId && fresh.length === events.length && next_cursor) {
+          // More new events than one page holds: reload the list instead.
+          lastEventId = await onResync();
+        } else {
+          for (const event of fresh.reverse()) {
+            lastEventId = Math.max(lastEventId || 0, event.id);
+            onEvent(event);
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+        console.error("Event polling error:", error);
+      }
+      await new Promise((resolve) => setTimeout(resolve, POLL_MS));
+    }
+  }
+
+  connect();
+  return () => controller.abort();
+}
+
+function parseMessage(block) {
+  const message = { event: "message", data: "" };
+  for (const line of block.split("\n")) {
+    if (line.startsWith(":")) continue; // keep-alive comment
+    const colon = line.indexOf(":");
+    const field = colon === -1 ? line : line.slice(0, colon);
+    const value = colon === -1 ? "" : line.slice(colon + 1).replace(/^ /, "");
+    if (field === "data") message.data += value;
+    else if (field === "retry") message.retry = parseInt(value, 10);
+    else message[field] = value;
+  }
+  return message;
+}
@@ -83,77 +83,93 @@ export async function fetchPatientRecord(wallet_address) {
   return patient;
 }
 
-export async function fetchAccessiblePatients(providerAddress) {
-  const provider = new ethers.BrowserProvider(window.ethereum);
-  const contract = new ethers.Contract(contractAddress, contractABI, provider);
+// The backend's MAX_REGISTRY_PATIENTS
+const MAX_REGISTRY_PATIENTS = 1000;
 
+export async function fetchAccessiblePatients(providerAddress) {
   console.log("Provider address:", providerAddress);
 
-  //get patient count from django backend
+  // One indexed lookup on the backend instead of canProviderAccess per patient
   const response = await axios.get(
-    "http://localhost:8000/api/patients/getPatientCount/",
+    "http://localhost:8000/api/chain/accessible_patients/",
     {
+      params: { provider: providerAddress },
       headers: {
         Authorization: `Bearer ${localStorage.getItem("accessToken")}`,
       },
     }
   );
 
-  const count = response.data.patient_count;
-  console.log("Patient count from backend:", count);
-
-  const patients = [];
+  console.log("Index caught up to block:", response.data.indexed_block);
 
-  for (let i = 0; i < count; i++) {
-    // const address = await contract.getPatientAddress(i);
-
-    console.log(localStorage.getItem("accessToken"));
-    const response = await axios.get(
-      "http://localhost:8000/api/patients/getPatientWalletAddress/?index=" +
-        `${i + 1}`,
-      {
-        headers: {
-          Authorization: `Bearer ${localStorage.getItem("accessToken")}`,
-        },
-      }
-    );
-
-    console.log("reponse", response.data.wallet_address);
-
-    // Check if the user has access to the patient record
-
-    console.log("Checking access for provider:", providerAddress);
-    console.log("patient wallet:", response.data.wallet_address);
+  // updatePatientRecord emits no event, so read the current CID on-chain
+  // through the backend's batched registry proxy, MAX_REGISTRY_PATIENTS at a time
+  const wallets = response.data.patients.map((accessible) => accessible.wallet_address);
+  const chunks = [];
+  for (let i = 0; i < wallets.length; i += MAX_REGISTRY_PATIENTS) {
+    chunks.push(wallets.slice(i, i + MAX_REGISTRY_PATIENTS));
+  }
+  const onChain = await Promise.all(
+    chunks.map((chunk) =>
+      axios.post(
+        "http://localhost:8000/api/chain/registry/patients/",
+        { patients: chunk },
+        {
+          headers: {
+            Authorization: `Bearer ${localStorage.getItem("accessToken")}`,
+          },
+        }
+      )
+    )
+  );
+  const cids = onChain.flatMap((reply) => reply.data.patients.map((patient) => patient.cid));
 
-    const hasAccess = await contract.canProviderAccess(
-      response.data.wallet_address,
-      providerAddress
-    );
+  const records = await fetchRecordsByCid(cids.filter(Boolean));
 
-    console.log("Access status:", hasAccess);
+  return response.data.patients
+    .map((accessible, i) => ({
+      ...records[cids[i]],
+      wallet_address: accessible.wallet_address,
+      cid: cids[i],
+    }))
+    .filter((patient, i) => records[cids[i]] !== undefined);
+}
 
-    if (hasAccess) {
-      console.log(
-        "User has access to patient record:",
-        response.data.wallet_address
-      );
+// The backend's MAX_BATCH_CIDS
+const MAX_BATCH_CIDS = 200;
 
-      console.log("Fetching CID for patient:", response.data.wallet_address);
-      const cid = await contract.getPatientRecord(response.data.wallet_address);
+// Fetch many IPFS records at once through the backend's CID cache
+export async function fetchRecordsByCid(cids) {
+  if (cids.length === 0) return {};
 
-      // 3. Fetch from IPFS (Pinata gateway or public IPFS)
-      const { data, contentType } = await pinata.gateways.private.get(cid);
-      console.log("IPFS response:", data, contentType);
+  const chunks = [];
+  for (let i = 0; i < cids.length; i += MAX_BATCH_CIDS) {
+    chunks.push(cids.slice(i, i + MAX_BATCH_CIDS));
+  }
+  const responses = await Promise.all(
+    chunks.map((chunk) =>
+      axios.post(
+        "http://localhost:8000/api/ipfs/batch/",
+        { cids: chunk },
+        {
+          headers: {
+            Authorization: `Bearer ${localStorage.getItem("accessToken")}`,
+          },
+        }
+      )
+    )
+  );
 
-      patients.push({
-        ...data,
-        wallet_address: response.data.wallet_address,
-        cid,
-      });
+  const records = {};
+  for (const response of responses) {
+    for (const record of response.data.records) {
+      records[record.cid] = record.data;
+    }
+    for (const [cid, error] of Object.entries(response.data.errors)) {
+      console.error("Could not fetch record:", cid, error);
     }
   }
-
-  return patients;
+  return records;
 }
 
 export async function fetchAndDecryptPatient(walletAddress) {
@@ -0,0 +1,72 @@
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks.seed import seed_dataset
+from benchmarks.workloads import WORKLOADS, run_workload
+from emr_api.benchmarking import benchmark_database, dump
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway test database (100k users, 50k patients, 1M events at --scale 1) and run "
+            "scripted workloads, printing throughput, latency percentiles and query counts as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for all seeded volumes.")
+        parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                            help=f"Comma separated subset of {', '.join(WORKLOADS)}.")
+        parser.add_argument("--operations", type=int, default=1000, help="Operations per workload.")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+
+    def handle(self, *args, **options):
+        names = [name for name in options["workloads"].split(",") if name]
+        unknown = set(names) - set(WORKLOADS)
+        if unknown:
+            raise CommandError(f"Unknown workloads: {', '.join(sorted(unknown))}")
+        if "emr_api.middleware.InstrumentationMiddleware" not in settings.MIDDLEWARE:
+            raise CommandError("run_benchmarks reads query counts from InstrumentationMiddleware; enable it.")
+
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "scale": options["scale"],
+                "seed": options["seed"],
+                "threads": options["threads"],
+                "operations": options["operations"],
+            },
+            "workloads": {},
+        }
+        with benchmark_database(on_disk=True):
+            dataset = seed_dataset(options["scale"], options["seed"])
+            report["meta"]["seeded"] = dataset.counts
+            report["meta"]["seed_seconds"] = dataset.seconds
+            self.stderr.write(f"Seeded {dataset.counts} in {dataset.seconds:.1f}s")
+            for name in names:
+                result = run_workload(name, dataset, options["operations"], options["threads"], options["seed"])
+                report["workloads"][name] = result
+                self.stderr.write(f"{name}: {result['ops_per_sec']:.0f} ops/sec, "
+                                  f"p99 {result['latency_ms'].get('p99_ms', 0):.1f} ms, {result['errors']} errors")
+
+        if options["output"]:
+            with open(options["output"], "w") as out:
+                dump(out, report)
+        dump(self.stdout, report)
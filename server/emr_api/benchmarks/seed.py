@@ -0,0 +1,91 @@
+# Synthetic data for the benchmark suite. Everything derives from one seed,
+# so two runs at the same scale see the same rows.
+import itertools
+import random
+import time
+from dataclasses import dataclass, field
+
+from eth_account import Account
+from eth_utils import keccak
+
+from chainindex.models import AccessGrant
+from emr_api.benchmarking import seed_events, wallet
+from events.rollups import rebuild_rollups
+from patients.models import Patient
+from users.models import User, UserProfile
+
+# Full-scale volumes; --scale multiplies all of them.
+USERS = 100000
+PATIENTS = 50000
+PROVIDERS = 2000
+EVENTS = 1000000
+GRANTS_PER_PROVIDER = 25
+LOGIN_ACCOUNTS = 500
+BATCH = 5000
+
+FIRST_NAMES = ["Ada", "Ben", "Chloe", "Dev", "Ella", "Femi", "Grace", "Hugo", "Isla", "Jin"]
+LAST_NAMES = ["Adams", "Brown", "Chen", "Davies", "Evans", "Khan", "Lee", "Patel", "Smith", "Wong"]
+
+
+@dataclass
+class Dataset:
+    providers: list
+    patients: list
+    login_accounts: list
+    counts: dict = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def __post_init__(self):
+        self.next_login_account = itertools.cycle(self.login_accounts)
+
+
+def login_account(n):
+    return Account.from_key(keccak(text=f"emr-bench-{n}"))
+
+
+def seed_dataset(scale=1.0, seed=0):
+    """
+    Seed users (patients, providers with profiles, and the rest as admins),
+    patients, on-chain access grants and events, then rebuild the rollups.
+    Providers use wallet(n, "a") and patients wallet(n, "b"), matching
+    seed_events.
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    patients = max(1, int(PATIENTS * scale))
+    providers = max(1, int(PROVIDERS * scale))
+    others = max(0, int(USERS * scale) - patients - providers)
+
+    users = ([User(wallet_address=wallet(n, "b"), role="patient", password="!") for n in range(patients)]
+             + [User(wallet_address=wallet(n, "a"), role="provider", password="!") for n in range(providers)]
+             + [User(wallet_address=wallet(n, "d"), role="admin", password="!") for n in range(others)])
+    User.objects.bulk_create(users, batch_size=BATCH)
+
+    provider_users = User.objects.filter(role="provider").order_by("id")
+    UserProfile.objects.bulk_create([
+        UserProfile(user=user, title="Dr", first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                    email=f"{user.wallet_address[-8:]}@example.org", job_title="GP", orgnisation_name="NHS")
+        for user in provider_users.only("id", "wallet_address").iterator()
+    ], batch_size=BATCH)
+    Patient.objects.bulk_create([Patient(wallet_address=wallet(n, "b")) for n in range(patients)], batch_size=BATCH)
+
+    grants = {
+        (wallet(p, "a"), wallet(rng.randrange(patients), "b"))
+        for p in range(providers) for _ in range(GRANTS_PER_PROVIDER)
+    }
+    AccessGrant.objects.bulk_create([
+        AccessGrant(provider_wallet_address=provider, patient_wallet_address=patient, block_number=1)
+        for provider, patient in sorted(grants)
+    ], batch_size=BATCH)
+
+    events = seed_events(max(1, int(EVENTS * scale)), providers=providers, patients=patients, rng=rng)
+    rebuild_rollups()
+
+    return Dataset(
+        providers=[wallet(n, "a") for n in range(providers)],
+        patients=[wallet(n, "b") for n in range(patients)],
+        login_accounts=[login_account(n) for n in range(LOGIN_ACCOUNTS)],
+        counts={"users": len(users), "patients": patients, "providers": providers,
+                "access_grants": len(grants), "events": events},
+        seconds=time.perf_counter() - start,
+    )
@@ -0,0 +1,31 @@
+from django.test import TestCase, override_settings
+
+from benchmarks.seed import seed_dataset
+from benchmarks.workloads import WORKLOADS, run_workload
+from users.nonces import reset_nonce_store
+from users.verification import reset_signature_verifier
+
+
+@override_settings(SIGNATURE_POOL={"ENABLED": False},
+                   NONCE_STORE={"BACKEND": "users.nonces.LocalNonceStore", "OPTIONS": {}})
+class WorkloadTests(TestCase):
+    def setUp(self):
+        reset_signature_verifier()
+        reset_nonce_store()
+        self.addCleanup(reset_signature_verifier)
+        self.addCleanup(reset_nonce_store)
+
+    def test_every_workload_runs_cleanly_on_a_tiny_dataset(self):
+        """
+        Test that each workload completes without errors and reports latency and query counts.
+        """
+        dataset = seed_dataset(scale=0.0002)
+        self.assertEqual(dataset.counts["patients"], 10)
+        self.assertEqual(dataset.counts["events"], 200)
+
+        for name in WORKLOADS:
+            with self.subTest(workload=name):
+                result = run_workload(name, dataset, operations=3)
+                self.assertEqual(result["errors"], 0, result["first_errors"])
+                self.assertGreater(result["latency_ms"]["count"], 0)
+                self.assertTrue(result["queries_per_request"])
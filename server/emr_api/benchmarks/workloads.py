@@ -0,0 +1,167 @@
+# Scripted workloads for run_benchmarks. A workload is a function taking
+# (dataset, rng, client, watch) that performs one operation, timing the
+# part that counts with `with watch:`; run_workload drives it from a pool
+# of threads, each with its own client and RNG.
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+from eth_account.messages import encode_defunct
+from rest_framework.test import APIClient
+
+from emr_api.benchmarking import EVENT_TYPES, Stopwatch, access_token_for, summarise
+from emr_api.instrumentation import DB_QUERIES, REQUEST_DURATION, reset_metrics
+from users.models import User
+
+AUDIT_PAGE_SIZE = 50
+AUDIT_DEPTH = 10
+INGEST_BATCH = 50
+
+
+class WorkloadError(Exception):
+    pass
+
+
+def check(response, *statuses):
+    if response.status_code not in (statuses or (200,)):
+        raise WorkloadError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+    return response
+
+
+def login_storm(dataset, rng, client, watch):
+    """Nonce + signed wallet login, cycling through the login accounts."""
+    # Handed out in turn so two threads never race on one account's nonce.
+    account = next(dataset.next_login_account)
+    with watch:
+        nonce = check(client.post("/api/auth/nonce/", {"address": account.address})).data["nonce"]
+    signature = account.sign_message(encode_defunct(text=nonce)).signature.hex()
+    with watch:
+        check(client.post("/api/auth/login/", {"address": account.address, "signature": signature}))
+
+
+def dashboard(dataset, rng, client, watch):
+    """The requests a provider's dashboard makes on load."""
+    provider = rng.choice(dataset.providers)
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {provider_token(provider)}")
+    with watch:
+        check(client.get("/api/patients/getPatientCount/"))
+        check(client.get("/api/chain/accessible_patients/", {"provider": provider}))
+        check(client.get("/api/auth/profiles/", {"role": "provider", "limit": 50}))
+        check(client.get("/api/events/get_events/", {"related_wallet_address": provider, "limit": 20}))
+        check(client.get("/api/events/event_stats/", {"group_by": "event_type", "related_wallet_address": provider}))
+
+
+def audit_paging(dataset, rng, client, watch):
+    """A patient's audit log, followed AUDIT_DEPTH pages deep."""
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {provider_token(dataset.providers[0])}")
+    params = {"related_patient_wallet_address": rng.choice(dataset.patients), "limit": AUDIT_PAGE_SIZE}
+    for _ in range(AUDIT_DEPTH):
+        with watch:
+            data = check(client.get("/api/events/get_events/", params)).data
+        if not data["next_cursor"]:
+            break
+        params["cursor"] = data["next_cursor"]
+
+
+def event(dataset, rng):
+    return {
+        "event_type": rng.choice(EVENT_TYPES),
+        "event_details": "benchmark event",
+        "related_wallet_address": rng.choice(dataset.providers),
+        "related_patient_wallet_address": rng.choice(dataset.patients),
+    }
+
+
+def event_ingest(dataset, rng, client, watch):
+    """One add_event call."""
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {provider_token(dataset.providers[0])}")
+    with watch:
+        check(client.post("/api/events/add_event/", event(dataset, rng), format="json"))
+
+
+def event_ingest_batch(dataset, rng, client, watch):
+    """One add_events call carrying INGEST_BATCH events."""
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {provider_token(dataset.providers[0])}")
+    batch = [event(dataset, rng) for _ in range(INGEST_BATCH)]
+    with watch:
+        check(client.post("/api/events/add_events/", {"events": batch}, format="json"), 200, 202)
+
+
+WORKLOADS = {
+    "login_storm": login_storm,
+    "dashboard": dashboard,
+    "audit_paging": audit_paging,
+    "event_ingest": event_ingest,
+    "event_ingest_batch": event_ingest_batch,
+}
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+def provider_token(wallet_address):
+    with _tokens_lock:
+        token = _tokens.get(wallet_address)
+    if token is None:
+        token = access_token_for(User.objects.get(wallet_address=wallet_address))
+        with _tokens_lock:
+            _tokens[wallet_address] = token
+    return token
+
+
+def run_workload(name, dataset, operations, threads=1, seed=0):
+    """
+    Run `operations` operations of a workload and return throughput,
+    latency percentiles and per-view query counts (from the request
+    metrics, so InstrumentationMiddleware must be enabled).
+    """
+    workload = WORKLOADS[name]
+    samples, errors = [], []
+
+    # Unmeasured warm-up: first-request setup, worker pools, caches.
+    warmup_rng, warmup_client = random.Random(f"{seed}:{name}:warmup"), APIClient()
+    for _ in range(min(threads, operations)):
+        try:
+            workload(dataset, warmup_rng, warmup_client, Stopwatch())
+        except WorkloadError:
+            pass
+    reset_metrics()
+
+    def worker(index):
+        rng = random.Random(f"{seed}:{name}:{index}")
+        client = APIClient()
+        watch = Stopwatch()
+        try:
+            for _ in range(index, operations, threads):
+                try:
+                    workload(dataset, rng, client, watch)
+                except WorkloadError as exc:
+                    errors.append(str(exc))
+        finally:
+            samples.extend(watch.samples)
+            if threads > 1:
+                close_old_connections()
+
+    start = time.perf_counter()
+    if threads == 1:
+        worker(0)
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    requests = sum(count for count, _ in REQUEST_DURATION.totals().values())
+    return {
+        "operations": operations,
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "seconds": elapsed,
+        "ops_per_sec": operations / elapsed,
+        "requests_per_sec": requests / elapsed,
+        "latency_ms": summarise(samples),
+        "queries_per_request": {
+            labels[0]: round(total / count, 2) for labels, (count, total) in sorted(DB_QUERIES.totals().items())
+        },
+    }
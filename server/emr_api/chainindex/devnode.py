@@ -0,0 +1,129 @@
+# In-process stand-in for a node with PatientRegistry and Multicall3
+# deployed, for the registry read proxy's tests and bench_registry_reads. It
+# answers eth_blockNumber, eth_getCode and eth_call from a dict of records
+# and a set of grants, directly or over HTTP (single and batch requests), and
+# counts the requests and view calls it serves.
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from eth_abi import decode, encode
+
+from .registry import AGGREGATE3, MULTICALL3, SELECTORS
+from .rpc import RpcError
+
+class RegistryNode:
+    def __init__(self, contract_address, multicall_address=MULTICALL3):
+        self.contract_address = contract_address.lower()
+        # None for a chain without Multicall3, like a fresh local node.
+        self.multicall_address = multicall_address.lower() if multicall_address else None
+        self.block_number = 1
+        # patient -> cid, and (patient, provider) pairs; lowercase addresses.
+        self.records = {}
+        self.grants = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.eth_calls = 0
+        # Set to hold eth_calls until released, to line up concurrent readers.
+        self.gate = None
+
+    def _count(self, field):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def call(self, method, *params):
+        self._count("requests")
+        return self.dispatch(method, params)
+
+    def batch(self, calls):
+        self._count("requests")
+        results = []
+        for method, params in calls:
+            try:
+                results.append(self.dispatch(method, params))
+            except RpcError as exc:
+                results.append(exc)
+        return results
+
+    def dispatch(self, method, params):
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_getCode":
+            deployed = params[0].lower() in (self.contract_address, self.multicall_address)
+            return "0x6080" if deployed else "0x"
+        if method != "eth_call":
+            raise RpcError(f"{method} not supported", code=-32601)
+        if self.gate is not None:
+            self.gate.wait()
+        call = params[0]
+        data = bytes.fromhex(call["data"][2:])
+        if call["to"].lower() == self.contract_address:
+            return "0x" + self.view(data).hex()
+        if self.multicall_address and call["to"].lower() == self.multicall_address and data[:4] == AGGREGATE3:
+            calls, = decode(["(address,bool,bytes)[]"], data[4:])
+            results = []
+            for target, allow_failure, calldata in calls:
+                try:
+                    if target.lower() != self.contract_address:
+                        raise RpcError("execution reverted", code=3)
+                    results.append((True, self.view(calldata)))
+                except RpcError:
+                    if not allow_failure:
+                        raise
+                    results.append((False, b""))
+            return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+        # A call to an address without code succeeds and returns nothing.
+        return "0x"
+
+    def view(self, data):
+        self._count("eth_calls")
+        selector, args = data[:4], data[4:]
+        if selector == SELECTORS["getPatientRecord"]:
+            patient, = decode(["address"], args)
+            if patient.lower() not in self.records:
+                raise RpcError("execution reverted: Patient not found", code=3)
+            return encode(["string"], [self.records[patient.lower()]])
+        if selector == SELECTORS["canProviderAccess"]:
+            patient, provider = decode(["address", "address"], args)
+            return encode(["bool"], [(patient.lower(), provider.lower()) in self.grants])
+        raise RpcError("execution reverted", code=3)
+
+
+def serve(node, latency=0.0):
+    """
+    Serve `node` over JSON-RPC on a free local port from a daemon thread,
+    sleeping `latency` seconds per HTTP request to stand in for the network.
+    Returns the server; its URL is server.url.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            node._count("requests")
+            if isinstance(payload, list):
+                reply = [self.answer(request) for request in payload]
+            else:
+                reply = self.answer(payload)
+            body = json.dumps(reply).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def answer(self, request):
+            try:
+                result = {"result": node.dispatch(request["method"], request["params"])}
+            except RpcError as exc:
+                result = {"error": {"code": exc.code, "message": str(exc)}}
+            return {"jsonrpc": "2.0", "id": request["id"], **result}
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,182 @@
+# Follows PatientRegistry logs on a JSON-RPC node into ChainLog, and keeps
+# the AccessGrant / PatientRecord tables the API reads in step with them.
+#
+# Each sync first checks that the last indexed block is still canonical. If
+# its hash changed, the indexer walks back through the block hashes it saw
+# on logs until one matches, deletes everything above it and replays the
+# remaining logs for the affected patients, then carries on from there.
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from eth_abi import decode
+from eth_utils import keccak
+
+from .models import AccessGrant, ChainLog, IndexCursor, PatientRecord
+from .rpc import JsonRpcClient
+
+logger = logging.getLogger(__name__)
+
+ACCESS_CHANGED_TOPIC = "0x" + keccak(text="AccessChanged(address,address,bool)").hex()
+PATIENT_ADDED_TOPIC = "0x" + keccak(text="PatientAdded(address,string)").hex()
+
+DEFAULT_INDEX_SETTINGS = {
+    "RPC_URL": "http://127.0.0.1:8545",
+    "CONTRACT_ADDRESS": None,
+    # First block worth scanning, normally the contract's deployment block.
+    "START_BLOCK": 0,
+    # Blocks per eth_getLogs call; many nodes cap the range.
+    "BATCH_BLOCKS": 2000,
+    # Stay this many blocks behind the head to avoid most reorgs entirely.
+    "CONFIRMATIONS": 0,
+    "POLL_INTERVAL": 5.0,
+}
+
+# Keeps IN (...) lists under SQLite's variable limit.
+REPLAY_CHUNK = 500
+
+
+def index_settings():
+    return {**DEFAULT_INDEX_SETTINGS, **getattr(settings, "CHAIN_INDEX", {})}
+
+
+def topic_address(topic):
+    return "0x" + topic[-40:].lower()
+
+
+def decode_log(log):
+    """Turn one eth_getLogs entry into an unsaved ChainLog, or None if it is not one we index."""
+    topics = [topic.lower() for topic in log["topics"]]
+    if log.get("removed") or not topics:
+        return None
+    data = bytes.fromhex(log["data"][2:])
+    position = {
+        "block_number": int(log["blockNumber"], 16),
+        "block_hash": log["blockHash"],
+        "log_index": int(log["logIndex"], 16),
+    }
+    if topics[0] == ACCESS_CHANGED_TOPIC:
+        granted, = decode(["bool"], data)
+        return ChainLog(event=ChainLog.ACCESS_CHANGED, patient_wallet_address=topic_address(topics[1]),
+                        provider_wallet_address=topic_address(topics[2]), granted=granted, **position)
+    if topics[0] == PATIENT_ADDED_TOPIC:
+        cid, = decode(["string"], data)
+        return ChainLog(event=ChainLog.PATIENT_ADDED, patient_wallet_address=topic_address(topics[1]),
+                        cid=cid, **position)
+    return None
+
+
+def replay(patients):
+    """Rebuild AccessGrant and PatientRecord rows for these patients from ChainLog."""
+    patients = sorted(patients)
+    for start in range(0, len(patients), REPLAY_CHUNK):
+        chunk = patients[start:start + REPLAY_CHUNK]
+        grants, records = {}, {}
+        logs = ChainLog.objects.filter(patient_wallet_address__in=chunk).order_by("block_number", "log_index")
+        for log in logs.iterator():
+            if log.event == ChainLog.ACCESS_CHANGED:
+                pair = (log.provider_wallet_address, log.patient_wallet_address)
+                if log.granted:
+                    grants[pair] = log.block_number
+                else:
+                    grants.pop(pair, None)
+            else:
+                records[log.patient_wallet_address] = (log.cid, log.block_number)
+
+        AccessGrant.objects.filter(patient_wallet_address__in=chunk).delete()
+        PatientRecord.objects.filter(patient_wallet_address__in=chunk).delete()
+        AccessGrant.objects.bulk_create([
+            AccessGrant(provider_wallet_address=provider, patient_wallet_address=patient, block_number=block)
+            for (provider, patient), block in grants.items()
+        ])
+        PatientRecord.objects.bulk_create([
+            PatientRecord(patient_wallet_address=patient, cid=cid, block_number=block)
+            for patient, (cid, block) in records.items()
+        ])
+
+
+class ChainIndexer:
+    def __init__(self, client, contract_address, start_block=0, batch_blocks=2000, confirmations=0):
+        self.client = client
+        self.contract_address = contract_address.lower()
+        self.start_block = start_block
+        self.batch_blocks = batch_blocks
+        self.confirmations = confirmations
+
+    def cursor(self):
+        cursor, _ = IndexCursor.objects.get_or_create(
+            contract_address=self.contract_address,
+            defaults={"block_number": self.start_block - 1},
+        )
+        return cursor
+
+    def block_hash(self, number):
+        block = self.client.call("eth_getBlockByNumber", hex(number), False)
+        return block["hash"] if block else None
+
+    def sync(self, max_batches=None):
+        """Index up to the node's head less CONFIRMATIONS; returns a short summary."""
+        cursor = self.cursor()
+        summary = {"reorged_to": None, "batches": 0, "logs": 0}
+        fork = self.find_fork(cursor)
+        if fork is not None:
+            self.rollback(cursor, *fork)
+            summary["reorged_to"] = cursor.block_number
+
+        head = int(self.client.call("eth_blockNumber"), 16) - self.confirmations
+        while cursor.block_number < head and (max_batches is None or summary["batches"] < max_batches):
+            start = cursor.block_number + 1
+            end = min(head, start + self.batch_blocks - 1)
+            logs = self.client.call("eth_getLogs", {
+                "address": self.contract_address,
+                "fromBlock": hex(start),
+                "toBlock": hex(end),
+                "topics": [[ACCESS_CHANGED_TOPIC, PATIENT_ADDED_TOPIC]],
+            })
+            summary["logs"] += self.apply(cursor, logs, end, self.block_hash(end))
+            summary["batches"] += 1
+        summary["block_number"] = cursor.block_number
+        return summary
+
+    def find_fork(self, cursor):
+        """Return (number, hash) of the newest indexed block still canonical, or None if the tip is."""
+        if cursor.block_hash is None or self.block_hash(cursor.block_number) == cursor.block_hash:
+            return None
+        seen = (ChainLog.objects.filter(block_number__lt=cursor.block_number)
+                .values_list("block_number", "block_hash").distinct().order_by("-block_number"))
+        for number, block_hash in seen.iterator():
+            if self.block_hash(number) == block_hash:
+                return number, block_hash
+        return self.start_block - 1, None
+
+    @transaction.atomic
+    def rollback(self, cursor, block_number, block_hash):
+        orphaned = ChainLog.objects.filter(block_number__gt=block_number)
+        patients = set(orphaned.values_list("patient_wallet_address", flat=True))
+        orphaned.delete()
+        replay(patients)
+        logger.warning("Reorg: rolled %s back from block %s to %s",
+                       self.contract_address, cursor.block_number, block_number)
+        cursor.block_number, cursor.block_hash = block_number, block_hash
+        cursor.save()
+
+    @transaction.atomic
+    def apply(self, cursor, logs, block_number, block_hash):
+        entries = [entry for entry in map(decode_log, logs) if entry is not None]
+        ChainLog.objects.bulk_create(entries, batch_size=REPLAY_CHUNK)
+        replay({entry.patient_wallet_address for entry in entries})
+        cursor.block_number, cursor.block_hash = block_number, block_hash
+        cursor.save()
+        return len(entries)
+
+
+def get_indexer():
+    """Build an indexer for the configured node and contract."""
+    config = index_settings()
+    return ChainIndexer(
+        JsonRpcClient(config["RPC_URL"]),
+        config["CONTRACT_ADDRESS"],
+        start_block=config["START_BLOCK"],
+        batch_blocks=config["BATCH_BLOCKS"],
+        confirmations=config["CONFIRMATIONS"],
+    )
@@ -0,0 +1,73 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from chainindex.devnode import MULTICALL3, RegistryNode, serve
+from chainindex.registry import RegistryReader, encode_call
+from chainindex.rpc import JsonRpcClient
+from emr_api.benchmarking import dump, wallet
+from emr_api.fields import normalize_address
+
+CONTRACT = "0x988acaA10D043bfaD8A6506D2119f64244382107"
+
+
+class Command(BaseCommand):
+    help = ("Compare node round trips and latency for reading getPatientRecord and canProviderAccess "
+            "for many patients: one eth_call each, as the browser does, against the read proxy's "
+            "JSON-RPC batches and Multicall3, cached and coalesced.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=1000)
+        parser.add_argument("--latency-ms", type=float, default=5.0, help="Added to every HTTP request to the node.")
+        parser.add_argument("--parallel", type=int, default=6,
+                            help="Concurrent eth_calls for the per-call baseline (a browser's per-host limit).")
+        parser.add_argument("--readers", type=int, default=8, help="Concurrent identical proxy requests.")
+
+    def handle(self, *args, **options):
+        node = RegistryNode(CONTRACT)
+        server = serve(node, latency=options["latency_ms"] / 1000)
+        client = JsonRpcClient(server.url)
+        provider = wallet(0, "c")
+        patients = [normalize_address(wallet(n, "b")) for n in range(options["patients"])]
+        for n, patient in enumerate(patients):
+            node.records[patient.lower()] = f"cid-{n}"
+            if n % 2:
+                node.grants.add((patient.lower(), provider.lower()))
+
+        def measure(run):
+            node.requests = node.eth_calls = 0
+            started = time.perf_counter()
+            run()
+            return {"http_requests": node.requests, "eth_calls": node.eth_calls,
+                    "seconds": time.perf_counter() - started}
+
+        def eth_call(method, args):
+            return client.call("eth_call", {"to": CONTRACT, "data": "0x" + encode_call(method, args).hex()}, "latest")
+
+        def per_call(patient):
+            eth_call("getPatientRecord", (patient,))
+            eth_call("canProviderAccess", (patient, provider))
+
+        def reader(multicall=MULTICALL3):
+            return RegistryReader(client, CONTRACT, multicall)
+
+        report = {"patients": len(patients), "latency_ms": options["latency_ms"]}
+        report["per_call_sequential"] = measure(lambda: [per_call(patient) for patient in patients])
+        with ThreadPoolExecutor(options["parallel"]) as pool:
+            report["per_call_parallel"] = measure(lambda: list(pool.map(per_call, patients)))
+        report["json_rpc_batch"] = measure(lambda: reader(None).patients(patients, provider))
+        warm = reader()
+        report["multicall"] = measure(lambda: warm.patients(patients, provider))
+        report["multicall_cached"] = measure(lambda: warm.patients(patients, provider))
+
+        shared = reader()
+        with ThreadPoolExecutor(options["readers"]) as pool:
+            report["multicall_coalesced"] = measure(
+                lambda: list(pool.map(lambda _: shared.patients(patients, provider), range(options["readers"]))))
+        report["multicall_coalesced"]["readers"] = options["readers"]
+        report["multicall_coalesced"]["stats"] = shared.stats
+
+        server.shutdown()
+        server.server_close()
+        dump(self.stdout, report)
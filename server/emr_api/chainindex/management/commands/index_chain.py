@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chainindex.indexer import get_indexer, index_settings
+from chainindex.rpc import RpcError
+
+
+class Command(BaseCommand):
+    help = "Index PatientRegistry access and record logs from CHAIN_INDEX['RPC_URL']."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--follow", action="store_true", help="Keep polling for new blocks.")
+        parser.add_argument("--interval", type=float, default=None, help="Seconds between polls with --follow.")
+        parser.add_argument("--max-batches", type=int, default=None)
+
+    def handle(self, *args, **options):
+        indexer = get_indexer()
+        interval = options["interval"] or index_settings()["POLL_INTERVAL"]
+        while True:
+            try:
+                summary = indexer.sync(max_batches=options["max_batches"])
+            except RpcError as exc:
+                if not options["follow"]:
+                    raise
+                self.stderr.write(str(exc))
+            else:
+                if summary["reorged_to"] is not None:
+                    self.stdout.write(f"Reorg: rolled back to block {summary['reorged_to']}")
+                self.stdout.write(f"Indexed to block {summary['block_number']} ({summary['logs']} logs)")
+            if not options["follow"]:
+                return
+            time.sleep(interval)
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexCursor',
+            fields=[
+                ('contract_address', models.CharField(max_length=42, primary_key=True, serialize=False)),
+                ('block_number', models.BigIntegerField()),
+                ('block_hash', models.CharField(blank=True, max_length=66, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PatientRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_wallet_address', models.CharField(max_length=42, unique=True)),
+                ('cid', models.CharField(max_length=255)),
+                ('block_number', models.PositiveBigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AccessGrant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider_wallet_address', models.CharField(max_length=42)),
+                ('patient_wallet_address', models.CharField(max_length=42)),
+                ('block_number', models.PositiveBigIntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('provider_wallet_address', 'patient_wallet_address'), name='access_grant_pair_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChainLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('block_number', models.PositiveBigIntegerField()),
+                ('block_hash', models.CharField(max_length=66)),
+                ('log_index', models.PositiveIntegerField()),
+                ('event', models.CharField(choices=[('AccessChanged', 'Access Changed'), ('PatientAdded', 'Patient Added')], max_length=32)),
+                ('patient_wallet_address', models.CharField(max_length=42)),
+                ('provider_wallet_address', models.CharField(blank=True, max_length=42, null=True)),
+                ('granted', models.BooleanField(null=True)),
+                ('cid', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_wallet_address', 'block_number', 'log_index'], name='chain_log_patient_idx'), models.Index(fields=['block_hash'], name='chain_log_block_hash_idx')],
+                'constraints': [models.UniqueConstraint(fields=('block_number', 'log_index'), name='chain_log_position_unique')],
+            },
+        ),
+    ]
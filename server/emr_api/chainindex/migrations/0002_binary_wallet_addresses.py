@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:05
+
+import emr_api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chainindex', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accessgrant',
+            name='patient_wallet_address',
+            field=emr_api.fields.WalletAddressField(),
+        ),
+        migrations.AlterField(
+            model_name='accessgrant',
+            name='provider_wallet_address',
+            field=emr_api.fields.WalletAddressField(),
+        ),
+        migrations.AlterField(
+            model_name='chainlog',
+            name='patient_wallet_address',
+            field=emr_api.fields.WalletAddressField(),
+        ),
+        migrations.AlterField(
+            model_name='chainlog',
+            name='provider_wallet_address',
+            field=emr_api.fields.WalletAddressField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='indexcursor',
+            name='contract_address',
+            field=emr_api.fields.WalletAddressField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='patientrecord',
+            name='patient_wallet_address',
+            field=emr_api.fields.WalletAddressField(unique=True),
+        ),
+        emr_api.fields.convert_address_columns('chainindex_accessgrant',
+                                               ['patient_wallet_address', 'provider_wallet_address']),
+        emr_api.fields.convert_address_columns('chainindex_chainlog',
+                                               ['patient_wallet_address', 'provider_wallet_address']),
+        emr_api.fields.convert_address_columns('chainindex_indexcursor', ['contract_address'],
+                                               key='contract_address'),
+        emr_api.fields.convert_address_columns('chainindex_patientrecord', ['patient_wallet_address']),
+    ]
@@ -0,0 +1,75 @@
+from django.db import models
+
+from emr_api.fields import WalletAddressField
+
+
+class ChainLog(models.Model):
+    """
+    A decoded PatientRegistry log. AccessGrant and PatientRecord are derived
+    from these, so a reorg is undone by deleting the orphaned logs and
+    replaying what is left for the patients they touched.
+    """
+    ACCESS_CHANGED = "AccessChanged"
+    PATIENT_ADDED = "PatientAdded"
+    EVENT_CHOICES = [
+        (ACCESS_CHANGED, "Access Changed"),
+        (PATIENT_ADDED, "Patient Added"),
+    ]
+
+    block_number = models.PositiveBigIntegerField()
+    block_hash = models.CharField(max_length=66)
+    log_index = models.PositiveIntegerField()
+    event = models.CharField(max_length=32, choices=EVENT_CHOICES)
+    patient_wallet_address = WalletAddressField()
+    provider_wallet_address = WalletAddressField(null=True, blank=True)
+    granted = models.BooleanField(null=True)
+    cid = models.CharField(max_length=255, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["block_number", "log_index"], name="chain_log_position_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["patient_wallet_address", "block_number", "log_index"], name="chain_log_patient_idx"),
+            models.Index(fields=["block_hash"], name="chain_log_block_hash_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.event} {self.patient_wallet_address} @{self.block_number}:{self.log_index}"
+
+
+class AccessGrant(models.Model):
+    """A provider's current access to a patient; revoked grants are deleted."""
+    provider_wallet_address = WalletAddressField()
+    patient_wallet_address = WalletAddressField()
+    block_number = models.PositiveBigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["provider_wallet_address", "patient_wallet_address"],
+                                    name="access_grant_pair_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider_wallet_address} -> {self.patient_wallet_address}"
+
+
+class PatientRecord(models.Model):
+    """The CID a patient was registered with, as seen in PatientAdded."""
+    patient_wallet_address = WalletAddressField(unique=True)
+    cid = models.CharField(max_length=255)
+    block_number = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return f"{self.patient_wallet_address}: {self.cid}"
+
+
+class IndexCursor(models.Model):
+    """The last block indexed for a contract, and its hash for reorg checks."""
+    contract_address = WalletAddressField(primary_key=True)
+    block_number = models.BigIntegerField()
+    block_hash = models.CharField(max_length=66, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.contract_address} @{self.block_number}"
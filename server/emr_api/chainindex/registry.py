@@ -0,0 +1,239 @@
+# Read proxy for PatientRegistry view calls, so the dashboards don't send one
+# eth_call per patient from the browser. All the calls of a request are read
+# at one block and packed into as few node round trips as possible: a JSON-RPC
+# batch of plain eth_calls by default, or Multicall3 aggregate3 eth_calls of
+# CALLS_PER_REQUEST calls each when MULTICALL_ADDRESS is set. The multicall
+# address is checked for code once; a chain without the contract (a fresh
+# local node) falls back to batches. Multicall changes msg.sender, which is
+# fine for these views: they take both addresses as arguments.
+#
+# Results are cached under (block, method, args) and the cache is dropped
+# when the head moves, so a response only ever carries values read at the
+# block it names. A call another request already has in flight is waited on
+# rather than sent again.
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from eth_abi import decode, encode
+from eth_abi.exceptions import DecodingError
+from eth_utils import keccak
+
+from emr_api.fields import normalize_address
+
+from .indexer import index_settings
+from .rpc import JsonRpcClient, RpcError
+
+logger = logging.getLogger(__name__)
+
+# Multicall3's address on mainnet, the testnets and forks of them.
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+DEFAULT_REGISTRY_READS = {
+    # A Multicall3 deployment to pack calls into, e.g. MULTICALL3; None sends
+    # JSON-RPC batches.
+    "MULTICALL_ADDRESS": None,
+    # View calls per aggregate3 eth_call, or per JSON-RPC batch.
+    "CALLS_PER_REQUEST": 500,
+    # Seconds a head block number is reused before asking the node again.
+    "HEAD_TTL": 1.0,
+    # Cached results kept for the current block before starting over.
+    "MAX_CACHED": 100000,
+}
+
+# PatientRegistry views served by the proxy: argument types and return type.
+VIEWS = {
+    "getPatientRecord": (["address"], "string"),
+    "canProviderAccess": (["address", "address"], "bool"),
+}
+SELECTORS = {method: keccak(text=f"{method}({','.join(args)})")[:4] for method, (args, _) in VIEWS.items()}
+AGGREGATE3 = keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+
+
+class RegistryNotConfigured(Exception):
+    pass
+
+
+class RegistryReadError(Exception):
+    """The node answered with data that isn't what the call returns."""
+
+
+def registry_settings():
+    return {**DEFAULT_REGISTRY_READS, **getattr(settings, "REGISTRY_READS", {})}
+
+
+def encode_call(method, args):
+    return SELECTORS[method] + encode(VIEWS[method][0], list(args))
+
+
+def decode_result(method, data):
+    """The call's return value, or None if it reverted or returned nothing."""
+    try:
+        return decode([VIEWS[method][1]], data)[0]
+    except DecodingError:
+        return None
+
+
+class RegistryReader:
+    def __init__(self, client, contract_address, multicall_address=None, calls_per_request=500, head_ttl=1.0,
+                 max_cached=100000):
+        self.client = client
+        self.contract_address = normalize_address(contract_address)
+        self.multicall_address = multicall_address
+        self.calls_per_request = calls_per_request
+        self.head_ttl = head_ttl
+        self.max_cached = max_cached
+        self.lock = threading.Lock()
+        self.head_lock = threading.Lock()
+        # (block number, monotonic time it was read)
+        self.head = None
+        self.cache_block = None
+        self.cache = {}
+        self.inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "rpc_requests": 0}
+        # Whether multicall_address has code; None until checked.
+        self.multicall_deployed = None
+
+    def block_number(self):
+        """The head block, asked of the node at most once per head_ttl across threads."""
+        with self.head_lock:
+            if self.head is None or time.monotonic() - self.head[1] >= self.head_ttl:
+                self.stats["rpc_requests"] += 1
+                self.head = (int(self.client.call("eth_blockNumber"), 16), time.monotonic())
+            return self.head[0]
+
+    def read(self, calls, block=None):
+        """
+        Read view calls [(method, args), ...] at `block` (default: the head).
+        Returns (block, {(method, args): value}); reverted calls read None.
+        """
+        block = self.block_number() if block is None else block
+        values, waiting, mine = {}, {}, []
+        with self.lock:
+            head = self.head[0] if self.head else None
+            if block != self.cache_block and block == head:
+                # A new head, or a reorg back: nothing cached is at this block.
+                # A request still on the previous head reads without the cache.
+                self.cache, self.cache_block = {}, block
+            elif len(self.cache) >= self.max_cached:
+                self.cache = {}
+            for call in dict.fromkeys(calls):
+                key = (block, *call)
+                if key in self.cache:
+                    values[call] = self.cache[key]
+                    self.stats["hits"] += 1
+                elif key in self.inflight:
+                    waiting[call] = self.inflight[key]
+                    self.stats["coalesced"] += 1
+                else:
+                    future = self.inflight[key] = Future()
+                    mine.append((call, future))
+                    self.stats["misses"] += 1
+
+        try:
+            fetched = self._fetch([call for call, _ in mine], block)
+        except Exception as exc:
+            with self.lock:
+                for call, future in mine:
+                    del self.inflight[(block, *call)]
+                    future.set_exception(exc)
+            raise
+        with self.lock:
+            for (call, future), value in zip(mine, fetched):
+                del self.inflight[(block, *call)]
+                if block == self.cache_block:
+                    self.cache[(block, *call)] = value
+                future.set_result(value)
+                values[call] = value
+        for call, future in waiting.items():
+            values[call] = future.result()
+        return block, values
+
+    def _use_multicall(self, block):
+        if self.multicall_address and self.multicall_deployed is None:
+            self.stats["rpc_requests"] += 1
+            code = self.client.call("eth_getCode", self.multicall_address, hex(block))
+            self.multicall_deployed = code not in (None, "0x", "0x0")
+            if not self.multicall_deployed:
+                logger.warning("No contract at MULTICALL_ADDRESS %s; reading with JSON-RPC batches.",
+                               self.multicall_address)
+        return bool(self.multicall_address) and self.multicall_deployed
+
+    def _fetch(self, calls, block):
+        values = []
+        aggregate = calls and self._use_multicall(block)
+        for start in range(0, len(calls), self.calls_per_request):
+            chunk = calls[start:start + self.calls_per_request]
+            self.stats["rpc_requests"] += 1
+            values += self._aggregate(chunk, block) if aggregate else self._batch(chunk, block)
+        return values
+
+    def _aggregate(self, calls, block):
+        data = AGGREGATE3 + encode(["(address,bool,bytes)[]"], [
+            [(self.contract_address, True, encode_call(method, args)) for method, args in calls]])
+        result = self.client.call("eth_call", {"to": self.multicall_address, "data": "0x" + data.hex()}, hex(block))
+        try:
+            results, = decode(["(bool,bytes)[]"], bytes.fromhex(result[2:]))
+        except (DecodingError, ValueError) as exc:
+            raise RegistryReadError(f"Unexpected aggregate3 result from {self.multicall_address}: {exc}") from exc
+        return [decode_result(method, data) if success else None
+                for (method, _), (success, data) in zip(calls, results)]
+
+    def _batch(self, calls, block):
+        replies = self.client.batch([
+            ("eth_call", [{"to": self.contract_address, "data": "0x" + encode_call(method, args).hex()}, hex(block)])
+            for method, args in calls])
+        values = []
+        for (method, _), reply in zip(calls, replies):
+            if isinstance(reply, RpcError):
+                if not reply.reverted:
+                    raise reply
+                values.append(None)
+            else:
+                values.append(decode_result(method, bytes.fromhex(reply[2:])))
+        return values
+
+    def patients(self, patients, provider=None):
+        """
+        getPatientRecord, and canProviderAccess for `provider` if given, for
+        each patient; returns (block, rows). A patient with no record has cid None.
+        """
+        calls = [("getPatientRecord", (patient,)) for patient in patients]
+        if provider:
+            calls += [("canProviderAccess", (patient, provider)) for patient in patients]
+        block, values = self.read(calls)
+        return block, [{
+            "wallet_address": patient,
+            "cid": values[("getPatientRecord", (patient,))] or None,
+            "can_access": values[("canProviderAccess", (patient, provider))] if provider else None,
+        } for patient in patients]
+
+
+_reader = None
+_reader_lock = threading.Lock()
+
+
+def get_registry_reader():
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            chain, config = index_settings(), registry_settings()
+            if not chain["CONTRACT_ADDRESS"]:
+                raise RegistryNotConfigured("CHAIN_INDEX['CONTRACT_ADDRESS'] is not set.")
+            _reader = RegistryReader(
+                JsonRpcClient(chain["RPC_URL"]),
+                chain["CONTRACT_ADDRESS"],
+                multicall_address=config["MULTICALL_ADDRESS"],
+                calls_per_request=config["CALLS_PER_REQUEST"],
+                head_ttl=config["HEAD_TTL"],
+                max_cached=config["MAX_CACHED"],
+            )
+        return _reader
+
+
+def reset_registry_reader():
+    global _reader
+    with _reader_lock:
+        _reader = None
@@ -0,0 +1,64 @@
+# Minimal Ethereum JSON-RPC client; the indexer only needs a handful of calls.
+import itertools
+import json
+import urllib.request
+
+
+class RpcError(Exception):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+    @property
+    def reverted(self):
+        # Geth and anvil use code 3 for a revert; some nodes only say so in the message.
+        return self.code == 3 or "revert" in str(self)
+
+
+def reply_error(method, error):
+    return RpcError(f"{method} failed: {error.get('message', error)}", error.get("code"))
+
+
+class JsonRpcClient:
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+    def _post(self, payload, label):
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except (OSError, ValueError) as exc:
+            raise RpcError(f"{label} failed: {exc}") from exc
+
+    def call(self, method, *params):
+        reply = self._post({"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": list(params)}, method)
+        if reply.get("error"):
+            raise reply_error(method, reply["error"])
+        return reply.get("result")
+
+    def batch(self, calls):
+        """
+        Send [(method, params), ...] as one JSON-RPC batch request. Returns
+        the results in order, with an RpcError in place of each call that failed.
+        """
+        ids = [next(self._ids) for _ in calls]
+        replies = self._post([{"jsonrpc": "2.0", "id": call_id, "method": method, "params": list(params)}
+                              for call_id, (method, params) in zip(ids, calls)], "batch")
+        if not isinstance(replies, list):
+            # A node that rejects the whole batch answers with one error object.
+            raise reply_error("batch", replies.get("error") or {})
+        by_id = {reply.get("id"): reply for reply in replies}
+        results = []
+        for call_id, (method, _) in zip(ids, calls):
+            reply = by_id.get(call_id)
+            if reply is None:
+                results.append(RpcError(f"{method} failed: no reply in the batch"))
+            elif reply.get("error"):
+                results.append(reply_error(method, reply["error"]))
+            else:
+                results.append(reply.get("result"))
+        return results
@@ -0,0 +1,388 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
+from eth_abi import encode
+from eth_utils import keccak
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from chainindex.devnode import MULTICALL3, RegistryNode, serve
+from chainindex.indexer import ACCESS_CHANGED_TOPIC, PATIENT_ADDED_TOPIC, ChainIndexer
+from chainindex.models import AccessGrant, ChainLog, IndexCursor, PatientRecord
+from chainindex.registry import RegistryReader, reset_registry_reader
+from chainindex.rpc import JsonRpcClient, RpcError
+from emr_api.fields import normalize_address
+from users.models import User
+
+CONTRACT = "0x988acaa10d043bfad8a6506d2119f64244382107"
+PROVIDER = normalize_address("0x" + "a" * 40)
+OTHER_PROVIDER = normalize_address("0x" + "b" * 40)
+PATIENT = normalize_address("0x" + "1" * 40)
+OTHER_PATIENT = normalize_address("0x" + "2" * 40)
+
+
+def address_topic(address):
+    return "0x" + "0" * 24 + address[2:].lower()
+
+
+def access_changed(patient, provider, granted):
+    return {"topics": [ACCESS_CHANGED_TOPIC, address_topic(patient), address_topic(provider)],
+            "data": "0x" + encode(["bool"], [granted]).hex()}
+
+
+def patient_added(patient, cid):
+    return {"topics": [PATIENT_ADDED_TOPIC, address_topic(patient)],
+            "data": "0x" + encode(["string"], [cid]).hex()}
+
+
+class FakeNode:
+    """
+    In-process stand-in for an Ethereum node: a list of blocks, each with
+    PatientRegistry logs, answering the JSON-RPC calls the indexer makes.
+    """
+    def __init__(self):
+        self.blocks = []
+        self.forks = 0
+        self.calls = []
+        self.mine()  # genesis
+
+    def mine(self, *logs):
+        number = len(self.blocks)
+        block_hash = "0x" + keccak(text=f"{number}:{self.forks}:{len(logs)}").hex()
+        self.blocks.append({"hash": block_hash, "logs": [
+            {**log, "address": CONTRACT, "blockNumber": hex(number), "blockHash": block_hash,
+             "logIndex": hex(index), "removed": False}
+            for index, log in enumerate(logs)
+        ]})
+        return number
+
+    def reorg(self, depth):
+        """Drop the last `depth` blocks so different ones can be mined in their place."""
+        self.forks += 1
+        del self.blocks[-depth:]
+
+    def call(self, method, *params):
+        self.calls.append(method)
+        if method == "eth_blockNumber":
+            return hex(len(self.blocks) - 1)
+        if method == "eth_getBlockByNumber":
+            number = int(params[0], 16)
+            if number >= len(self.blocks):
+                return None
+            return {"number": params[0], "hash": self.blocks[number]["hash"]}
+        if method == "eth_getLogs":
+            query = params[0]
+            topics = set(query["topics"][0])
+            return [
+                log
+                for block in self.blocks[int(query["fromBlock"], 16):int(query["toBlock"], 16) + 1]
+                for log in block["logs"]
+                if log["address"] == query["address"] and log["topics"][0] in topics
+            ]
+        raise RpcError(f"{method} not supported")
+
+
+class ChainIndexerTests(TestCase):
+    def setUp(self):
+        self.node = FakeNode()
+        self.indexer = ChainIndexer(self.node, CONTRACT, batch_blocks=3)
+
+    def grants(self):
+        return set(AccessGrant.objects.values_list("provider_wallet_address", "patient_wallet_address"))
+
+    def test_indexes_grants_revocations_and_records(self):
+        """
+        Test that grants and revocations leave only current access, and PatientAdded sets the CID.
+        """
+        self.node.mine(patient_added(PATIENT, "cid-1"), access_changed(PATIENT, PROVIDER, True))
+        self.node.mine(access_changed(PATIENT, OTHER_PROVIDER, True))
+        self.node.mine(access_changed(PATIENT, OTHER_PROVIDER, False))
+        self.node.mine(patient_added(OTHER_PATIENT, "cid-2"), access_changed(OTHER_PATIENT, PROVIDER, True))
+
+        summary = self.indexer.sync()
+
+        self.assertEqual(summary["block_number"], 4)
+        self.assertEqual(summary["logs"], 6)
+        self.assertEqual(self.grants(), {(PROVIDER, PATIENT), (PROVIDER, OTHER_PATIENT)})
+        self.assertEqual(PatientRecord.objects.get(patient_wallet_address=PATIENT).cid, "cid-1")
+
+    def test_follows_new_blocks_incrementally(self):
+        """
+        Test that a second sync only asks the node for blocks after the cursor.
+        """
+        self.node.mine(access_changed(PATIENT, PROVIDER, True))
+        self.indexer.sync()
+        self.node.mine(access_changed(OTHER_PATIENT, PROVIDER, True))
+        self.node.calls.clear()
+
+        summary = self.indexer.sync()
+
+        self.assertEqual(summary["batches"], 1)
+        self.assertEqual(summary["logs"], 1)
+        self.assertEqual(self.node.calls.count("eth_getLogs"), 1)
+        self.assertEqual(ChainLog.objects.count(), 2)
+
+    def test_reorg_rolls_back_orphaned_logs(self):
+        """
+        Test that replacing indexed blocks undoes their grants and indexes the new ones.
+        """
+        self.node.mine(access_changed(PATIENT, PROVIDER, True))
+        self.node.mine(access_changed(PATIENT, PROVIDER, False))
+        self.node.mine(access_changed(OTHER_PATIENT, PROVIDER, True))
+        self.indexer.sync()
+        self.assertEqual(self.grants(), {(PROVIDER, OTHER_PATIENT)})
+
+        # Blocks 2 and 3 are replaced: the revocation and the second grant never happened.
+        self.node.reorg(2)
+        self.node.mine()
+        self.node.mine(access_changed(PATIENT, OTHER_PROVIDER, True))
+        self.node.mine()
+        with self.assertLogs("chainindex.indexer", "WARNING"):
+            summary = self.indexer.sync()
+
+        self.assertEqual(summary["reorged_to"], 1)
+        self.assertEqual(self.grants(), {(PROVIDER, PATIENT), (OTHER_PROVIDER, PATIENT)})
+        cursor = IndexCursor.objects.get(contract_address=CONTRACT)
+        self.assertEqual(cursor.block_hash, self.node.blocks[-1]["hash"])
+
+    def test_confirmations_hold_back_recent_blocks(self):
+        """
+        Test that blocks within CONFIRMATIONS of the head are not indexed yet.
+        """
+        self.node.mine(access_changed(PATIENT, PROVIDER, True))
+        self.node.mine()
+        indexer = ChainIndexer(self.node, CONTRACT, confirmations=2)
+
+        self.assertEqual(indexer.sync()["block_number"], 0)
+        self.node.mine()
+        indexer.sync()
+        self.assertEqual(self.grants(), {(PROVIDER, PATIENT)})
+
+
+class JsonRpcClientTests(TestCase):
+    def setUp(self):
+        node = self.node = FakeNode()
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                try:
+                    reply = {"result": node.call(request["method"], *request["params"])}
+                except RpcError as exc:
+                    reply = {"error": {"code": -32601, "message": str(exc)}}
+                body = json.dumps({"jsonrpc": "2.0", "id": request["id"], **reply}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = JsonRpcClient(f"http://127.0.0.1:{self.server.server_port}")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_indexes_over_http(self):
+        """
+        Test that the indexer works through the JSON-RPC client and surfaces node errors.
+        """
+        self.node.mine(access_changed(PATIENT, PROVIDER, True))
+        ChainIndexer(self.client, CONTRACT).sync()
+
+        self.assertEqual(AccessGrant.objects.count(), 1)
+        with self.assertRaises(RpcError):
+            self.client.call("eth_unknown")
+
+
+@override_settings(CHAIN_INDEX={"CONTRACT_ADDRESS": CONTRACT})
+class AccessiblePatientsViewTests(TestCase):
+    def setUp(self):
+        node = FakeNode()
+        node.mine(patient_added(PATIENT, "cid-1"), access_changed(PATIENT, PROVIDER, True))
+        node.mine(access_changed(OTHER_PATIENT, PROVIDER, True), access_changed(PATIENT, OTHER_PROVIDER, True))
+        ChainIndexer(node, CONTRACT).sync()
+
+        user = User.objects.create(wallet_address=PROVIDER, role="provider")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+    def test_lists_accessible_patients(self):
+        """
+        Test that the provider's patients come back with their CIDs from the index.
+        """
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/chain/accessible_patients/", {"provider": PROVIDER.upper().replace("0X", "0x")})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["indexed_block"], 2)
+        self.assertEqual(response.data["patients"], [
+            {"wallet_address": PATIENT, "cid": "cid-1", "granted_block": 1},
+            {"wallet_address": OTHER_PATIENT, "cid": None, "granted_block": 2},
+        ])
+
+    def test_defaults_to_the_caller(self):
+        """
+        Test that without ?provider= the caller's own wallet is used.
+        """
+        response = self.client.get("/api/chain/accessible_patients/")
+
+        self.assertEqual(response.data["provider"], PROVIDER)
+        self.assertEqual(len(response.data["patients"]), 2)
+
+
+class RegistryReaderTests(TestCase):
+    def setUp(self):
+        self.node = RegistryNode(CONTRACT)
+        self.node.records[PATIENT.lower()] = "cid-1"
+        self.node.grants.add((PATIENT.lower(), PROVIDER.lower()))
+
+    def reader(self, client=None, multicall=MULTICALL3):
+        return RegistryReader(client or self.node, CONTRACT, multicall, calls_per_request=3, head_ttl=0)
+
+    def expected(self, block=1, cid="cid-1"):
+        return block, [
+            {"wallet_address": PATIENT, "cid": cid, "can_access": True},
+            {"wallet_address": OTHER_PATIENT, "cid": None, "can_access": False},
+        ]
+
+    def test_reads_through_multicall_and_json_rpc_batches(self):
+        """
+        Test that both transports read every call at one block in chunks of calls_per_request.
+        """
+        for multicall, probes in [(MULTICALL3, 1), (None, 0)]:
+            self.node.requests = self.node.eth_calls = 0
+            self.assertEqual(self.reader(multicall=multicall).patients([PATIENT, OTHER_PATIENT], PROVIDER),
+                             self.expected())
+            # eth_blockNumber, eth_getCode for the multicall, then four calls in two requests.
+            self.assertEqual(self.node.requests, 3 + probes)
+            self.assertEqual(self.node.eth_calls, 4)
+
+    def test_missing_multicall_falls_back_to_batches(self):
+        """
+        Test that a multicall address without code is checked once and then read around with batches.
+        """
+        self.node.multicall_address = None
+        reader = self.reader()
+        with self.assertLogs("chainindex.registry", "WARNING"):
+            self.assertEqual(reader.patients([PATIENT, OTHER_PATIENT], PROVIDER), self.expected())
+        self.assertIs(reader.multicall_deployed, False)
+
+        self.node.requests = 0
+        self.node.block_number = 2
+        self.assertEqual(reader.patients([PATIENT, OTHER_PATIENT], PROVIDER), self.expected(2))
+        self.assertEqual(self.node.requests, 3)
+
+    def test_results_are_cached_until_the_next_block(self):
+        """
+        Test that a repeated read only asks for the head, and a new block reads afresh.
+        """
+        reader = self.reader()
+        reader.patients([PATIENT, OTHER_PATIENT], PROVIDER)
+        self.node.records[PATIENT.lower()] = "cid-2"
+        self.assertEqual(reader.patients([PATIENT, OTHER_PATIENT], PROVIDER), self.expected())
+        self.assertEqual(self.node.eth_calls, 4)
+
+        self.node.block_number = 2
+        self.assertEqual(reader.patients([PATIENT, OTHER_PATIENT], PROVIDER), self.expected(2, "cid-2"))
+        self.assertEqual(self.node.eth_calls, 8)
+
+    def test_concurrent_identical_reads_are_coalesced(self):
+        """
+        Test that readers asking for calls already in flight wait for them instead of calling again.
+        """
+        reader = self.reader()
+        self.node.gate = threading.Event()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(reader.patients([PATIENT], PROVIDER)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while reader.stats["coalesced"] < 6 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.node.gate.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(reader.stats["coalesced"], 6)
+        self.assertEqual(self.node.eth_calls, 2)
+        self.assertEqual(results, [(1, [{"wallet_address": PATIENT, "cid": "cid-1", "can_access": True}])] * 4)
+
+    def test_reads_over_http(self):
+        """
+        Test that both transports work through the JSON-RPC client against a served node.
+        """
+        server = serve(self.node)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = JsonRpcClient(server.url)
+        for multicall in [MULTICALL3, None]:
+            self.assertEqual(self.reader(client, multicall).patients([PATIENT, OTHER_PATIENT], PROVIDER),
+                             self.expected())
+        self.assertIsInstance(client.batch([("eth_unknown", [])])[0], RpcError)
+
+
+class RegistryPatientsViewTests(TestCase):
+    def setUp(self):
+        self.node = node = RegistryNode(CONTRACT)
+        node.records[PATIENT.lower()] = "cid-1"
+        self.server = serve(node)
+        self.override = override_settings(CHAIN_INDEX={"RPC_URL": self.server.url, "CONTRACT_ADDRESS": CONTRACT})
+        self.override.enable()
+        reset_registry_reader()
+
+        user = User.objects.create(wallet_address=PROVIDER, role="provider")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+    def tearDown(self):
+        reset_registry_reader()
+        self.override.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reads_patients_on_chain(self):
+        """
+        Test that records and access come back in request order with the block they were read at.
+        """
+        response = self.client.post("/api/chain/registry/patients/",
+                                    {"patients": [OTHER_PATIENT, PATIENT.lower()], "provider": PROVIDER},
+                                    format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["block_number"], 1)
+        self.assertEqual(response.data["patients"], [
+            {"wallet_address": OTHER_PATIENT, "cid": None, "can_access": False},
+            {"wallet_address": PATIENT, "cid": "cid-1", "can_access": False},
+        ])
+
+    def test_undecodable_results_are_a_bad_gateway(self):
+        """
+        Test that a multicall answer that doesn't decode is a 502, not a server error.
+        """
+        dispatch = self.node.dispatch
+        self.node.dispatch = lambda method, params: "0x1234" if method == "eth_call" else dispatch(method, params)
+        with override_settings(REGISTRY_READS={"MULTICALL_ADDRESS": MULTICALL3}):
+            reset_registry_reader()
+            response = self.client.post("/api/chain/registry/patients/", {"patients": [PATIENT]}, format="json")
+
+        self.assertEqual(response.status_code, 502)
+        self.assertIn("aggregate3", response.data["error"])
+
+    def test_rejects_invalid_addresses(self):
+        """
+        Test that a malformed address is a 400 before anything is sent to the node.
+        """
+        response = self.client.post("/api/chain/registry/patients/", {"patients": [PATIENT, "0x123"]},
+                                    format="json")
+
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import AccessiblePatientsView, RegistryPatientsView
+
+urlpatterns = [
+    path('accessible_patients/', AccessiblePatientsView.as_view(), name='accessible-patients'),
+    path('registry/patients/', RegistryPatientsView.as_view(), name='registry-patients'),
+]
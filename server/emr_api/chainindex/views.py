@@ -0,0 +1,81 @@
+from django.db.models import OuterRef, Subquery
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from emr_api.fields import normalize_address
+
+from .indexer import index_settings
+from .models import AccessGrant, IndexCursor, PatientRecord
+from .registry import RegistryNotConfigured, RegistryReadError, get_registry_reader
+from .rpc import RpcError
+
+MAX_REGISTRY_PATIENTS = 1000
+
+
+class AccessiblePatientsView(APIView):
+    """
+    Patients the provider (default: the caller) currently has access to,
+    from the local chain index rather than one canProviderAccess call per
+    patient. indexed_block says how far the index has caught up.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        provider = request.query_params.get("provider") or getattr(request.user, "wallet_address", None)
+        if not provider:
+            return Response({"error": "provider is required."}, status=400)
+        try:
+            provider = normalize_address(provider)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+
+        cid = PatientRecord.objects.filter(patient_wallet_address=OuterRef("patient_wallet_address")).values("cid")[:1]
+        patients = (AccessGrant.objects.filter(provider_wallet_address=provider)
+                    .annotate(cid=Subquery(cid))
+                    .order_by("patient_wallet_address")
+                    .values("patient_wallet_address", "cid", "block_number"))
+
+        contract = (index_settings()["CONTRACT_ADDRESS"] or "").lower()
+        cursor = (IndexCursor.objects.filter(contract_address=contract).values_list("block_number", flat=True).first()
+                  if contract else None)
+        return Response({
+            "provider": provider,
+            "indexed_block": cursor,
+            "patients": [
+                {"wallet_address": row["patient_wallet_address"], "cid": row["cid"], "granted_block": row["block_number"]}
+                for row in patients
+            ],
+        })
+
+
+class RegistryPatientsView(APIView):
+    """
+    POST {"patients": [...], "provider": optional}: each patient's CID from
+    getPatientRecord, and canProviderAccess for the provider if one is
+    given, read on-chain at one block in as few node round trips as possible
+    (see chainindex/registry.py). Returns {"block_number", "patients":
+    [{"wallet_address", "cid", "can_access"}...]} in request order.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        patients = request.data.get("patients")
+        if not isinstance(patients, list) or not patients:
+            return Response({"error": "patients must be a non-empty list."}, status=400)
+        if len(patients) > MAX_REGISTRY_PATIENTS:
+            return Response({"error": f"At most {MAX_REGISTRY_PATIENTS} patients per request."}, status=400)
+        try:
+            patients = [normalize_address(patient) for patient in patients]
+            provider = request.data.get("provider")
+            provider = normalize_address(provider) if provider else None
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+
+        try:
+            block, rows = get_registry_reader().patients(patients, provider)
+        except RegistryNotConfigured as exc:
+            return Response({"error": str(exc)}, status=503)
+        except (RpcError, RegistryReadError) as exc:
+            return Response({"error": str(exc)}, status=502)
+        return Response({"block_number": block, "patients": rows})
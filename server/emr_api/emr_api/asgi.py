@@ -9,8 +9,27 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emr_api.settings')
 
-application = get_asgi_application()
+# Responses on these paths stay open for as long as the client listens.
+LONG_LIVED_PATHS = ("/api/async/events/stream/",)
+
+
+class EMRASGIHandler(ASGIHandler):
+    """
+    Django runs every request in its own ThreadSensitiveContext, and the
+    thread behind it lives until the response ends: one idle OS thread per
+    open event stream. Those requests skip the context, so the few sync
+    calls they make (request signals) share asgiref's single sync thread.
+    """
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(LONG_LIVED_PATHS):
+            return await self.handle(scope, receive, send)
+        return await super().__call__(scope, receive, send)
+
+
+django.setup(set_prefix=False)
+application = EMRASGIHandler()
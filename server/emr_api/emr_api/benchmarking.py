@@ -0,0 +1,188 @@
+# Helpers shared by the bench_* management commands. Benchmarks always run
+# against a throwaway test database so they never touch db.sqlite3.
+import contextlib
+import json
+import os
+import socketserver
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+@contextlib.contextmanager
+def benchmark_database(keepdb=False, on_disk=False):
+    """
+    Create a test database for the duration of the block. SQLite test
+    databases are in-memory by default; on_disk=True puts it in a temporary
+    file instead so write locking behaves like production.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    if on_disk and connection.vendor == "sqlite":
+        tmpdir = tempfile.mkdtemp(prefix="emr-bench-")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def access_token_for(user):
+    refresh = RefreshToken.for_user(user)
+    refresh['wallet_address'] = user.wallet_address
+    refresh['role'] = user.role
+    return str(refresh.access_token)
+
+
+def authenticated_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {access_token_for(user)}')
+    return client
+
+
+def summarise(samples):
+    """Reduce a list of latencies (seconds) to milliseconds percentiles."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "count": len(ordered),
+        "total_ms": sum(ordered) * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+class Stopwatch:
+    """Collects wall-clock samples: ``with watch: ...`` records one."""
+
+    def __init__(self):
+        self.samples = []
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self._start)
+        return False
+
+
+def dump(stdout, report):
+    stdout.write(json.dumps(report, indent=2, default=str))
+
+
+EVENT_TYPES = [
+    'record_accessed', 'record_updated', 'access_granted', 'access_revoked',
+    'note_added', 'prescription_added', 'appointment_scheduled',
+]
+
+
+def wallet(n, prefix="a"):
+    return f"0x{prefix}{n:039x}"
+
+
+def seed_events(count, providers=1000, patients=10000, start=None, batch_size=50000, rng=None, details=None,
+                span=None):
+    """
+    Insert `count` synthetic events with raw executemany, bypassing the ORM
+    (and auto_now_add) so timestamps can be spread over the past year, or
+    over `span` (a timedelta) from `start`. details(i, rng) supplies
+    event_details when given.
+    """
+    import datetime
+    import random
+
+    from django.utils import timezone
+    from emr_api.fields import address_to_bytes
+    from events.models import Event
+
+    rng = rng or random.Random(0)
+    span = span or datetime.timedelta(days=365)
+    start = start or timezone.now() - span
+    step = span / max(count, 1)
+    table = Event._meta.db_table
+    sql = (f"INSERT INTO {table} (event_type, event_details, timestamp, "
+           f"related_wallet_address, related_patient_wallet_address) VALUES (%s, %s, %s, %s, %s)")
+    adapt = connection.ops.adapt_datetimefield_value
+    done = 0
+    with connection.cursor() as cursor:
+        while done < count:
+            rows = []
+            for i in range(done, min(done + batch_size, count)):
+                rows.append((
+                    EVENT_TYPES[i % len(EVENT_TYPES)],
+                    details(i, rng) if details else f"synthetic event {i}",
+                    adapt(start + step * i),
+                    address_to_bytes(wallet(rng.randrange(providers), "a")),
+                    address_to_bytes(wallet(rng.randrange(patients), "b")),
+                ))
+            cursor.executemany(sql, rows)
+            done += len(rows)
+    return done
+
+
+def current_rss_bytes():
+    """Resident set size of this process right now (Linux), else the peak."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@contextlib.contextmanager
+def live_server():
+    """Serve the project over HTTP on a free local port from a background thread."""
+    from django.core.wsgi import get_wsgi_application
+
+    server = make_server("127.0.0.1", 0, get_wsgi_application(),
+                         server_class=_ThreadingWSGIServer, handler_class=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def http_json(method, url, payload=None, headers=None, timeout=30):
+    """Minimal JSON-over-HTTP client for benchmarks; returns (status, body)."""
+    body = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=body, method=method,
+                                     headers={"Content-Type": "application/json", **(headers or {})})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as error:
+        return error.code, None
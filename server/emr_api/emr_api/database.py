@@ -0,0 +1,84 @@
+# Database profiles, selected from the environment:
+#
+#   EMR_DB_ENGINE=sqlite (default)
+#       EMR_DB_NAME          path of the database file (default db.sqlite3)
+#       EMR_SQLITE_MMAP_MB   memory-mapped I/O size (default 256)
+#   EMR_DB_ENGINE=postgres
+#       EMR_DB_NAME, EMR_DB_USER, EMR_DB_PASSWORD, EMR_DB_HOST, EMR_DB_PORT
+#       EMR_DB_POOL_MAX      psycopg connection pool size; 0 disables the pool
+#                            and keeps persistent connections instead (default 20)
+#       EMR_DB_POOL_MIN      connections the pool keeps open (default 2)
+#       EMR_DB_CONN_MAX_AGE  persistent connection lifetime without the pool (default 60)
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def sqlite_database(name, mmap_mb=256):
+    """
+    SQLite tuned for concurrent web traffic: WAL lets readers run alongside
+    the single writer, busy_timeout makes writers wait for the lock instead
+    of failing with "database is locked", synchronous=NORMAL is durable
+    under WAL except for the last commits on power loss, and IMMEDIATE
+    transactions take the write lock up front so two writers can't deadlock
+    upgrading from a read lock.
+    """
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        # The only lock wait setting: sqlite3's `timeout` option would be
+        # overridden by this pragma, since init_command runs after connect.
+        "PRAGMA busy_timeout=5000",
+        f"PRAGMA mmap_size={mmap_mb * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-20000",
+    ]
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'OPTIONS': {
+            'init_command': ';'.join(pragmas),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def postgres_database(name, user, password, host, port, pool_min=2, pool_max=20, conn_max_age=60):
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': name,
+        'USER': user,
+        'PASSWORD': password,
+        'HOST': host,
+        'PORT': port,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if pool_max:
+        # psycopg 3 pool; Django requires CONN_MAX_AGE=0 alongside it.
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {'min_size': pool_min, 'max_size': pool_max, 'timeout': 10}
+    else:
+        database['CONN_MAX_AGE'] = conn_max_age
+    return database
+
+
+def database_from_env(base_dir, environ=os.environ):
+    engine = environ.get('EMR_DB_ENGINE', 'sqlite')
+    if engine == 'sqlite':
+        return sqlite_database(
+            environ.get('EMR_DB_NAME') or base_dir / 'db.sqlite3',
+            mmap_mb=int(environ.get('EMR_SQLITE_MMAP_MB', 256)),
+        )
+    if engine in ('postgres', 'postgresql'):
+        return postgres_database(
+            environ.get('EMR_DB_NAME', 'emr'),
+            environ.get('EMR_DB_USER', 'emr'),
+            environ.get('EMR_DB_PASSWORD', ''),
+            environ.get('EMR_DB_HOST', 'localhost'),
+            environ.get('EMR_DB_PORT', '5432'),
+            pool_min=int(environ.get('EMR_DB_POOL_MIN', 2)),
+            pool_max=int(environ.get('EMR_DB_POOL_MAX', 20)),
+            conn_max_age=int(environ.get('EMR_DB_CONN_MAX_AGE', 60)),
+        )
+    raise ImproperlyConfigured(f"Unknown EMR_DB_ENGINE {engine!r}; use 'sqlite' or 'postgres'.")
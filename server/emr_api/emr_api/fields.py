@@ -0,0 +1,193 @@
+# Wallet addresses as 20 raw bytes. A 42-character "0x..." string doubles
+# the width of every index that holds one, and case differences between
+# code paths ("0xAbC..." vs "0xabc...") made equality lookups miss. Binary
+# storage has a single form per address; Python code only ever sees the
+# EIP-55 checksum string.
+import re
+from functools import lru_cache
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models
+from django.db.models.query_utils import DeferredAttribute
+from eth_hash.auto import keccak
+
+ADDRESS_BYTES = 20
+
+_HEX_ADDRESS = re.compile(r"0x[0-9a-fA-F]{40}")
+
+
+def _checksum(digits):
+    # EIP-55: uppercase each letter whose nibble in keccak(lowercase hex) is >= 8.
+    # Done by hand because eth_utils.to_checksum_address re-validates its
+    # input and costs several times the hash itself.
+    digest = keccak(digits.encode()).hex()
+    return "0x" + "".join(c.upper() if d in "89abcdef" else c for c, d in zip(digits, digest))
+
+
+def normalize_address(value):
+    """EIP-55 checksum form of `value`; raises ValueError for anything else.
+
+    All-lowercase and all-uppercase hex is accepted; mixed case must carry a
+    valid checksum, which catches most typos.
+    """
+    if not isinstance(value, str):
+        raise ValueError("Invalid wallet address.")
+    return _normalize(value)
+
+
+# Addresses repeat heavily (every event names a provider and a patient), so
+# the hash is paid once per distinct address rather than once per row.
+@lru_cache(maxsize=65536)
+def _normalize(value):
+    if not _HEX_ADDRESS.fullmatch(value):
+        raise ValueError("Invalid wallet address.")
+    digits = value[2:]
+    checksummed = _checksum(digits.lower())
+    if digits != digits.lower() and digits != digits.upper() and value != checksummed:
+        raise ValueError("Wallet address checksum does not match.")
+    return checksummed
+
+
+@lru_cache(maxsize=65536)
+def address_from_bytes(value):
+    """Checksum string for 20 raw address bytes."""
+    if len(value) != ADDRESS_BYTES:
+        raise ValueError(f"A wallet address is {ADDRESS_BYTES} bytes, got {len(value)}.")
+    return _checksum(value.hex())
+
+
+def address_to_bytes(value):
+    """20 raw bytes for an address in any accepted form; raises ValueError."""
+    return bytes.fromhex(normalize_address(value)[2:])
+
+
+class WalletAddressDescriptor(DeferredAttribute):
+    # Normalise on assignment, so User(wallet_address="0xabc...") holds the
+    # same string it will read back from the database. Invalid values are
+    # kept as they are and rejected when the row is saved.
+    def __set__(self, instance, value):
+        if isinstance(value, str):
+            try:
+                value = normalize_address(value)
+            except ValueError:
+                pass
+        instance.__dict__[self.field.attname] = value
+
+
+class WalletAddressField(models.Field):
+    """
+    An Ethereum address stored as 20 bytes (BLOB on SQLite, bytea on
+    PostgreSQL). Accepts an address in any case, or raw bytes, and always
+    returns its EIP-55 checksum string. Lookups with a malformed address
+    raise ValidationError, as UUIDField does, so normalise user input first.
+    """
+    description = "Ethereum wallet address"
+    descriptor_class = WalletAddressDescriptor
+    default_error_messages = {
+        "invalid": "“%(value)s” is not a valid wallet address.",
+    }
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return address_from_bytes(bytes(value))
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        try:
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                return address_from_bytes(bytes(value))
+            return normalize_address(value)
+        except ValueError:
+            raise ValidationError(self.error_messages["invalid"], code="invalid", params={"value": value})
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return bytes.fromhex(self.to_python(value)[2:])
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is not None:
+            return connection.Database.Binary(value)
+        return value
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": forms.CharField, "max_length": 42, **kwargs})
+
+
+def _to_binary(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        if len(value) == ADDRESS_BYTES:
+            return value
+        value = value.decode("ascii")
+    return address_to_bytes(value)
+
+
+def _rewrite_column(cursor, table, column, key, convert, batch_size):
+    # Walk the table in key order a batch at a time, so a 10M-row table is
+    # never held in memory at once.
+    last = None
+    while True:
+        after = f"AND {key} > %s " if last is not None else ""
+        cursor.execute(f"SELECT {key}, {column} FROM {table} WHERE {column} IS NOT NULL {after}"
+                       f"ORDER BY {key} LIMIT %s", ([last] if last is not None else []) + [batch_size])
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        updates = []
+        for pk, value in rows:
+            try:
+                updates.append((convert(value), pk))
+            except (ValueError, UnicodeDecodeError):
+                raise ValueError(f"{table}.{column} of row {pk!r} is not a wallet address: {value!r}. "
+                                 f"Fix or delete the row and migrate again.")
+        try:
+            cursor.executemany(f"UPDATE {table} SET {column} = %s WHERE {key} = %s", updates)
+        except IntegrityError:
+            raise ValueError(f"{table}.{column} holds the same address in different cases. "
+                             f"Merge those rows and migrate again.")
+        last = rows[-1][0]
+
+
+def convert_address_columns(table, columns, key="id", batch_size=10000):
+    """
+    RunPython operation to go after AlterField(..., WalletAddressField()) on
+    `columns` of `table`. The altered columns still hold the old "0x..."
+    text (or its bytes, on PostgreSQL); this rewrites them as 20 bytes.
+    Reversing it writes checksum strings back (SQLite only, where the
+    reversed AlterField copies them over as text).
+    """
+    from django.db import migrations
+    from django.db.migrations.exceptions import IrreversibleError
+
+    def forward(apps, schema_editor):
+        connection = schema_editor.connection
+        with connection.cursor() as cursor:
+            for column in columns:
+                if connection.vendor == "postgresql":
+                    cursor.execute(f"UPDATE {table} SET {column} = decode(substr(convert_from({column}, 'UTF8'), 3), "
+                                   f"'hex') WHERE length({column}) = 42")
+                else:
+                    _rewrite_column(cursor, table, column, key, _to_binary, batch_size)
+
+    def backward(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != "sqlite":
+            raise IrreversibleError(f"Converting {table} back to text addresses is only supported on SQLite.")
+        with connection.cursor() as cursor:
+            for column in columns:
+                _rewrite_column(cursor, table, column, key, lambda value: address_from_bytes(bytes(value)),
+                                batch_size)
+
+    return migrations.RunPython(forward, backward)
@@ -0,0 +1,228 @@
+# In-process request metrics, exposed in the Prometheus text format by
+# emr_api.views.metrics_view.
+#
+# The middleware opens a RequestStats for each request in a context
+# variable; code on the request path adds to it through timed() and the
+# query wrapper installed on every database connection. Context variables
+# follow sync_to_async, so the async views are measured the same way.
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time", "timings")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.timings = {}
+
+
+_current = contextvars.ContextVar("emr_request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+@contextmanager
+def request_stats():
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's `name` timing."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[name] = stats.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - start
+
+
+def _add_query_wrapper(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install_query_wrapper():
+    """Count queries on every connection, including ones this thread already opened."""
+    connection_created.connect(_add_query_wrapper, dispatch_uid="emr_api.instrumentation")
+    for connection in connections.all(initialized_only=True):
+        _add_query_wrapper(connection)
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def totals(self):
+        """{labels: (observations, sum)} for every series."""
+        with self.lock:
+            return {labels: (sum(counts), total) for labels, (counts, total) in self.series.items()}
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        for labels, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket = _labels(self.label_names, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, value, *labels):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + value
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            series = sorted(self.series.items())
+        for labels, value in series:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Gauge:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.series[labels] = value
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        with self.lock:
+            series = sorted(self.series.items())
+        for labels, value in series:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+REQUEST_DURATION = Histogram(
+    "emr_http_request_duration_seconds", "Time spent handling a request.", ("view", "method", "status"))
+DB_QUERIES = Histogram(
+    "emr_db_queries_per_request", "Database queries made by one request.", ("view",), QUERY_COUNT_BUCKETS)
+DB_TIME = Counter(
+    "emr_db_query_seconds_total", "Time spent in database queries.", ("view",))
+AUTH_DURATION = Histogram(
+    "emr_auth_duration_seconds", "Time spent authenticating a request.", ("view",))
+RENDER_DURATION = Histogram(
+    "emr_render_duration_seconds", "Time spent serialising a response body.", ("view",))
+PROFILES = Counter(
+    "emr_profiles_written_total", "Slow-request profiles written to disk.", ("view",))
+RESPONSE_CACHE = Counter(
+    "emr_response_cache_total", "Conditional GET outcomes (hit, miss, not_modified).", ("view", "result"))
+# Fed by users.verification.SignatureVerifier.
+SIGNATURE_DURATION = Histogram(
+    "emr_signature_verification_seconds", "Time a login waited for signature recovery.", ("outcome",))
+SIGNATURE_PENDING = Gauge(
+    "emr_signature_verifications_pending", "Signature verifications running or queued.", ())
+SIGNATURE_REJECTED = Counter(
+    "emr_signature_verifications_rejected_total", "Logins turned away with MAX_PENDING verifications pending.", ())
+
+METRICS = [REQUEST_DURATION, DB_QUERIES, DB_TIME, AUTH_DURATION, RENDER_DURATION, PROFILES, RESPONSE_CACHE,
+           SIGNATURE_DURATION, SIGNATURE_PENDING, SIGNATURE_REJECTED]
+
+
+def record_request(view, method, status, duration, stats):
+    REQUEST_DURATION.observe(duration, view, method, f"{status // 100}xx")
+    DB_QUERIES.observe(stats.queries, view)
+    if stats.query_time:
+        DB_TIME.inc(stats.query_time, view)
+    if "auth" in stats.timings:
+        AUTH_DURATION.observe(stats.timings["auth"], view)
+    if "render" in stats.timings:
+        RENDER_DURATION.observe(stats.timings["render"], view)
+
+
+def render_metrics():
+    lines = [line for metric in METRICS for line in metric.collect()]
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    for metric in METRICS:
+        metric.clear()
@@ -0,0 +1,48 @@
+# Non-blocking log output. Request threads only put records on a bounded
+# queue; one background thread formats and writes them, so a slow stdout
+# or log collector never holds up a response. Records are dropped, not
+# waited for, when the queue is full.
+#
+# Message arguments are interpolated on that thread too, after the logging
+# call has returned, so log values rather than objects the caller goes on
+# changing.
+import atexit
+import copy
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueStreamHandler(QueueHandler):
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.running = True
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread (see prepare).
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # QueueHandler.prepare formats the record here, on the request thread:
+        # it interpolates the arguments and renders any traceback. Hand over
+        # msg, args and exc_info untouched instead, for the target to format.
+        return copy.copy(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.running:
+            self.running = False
+            self.listener.stop()
+        self.target.close()
+        super().close()
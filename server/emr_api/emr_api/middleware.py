@@ -0,0 +1,185 @@
+import cProfile
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .instrumentation import PROFILES, current_stats, install_query_wrapper, record_request, request_stats
+
+try:
+    import pyinstrument
+except ImportError:  # optional
+    pyinstrument = None
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+DEFAULT_INSTRUMENTATION = {
+    "ENABLED": True,
+    # Bearer token required by /metrics; None leaves it open.
+    "METRICS_TOKEN": None,
+    # Fraction of (sync) requests run under a profiler...
+    "PROFILE_SAMPLE_RATE": 0.0,
+    # ...whose profile is kept if the request took at least this long.
+    "PROFILE_SLOW_SECONDS": 0.5,
+    "PROFILE_DIR": None,
+    # "cprofile" (.prof, read with pstats/snakeviz) or "pyinstrument" (.html).
+    "PROFILER": "cprofile",
+}
+
+
+DEFAULT_COMPRESSION = {
+    # Bodies smaller than this are sent as they are.
+    "MIN_SIZE": 1024,
+    "BROTLI_QUALITY": 5,
+    "CONTENT_TYPES": ["application/json", "application/x-ndjson", "text/"],
+}
+
+accepts_brotli = re.compile(r"\bbr\b")
+
+
+def instrumentation_settings():
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, "INSTRUMENTATION", {})}
+
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "unmatched"
+
+
+class InstrumentationMiddleware:
+    """
+    Records latency, query count and time, auth time and render time for
+    every request (see emr_api/instrumentation.py), and optionally profiles
+    a sample of requests, keeping the slow ones. Put it first in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = instrumentation_settings()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        install_query_wrapper()
+
+        self.sample_rate = config["PROFILE_SAMPLE_RATE"] if config["PROFILE_DIR"] else 0.0
+        self.slow = config["PROFILE_SLOW_SECONDS"]
+        self.profile_dir = Path(config["PROFILE_DIR"]) if config["PROFILE_DIR"] else None
+        self.profiler = config["PROFILER"]
+        if self.profiler == "pyinstrument" and pyinstrument is None:
+            self.profiler = "cprofile"
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with request_stats() as stats:
+            start = time.perf_counter()
+            if self.sample_rate and random.random() < self.sample_rate:
+                response, profiler = self.profiled(request)
+            else:
+                response, profiler = self.get_response(request), None
+            duration = time.perf_counter() - start
+            view = view_label(request)
+            record_request(view, request.method, response.status_code, duration, stats)
+        if profiler is not None and duration >= self.slow:
+            self.save_profile(profiler, view)
+        return response
+
+    async def __acall__(self, request):
+        with request_stats() as stats:
+            start = time.perf_counter()
+            response = await self.get_response(request)
+            record_request(view_label(request), request.method, response.status_code,
+                           time.perf_counter() - start, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        # Runs last, just before DRF renders the body; the callback runs just after.
+        stats = current_stats()
+        if stats is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                stats.timings["render"] = stats.timings.get("render", 0.0) + time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def profiled(self, request):
+        if self.profiler == "pyinstrument":
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                return self.get_response(request), profiler
+            finally:
+                profiler.stop()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.get_response(request), profiler
+        finally:
+            profiler.disable()
+
+    def save_profile(self, profiler, view):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{datetime.now():%Y%m%dT%H%M%S.%f}-{view.replace(':', '_')}"
+        if self.profiler == "pyinstrument":
+            (self.profile_dir / f"{name}.html").write_text(profiler.output_html())
+        else:
+            profiler.dump_stats(self.profile_dir / f"{name}.prof")
+        PROFILES.inc(1, view)
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that prefers brotli when the client accepts it and the
+    brotli package is installed, leaves small bodies and non-text content
+    types (e.g. IPFS ciphertext) alone, and never touches a response that
+    already has a Content-Encoding, like the gzipped event export.
+    Streaming responses are gzipped as Django does, except event streams:
+    gzip holds small writes back until its buffer fills.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = {**DEFAULT_COMPRESSION, **getattr(settings, "COMPRESSION", {})}
+        self.min_size = config["MIN_SIZE"]
+        self.brotli_quality = config["BROTLI_QUALITY"]
+        self.content_types = tuple(config["CONTENT_TYPES"])
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "")
+        if not content_type.startswith(self.content_types) or content_type.startswith("text/event-stream"):
+            return response
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+        if (brotli is None or response.streaming
+                or not accepts_brotli.search(request.META.get("HTTP_ACCEPT_ENCODING", ""))):
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = "br"
+        return response
@@ -0,0 +1,44 @@
+# Helpers shared by the keyset-paginated list endpoints.
+import base64
+import binascii
+
+
+
+def parse_int_param(value, default, minimum=0, maximum=None):
+    """Parse an integer query parameter, clamping it to [minimum, maximum].
+
+    Returns None when the value is present but not an integer so the caller
+    can answer with a 400.
+    """
+    if value in (None, ""):
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if value < minimum:
+        return None
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
+def encode_cursor(*values):
+    """Pack keyset values into an opaque, URL-safe cursor string."""
+    raw = "|".join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    """Unpack a cursor made by encode_cursor into its `size` string parts.
+
+    Raises ValueError for anything that was not produced by encode_cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError("Malformed cursor.") from exc
+    if len(parts) != size:
+        raise ValueError("Malformed cursor.")
+    return parts
@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from .database import database_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +49,10 @@ INSTALLED_APPS = [
     'users',
     'patients',
     'events',
+    'chainindex',
+    'ipfscache',
+    'benchmarks',
+    'responsecache',
     'corsheaders',
 ]
 
@@ -56,15 +63,184 @@ CORS_ALLOWED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',
+    ),
+    # orjson when installed, DRF's json otherwise (see emr_api/renderers.py).
+    'DEFAULT_RENDERER_CLASSES': (
+        'emr_api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'emr_api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "emr-responses",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+
+# Cached read endpoints, invalidated through per-resource version stamps
+# (see responsecache/decorators.py). Point CACHES at a shared backend when
+# running several workers to share hits between them.
+RESPONSE_CACHE = {
+    "ENABLED": True,
+    "CACHE": "default",
+    "TIMEOUT": 300,
+}
+
+# Cache of users.User rows behind ClaimsJWTAuthentication (see users/authentication.py).
+USER_CACHE = {
+    "MAX_SIZE": 1024,
+    "TTL": 60,
+}
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# Token signing (see users/signing.py). ES256 or EdDSA sign with the first of
+# PRIVATE_KEY_FILES (`manage.py generate_jwt_key`) and publish the public keys
+# at /.well-known/jwks.json; HS256 keeps using SECRET_KEY.
+JWT_KEYS = {
+    "ALGORITHM": os.environ.get("EMR_JWT_ALGORITHM", "HS256"),
+    "PRIVATE_KEY_FILES": [path for path in os.environ.get("EMR_JWT_KEY_FILES", "").split(",") if path],
+    "JWKS_MAX_AGE": 300,
+}
+
+# Where login nonces live between GetNonceView and WalletLoginView (see
+# users/nonces.py). The SQLite file is shared by every worker on the host, so
+# a login can land on a different worker than its nonce request. Across
+# hosts use RedisNonceStore. EMR_NONCE_STORE=local keeps them in process,
+# which only works with a single worker.
+if os.environ.get("EMR_NONCE_STORE") == "local":
+    NONCE_STORE = {
+        "BACKEND": "users.nonces.LocalNonceStore",
+        "OPTIONS": {"max_entries": 100000},
+    }
+else:
+    NONCE_STORE = {
+        "BACKEND": "users.nonces.SQLiteNonceStore",
+        "OPTIONS": {"path": BASE_DIR / 'nonces.sqlite3', "max_entries": 100000},
+    }
+
+# Process pool for WalletLoginView signature recovery (see users/verification.py).
+SIGNATURE_POOL = {
+    "ENABLED": True,
+    "WORKERS": None,
+    "MAX_PENDING": 64,
+    "TIMEOUT": 2.0,
+}
+
+# Write-behind buffer for /api/events/add_events/ (see events/ingest.py).
+EVENT_WRITE_BUFFER = {
+    "ENABLED": False,
+    "MAX_BATCH": 500,
+    "MAX_AGE": 0.5,
+    "CAPACITY": 10000,
+    "SUBMIT_TIMEOUT": 0.05,
+    "SPOOL_PATH": BASE_DIR / 'event_spool.ndjson',
+}
+
+# Hot/archive/file tiers and retention for the audit trail, applied by
+# `manage.py archive_events` (see events/archive.py).
+EVENT_ARCHIVE = {
+    "HOT_DAYS": 90,
+    "FILE_AFTER_DAYS": 365,
+    "PATH": BASE_DIR / 'event_archive',
+    "RETENTION": {},
+}
+
+# Merkle-batched audit log, sealed by `manage.py seal_audit_batches` and
+# checked by `manage.py verify_audit_log` (see events/audit.py).
+EVENT_AUDIT = {
+    "BATCH_SIZE": 1024,
+    "SETTLE_SECONDS": 60,
+}
+
+# Live event push at /api/async/events/stream/ (see events/stream.py).
+EVENT_STREAM = {
+    "QUEUE_SIZE": 256,
+    "POLL_INTERVAL": 1.0,
+    "HEARTBEAT": 15.0,
+    "REPLAY_LIMIT": 1000,
+    "MAX_SUBSCRIBERS": 20000,
+}
+
+# JSON-RPC node and PatientRegistry deployment followed by `manage.py index_chain`
+# (see chainindex/indexer.py).
+CHAIN_INDEX = {
+    "RPC_URL": os.environ.get("EMR_RPC_URL", "http://127.0.0.1:8545"),
+    "CONTRACT_ADDRESS": os.environ.get("EMR_PATIENT_REGISTRY", "0x988acaA10D043bfaD8A6506D2119f64244382107"),
+    "START_BLOCK": int(os.environ.get("EMR_PATIENT_REGISTRY_START_BLOCK", 0)),
+    "BATCH_BLOCKS": 2000,
+    "CONFIRMATIONS": 0,
+    "POLL_INTERVAL": 5.0,
+}
+
+# PatientRegistry view calls proxied through /api/chain/registry/patients/ on
+# CHAIN_INDEX's node (see chainindex/registry.py), as JSON-RPC batches. Set
+# EMR_MULTICALL_ADDRESS (0xcA11bde05977b3631167028862bE2a173976CA11 on
+# mainnet and the testnets) to pack them into Multicall3 calls instead.
+REGISTRY_READS = {
+    "MULTICALL_ADDRESS": os.environ.get("EMR_MULTICALL_ADDRESS") or None,
+    "CALLS_PER_REQUEST": 500,
+    "HEAD_TTL": 1.0,
+}
+
+# Read-through cache for encrypted patient blobs on IPFS (see ipfscache/cache.py).
+IPFS_CACHE = {
+    "GATEWAY_URL": os.environ.get("EMR_IPFS_GATEWAY", "https://gateway.pinata.cloud/ipfs/"),
+    "GATEWAY_TOKEN": os.environ.get("EMR_IPFS_GATEWAY_TOKEN"),
+    "PATH": BASE_DIR / 'ipfs_cache',
+    "MAX_BYTES": 1024 * 1024 * 1024,
+    "MAX_OBJECT_BYTES": 20 * 1024 * 1024,
+    "WORKERS": 8,
+    "TIMEOUT": 10.0,
+}
+
+# Request metrics served at /metrics, and opt-in profiling of slow requests
+# (see emr_api/middleware.py).
+INSTRUMENTATION = {
+    "ENABLED": True,
+    "METRICS_TOKEN": os.environ.get("EMR_METRICS_TOKEN"),
+    "PROFILE_SAMPLE_RATE": float(os.environ.get("EMR_PROFILE_SAMPLE_RATE", 0)),
+    "PROFILE_SLOW_SECONDS": 0.5,
+    "PROFILE_DIR": BASE_DIR / 'profiles',
+    "PROFILER": "cprofile",
+}
+
+# App logs go through a queue to a background writer (see emr_api/log.py).
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "standard": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "handlers": {
+        "queue": {"class": "emr_api.log.QueueStreamHandler", "formatter": "standard"},
+    },
+    "loggers": {
+        app: {"handlers": ["queue"], "level": os.environ.get("EMR_LOG_LEVEL", "INFO"), "propagate": False}
+        for app in ["emr_api", "users", "patients", "events", "chainindex", "ipfscache"]
+    },
+}
+
+# Response compression (see emr_api/middleware.py); brotli is used when installed.
+COMPRESSION = {
+    "MIN_SIZE": 1024,
+    "BROTLI_QUALITY": 5,
+    "CONTENT_TYPES": ["application/json", "application/x-ndjson", "text/"],
+}
+
 MIDDLEWARE = [
+    'emr_api.middleware.InstrumentationMiddleware',
+    'emr_api.middleware.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -100,11 +276,9 @@ AUTH_USER_MODEL = 'users.User'  # Custom user model
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Chosen by EMR_DB_ENGINE and friends, see emr_api/database.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_env(BASE_DIR),
 }
 
 
@@ -0,0 +1,357 @@
+import datetime
+import decimal
+import gzip
+import io
+import logging
+import pstats
+import tempfile
+import threading
+import uuid
+from types import SimpleNamespace
+from pathlib import Path
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.http import HttpResponse
+from django.core.exceptions import ValidationError
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from emr_api.database import database_from_env
+from emr_api.fields import address_to_bytes, convert_address_columns, normalize_address
+from emr_api.instrumentation import reset_metrics
+from emr_api.log import QueueStreamHandler
+from emr_api.middleware import CompressionMiddleware
+from emr_api.pagination import decode_cursor, encode_cursor, parse_int_param
+from emr_api.renderers import ORJSONParser, ORJSONRenderer
+from users.models import User
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    def test_sqlite_profile_is_tuned(self):
+        """
+        Test that the default profile is SQLite with WAL and a busy timeout applied at connect.
+        """
+        database = database_from_env(Path('/srv'), environ={})
+        self.assertEqual(database['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(database['NAME'], Path('/srv/db.sqlite3'))
+        self.assertIn('journal_mode=WAL', database['OPTIONS']['init_command'])
+        self.assertIn('busy_timeout=5000', database['OPTIONS']['init_command'])
+        self.assertEqual(database['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+
+    def test_postgres_profile_pools_connections(self):
+        """
+        Test that the PostgreSQL profile uses the psycopg pool, or persistent connections without it.
+        """
+        pooled = database_from_env(Path('/srv'), environ={'EMR_DB_ENGINE': 'postgres', 'EMR_DB_POOL_MAX': '8'})
+        self.assertEqual(pooled['OPTIONS']['pool']['max_size'], 8)
+        self.assertEqual(pooled['CONN_MAX_AGE'], 0)
+
+        persistent = database_from_env(Path('/srv'), environ={'EMR_DB_ENGINE': 'postgres', 'EMR_DB_POOL_MAX': '0'})
+        self.assertNotIn('pool', persistent['OPTIONS'])
+        self.assertEqual(persistent['CONN_MAX_AGE'], 60)
+
+
+class SQLiteConnectionTests(TestCase):
+    def test_init_command_runs_on_connect(self):
+        """
+        Test that the busy timeout pragma is live on the connection Django opened.
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+
+class WalletAddressFieldTests(TestCase):
+    address = '0xDAD3e36F7E135c67123F4DF53e90472A40cEB01c'
+
+    def test_normalize_address(self):
+        """
+        Test that any case is normalised to the checksum form and malformed addresses are rejected.
+        """
+        self.assertEqual(normalize_address(self.address.lower()), self.address)
+        self.assertEqual(normalize_address('0x' + self.address[2:].upper()), self.address)
+        for invalid in ['0x1234', self.address[:-1] + 'g', self.address.replace('D', 'd', 1), None]:
+            with self.assertRaises(ValueError):
+                normalize_address(invalid)
+
+    def test_stored_as_20_bytes(self):
+        """
+        Test that the column holds raw bytes and reads back as the checksum string.
+        """
+        user = User.objects.create(wallet_address=self.address.lower(), role='patient')
+        self.assertEqual(user.wallet_address, self.address)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT wallet_address FROM users_user WHERE id = %s', [user.id])
+            self.assertEqual(bytes(cursor.fetchone()[0]), address_to_bytes(self.address))
+        self.assertEqual(User.objects.get(id=user.id).wallet_address, self.address)
+
+    def test_lookups_ignore_case(self):
+        """
+        Test that lookups match whatever case the address is given in.
+        """
+        User.objects.create(wallet_address=self.address, role='patient')
+        self.assertTrue(User.objects.filter(wallet_address=self.address.lower()).exists())
+        self.assertTrue(User.objects.filter(wallet_address__in=['0x' + self.address[2:].upper()]).exists())
+
+    def test_invalid_address_raises_validation_error(self):
+        """
+        Test that looking up or saving a malformed address raises ValidationError.
+        """
+        with self.assertRaises(ValidationError):
+            User.objects.filter(wallet_address='0x1234').exists()
+        with self.assertRaises(ValidationError):
+            User.objects.create(wallet_address='not an address', role='patient')
+
+    def test_convert_address_columns(self):
+        """
+        Test that the data migration rewrites text addresses as bytes, and back.
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        user = User.objects.create(wallet_address=self.address, role='patient')
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE users_user SET wallet_address = %s WHERE id = %s', [self.address.lower(), user.id])
+        operation = convert_address_columns('users_user', ['wallet_address'], batch_size=1)
+        schema_editor = SimpleNamespace(connection=connection)
+
+        operation.code(None, schema_editor)
+        self.assertEqual(User.objects.get(id=user.id).wallet_address, self.address)
+
+        operation.reverse_code(None, schema_editor)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT wallet_address FROM users_user WHERE id = %s', [user.id])
+            self.assertEqual(cursor.fetchone()[0], self.address)
+
+
+class PaginationHelperTests(SimpleTestCase):
+    def test_cursor_round_trip(self):
+        """
+        Test that cursors decode to what was encoded and reject tampering.
+        """
+        self.assertEqual(decode_cursor(encode_cursor('2025-01-01T00:00:00', 7), 2), ['2025-01-01T00:00:00', '7'])
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor('a', 'b', 'c'), 2)
+
+    def test_parse_int_param(self):
+        """
+        Test that integer params are defaulted, clamped and validated.
+        """
+        self.assertEqual(parse_int_param(None, 5), 5)
+        self.assertEqual(parse_int_param('50', 5, maximum=10), 10)
+        self.assertIsNone(parse_int_param('-1', 5))
+        self.assertIsNone(parse_int_param('x', 5))
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        reset_metrics()
+        caches['default'].clear()
+        user = User.objects.create(wallet_address='0x' + 'a' * 40, role='provider')
+        self.token = str(RefreshToken.for_user(user).access_token)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def metrics(self):
+        with override_settings(DEBUG=True):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_records_latency_queries_auth_and_render(self):
+        """
+        Test that a request shows up in every per-view metric on /metrics.
+        """
+        self.client.get('/api/events/get_events/', {'related_wallet_address': '0x' + 'a' * 40})
+        metrics = self.metrics()
+
+        self.assertIn('emr_http_request_duration_seconds_count{view="get-events",method="GET",status="2xx"} 1', metrics)
+        # Version stamps, the caller's role (the test token carries no role claim), the page
+        # and the archive catalogue.
+        self.assertIn('emr_db_queries_per_request_bucket{view="get-events",le="3"} 0', metrics)
+        self.assertIn('emr_db_queries_per_request_bucket{view="get-events",le="5"} 1', metrics)
+        self.assertIn('emr_db_query_seconds_total{view="get-events"}', metrics)
+        self.assertIn('emr_auth_duration_seconds_count{view="get-events"} 1', metrics)
+        self.assertIn('emr_render_duration_seconds_count{view="get-events"} 1', metrics)
+
+    def test_async_views_are_measured(self):
+        """
+        Test that queries made through the async ORM are counted against the async view.
+        """
+        async_to_sync(AsyncClient().get)(
+            '/api/async/patients/getPatientCount/', headers={'Authorization': f'Bearer {self.token}'})
+
+        self.assertIn('emr_db_queries_per_request_bucket{view="patients.async_views.GetPatientCountView",le="1"} 1', self.metrics())
+
+    @override_settings(INSTRUMENTATION={'METRICS_TOKEN': 'scrape'})
+    def test_metrics_token(self):
+        """
+        Test that /metrics requires the configured bearer token.
+        """
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_metrics_are_hidden_without_a_token(self):
+        """
+        Test that /metrics is a 404 when no token is configured, unless DEBUG is on.
+        """
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_slow_requests_are_profiled(self):
+        """
+        Test that a sampled request over the threshold leaves a profile on disk.
+        """
+        directory = Path(tempfile.mkdtemp())
+        with override_settings(INSTRUMENTATION={'PROFILE_SAMPLE_RATE': 1.0, 'PROFILE_SLOW_SECONDS': 0,
+                                                'PROFILE_DIR': directory}):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+            client.get('/api/patients/getPatientCount/')
+
+        profile, = directory.glob('*.prof')
+        profiled_files = {filename for filename, line, function in pstats.Stats(str(profile)).stats}
+        self.assertIn(str(Path(settings.BASE_DIR) / 'patients' / 'views.py'), profiled_files)
+
+
+class QueueStreamHandlerTests(SimpleTestCase):
+    def test_writes_from_a_background_thread(self):
+        """
+        Test that records are formatted and written by the listener, and dropped when the queue is full.
+        """
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream, maxsize=10)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        logger = logging.getLogger('emr_api.tests.queue')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+
+        logger.warning('hello %s', 'world')
+        handler.close()
+
+        self.assertEqual(stream.getvalue(), 'WARNING hello world\n')
+        # Nothing drains the queue once closed, so it fills up.
+        for _ in range(11):
+            handler.enqueue(logging.makeLogRecord({}))
+        self.assertEqual(handler.dropped, 1)
+
+    def test_arguments_and_tracebacks_are_formatted_by_the_listener(self):
+        """
+        Test that the calling thread neither interpolates arguments nor renders tracebacks.
+        """
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger = logging.getLogger('emr_api.tests.queue_prepare')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+
+        formatted_on = []
+
+        class Argument:
+            def __str__(self):
+                formatted_on.append(threading.current_thread())
+                return 'arg'
+
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('failed with %s', Argument())
+        handler.close()
+
+        self.assertEqual(len(formatted_on), 1)
+        self.assertIsNot(formatted_on[0], threading.current_thread())
+        self.assertIn('failed with arg\nTraceback', stream.getvalue())
+        self.assertIn('ValueError: boom', stream.getvalue())
+
+
+class ORJSONRendererTests(SimpleTestCase):
+    data = {
+        'timestamp': datetime.datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+        'naive': datetime.datetime(2024, 5, 1, 12, 30),
+        'day': datetime.date(2024, 5, 1),
+        'amount': decimal.Decimal('1.50'),
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'label': gettext_lazy('Patient Added'),
+        'name': 'Zoë',
+        'nested': [{'count': 3, 'ok': True, 'missing': None}],
+    }
+
+    def test_matches_drf_json_renderer(self):
+        """
+        Test that the fast renderer produces the same JSON as DRF's, datetimes included.
+        """
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertIn(b'"2024-05-01T12:30:15.123456Z"', ORJSONRenderer().render(self.data))
+
+    def test_parser_round_trip_and_errors(self):
+        """
+        Test that the parser reads what the renderer writes and rejects malformed JSON with a 400.
+        """
+        body = ORJSONRenderer().render({'events': [{'event_type': 'Patient Added'}]})
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), {'events': [{'event_type': 'Patient Added'}]})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"events": ['))
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"n": NaN}'))
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+    def process(self, response, accept_encoding='gzip, deflate, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def json_response(self, size):
+        return HttpResponse(b'{"events": [' + b'{"event_type": "note_added"},' * size + b'{}]}',
+                            content_type='application/json')
+
+    @patch('emr_api.middleware.brotli', None)
+    def test_gzips_large_json(self):
+        """
+        Test that large JSON bodies are gzipped when brotli is unavailable, with Vary set.
+        """
+        response = self.process(self.json_response(1000))
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(gzip.decompress(response.content).startswith(b'{"events": ['))
+
+    def test_brotli_when_available(self):
+        """
+        Test that brotli is chosen when installed and accepted.
+        """
+        try:
+            import brotli
+        except ImportError:
+            self.skipTest('brotli is not installed')
+        response = self.process(self.json_response(1000))
+
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertTrue(brotli.decompress(response.content).startswith(b'{"events": ['))
+
+    def test_leaves_small_encoded_and_binary_bodies_alone(self):
+        """
+        Test that small bodies, already-encoded bodies and non-text content are passed through.
+        """
+        self.assertFalse(self.process(self.json_response(5)).has_header('Content-Encoding'))
+
+        encoded = self.json_response(1000)
+        encoded['Content-Encoding'] = 'gzip'
+        self.assertEqual(self.process(encoded).content, self.json_response(1000).content)
+
+        binary = HttpResponse(b'\0' * 10000, content_type='application/octet-stream')
+        self.assertFalse(self.process(binary).has_header('Content-Encoding'))
+        self.assertFalse(self.process(self.json_response(1000), accept_encoding='').has_header('Content-Encoding'))
@@ -16,10 +16,20 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from users.views import JwksView
+from .views import metrics_view
 
 urlpatterns = [
     # path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
+    path('.well-known/jwks.json', JwksView.as_view(), name='jwks'),
     path('api/auth/', include('users.urls')),
     path('api/patients/', include('patients.urls')),
     path('api/events/', include('events.urls')),
+    path('api/chain/', include('chainindex.urls')),
+    path('api/ipfs/', include('ipfscache.urls')),
+    # Async variants of the same endpoints, for running under ASGI.
+    path('api/async/auth/', include('users.async_urls')),
+    path('api/async/patients/', include('patients.async_urls')),
+    path('api/async/events/', include('events.async_urls')),
 ]
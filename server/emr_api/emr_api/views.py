@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.http import HttpResponse
+
+from .instrumentation import render_metrics
+from .middleware import instrumentation_settings
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Per-view traffic is not for everyone to see:
+    without a METRICS_TOKEN it only answers when DEBUG is on.
+    """
+    token = instrumentation_settings()["METRICS_TOKEN"]
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=404)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
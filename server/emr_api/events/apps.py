@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # Table rebuilds in later migrations drop the SQLite triggers; put them back.
+    from django.db import connections
+
+    from .search import install_search_index
+    connection = connections[using]
+    if "events_event" in connection.introspection.table_names():
+        install_search_index(connection)
 
 
 class EventsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'events'
+
+    def ready(self):
+        post_migrate.connect(ensure_search_index, sender=self, dispatch_uid="events.search_index")
@@ -0,0 +1,409 @@
+# Tiered storage for the audit trail. Recent events live in events_event;
+# `manage.py archive_events` moves whole months out of it:
+#
+#   hot    events_event, the last HOT_DAYS days.
+#   table  events_archive_YYYYMM, one table per month with the same columns
+#          and indexes, still queried with the ORM.
+#   file   <PATH>/events-YYYY-MM.emrcol.gz, the month in the columnar export
+#          format, gzipped. Scanned in full when a query reaches it.
+#
+# EventArchive is the catalogue of archived months. events.queries.event_page
+# reads the hot table first and only opens an archived month when that
+# month can still contribute rows to the page being built.
+import gzip
+import heapq
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.apps.registry import Apps
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from emr_api.fields import WalletAddressField, normalize_address
+from responsecache.versions import bump
+
+from .export import EXPORT_FIELDS, columnar_stream, gzip_stream, read_columnar
+from .models import Event, EventArchive
+
+DEFAULT_EVENT_ARCHIVE = {
+    # Months that ended more than this many days ago leave events_event.
+    "HOT_DAYS": 90,
+    # Archive tables of months that ended more than this many days ago are
+    # compressed into files. None keeps every archived month as a table.
+    "FILE_AFTER_DAYS": 365,
+    # Directory for the compressed files.
+    "PATH": None,
+    # Days to keep each event_type at all, in every tier; "DEFAULT" covers
+    # the types not listed. A missing entry or None keeps them forever.
+    "RETENTION": {},
+}
+
+TABLE_PREFIX = "events_archive_"
+ADDRESS_FIELDS = ("related_wallet_address", "related_patient_wallet_address")
+
+# Archive models are built on the fly and kept out of the project's app
+# registry, so migrations and admin never see them.
+_archive_apps = Apps()
+_archive_models = {}
+
+
+def archive_settings():
+    return {**DEFAULT_EVENT_ARCHIVE, **getattr(settings, "EVENT_ARCHIVE", {})}
+
+
+def month_start(value):
+    """First instant (UTC) of the month containing a date or datetime."""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc)
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(start):
+    return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def archive_table_model(table):
+    """An unmanaged model for one month's archive table."""
+    model = _archive_models.get(table)
+    if model is None:
+        suffix = table[len(TABLE_PREFIX):]
+        meta = type("Meta", (), {
+            "app_label": "events",
+            "apps": _archive_apps,
+            "db_table": table,
+            "managed": False,
+            # The same keyset indexes as Event, so an archived month pages the same way.
+            "indexes": [
+                models.Index(fields=["related_wallet_address", "timestamp", "id"], name=f"{table}_wts"),
+                models.Index(fields=["related_patient_wallet_address", "timestamp", "id"],
+                             name=f"{table}_pts"),
+                models.Index(fields=["event_type", "timestamp", "id"], name=f"{table}_tts"),
+                models.Index(fields=["timestamp", "id"], name=f"{table}_ts"),
+            ],
+        })
+        model = _archive_models[table] = type(f"ArchivedEvent{suffix}", (models.Model,), {
+            "__module__": __name__,
+            "Meta": meta,
+            "id": models.IntegerField(primary_key=True),
+            "event_type": models.CharField(max_length=50),
+            "event_details": models.TextField(),
+            "timestamp": models.DateTimeField(),
+            "related_wallet_address": WalletAddressField(),
+            "related_patient_wallet_address": WalletAddressField(null=True),
+        })
+    return model
+
+
+def archive_path(month):
+    directory = Path(archive_settings()["PATH"] or Path(settings.BASE_DIR) / "event_archive")
+    return directory / f"events-{month:%Y-%m}.emrcol.gz"
+
+
+def _table_exists(table):
+    with connection.cursor() as cursor:
+        return table in connection.introspection.table_names(cursor)
+
+
+def _create_table(model):
+    # Outside any transaction: SQLite's schema editor refuses to run inside one.
+    if not _table_exists(model._meta.db_table):
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+
+
+def _drop_table(model):
+    if _table_exists(model._meta.db_table):
+        with connection.schema_editor() as editor:
+            editor.delete_model(model)
+
+
+def _adapt(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def _read_file(path):
+    # Files written before addresses were stored as bytes may hold them in any case.
+    with gzip.open(path, "rb") as stream:
+        for row in read_columnar(stream):
+            for field in ADDRESS_FIELDS:
+                if row[field] is not None:
+                    row[field] = normalize_address(row[field])
+            yield row
+
+
+def _write_file(path, rows):
+    """Write rows (dicts) to a compressed columnar file; returns the row count."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+
+    def tuples():
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield tuple(row[field] for field in EXPORT_FIELDS)
+
+    partial = path.with_name(path.name + ".partial")
+    with open(partial, "wb") as out:
+        for chunk in gzip_stream(columnar_stream(tuples())):
+            out.write(chunk)
+    os.replace(partial, path)
+    return count
+
+
+# -- Reads ---------------------------------------------------------------
+
+def _matches(row, filters):
+    # The subset of Event.objects.filter lookups parse_event_filters produces.
+    for lookup, value in filters.items():
+        field, _, operator = lookup.partition("__")
+        actual = row[field]
+        if operator == "":
+            matched = actual == value
+        elif operator == "in":
+            matched = actual in value
+        elif operator == "gte":
+            matched = actual >= value
+        elif operator == "lt":
+            matched = actual < value
+        else:
+            raise ValueError(f"Unsupported archive filter: {lookup}")
+        if not matched:
+            return False
+    return True
+
+
+def _file_page(path, filters, position, limit):
+    rows = (row for row in _read_file(path) if _matches(row, filters))
+    if position is not None:
+        rows = (row for row in rows if (row["timestamp"], row["id"]) < position)
+    return heapq.nlargest(limit + 1, rows, key=lambda row: (row["timestamp"], row["id"]))
+
+
+def relevant_archives(filters, position=None):
+    """Catalogue entries whose month overlaps the filters' time range, newest first."""
+    archives = EventArchive.objects.order_by("-month")
+    since, until = filters.get("timestamp__gte"), filters.get("timestamp__lt")
+    if position is not None and (until is None or position[0] < until):
+        until = position[0] + timedelta(microseconds=1)
+    if since is not None:
+        archives = archives.filter(month__gte=month_start(since).date())
+    if until is not None:
+        archives = archives.filter(month__lt=until.date() if until == month_start(until) else
+                                   next_month(month_start(until)).date())
+    return archives
+
+
+def fan_out(rows, filters, position, limit):
+    """
+    Merge archived months into a page of hot rows (limit + 1 of them at most,
+    newest first). A month is read only while it could still place a row
+    above the page's look-ahead row.
+    """
+    from .queries import page_queryset  # queries imports this module
+
+    for archive in relevant_archives(filters, position):
+        end = next_month(month_start(archive.month))
+        if len(rows) > limit and rows[limit]["timestamp"] >= end:
+            break
+        if archive.tier == EventArchive.TABLE:
+            model = archive_table_model(archive.location)
+            found = list(page_queryset(filters, position, limit, model=model))
+        else:
+            found = _file_page(Path(archive.location), filters, position, limit)
+        rows = heapq.nlargest(limit + 1, rows + found, key=lambda row: (row["timestamp"], row["id"]))
+    return rows
+
+
+def archived_until():
+    """End of the newest archived month, or None; rollups before it are frozen."""
+    newest = EventArchive.objects.order_by("-month").values_list("month", flat=True).first()
+    return next_month(month_start(newest)) if newest else None
+
+
+# -- Moving months down the tiers -----------------------------------------
+
+def archive_month(month):
+    """Move every hot event in `month` into its archive; returns the number moved."""
+    start = month_start(month)
+    end = next_month(start)
+    if not Event.objects.filter(timestamp__gte=start, timestamp__lt=end).exists():
+        return 0
+    table = f"{TABLE_PREFIX}{start:%Y%m}"
+    existing = EventArchive.objects.filter(month=start.date()).first()
+    if existing is not None and existing.tier == EventArchive.FILE:
+        return _archive_into_file(existing, start, end)
+
+    model = archive_table_model(table)
+    _create_table(model)
+    columns = ", ".join(EXPORT_FIELDS)
+    where = "timestamp >= %s AND timestamp < %s"
+    params = [_adapt(start), _adapt(end)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {Event._meta.db_table} "
+                       f"WHERE {where}", params)
+        cursor.execute(f"DELETE FROM {Event._meta.db_table} WHERE {where}", params)
+        moved = cursor.rowcount
+        EventArchive.objects.update_or_create(month=start.date(), defaults={
+            "tier": EventArchive.TABLE, "location": table, "events": model.objects.count()})
+        bump("events")
+    return moved
+
+
+def _archive_into_file(archive, start, end):
+    # A late event for a month that is already compressed: rewrite the file with it.
+    path = Path(archive.location)
+    hot = Event.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    late = list(hot.order_by("id").values(*EXPORT_FIELDS))
+    merged = heapq.merge(_read_file(path), late, key=lambda row: row["id"])
+    with transaction.atomic():
+        count = _write_file(path, merged)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Event._meta.db_table} WHERE timestamp >= %s AND timestamp < %s",
+                           [_adapt(start), _adapt(end)])
+        EventArchive.objects.filter(pk=archive.pk).update(events=count)
+        bump("events")
+    return len(late)
+
+
+def compress_month(archive):
+    """Turn an archive table into a compressed file and drop the table."""
+    model = archive_table_model(archive.location)
+    path = archive_path(archive.month)
+    rows = model.objects.order_by("id").values(*EXPORT_FIELDS).iterator(chunk_size=5000)
+    count = _write_file(path, rows)
+    EventArchive.objects.filter(pk=archive.pk).update(tier=EventArchive.FILE, location=str(path), events=count)
+    bump("events")
+    _drop_table(model)
+    return count
+
+
+# -- Retention ------------------------------------------------------------
+
+def retention_cutoffs(now):
+    """[(event_types, excluded_types, cutoff)]: rows of those types older than cutoff expire."""
+    policy = dict(archive_settings()["RETENTION"])
+    default = policy.pop("DEFAULT", None)
+    cutoffs = [([event_type], None, now - timedelta(days=days))
+               for event_type, days in policy.items() if days is not None]
+    if default is not None:
+        cutoffs.append((None, list(policy), now - timedelta(days=default)))
+    return cutoffs
+
+
+def _expired_sql(cutoffs):
+    clauses, params = [], []
+    for types, excluded, cutoff in cutoffs:
+        if types:
+            clauses.append("(event_type = %s AND timestamp < %s)")
+            params += [types[0], _adapt(cutoff)]
+        elif excluded:
+            marks = ", ".join(["%s"] * len(excluded))
+            clauses.append(f"(event_type NOT IN ({marks}) AND timestamp < %s)")
+            params += [*excluded, _adapt(cutoff)]
+        else:
+            clauses.append("(timestamp < %s)")
+            params.append(_adapt(cutoff))
+    return " OR ".join(clauses), params
+
+
+def _expired_q(cutoffs):
+    # The ORM spelling of _expired_sql, to read rows before they are deleted.
+    query = models.Q(pk__in=[])
+    for types, excluded, cutoff in cutoffs:
+        clause = models.Q(timestamp__lt=cutoff)
+        if types:
+            clause &= models.Q(event_type__in=types)
+        elif excluded:
+            clause &= ~models.Q(event_type__in=excluded)
+        query |= clause
+    return query
+
+
+def _is_expired(row, cutoffs):
+    for types, excluded, cutoff in cutoffs:
+        if row["timestamp"] >= cutoff:
+            continue
+        if types is not None and row["event_type"] in types:
+            return True
+        if types is None and row["event_type"] not in (excluded or ()):
+            return True
+    return False
+
+
+def apply_retention(now=None):
+    """
+    Delete expired events from every tier; returns how many went. Rollups are
+    kept, and so are the audit leaf hashes of sealed events.
+    """
+    from .audit import record_expired  # audit imports this module
+
+    now = now or timezone.now()
+    cutoffs = retention_cutoffs(now)
+    if not cutoffs:
+        return 0
+    oldest_kept = max(cutoff for _, _, cutoff in cutoffs)
+    where, params = _expired_sql(cutoffs)
+    expired = _expired_q(cutoffs)
+    deleted = 0
+    record_expired(Event.objects.filter(expired).values(*EXPORT_FIELDS).iterator(chunk_size=5000))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {Event._meta.db_table} WHERE {where}", params)
+        deleted += cursor.rowcount
+    for archive in EventArchive.objects.filter(month__lt=oldest_kept.date()):
+        if archive.tier == EventArchive.TABLE:
+            model = archive_table_model(archive.location)
+            record_expired(model.objects.filter(expired).values(*EXPORT_FIELDS).iterator(chunk_size=5000))
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {archive.location} WHERE {where}", params)
+                deleted += cursor.rowcount
+            remaining = model.objects.count()
+        else:
+            path = Path(archive.location)
+            if not any(_is_expired(row, cutoffs) for row in _read_file(path)):
+                continue
+            record_expired(row for row in _read_file(path) if _is_expired(row, cutoffs))
+            before = archive.events
+            remaining = _write_file(path, (row for row in _read_file(path) if not _is_expired(row, cutoffs)))
+            deleted += before - remaining
+        if remaining:
+            EventArchive.objects.filter(pk=archive.pk).update(events=remaining)
+        else:
+            # Nothing left of the month: forget it.
+            archive.delete()
+            if archive.tier == EventArchive.TABLE:
+                _drop_table(model)
+            else:
+                path.unlink(missing_ok=True)
+    if deleted:
+        bump("events")
+    return deleted
+
+
+def archive_events(now=None):
+    """
+    One pass of `manage.py archive_events`: archive months that left the hot
+    window, compress old archive tables, then apply retention. Returns a
+    summary dict.
+    """
+    options = archive_settings()
+    now = now or timezone.now()
+    summary = {"archived": {}, "compressed": {}, "expired": 0}
+
+    hot_until = month_start(now - timedelta(days=options["HOT_DAYS"]))
+    oldest = Event.objects.order_by("timestamp").values_list("timestamp", flat=True).first()
+    month = month_start(oldest) if oldest else hot_until
+    while month < hot_until:
+        moved = archive_month(month)
+        if moved:
+            summary["archived"][f"{month:%Y-%m}"] = moved
+        month = next_month(month)
+
+    if options["FILE_AFTER_DAYS"] is not None:
+        file_until = month_start(now - timedelta(days=options["FILE_AFTER_DAYS"]))
+        for archive in EventArchive.objects.filter(tier=EventArchive.TABLE, month__lt=file_until.date()):
+            summary["compressed"][f"{archive.month:%Y-%m}"] = compress_month(archive)
+
+    summary["expired"] = apply_retention(now)
+    return summary
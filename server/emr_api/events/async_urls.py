@@ -0,0 +1,11 @@
+from django.urls import path
+from .async_views import AddEventView, AddEventsBatchView, GetEventsView, GetEventStatsView, SearchEventsView, EventStreamView
+
+urlpatterns = [
+    path('add_event/', AddEventView.as_view(), name='async-add-event'),
+    path('add_events/', AddEventsBatchView.as_view(), name='async-add-events'),
+    path('get_events/', GetEventsView.as_view(), name='async-get-events'),
+    path('search_events/', SearchEventsView.as_view(), name='async-search-events'),
+    path('event_stats/', GetEventStatsView.as_view(), name='async-event-stats'),
+    path('stream/', EventStreamView.as_view(), name='async-event-stream'),
+]
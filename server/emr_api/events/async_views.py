@@ -0,0 +1,158 @@
+# Async (ASGI) variants of events.views; see emr_api/async_api.py. Inserts
+# go through insert_events in a worker thread because they update the
+# rollups inside one transaction, which the async ORM can't span.
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from emr_api.async_api import AsyncAPIView, json_response
+from emr_api.fields import normalize_address
+from .ingest import BufferFull, InvalidEvents, build_event, get_write_buffer, insert_events, parse_event_batch
+from .queries import aevent_page, parse_event_filters, parse_page_params, parse_stats_params
+from .rollups import aevent_stats
+from .search import SearchRangeArchived, SearchUnavailable, parse_search_params, search_events
+from .stream import RESYNC, BrokerFull, format_event, get_broker, replay, stream_settings
+
+
+class AddEventView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            event = build_event(request.data)
+        except ValueError as exc:
+            return json_response({"error": str(exc)}, status=400)
+        event, = await sync_to_async(insert_events)([event])
+        return json_response({"message": "Event added successfully.", "event_id": event.id})
+
+
+class AddEventsBatchView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            events, durable = parse_event_batch(request.data)
+        except InvalidEvents as exc:
+            return json_response({"error": str(exc), "details": exc.details}, status=400)
+        except ValueError as exc:
+            return json_response({"error": str(exc)}, status=400)
+
+        buffer = None if durable else get_write_buffer()
+        if buffer is not None:
+            try:
+                await sync_to_async(buffer.submit, thread_sensitive=False)(events)
+            except BufferFull:
+                return json_response({"error": "Event buffer is full, retry later."}, status=503,
+                                     headers={"Retry-After": "1"})
+            return json_response({"message": "Events queued.", "accepted": len(events)}, status=202)
+
+        events = await sync_to_async(insert_events)(events)
+        return json_response({"message": "Events added successfully.", "event_ids": [e.id for e in events]})
+
+
+class GetEventsView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            filters = parse_event_filters(request.query_params)
+            position, limit = parse_page_params(request.query_params)
+        except ValueError as exc:
+            return json_response({"error": str(exc)}, status=400)
+
+        events, next_cursor = await aevent_page(filters, position, limit)
+        return json_response({"events": events, "next_cursor": next_cursor})
+
+
+class SearchEventsView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            filters = parse_event_filters(request.query_params)
+            terms, sort, position, limit = parse_search_params(request.query_params)
+            events, next_cursor = await sync_to_async(search_events)(terms, filters, sort, position, limit)
+        except ValueError as exc:
+            return json_response({"error": str(exc)}, status=400)
+        except SearchUnavailable as exc:
+            return json_response({"error": str(exc)}, status=501)
+        except SearchRangeArchived as exc:
+            return json_response({"error": str(exc), "searchable_since": exc.searchable_since.isoformat()}, status=409)
+        return json_response({"events": events, "next_cursor": next_cursor})
+
+
+class GetEventStatsView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            group_by, filters = parse_stats_params(request.query_params)
+        except ValueError as exc:
+            return json_response({"error": str(exc)}, status=400)
+
+        return json_response({"stats": await aevent_stats(group_by, filters)})
+
+
+class EventStreamView(AsyncAPIView):
+    """
+    Server-Sent Events stream of new events (see events/stream.py), for
+    dashboards that used to poll get_events.
+
+    Query params:
+        related_wallet_address, related_patient_wallet_address: ANDed filters
+        last_event_id: resume after this id, for clients that can't send the
+            Last-Event-ID header
+
+    Each event is sent as `id: <id>`, `event: event` and the get_events row
+    as data. A resume too far back, or a client that can't keep up, gets a
+    `resync` event and the stream ends: reload with get_events, then
+    reconnect.
+
+    Under WSGI (runserver, gunicorn) the stream would pin a worker thread
+    and run on a throwaway event loop per request, so it answers 501 and
+    clients poll get_events instead.
+    """
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return json_response({"error": "The event stream needs the ASGI server (emr_api.asgi); "
+                                           "poll get_events instead."}, status=501)
+        filters = {}
+        for field in ("related_wallet_address", "related_patient_wallet_address"):
+            if request.query_params.get(field):
+                try:
+                    filters[field] = normalize_address(request.query_params[field])
+                except ValueError as error:
+                    return json_response({"error": str(error)}, status=400)
+        last_id = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+        if last_id is not None and not last_id.isdigit():
+            return json_response({"error": "Last-Event-ID must be an event id."}, status=400)
+
+        try:
+            subscriber = await get_broker().subscribe(filters.get("related_wallet_address"),
+                                                      filters.get("related_patient_wallet_address"))
+        except BrokerFull as exc:
+            return json_response({"error": str(exc)}, status=503, headers={"Retry-After": "5"})
+        response = StreamingHttpResponse(self.stream(subscriber, filters, last_id),
+                                         content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # nginx would hold the events back otherwise
+        return response
+
+    async def stream(self, subscriber, filters, last_id):
+        options = stream_settings()
+        try:
+            yield b"retry: 3000\n\n"
+            replayed = set()
+            if last_id is not None:
+                # Subscribed first, so nothing committed meanwhile is lost; the
+                # queue may repeat some of these rows.
+                rows = await sync_to_async(replay)(filters, int(last_id), options["REPLAY_LIMIT"])
+                if len(rows) > options["REPLAY_LIMIT"]:
+                    yield b"event: resync\ndata: {}\n\n"
+                    return
+                for row in rows:
+                    replayed.add(row["id"])
+                    yield format_event(row)
+            while True:
+                try:
+                    row = await subscriber.get(options["HEARTBEAT"])
+                except TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if row is RESYNC:
+                    yield b"event: resync\ndata: {}\n\n"
+                    return
+                if row["id"] not in replayed:
+                    yield format_event(row)
+        finally:
+            get_broker().unsubscribe(subscriber)
@@ -0,0 +1,347 @@
+# Tamper evidence for the audit trail. Events are sealed, in id order, into
+# fixed-size batches. Each batch stores the root of a Merkle tree over its
+# events and a chain hash over the previous batch's chain hash and its own
+# root, so rewriting a stored root breaks every later link.
+#
+#   leaf   sha256(0x00 || canonical_event(row))
+#   node   sha256(0x01 || left || right); a node without a sibling moves up
+#          a level unchanged.
+#   chain  sha256(0x02 || previous chain || root || number, first id, last id)
+#          with 32 zero bytes before the first batch.
+#
+# An inclusion proof is the list of siblings from a leaf up to its batch
+# root: log2(BATCH_SIZE) hashes however long the log grows. Each batch also
+# keeps the first event id and subtree root of every CHUNK events, so a
+# proof only reads the chunk its event is in rather than the batch.
+#
+# Sealing and verification read the log as one id-ordered stream across
+# every storage tier (see events/archive.py). Events removed by the
+# retention policy leave their leaf hash in AuditExpiredLeaf, so their batch
+# still verifies.
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import struct
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .archive import _read_file, archive_table_model, relevant_archives
+from .export import EXPORT_FIELDS
+from .models import AuditBatch, AuditCheckpoint, AuditExpiredLeaf, Event, EventArchive
+
+DEFAULT_EVENT_AUDIT = {
+    # Events per sealed batch; proofs hold about log2 of this many hashes.
+    "BATCH_SIZE": 1024,
+    # Only seal a batch once its newest event is this old, so a transaction
+    # that took an id but hasn't committed yet is not left out of it.
+    "SETTLE_SECONDS": 60,
+}
+
+GENESIS = bytes(32)
+
+# Leaves under each stored subtree root (fewer when BATCH_SIZE isn't a multiple).
+CHUNK = 32
+_CHUNK_ENTRY = struct.Struct(">Q32s")
+
+
+def audit_settings():
+    return {**DEFAULT_EVENT_AUDIT, **getattr(settings, "EVENT_AUDIT", {})}
+
+
+# -- Hashing --------------------------------------------------------------
+
+def canonical_event(row):
+    """The exact string a leaf hashes: the export fields as a compact JSON array."""
+    values = [row[field] for field in EXPORT_FIELDS]
+    values[3] = values[3].astimezone(dt_timezone.utc).isoformat()
+    return json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+
+
+def leaf_hash(row):
+    return hashlib.sha256(b"\x00" + canonical_event(row).encode()).digest()
+
+
+def _node(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _parents(level):
+    parents = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        parents.append(level[-1])
+    return parents
+
+
+def merkle_root(leaves):
+    level = list(leaves)
+    while len(level) > 1:
+        level = _parents(level)
+    return level[0]
+
+
+def merkle_proof(leaves, index):
+    """Siblings of leaves[index] from the bottom up, as (side, hash) pairs."""
+    proof, level = [], list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(("left" if sibling < index else "right", level[sibling]))
+        level, index = _parents(level), index // 2
+    return proof
+
+
+def root_from_proof(leaf, proof):
+    """The root a proof leads to; equal to the batch root when the leaf is included."""
+    node = leaf
+    for side, sibling in proof:
+        node = _node(sibling, node) if side == "left" else _node(node, sibling)
+    return node
+
+
+def chain_hash(previous, root, number, first_event_id, last_event_id):
+    return hashlib.sha256(b"\x02" + previous + root
+                          + struct.pack(">QQQ", number, first_event_id, last_event_id)).digest()
+
+
+# -- Reading the log ------------------------------------------------------
+
+def _table_rows(model, after_id, until_id=None, chunk_size=5000):
+    rows = model.objects.filter(id__gt=after_id)
+    if until_id is not None:
+        rows = rows.filter(id__lte=until_id)
+    return rows.order_by("id").values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def _file_rows(path, after_id, until_id=None):
+    # Archive files are written in id order.
+    for row in _read_file(path):
+        if until_id is not None and row["id"] > until_id:
+            return
+        if row["id"] > after_id:
+            yield row
+
+
+def log_rows(after_id=0, until_id=None, archives=None):
+    """Every stored event with after_id < id <= until_id, from all tiers, in id order."""
+    sources = [_table_rows(Event, after_id, until_id)]
+    for archive in archives if archives is not None else EventArchive.objects.all():
+        if archive.tier == EventArchive.TABLE:
+            sources.append(_table_rows(archive_table_model(archive.location), after_id, until_id))
+        else:
+            sources.append(_file_rows(Path(archive.location), after_id, until_id))
+    return heapq.merge(*sources, key=lambda row: row["id"])
+
+
+def _log_leaves(after_id=0, until_id=None, archives=None):
+    """(id, leaf hash, row or None) for stored and expired events, in id order."""
+    stored = ((row["id"], leaf_hash(row), row) for row in log_rows(after_id, until_id, archives))
+    expired = AuditExpiredLeaf.objects.filter(event_id__gt=after_id)
+    if until_id is not None:
+        expired = expired.filter(event_id__lte=until_id)
+    expired = ((event_id, bytes.fromhex(leaf), None) for event_id, leaf in
+               expired.order_by("event_id").values_list("event_id", "leaf_hash").iterator(chunk_size=5000))
+    return heapq.merge(stored, expired, key=lambda leaf: leaf[0])
+
+
+def _batch_archives(batch):
+    # Only the archived months the batch's events fall in can hold them.
+    return relevant_archives({"timestamp__gte": batch.first_timestamp,
+                              "timestamp__lt": batch.last_timestamp + timedelta(microseconds=1)})
+
+
+def chunk_width(size):
+    return math.gcd(size, CHUNK)
+
+
+def pack_chunks(leaves, width):
+    """(first id, subtree root) of every `width` leaves of a batch, packed."""
+    return b"".join(_CHUNK_ENTRY.pack(leaves[i][0], merkle_root(leaf for _, leaf, _ in leaves[i:i + width]))
+                    for i in range(0, len(leaves), width))
+
+
+def unpack_chunks(packed):
+    return list(_CHUNK_ENTRY.iter_unpack(packed))
+
+
+# -- Sealing --------------------------------------------------------------
+
+def seal_batches(now=None, limit=None):
+    """
+    Seal every full batch of unsealed events whose newest event has settled.
+    Returns the number of batches sealed.
+    """
+    options = audit_settings()
+    size = options["BATCH_SIZE"]
+    settled = (now or timezone.now()) - timedelta(seconds=options["SETTLE_SECONDS"])
+    last = AuditBatch.objects.order_by("-number").first()
+    number = last.number + 1 if last else 1
+    previous = bytes.fromhex(last.chain_hash) if last else GENESIS
+
+    sealed = 0
+    leaves = _log_leaves(last.last_event_id if last else 0)
+    while limit is None or sealed < limit:
+        batch = list(islice(leaves, size))
+        timestamps = [row["timestamp"] for _, _, row in batch if row is not None]
+        if len(batch) < size or not timestamps or max(timestamps) > settled:
+            break
+        chunks = pack_chunks(batch, chunk_width(size))
+        # The leaf count under each chunk is a power of two, so the tree over
+        # the chunk roots is the top of the batch's tree.
+        root = merkle_root(chunk_root for _, chunk_root in unpack_chunks(chunks))
+        first_id, last_id = batch[0][0], batch[-1][0]
+        previous = chain_hash(previous, root, number, first_id, last_id)
+        AuditBatch.objects.create(
+            number=number, first_event_id=first_id, last_event_id=last_id, size=size,
+            first_timestamp=min(timestamps), last_timestamp=max(timestamps),
+            root=root.hex(), chain_hash=previous.hex(), chunks=chunks)
+        number += 1
+        sealed += 1
+    return sealed
+
+
+def record_expired(rows):
+    """Keep the leaf hashes of sealed events the retention policy is about to delete."""
+    last = AuditBatch.objects.order_by("-number").values_list("last_event_id", flat=True).first()
+    if last is None:
+        return 0
+    recorded = 0
+    sealed = (AuditExpiredLeaf(event_id=row["id"], leaf_hash=leaf_hash(row).hex()) for row in rows
+              if row["id"] <= last)
+    while chunk := list(islice(sealed, 1000)):
+        AuditExpiredLeaf.objects.bulk_create(chunk, ignore_conflicts=True)
+        recorded += len(chunk)
+    return recorded
+
+
+# -- Proofs ---------------------------------------------------------------
+
+class NotSealed(Exception):
+    pass
+
+
+class ProofMismatch(Exception):
+    """The stored events no longer hash to the sealed root."""
+
+
+def inclusion_proof(event_id):
+    """
+    Proof that event `event_id` is in its sealed batch. Raises Event.DoesNotExist
+    for an id that isn't stored, NotSealed when its batch isn't sealed yet and
+    ProofMismatch when its chunk of the log was tampered with.
+    """
+    batch = AuditBatch.objects.filter(last_event_id__gte=event_id).order_by("last_event_id").first()
+    if batch is None or batch.first_event_id > event_id:
+        # Sealing trails the newest events, which are always in the hot table.
+        if Event.objects.filter(id=event_id).exists():
+            raise NotSealed(f"Event {event_id} is not sealed into a batch yet.")
+        raise Event.DoesNotExist(f"Event {event_id} does not exist.")
+
+    chunks = unpack_chunks(batch.chunks)
+    chunk = bisect.bisect_right([first_id for first_id, _ in chunks], event_id) - 1
+    until = chunks[chunk + 1][0] - 1 if chunk + 1 < len(chunks) else batch.last_event_id
+    leaves = list(_log_leaves(chunks[chunk][0] - 1, until, _batch_archives(batch)))
+    index = next((i for i, (leaf_id, _, _) in enumerate(leaves) if leaf_id == event_id), None)
+    if index is None or leaves[index][2] is None:
+        raise Event.DoesNotExist(f"Event {event_id} does not exist.")
+
+    hashes = [leaf for _, leaf, _ in leaves]
+    roots = [chunk_root for _, chunk_root in chunks]
+    if merkle_root(hashes) != roots[chunk] or merkle_root(roots).hex() != batch.root:
+        raise ProofMismatch(f"Batch {batch.number} no longer matches its sealed root.")
+    previous = AuditBatch.objects.filter(number=batch.number - 1).values_list("chain_hash", flat=True).first()
+    proof = merkle_proof(hashes, index) + merkle_proof(roots, chunk)
+    return {
+        "event_id": event_id,
+        "leaf": canonical_event(leaves[index][2]),
+        "leaf_hash": hashes[index].hex(),
+        "batch": batch.number,
+        "index": chunk * chunk_width(batch.size) + index,
+        "batch_size": batch.size,
+        "first_event_id": batch.first_event_id,
+        "last_event_id": batch.last_event_id,
+        "proof": [{"side": side, "hash": sibling.hex()} for side, sibling in proof],
+        "root": batch.root,
+        "previous_chain_hash": previous or GENESIS.hex(),
+        "chain_hash": batch.chain_hash,
+    }
+
+
+# -- Verification ---------------------------------------------------------
+
+def _verify_batch(batch, leaves, previous):
+    if len(leaves) != batch.size:
+        return f"holds {len(leaves)} events, sealed with {batch.size}"
+    if leaves[0][0] != batch.first_event_id or leaves[-1][0] != batch.last_event_id:
+        return "event ids differ from the sealed range"
+    chunks = pack_chunks(leaves, chunk_width(batch.size))
+    if merkle_root(chunk_root for _, chunk_root in unpack_chunks(chunks)).hex() != batch.root:
+        return "Merkle root does not match: an event was changed, added or removed"
+    if chunks != bytes(batch.chunks):
+        return "chunk index does not match the root: the batch record was altered"
+    if chain_hash(previous, bytes.fromhex(batch.root), batch.number, batch.first_event_id,
+                  batch.last_event_id).hex() != batch.chain_hash:
+        return "chain hash does not match: the batch record was altered"
+    return None
+
+
+def verify_log(full=False, limit=None):
+    """
+    Recompute sealed batches from the stored events, starting after the last
+    verified checkpoint (or from the first batch with full=True), and move
+    the checkpoint to the last batch before the first failure. Returns a
+    summary dict; "failures" is empty when everything checked out.
+    """
+    checkpoint = AuditCheckpoint.objects.filter(pk=1).first()
+    start = 0 if full or checkpoint is None else checkpoint.batch_number
+    previous = GENESIS
+    if start:
+        previous = bytes.fromhex(checkpoint.chain_hash)
+    batches = AuditBatch.objects.filter(number__gt=start).order_by("number")
+    if limit is not None:
+        batches = batches[:limit]
+
+    after_id = AuditBatch.objects.filter(number=start).values_list("last_event_id", flat=True).first() or 0
+
+    summary = {"from_batch": start + 1, "batches": 0, "events": 0, "expired": 0, "failures": []}
+    verified, verified_hash = start, previous
+    expected = start + 1
+    leaves = None
+    for batch in batches.iterator(chunk_size=1000):
+        if leaves is None:
+            leaves = _log_leaves(after_id)
+            pending = next(leaves, None)
+        batch_leaves, unsealed = [], []
+        while pending is not None and pending[0] <= batch.last_event_id:
+            if pending[0] < batch.first_event_id:
+                unsealed.append(pending[0])
+            else:
+                batch_leaves.append(pending)
+            pending = next(leaves, None)
+
+        failure = f"batch {expected} is missing" if batch.number != expected else None
+        if unsealed:
+            failure = failure or f"events {unsealed[:10]} before it were added after sealing"
+        failure = failure or _verify_batch(batch, batch_leaves, previous)
+        if failure:
+            summary["failures"].append({"batch": batch.number, "error": failure})
+        elif not summary["failures"]:
+            verified, verified_hash = batch.number, bytes.fromhex(batch.chain_hash)
+        summary["batches"] += 1
+        summary["events"] += len(batch_leaves)
+        summary["expired"] += sum(1 for _, _, row in batch_leaves if row is None)
+        # Keep checking the links after a failure from what is stored.
+        previous = bytes.fromhex(batch.chain_hash)
+        expected = batch.number + 1
+
+    if full or verified > start:
+        AuditCheckpoint.objects.update_or_create(pk=1, defaults={
+            "batch_number": verified, "chain_hash": verified_hash.hex()})
+    summary["verified_through"] = verified
+    summary["chain_hash"] = verified_hash.hex()
+    return summary
@@ -0,0 +1,215 @@
+# Streaming exports of the audit trail. Rows come off a server-side
+# iterator and are encoded chunk by chunk, so memory use is bounded by
+# the chunk size rather than by the size of the export. Archived months
+# (see events/archive.py) are merged in, so an export covers every tier.
+import csv
+import heapq
+import json
+import struct
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from .models import Event, EventArchive
+
+EXPORT_FIELDS = [
+    "id", "event_type", "event_details", "timestamp",
+    "related_wallet_address", "related_patient_wallet_address",
+]
+EXPORT_CHUNK_SIZE = 2000
+WRITE_SIZE = 64 * 1024
+
+COLUMNAR_MAGIC = b"EMRCOL1\n"
+_NULL_INDEX = 0xFFFFFFFF
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _table_rows(model, filters, chunk_size):
+    return (model.objects.filter(**filters)
+            .order_by("id")
+            .values_list(*EXPORT_FIELDS)
+            .iterator(chunk_size=chunk_size))
+
+
+def _file_rows(path, filters):
+    from .archive import _matches, _read_file  # archive imports this module
+
+    # Archive files are written in id order.
+    for row in _read_file(path):
+        if _matches(row, filters):
+            yield tuple(row[field] for field in EXPORT_FIELDS)
+
+
+def export_rows(filters, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield matching events from every tier as tuples in EXPORT_FIELDS order, in id order."""
+    from .archive import archive_table_model, relevant_archives
+
+    sources = [_table_rows(Event, filters, chunk_size)]
+    for archive in relevant_archives(filters):
+        if archive.tier == EventArchive.TABLE:
+            sources.append(_table_rows(archive_table_model(archive.location), filters, chunk_size))
+        else:
+            sources.append(_file_rows(Path(archive.location), filters))
+    return heapq.merge(*sources, key=lambda row: row[0])
+
+
+def _coalesce(pieces, size=WRITE_SIZE):
+    # Many tiny yields make for many tiny socket writes; group them.
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield b"".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def ndjson_stream(rows):
+    def lines():
+        for row in rows:
+            record = dict(zip(EXPORT_FIELDS, row))
+            record["timestamp"] = record["timestamp"].isoformat()
+            yield json.dumps(record).encode() + b"\n"
+    return _coalesce(lines())
+
+
+class _Echo:
+    # csv.writer wants a file; this one hands each line straight back.
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(EXPORT_FIELDS).encode()
+        for row in rows:
+            row = list(row)
+            row[3] = row[3].isoformat()
+            yield writer.writerow(row).encode()
+    return _coalesce(lines())
+
+
+def _encode_strings(values):
+    # Dictionary encoding: addresses and event types repeat heavily within a block.
+    positions, entries, indexes = {}, [], array("I")
+    for value in values:
+        if value is None:
+            indexes.append(_NULL_INDEX)
+            continue
+        if value not in positions:
+            positions[value] = len(entries)
+            entries.append(value.encode())
+        indexes.append(positions[value])
+    parts = [struct.pack("<I", len(entries))]
+    for entry in entries:
+        parts.append(struct.pack("<I", len(entry)))
+        parts.append(entry)
+    parts.append(indexes.tobytes())
+    return b"".join(parts)
+
+
+def _encode_ints(values):
+    # Delta encoded so sorted ids and timestamps compress well.
+    deltas, previous = array("q"), 0
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return deltas.tobytes()
+
+
+def columnar_stream(rows, block_rows=EXPORT_CHUNK_SIZE):
+    """
+    Compact column-oriented binary format.
+
+    The stream starts with COLUMNAR_MAGIC followed by blocks of up to
+    block_rows rows. Each block is a little-endian uint32 row count and then,
+    for every field in EXPORT_FIELDS order, a uint32 byte length and the
+    column payload: id and timestamp (microseconds since the epoch) are
+    delta-encoded int64s, the other columns are dictionary-encoded strings.
+    A row count of zero ends the stream. See read_columnar for a decoder.
+    """
+    def blocks():
+        yield COLUMNAR_MAGIC
+        block = []
+        for row in rows:
+            block.append(row)
+            if len(block) == block_rows:
+                yield _encode_block(block)
+                block = []
+        if block:
+            yield _encode_block(block)
+        yield struct.pack("<I", 0)
+    return _coalesce(blocks())
+
+
+def _encode_block(block):
+    columns = list(zip(*block))
+    columns[3] = [(ts - _EPOCH) // _MICROSECOND for ts in columns[3]]
+    parts = [struct.pack("<I", len(block))]
+    for position, values in enumerate(columns):
+        payload = _encode_ints(values) if position in (0, 3) else _encode_strings(values)
+        parts.append(struct.pack("<I", len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def _decode_strings(payload, count):
+    (entry_count,), offset = struct.unpack_from("<I", payload), 4
+    entries = []
+    for _ in range(entry_count):
+        (length,) = struct.unpack_from("<I", payload, offset)
+        entries.append(payload[offset + 4:offset + 4 + length].decode())
+        offset += 4 + length
+    indexes = array("I")
+    indexes.frombytes(payload[offset:offset + 4 * count])
+    return [None if i == _NULL_INDEX else entries[i] for i in indexes]
+
+
+def _decode_ints(payload):
+    deltas, values, total = array("q"), [], 0
+    deltas.frombytes(payload)
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def read_columnar(stream):
+    """Decode a columnar export from a binary file object, yielding dicts."""
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar event export.")
+    while True:
+        (count,) = struct.unpack("<I", stream.read(4))
+        if count == 0:
+            return
+        columns = []
+        for position in range(len(EXPORT_FIELDS)):
+            (length,) = struct.unpack("<I", stream.read(4))
+            payload = stream.read(length)
+            columns.append(_decode_ints(payload) if position in (0, 3) else _decode_strings(payload, count))
+        columns[3] = [_EPOCH + _MICROSECOND * micros for micros in columns[3]]
+        for row in zip(*columns):
+            yield dict(zip(EXPORT_FIELDS, row))
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip an iterable of byte chunks on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_stream, "application/x-ndjson", "ndjson"),
+    "csv": (csv_stream, "text/csv", "csv"),
+    "columnar": (columnar_stream, "application/octet-stream", "emrcol"),
+}
@@ -0,0 +1,334 @@
+# Event ingestion: validation shared by the single and batch endpoints, a
+# one-transaction bulk insert, and an optional in-process write-behind
+# buffer that coalesces many small requests into a few large inserts.
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from emr_api.fields import normalize_address
+from responsecache.versions import bump
+
+from .models import Event
+from .rollups import record_events
+from .stream import notify_new_events
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_EVENTS = 1000
+
+DEFAULT_BUFFER_SETTINGS = {
+    "ENABLED": False,
+    # Flush when this many events are waiting...
+    "MAX_BATCH": 500,
+    # ...or when the oldest waiting event is this many seconds old.
+    "MAX_AGE": 0.5,
+    # Events held in memory before submit() starts refusing (backpressure).
+    "CAPACITY": 10000,
+    # How long submit() blocks waiting for room before giving up.
+    "SUBMIT_TIMEOUT": 0.05,
+    # Events that could not be written at shutdown are appended here and
+    # replayed when the next buffer starts. None disables spooling.
+    "SPOOL_PATH": None,
+}
+
+class BufferFull(Exception):
+    pass
+
+
+class InvalidEvents(ValueError):
+    def __init__(self, details):
+        super().__init__("Invalid events.")
+        # {index in the batch: error}
+        self.details = details
+
+
+# Queued by close() to wake the flusher thread.
+_STOP = object()
+
+
+def build_event(data):
+    """Validate one event payload and return an unsaved Event; raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("Event must be an object.")
+    event_type = data.get("event_type")
+    event_details = data.get("event_details")
+    related_wallet_address = data.get("related_wallet_address")
+    if not event_type or not event_details or not related_wallet_address:
+        raise ValueError("Missing required fields.")
+    related_patient_wallet_address = data.get("related_patient_wallet_address")
+    return Event(
+        event_type=event_type,
+        event_details=event_details,
+        related_wallet_address=normalize_address(related_wallet_address),
+        related_patient_wallet_address=(normalize_address(related_patient_wallet_address)
+                                        if related_patient_wallet_address else None),
+    )
+
+
+def parse_event_batch(data):
+    """
+    Validate an add_events body, {"events": [...], "durable": ...} or a bare
+    list. Returns (unsaved events, durable); raises InvalidEvents naming the
+    bad entries, or ValueError when the batch itself is malformed.
+    """
+    payload = data.get("events") if isinstance(data, dict) else data
+    if not isinstance(payload, list) or not payload:
+        raise ValueError("events must be a non-empty list.")
+    if len(payload) > MAX_BATCH_EVENTS:
+        raise ValueError(f"At most {MAX_BATCH_EVENTS} events per batch.")
+
+    events, errors = [], {}
+    for index, event in enumerate(payload):
+        try:
+            events.append(build_event(event))
+        except ValueError as exc:
+            errors[index] = str(exc)
+    if errors:
+        raise InvalidEvents(errors)
+    durable = isinstance(data, dict) and data.get("durable") in (True, "true", "1")
+    return events, durable
+
+
+def insert_events(events):
+    """Insert events and bump their rollups in one transaction; returns them with ids set."""
+    with transaction.atomic():
+        events = Event.objects.bulk_create(events, batch_size=MAX_BATCH_EVENTS)
+        record_events(events)
+        # bulk_create skips post_save, so cached event listings are invalidated here.
+        bump("events")
+        transaction.on_commit(notify_new_events)
+    return events
+
+
+def _event_to_dict(event):
+    return {
+        "event_type": event.event_type,
+        "event_details": event.event_details,
+        "related_wallet_address": event.related_wallet_address,
+        "related_patient_wallet_address": event.related_patient_wallet_address,
+        "timestamp": event.timestamp.isoformat(),
+    }
+
+
+def _event_from_dict(data):
+    event = build_event(data)
+    # Spools written before timestamps were kept get the replay time.
+    if data.get("timestamp"):
+        event.timestamp = parse_datetime(data["timestamp"])
+    return event
+
+
+class EventWriteBuffer:
+    """
+    Write-behind buffer for events.
+
+    submit() only enqueues; a background thread drains the queue and writes
+    with insert_events() whenever MAX_BATCH events are waiting or the oldest
+    one is MAX_AGE seconds old. Events keep the time they were submitted.
+    CAPACITY bounds the events held, queued or waiting for a retry: an
+    event's room is only freed once its write commits. When a batch doesn't
+    fit submit() queues none of it and raises BufferFull, so callers can
+    shed load instead of growing memory without limit, database outage
+    included.
+
+    Durability: an accepted event lives only in memory until its flush
+    commits. Failed flushes are retried; anything still unwritten at close()
+    (including interpreter exit) is appended to SPOOL_PATH when configured,
+    and replayed on the next start. Callers that must not lose an event
+    should write through insert_events() instead.
+    """
+
+    def __init__(self, max_batch=500, max_age=0.5, capacity=10000, submit_timeout=0.05,
+                 spool_path=None, writer=insert_events):
+        self.max_batch = max_batch
+        self.max_age = max_age
+        self.capacity = capacity
+        self.submit_timeout = submit_timeout
+        self.spool_path = Path(spool_path) if spool_path else None
+        self._writer = writer
+        # Each item is one submit() call's events, so a batch is queued whole
+        # or not at all. _held counts accepted events not yet written
+        # (queued, being flushed or kept for retry) against capacity.
+        self._queue = queue.Queue()
+        self._held = 0
+        self._room = threading.Condition()
+        self._retry = []
+        self._closed = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "written": 0, "flushes": 0, "failed_flushes": 0}
+        self._replay_spool()
+        self._thread = threading.Thread(target=self._run, name="event-write-buffer", daemon=True)
+        self._thread.start()
+
+    def submit(self, events):
+        """
+        Queue events for writing. Either all of them are accepted or, if
+        there is no room for all of them, none are and BufferFull is raised,
+        so a client retrying the batch can't write any event twice.
+        """
+        if self._closed.is_set():
+            raise BufferFull("Event buffer is closed.")
+        events = list(events)
+        now = timezone.now()
+        for event in events:
+            event.timestamp = event.timestamp or now
+        with self._room:
+            fits = len(events) <= self.capacity and self._room.wait_for(
+                lambda: self._held + len(events) <= self.capacity, timeout=self.submit_timeout)
+            if fits:
+                self._held += len(events)
+                self._queue.put((time.monotonic(), events))
+        if not fits:
+            self._count(rejected=len(events))
+            raise BufferFull("Event buffer is full.")
+        self._count(accepted=len(events))
+
+    def pending(self):
+        """Accepted events not written yet."""
+        return self._held
+
+    def flush(self):
+        """Write everything currently queued; returns the number written."""
+        with self._flush_lock:
+            batch, self._retry = self._retry, []
+            while True:
+                try:
+                    events = self._queue.get_nowait()[1]
+                except queue.Empty:
+                    break
+                if events is not _STOP:
+                    batch.extend(events)
+            return self._write(batch)
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._queue.put((time.monotonic(), _STOP))
+        self._thread.join()
+        self.flush()
+        if self._retry:
+            self._spool(self._retry)
+            self._release(len(self._retry))
+            self._retry = []
+
+    def _release(self, count):
+        """Free room for submit() once `count` held events are written or spooled."""
+        with self._room:
+            self._held -= count
+            self._room.notify_all()
+
+    def _count(self, **deltas):
+        # Bumped from request threads and the flusher thread alike.
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    def _write(self, batch):
+        written = 0
+        for start in range(0, len(batch), self.max_batch):
+            chunk = batch[start:start + self.max_batch]
+            try:
+                self._writer(chunk)
+            except Exception:
+                logger.exception("Event buffer flush failed; %d events kept for retry.", len(chunk))
+                self._count(failed_flushes=1)
+                # Keep the failed chunk and everything after it for the next flush.
+                self._retry = batch[start:]
+                break
+            written += len(chunk)
+            self._release(len(chunk))
+            self._count(flushes=1)
+        self._count(written=written)
+        return written
+
+    def _run(self):
+        try:
+            while not self._closed.is_set():
+                try:
+                    item = self._queue.get(timeout=self.max_age)
+                except queue.Empty:
+                    if self._retry:
+                        self.flush()
+                    continue
+                events = item[1]
+                if events is _STOP:
+                    break
+                with self._flush_lock:
+                    batch, self._retry = self._retry + events, []
+                    deadline = item[0] + self.max_age
+                    while len(batch) < self.max_batch:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        try:
+                            events = self._queue.get(timeout=remaining)[1]
+                        except queue.Empty:
+                            break
+                        if events is _STOP:
+                            break
+                        batch.extend(events)
+                    self._write(batch)
+        finally:
+            close_old_connections()
+
+    def _spool(self, events):
+        if self.spool_path is None:
+            logger.error("Dropping %d unwritten events: no SPOOL_PATH configured.", len(events))
+            return
+        with self.spool_path.open("a") as spool:
+            for event in events:
+                spool.write(json.dumps(_event_to_dict(event)) + "\n")
+        logger.warning("Spooled %d unwritten events to %s.", len(events), self.spool_path)
+
+    def _replay_spool(self):
+        if self.spool_path is None or not self.spool_path.exists():
+            return
+        with self.spool_path.open() as spool:
+            events = [_event_from_dict(json.loads(line)) for line in spool if line.strip()]
+        try:
+            self._writer(events)
+        except Exception:
+            # The database may still be down; the buffer works without it.
+            logger.exception("Could not replay %d spooled events; %s is kept for the next start.",
+                             len(events), self.spool_path)
+            return
+        self.spool_path.unlink()
+        logger.info("Replayed %d spooled events.", len(events))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def buffer_settings():
+    return {**DEFAULT_BUFFER_SETTINGS, **getattr(settings, "EVENT_WRITE_BUFFER", {})}
+
+
+def get_write_buffer():
+    """Return the process-wide buffer, or None when EVENT_WRITE_BUFFER is disabled."""
+    global _buffer
+    config = buffer_settings()
+    if not config["ENABLED"]:
+        return None
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = EventWriteBuffer(
+                max_batch=config["MAX_BATCH"],
+                max_age=config["MAX_AGE"],
+                capacity=config["CAPACITY"],
+                submit_timeout=config["SUBMIT_TIMEOUT"],
+                spool_path=config["SPOOL_PATH"],
+            )
+            atexit.register(_buffer.close)
+        return _buffer
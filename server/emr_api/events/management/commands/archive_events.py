@@ -0,0 +1,18 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from events.archive import archive_events
+
+
+class Command(BaseCommand):
+    help = ("Move months older than EVENT_ARCHIVE['HOT_DAYS'] out of the Event table into "
+            "per-month archive tables, compress old archive tables into files and apply the "
+            "per-event_type retention policy. Run it daily.")
+
+    def handle(self, *args, **options):
+        summary = archive_events()
+        self.stdout.write(json.dumps(summary, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {sum(summary['archived'].values())} events, compressed "
+            f"{len(summary['compressed'])} months, expired {summary['expired']} events."))
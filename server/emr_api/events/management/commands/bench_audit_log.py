@@ -0,0 +1,69 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from emr_api.benchmarking import (Stopwatch, authenticated_client, benchmark_database, dump, seed_events,
+                                  summarise, wallet)
+from events.audit import seal_batches, verify_log
+from events.search import SQLITE_TRIGGERS
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ("Measure sealing and full verification throughput of the audit log, incremental "
+            "verification after new events, and event_proof latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=1000000)
+        parser.add_argument("--batch-size", type=int, default=1024)
+        parser.add_argument("--samples", type=int, default=1000, help="Proofs fetched.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        size = options["batch_size"]
+        report = {"events": options["events"], "batch_size": size}
+        with benchmark_database(on_disk=True), override_settings(
+                EVENT_AUDIT={"BATCH_SIZE": size, "SETTLE_SECONDS": 0}):
+            if connection.vendor == "sqlite":
+                # Search isn't measured here and its triggers triple the seeding time.
+                with connection.cursor() as cursor:
+                    for trigger in SQLITE_TRIGGERS:
+                        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            seed_events(options["events"], rng=rng)
+            self.stderr.write(f"seeded {options['events']} events")
+
+            watch = Stopwatch()
+            with watch:
+                batches = seal_batches()
+            report["seal"] = self.throughput(watch, batches * size, batches)
+
+            watch = Stopwatch()
+            with watch:
+                summary = verify_log(full=True)
+            assert not summary["failures"], summary["failures"]
+            report["verify_full"] = self.throughput(watch, summary["events"], summary["batches"])
+
+            # The steady state: a few new batches since the last run.
+            seed_events(10 * size, rng=rng)
+            seal_batches()
+            watch = Stopwatch()
+            with watch:
+                summary = verify_log()
+            report["verify_incremental"] = self.throughput(watch, summary["events"], summary["batches"])
+
+            client = authenticated_client(User.objects.create(wallet_address=wallet(0, "c"), role="admin"))
+            watch = Stopwatch()
+            for _ in range(options["samples"]):
+                event_id = rng.randrange(1, batches * size)
+                with watch:
+                    response = client.get("/api/events/event_proof/", {"event_id": event_id})
+                assert response.status_code == 200, response.status_code
+            report["proof"] = summarise(watch.samples)
+            report["proof_hashes"] = len(response.data["proof"])
+        dump(self.stdout, report)
+
+    def throughput(self, watch, events, batches):
+        seconds = watch.samples[0]
+        return {"batches": batches, "events": events, "seconds": seconds, "events_per_sec": events / seconds}
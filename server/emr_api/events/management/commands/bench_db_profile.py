@@ -0,0 +1,88 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from emr_api.benchmarking import (Stopwatch, access_token_for, benchmark_database, dump, seed_events,
+                                  summarise, wallet)
+from rest_framework.test import APIClient
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ("Run a mixed read/write API workload against the configured database profile "
+            "(EMR_DB_ENGINE). On SQLite it also runs untuned defaults for comparison. For "
+            "SQLite against PostgreSQL, run it once per engine and compare the two reports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=5000)
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--seed-events", type=int, default=100000)
+        parser.add_argument("--write-ratio", type=float, default=0.3)
+
+    def handle(self, *args, **options):
+        profiles = {connection.vendor + "-tuned": dict(connection.settings_dict["OPTIONS"])}
+        if connection.vendor == "sqlite":
+            profiles = {"sqlite-default": {}, **profiles}
+
+        report = {"operations": options["operations"], "threads": options["threads"], "profiles": {}}
+        original = connection.settings_dict["OPTIONS"]
+        for name, db_options in profiles.items():
+            connection.close()
+            connection.settings_dict["OPTIONS"] = db_options
+            try:
+                with benchmark_database(on_disk=True):
+                    report["profiles"][name] = self.run(options)
+            finally:
+                connection.close()
+                connection.settings_dict["OPTIONS"] = original
+            self.stderr.write(f"{name}: {report['profiles'][name]['ops_per_sec']:.0f} ops/sec")
+        dump(self.stdout, report)
+
+    def run(self, options):
+        seed_events(options["seed_events"], providers=100, patients=1000)
+        token = access_token_for(User.objects.create(wallet_address=wallet(0, "c"), role="provider"))
+        reads, writes, errors = Stopwatch(), Stopwatch(), []
+
+        def operation(n):
+            rng = random.Random(n)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            try:
+                if rng.random() < options["write_ratio"]:
+                    with Stopwatch() as one:
+                        if n % 3:
+                            status = client.post("/api/events/add_event/", {
+                                "event_type": "record_accessed", "event_details": "bench",
+                                "related_wallet_address": wallet(rng.randrange(100), "a")}).status_code
+                        else:
+                            # The write half of a login.
+                            user, _ = User.objects.get_or_create(wallet_address=wallet(n, "d"))
+                            user.role = "patient"
+                            user.save()
+                            status = 200
+                    writes.samples.append(one.samples[0])
+                else:
+                    with Stopwatch() as one:
+                        status = client.get("/api/events/get_events/", {
+                            "related_wallet_address": wallet(rng.randrange(100), "a"), "limit": 50}).status_code
+                    reads.samples.append(one.samples[0])
+                if status >= 400:
+                    errors.append(status)
+            except Exception as exc:  # "database is locked" and friends
+                errors.append(type(exc).__name__)
+            finally:
+                close_old_connections()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["threads"]) as pool:
+            list(pool.map(operation, range(options["operations"])))
+        elapsed = time.perf_counter() - start
+        return {
+            "ops_per_sec": options["operations"] / elapsed,
+            "errors": len(errors),
+            "reads": summarise(reads.samples),
+            "writes": summarise(writes.samples),
+        }
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emr_api.benchmarking import (authenticated_client, benchmark_database, current_rss_bytes, dump,
+                                  seed_events, wallet)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Stream a large export_events response per format and report throughput and RSS growth."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=1000000)
+        parser.add_argument("--outputs", default="ndjson,csv,columnar")
+        parser.add_argument("--max-rss-growth-mb", type=float, default=None,
+                            help="Fail if any export grows RSS by more than this.")
+
+    def handle(self, *args, **options):
+        report = {"events": options["events"], "exports": {}}
+        with benchmark_database(on_disk=True):
+            client = authenticated_client(User.objects.create(wallet_address=wallet(0, "c"), role="admin"))
+            seed_events(options["events"])
+            for output in options["outputs"].split(","):
+                for gzipped in (False, True):
+                    name = output + ("+gzip" if gzipped else "")
+                    report["exports"][name] = self.export(client, output, gzipped)
+                    self.stderr.write(f"{name}: {report['exports'][name]}")
+        dump(self.stdout, report)
+
+        limit = options["max_rss_growth_mb"]
+        if limit is not None:
+            worst = max(r["rss_growth_mb"] for r in report["exports"].values())
+            if worst > limit:
+                raise CommandError(f"RSS grew by {worst:.1f} MB, over the {limit} MB limit.")
+
+    def export(self, client, output, gzipped):
+        headers = {"HTTP_ACCEPT_ENCODING": "gzip"} if gzipped else {}
+        baseline = peak = current_rss_bytes()
+        start = time.perf_counter()
+        response = client.get("/api/events/export_events/", {"output": output}, **headers)
+        size = 0
+        for count, chunk in enumerate(response.streaming_content):
+            size += len(chunk)
+            if count % 64 == 0:
+                peak = max(peak, current_rss_bytes())
+        elapsed = time.perf_counter() - start
+        return {
+            "bytes": size,
+            "seconds": elapsed,
+            "mb_per_sec": size / elapsed / 2**20,
+            "rss_growth_mb": (max(peak, current_rss_bytes()) - baseline) / 2**20,
+        }
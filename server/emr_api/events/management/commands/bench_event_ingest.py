@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test.utils import override_settings
+
+from emr_api.benchmarking import access_token_for, benchmark_database, dump, wallet
+from events import ingest
+from events.models import Event
+from rest_framework.test import APIClient
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Measure event ingest throughput (events/sec) for add_event, add_events and the write buffer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=20000)
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--modes", default="single,batch,buffered")
+
+    def handle(self, *args, **options):
+        report = {"events": options["events"], "threads": options["threads"], "modes": {}}
+        with benchmark_database(on_disk=True):
+            token = access_token_for(User.objects.create(wallet_address=wallet(0, "c"), role="provider"))
+            for mode in options["modes"].split(","):
+                Event.objects.all().delete()
+                report["modes"][mode] = getattr(self, f"run_{mode}")(token, options)
+        dump(self.stdout, report)
+
+    def payload(self, n):
+        return {
+            "event_type": "record_accessed",
+            "event_details": f"load test event {n}",
+            "related_wallet_address": wallet(n % 100, "a"),
+            "related_patient_wallet_address": wallet(n % 1000, "b"),
+        }
+
+    def drive(self, token, options, send):
+        """Split the events into requests and send them from a thread pool."""
+        size = options["batch_size"]
+        chunks = [list(range(i, min(i + size, options["events"]))) for i in range(0, options["events"], size)]
+        errors = []
+
+        def worker(chunk):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            try:
+                status = send(client, chunk)
+                if status >= 400:
+                    errors.append(status)
+            finally:
+                close_old_connections()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["threads"]) as pool:
+            list(pool.map(worker, chunks))
+        return start, errors
+
+    def result(self, start, errors):
+        elapsed = time.perf_counter() - start
+        stored = Event.objects.count()
+        return {"stored": stored, "errors": len(errors), "seconds": elapsed, "events_per_sec": stored / elapsed}
+
+    def run_single(self, token, options):
+        def send(client, chunk):
+            statuses = [client.post("/api/events/add_event/", self.payload(n), format="json").status_code
+                        for n in chunk]
+            return max(statuses)
+        return self.result(*self.drive(token, options, send))
+
+    def run_batch(self, token, options):
+        def send(client, chunk):
+            events = [self.payload(n) for n in chunk]
+            return client.post("/api/events/add_events/", {"events": events}, format="json").status_code
+        return self.result(*self.drive(token, options, send))
+
+    def run_buffered(self, token, options):
+        config = {**ingest.DEFAULT_BUFFER_SETTINGS, "ENABLED": True, "CAPACITY": options["events"]}
+        with override_settings(EVENT_WRITE_BUFFER=config):
+            ingest._buffer = None
+            buffer = ingest.get_write_buffer()
+            start, errors = self.drive(token, options, lambda client, chunk: client.post(
+                "/api/events/add_events/", {"events": [self.payload(n) for n in chunk]}, format="json").status_code)
+            buffer.close()
+            ingest._buffer = None
+        result = self.result(start, errors)
+        result["buffer"] = buffer.stats
+        return result
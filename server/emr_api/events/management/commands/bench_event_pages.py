@@ -0,0 +1,54 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from emr_api.benchmarking import (Stopwatch, authenticated_client, benchmark_database, dump,
+                                  seed_events, summarise, wallet)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Seed events in growing steps and measure get_events page latency at each size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkpoints", default="100000,1000000,10000000",
+                            help="Comma separated table sizes to measure at.")
+        parser.add_argument("--providers", type=int, default=1000)
+        parser.add_argument("--patients", type=int, default=10000)
+        parser.add_argument("--samples", type=int, default=200, help="Pages fetched per filter at each size.")
+        parser.add_argument("--depth", type=int, default=5, help="Pages followed per sampled wallet.")
+
+    def handle(self, *args, **options):
+        checkpoints = sorted(int(c) for c in options["checkpoints"].split(","))
+        rng = random.Random(1)
+        report = {"checkpoints": []}
+        with benchmark_database():
+            client = authenticated_client(User.objects.create(wallet_address=wallet(0, "c"), role="admin"))
+            seeded = 0
+            for size in checkpoints:
+                seeded += seed_events(size - seeded, options["providers"], options["patients"], rng=rng)
+                self.stderr.write(f"seeded {seeded} events")
+                report["checkpoints"].append({
+                    "events": seeded,
+                    "by_wallet": self.measure(client, options, rng, lambda: {
+                        "related_wallet_address": wallet(rng.randrange(options["providers"]), "a")}),
+                    "by_patient": self.measure(client, options, rng, lambda: {
+                        "related_patient_wallet_address": wallet(rng.randrange(options["patients"]), "b")}),
+                    "by_wallet_and_type": self.measure(client, options, rng, lambda: {
+                        "related_wallet_address": wallet(rng.randrange(options["providers"]), "a"),
+                        "event_type": "note_added"}),
+                })
+        dump(self.stdout, report)
+
+    def measure(self, client, options, rng, make_params):
+        watch, pages = Stopwatch(), 0
+        while pages < options["samples"]:
+            params = dict(make_params(), limit=50)
+            for _ in range(options["depth"]):
+                with watch:
+                    data = client.get("/api/events/get_events/", params).data
+                pages += 1
+                if not data["next_cursor"]:
+                    break
+                params["cursor"] = data["next_cursor"]
+        return summarise(watch.samples)
@@ -0,0 +1,67 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from emr_api.benchmarking import (Stopwatch, authenticated_client, benchmark_database, dump,
+                                  seed_events, summarise, wallet)
+from users.models import User
+
+# Word frequencies roughly follow an audit log's: a few words in most
+# events, a long tail of drug and condition names in very few.
+COMMON = ["record", "accessed", "provider", "patient", "updated", "note", "viewed", "summary"]
+TAIL = [f"{stem}{n}" for stem in ("medication", "condition", "allergy") for n in range(2000)]
+
+
+def event_details(i, rng):
+    words = rng.sample(COMMON, 3) + [rng.choice(TAIL) for _ in range(2)]
+    return f"{' '.join(words)} ref {i}"
+
+
+class Command(BaseCommand):
+    help = "Seed events with varied text and measure search_events latency at each size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkpoints", default="100000,1000000",
+                            help="Comma separated table sizes to measure at, e.g. 100000,1000000,10000000.")
+        parser.add_argument("--providers", type=int, default=1000)
+        parser.add_argument("--patients", type=int, default=10000)
+        parser.add_argument("--samples", type=int, default=100, help="Searches per query kind at each size.")
+
+    def handle(self, *args, **options):
+        checkpoints = sorted(int(c) for c in options["checkpoints"].split(","))
+        rng = random.Random(1)
+        report = {"checkpoints": []}
+        providers = options["providers"]
+        # Raw inserts don't move the response cache's version stamps, and the
+        # point is to time the search itself.
+        with benchmark_database(on_disk=True), override_settings(RESPONSE_CACHE={"ENABLED": False}):
+            client = authenticated_client(User.objects.create(wallet_address=wallet(0, "c"), role="admin"))
+            seeded = 0
+            for size in checkpoints:
+                seeded += seed_events(size - seeded, providers, options["patients"], rng=rng, details=event_details)
+                self.stderr.write(f"seeded {seeded} events")
+                kinds = {
+                    "rare_word": lambda: {"q": rng.choice(TAIL)},
+                    "common_word_rank": lambda: {"q": rng.choice(COMMON)},
+                    "common_word_recent": lambda: {"q": rng.choice(COMMON), "sort": "recent"},
+                    "two_words": lambda: {"q": f"{rng.choice(COMMON)} {rng.choice(TAIL)}"},
+                    "prefix": lambda: {"q": f"{rng.choice(TAIL)[:-1]}*"},
+                    "common_word_and_wallet": lambda: {
+                        "q": rng.choice(COMMON), "related_wallet_address": wallet(rng.randrange(providers), "a")},
+                    "rare_word_and_type": lambda: {"q": rng.choice(TAIL), "event_type": "note_added"},
+                }
+                report["checkpoints"].append({
+                    "events": seeded,
+                    **{kind: self.measure(client, options["samples"], make_params)
+                       for kind, make_params in kinds.items()},
+                })
+        dump(self.stdout, report)
+
+    def measure(self, client, samples, make_params):
+        watch, hits = Stopwatch(), 0
+        for _ in range(samples):
+            with watch:
+                data = client.get("/api/events/search_events/", make_params()).data
+            hits += len(data["events"])
+        return {"mean_hits": hits / samples, **summarise(watch.samples)}
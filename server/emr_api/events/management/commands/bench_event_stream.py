@@ -0,0 +1,133 @@
+import asyncio
+import gc
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from emr_api.asgi import application
+from emr_api.benchmarking import (access_token_for, benchmark_database, current_rss_bytes, dump, summarise,
+                                  wallet)
+from events.ingest import insert_events
+from events.models import Event
+from events.stream import get_broker
+from users.models import User
+
+
+class Connection:
+    """One idle EventSource client, driven straight through the ASGI application."""
+
+    def __init__(self, application, query, token):
+        self.scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/api/async/events/stream/", "raw_path": b"/api/async/events/stream/",
+            "query_string": query.encode(), "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"authorization", f"Bearer {token}".encode())],
+            "server": ("localhost", 80), "client": ("127.0.0.1", 50000),
+        }
+        self.application = application
+        self.status = None
+        self.received = asyncio.Event()
+        self.last_body_at = None
+        self.events = 0
+        self._requested = False
+        self._disconnect = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(application(self.scope, self.receive, self.send))
+
+    async def receive(self):
+        if not self._requested:
+            self._requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return await self._disconnect
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        elif message.get("body", b"").startswith(b"id:"):
+            self.events += 1
+            self.last_body_at = time.perf_counter()
+            self.received.set()
+        elif message.get("body"):
+            self.received.set()
+
+    def close(self):
+        if not self._disconnect.done():
+            self._disconnect.set_result({"type": "http.disconnect"})
+
+
+class Command(BaseCommand):
+    help = ("Hold many idle event stream subscribers in one process, then measure the memory "
+            "they take and how long new events take to reach them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=10000)
+        parser.add_argument("--wallets", type=int, default=1000,
+                            help="Distinct wallets the subscribers follow.")
+        parser.add_argument("--events", type=int, default=200, help="Events written while they listen.")
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True), override_settings(RESPONSE_CACHE={"ENABLED": False},
+                                                                INSTRUMENTATION={"ENABLED": False}):
+            token = access_token_for(User.objects.create(wallet_address=wallet(0, "c"), role="provider"))
+            report = asyncio.run(self.run(options, token))
+        dump(self.stdout, report)
+
+    async def run(self, options, token):
+        rng = random.Random(1)
+        wallets = [wallet(n, "a") for n in range(options["wallets"])]
+
+        # Warm up imports, the middleware chain and the broker's tail before measuring.
+        warm = Connection(application, urlencode({"related_wallet_address": wallets[0]}), token)
+        await asyncio.wait_for(warm.received.wait(), 10)
+
+        gc.collect()
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        connections = []
+        for n in range(options["subscribers"]):
+            query = urlencode({"related_wallet_address": wallets[n % len(wallets)]})
+            connections.append(Connection(application, query, token))
+            if n % 500 == 499:
+                await asyncio.gather(*(c.received.wait() for c in connections[-500:]))
+        await asyncio.gather(*(c.received.wait() for c in connections))
+        connect_seconds = time.perf_counter() - started
+        gc.collect()
+        rss_after = current_rss_bytes()
+        threads = threading.active_count()
+        assert all(c.status == 200 for c in connections), {c.status for c in connections}
+        self.stderr.write(f"{len(connections)} subscribers connected in {connect_seconds:.1f}s")
+
+        by_wallet = {}
+        for connection in connections:
+            by_wallet.setdefault(connection.scope["query_string"].decode().split("=")[1], []).append(connection)
+        latencies = []
+        for _ in range(options["events"]):
+            target = rng.choice(wallets)
+            listeners = by_wallet[target]
+            for connection in listeners:
+                connection.received.clear()
+            event = Event(event_type="note_added", event_details="bench", related_wallet_address=target)
+            # From the write, commit included, to the last listener's send;
+            # delivery can beat the return from the worker thread.
+            written = time.perf_counter()
+            await sync_to_async(insert_events)([event])
+            await asyncio.wait_for(asyncio.gather(*(c.received.wait() for c in listeners)), 10)
+            latencies.append(max(c.last_body_at for c in listeners) - written)
+
+        stats = dict(get_broker().stats)
+        for connection in connections + [warm]:
+            connection.close()
+        await asyncio.gather(*(c.task for c in connections + [warm]), return_exceptions=True)
+        return {
+            "subscribers": len(connections),
+            "connect_seconds": connect_seconds,
+            "rss_bytes_per_subscriber": (rss_after - rss_before) / len(connections),
+            "threads": threads,
+            "insert_to_delivery": summarise(latencies),
+            "listeners_per_event": len(connections) / len(wallets),
+            "broker": stats,
+        }
@@ -0,0 +1,98 @@
+import datetime
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from emr_api.benchmarking import (Stopwatch, authenticated_client, benchmark_database, dump,
+                                  seed_events, summarise, wallet)
+from events.archive import archive_events
+from events.search import SQLITE_TRIGGERS
+from users.models import User
+
+HOT_DAYS = 90
+
+
+class Command(BaseCommand):
+    help = ("Measure get_events latency on the recent past with a growing history kept in "
+            "events_event, then again once archive_events has moved the history out.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hot", type=int, default=200000, help="Events in the last HOT_DAYS days.")
+        parser.add_argument("--checkpoints", default="1000000,4000000",
+                            help="Comma separated amounts of older history to measure at.")
+        parser.add_argument("--years", type=int, default=3, help="How far back the history goes.")
+        parser.add_argument("--providers", type=int, default=1000)
+        parser.add_argument("--patients", type=int, default=10000)
+        parser.add_argument("--samples", type=int, default=300, help="Pages fetched per query kind.")
+
+    def handle(self, *args, **options):
+        checkpoints = sorted(int(c) for c in options["checkpoints"].split(","))
+        rng = random.Random(1)
+        now = timezone.now()
+        hot_span = datetime.timedelta(days=HOT_DAYS - 1)
+        history_span = datetime.timedelta(days=365 * options["years"])
+        history_start = now - datetime.timedelta(days=HOT_DAYS + 31) - history_span
+        seed = dict(providers=options["providers"], patients=options["patients"], rng=rng)
+        report = {"hot_events": options["hot"], "unarchived": [], "archived": {}}
+
+        # Raw inserts don't move the response cache's version stamps, and the
+        # point is to time the queries themselves.
+        with tempfile.TemporaryDirectory() as path, benchmark_database(on_disk=True), override_settings(
+                RESPONSE_CACHE={"ENABLED": False},
+                EVENT_ARCHIVE={"HOT_DAYS": HOT_DAYS, "FILE_AFTER_DAYS": None, "PATH": path, "RETENTION": {}}):
+            if connection.vendor == "sqlite":
+                # Search isn't measured here and its triggers triple the seeding time.
+                with connection.cursor() as cursor:
+                    for trigger in SQLITE_TRIGGERS:
+                        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            client = authenticated_client(User.objects.create(wallet_address=wallet(0, "c"), role="admin"))
+            seed_events(options["hot"], start=now - hot_span, span=hot_span, **seed)
+            report["unarchived"].append({"history": 0, **self.measure(client, options, rng, now)})
+
+            seeded = 0
+            for size in checkpoints:
+                seeded += seed_events(size - seeded, start=history_start, span=history_span, **seed)
+                self.stderr.write(f"seeded {seeded} older events")
+                report["unarchived"].append({"history": seeded, **self.measure(client, options, rng, now)})
+
+            watch = Stopwatch()
+            with watch:
+                summary = archive_events(now)
+            self.stderr.write(f"archived {sum(summary['archived'].values())} events")
+            report["archived"] = {
+                "history": seeded,
+                "months": len(summary["archived"]),
+                "archive_seconds": watch.samples[0],
+                **self.measure(client, options, rng, now),
+                # Pages that have to reach into the archive tables.
+                "by_wallet_a_year_ago": self.sample(client, options, lambda: {
+                    "related_wallet_address": wallet(rng.randrange(options["providers"]), "a"),
+                    "until": (now - datetime.timedelta(days=365)).isoformat()}),
+            }
+        dump(self.stdout, report)
+
+    def measure(self, client, options, rng, now):
+        week_ago = (now - datetime.timedelta(days=7)).isoformat()
+        return {
+            "newest": self.sample(client, options, lambda: {}),
+            "by_wallet": self.sample(client, options, lambda: {
+                "related_wallet_address": wallet(rng.randrange(options["providers"]), "a")}),
+            "by_patient_last_week": self.sample(client, options, lambda: {
+                "related_patient_wallet_address": wallet(rng.randrange(options["patients"]), "b"),
+                "since": week_ago}),
+            "by_type_last_week": self.sample(client, options, lambda: {
+                "event_type": "note_added", "since": week_ago}),
+        }
+
+    def sample(self, client, options, make_params):
+        watch = Stopwatch()
+        for _ in range(options["samples"]):
+            params = dict(make_params(), limit=50)
+            with watch:
+                response = client.get("/api/events/get_events/", params)
+            assert response.status_code == 200, response.status_code
+        return summarise(watch.samples)
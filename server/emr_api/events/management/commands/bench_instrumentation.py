@@ -0,0 +1,62 @@
+import statistics
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from emr_api.benchmarking import Stopwatch, authenticated_client, benchmark_database, dump, seed_events, wallet
+from emr_api.middleware import InstrumentationMiddleware
+from users.models import User
+
+INSTRUMENTATION_MIDDLEWARE = "emr_api.middleware.InstrumentationMiddleware"
+
+
+class Command(BaseCommand):
+    help = "Measure the per-request cost of InstrumentationMiddleware on get_events and getPatientCount."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint per round.")
+        parser.add_argument("--rounds", type=int, default=10)
+
+    def handle(self, *args, **options):
+        without = [name for name in settings.MIDDLEWARE if name != INSTRUMENTATION_MIDDLEWARE]
+        endpoints = {
+            "get_events": ("/api/events/get_events/", {"related_wallet_address": wallet(1, "a"), "limit": 50}),
+            "patient_count": ("/api/patients/getPatientCount/", {}),
+        }
+        report = {"requests": options["requests"], "rounds": options["rounds"], "endpoints": {}}
+        with benchmark_database():
+            seed_events(20000, providers=100, patients=1000)
+            user = User.objects.create(wallet_address=wallet(0, "c"), role="provider")
+            for name, (url, params) in endpoints.items():
+                timings = {"instrumented": [], "bare": []}
+                # Alternate the two setups so drift affects both equally.
+                for _ in range(options["rounds"]):
+                    for setup, middleware in (("bare", without), ("instrumented", settings.MIDDLEWARE)):
+                        with override_settings(MIDDLEWARE=middleware):
+                            client = authenticated_client(user)
+                            client.get(url, params)  # build the middleware chain
+                            watch = Stopwatch()
+                            for _ in range(options["requests"]):
+                                with watch:
+                                    client.get(url, params)
+                        timings[setup].append(statistics.fmean(watch.samples))
+                bare = statistics.median(timings["bare"])
+                instrumented = statistics.median(timings["instrumented"])
+                report["endpoints"][name] = {
+                    "bare_ms": bare * 1000,
+                    "instrumented_ms": instrumented * 1000,
+                    "overhead_pct": (instrumented - bare) / bare * 100,
+                }
+        report["middleware_self_us"] = self.self_time()
+        dump(self.stdout, report)
+
+    def self_time(self):
+        # The middleware around a view that does nothing: its own cost, free of request noise.
+        request = RequestFactory().get("/api/patients/getPatientCount/")
+        response = HttpResponse()
+        middleware = InstrumentationMiddleware(lambda request: response)
+        number = 100000
+        return min(timeit.repeat(lambda: middleware(request), number=number, repeat=5)) / number * 1e6
@@ -0,0 +1,70 @@
+import datetime
+import gzip
+import io
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from emr_api.benchmarking import EVENT_TYPES, dump, wallet
+from emr_api.renderers import ORJSONParser, ORJSONRenderer
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+
+def event_rows(count):
+    """Rows shaped like a get_events page: Event.values() with aware datetimes."""
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    return [{
+        "id": n,
+        "event_type": EVENT_TYPES[n % len(EVENT_TYPES)],
+        "event_details": f"Record {n} viewed by provider during consultation",
+        "timestamp": start + datetime.timedelta(seconds=n * 37, microseconds=n),
+        "related_wallet_address": wallet(n % 1000, "a"),
+        "related_patient_wallet_address": wallet(n % 10000, "b"),
+    } for n in range(count)]
+
+
+class Command(BaseCommand):
+    help = "Compare DRF's JSON renderer/parser with the orjson ones, and body sizes per encoding, for N events."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = {"events": event_rows(options["events"]), "next_cursor": None}
+        repeat = options["repeat"]
+
+        def best_ms(func):
+            return min(timeit.repeat(func, number=1, repeat=repeat)) * 1000
+
+        body = JSONRenderer().render(data)
+        fast_body = ORJSONRenderer().render(data)
+        report = {
+            "events": options["events"],
+            "identical_output": body == fast_body,
+            "render_ms": {
+                "drf": best_ms(lambda: JSONRenderer().render(data)),
+                "orjson": best_ms(lambda: ORJSONRenderer().render(data)),
+            },
+            "parse_ms": {
+                "drf": best_ms(lambda: JSONParser().parse(io.BytesIO(body))),
+                "orjson": best_ms(lambda: ORJSONParser().parse(io.BytesIO(body))),
+            },
+            "bytes": {
+                "identity": len(body),
+                "gzip": len(gzip.compress(body, compresslevel=6)),
+            },
+            "compress_ms": {
+                "gzip": best_ms(lambda: gzip.compress(body, compresslevel=6)),
+            },
+        }
+        if brotli is not None:
+            report["bytes"]["br"] = len(brotli.compress(body, quality=5))
+            report["compress_ms"]["br"] = best_ms(lambda: brotli.compress(body, quality=5))
+        dump(self.stdout, report)
@@ -0,0 +1,107 @@
+import random
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from emr_api.benchmarking import Stopwatch, benchmark_database, dump, seed_events, summarise, wallet
+from emr_api.fields import address_to_bytes, convert_address_columns
+from events.search import SQLITE_TRIGGERS
+
+TEXT_TABLE = "bench_text_events"
+
+# The wallet indexes on events_event (see Event.Meta), rebuilt on the text copy.
+INDEXES = {
+    "event_wallet_ts_idx": "related_wallet_address, timestamp, id",
+    "event_wallet_type_ts_idx": "related_wallet_address, event_type, timestamp, id",
+    "event_patient_ts_idx": "related_patient_wallet_address, timestamp, id",
+}
+
+LOOKUPS = {
+    "by_wallet": ("SELECT id FROM {table} WHERE related_wallet_address = %s "
+                  "ORDER BY timestamp DESC, id DESC LIMIT 50", "a"),
+    "by_patient": ("SELECT id FROM {table} WHERE related_patient_wallet_address = %s "
+                   "ORDER BY timestamp DESC, id DESC LIMIT 50", "b"),
+    "by_wallet_and_type": ("SELECT id FROM {table} WHERE related_wallet_address = %s AND event_type = 'note_added' "
+                           "ORDER BY timestamp DESC, id DESC LIMIT 50", "a"),
+}
+
+
+class Command(BaseCommand):
+    help = ("Compare the wallet indexes of events_event with addresses stored as 20 bytes against a copy "
+            "holding them as 42-character text, by size and by lookup latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=1000000)
+        parser.add_argument("--providers", type=int, default=1000)
+        parser.add_argument("--patients", type=int, default=10000)
+        parser.add_argument("--samples", type=int, default=2000, help="Lookups per query kind and layout.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        report = {"events": options["events"], "binary": {}, "text": {}}
+        with benchmark_database(on_disk=True):
+            if connection.vendor == "sqlite":
+                # Search isn't measured here and its triggers triple the seeding time.
+                with connection.cursor() as cursor:
+                    for trigger in SQLITE_TRIGGERS:
+                        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            seed_events(options["events"], providers=options["providers"], patients=options["patients"], rng=rng)
+            self.stderr.write(f"seeded {options['events']} events")
+            self.copy_as_text()
+
+            for layout, table, suffix, encode in [("binary", "events_event", "", address_to_bytes),
+                                                  ("text", TEXT_TABLE, "_text", str.lower)]:
+                report[layout]["index_bytes"] = {name: self.index_size(name + suffix) for name in INDEXES}
+                report[layout]["index_bytes"]["total"] = sum(report[layout]["index_bytes"].values())
+                for kind, (sql, prefix) in LOOKUPS.items():
+                    population = options["providers"] if prefix == "a" else options["patients"]
+                    report[layout][kind] = self.sample(sql.format(table=table), options["samples"], lambda: encode(
+                        wallet(rng.randrange(population), prefix)))
+
+            # What the data migration costs on a table this size, in a
+            # transaction as migrate runs it.
+            watch = Stopwatch()
+            with watch, transaction.atomic():
+                convert_address_columns(TEXT_TABLE, ["related_wallet_address", "related_patient_wallet_address"]
+                                        ).code(None, SimpleNamespace(connection=connection))
+            report["migration_seconds"] = watch.samples[0]
+        report["index_size_ratio"] = report["binary"]["index_bytes"]["total"] / report["text"]["index_bytes"]["total"]
+        dump(self.stdout, report)
+
+    def copy_as_text(self):
+        # Lowercase hex is the same width as the checksum strings the columns
+        # used to hold, so the indexes come out the same size.
+        if connection.vendor == "postgresql":
+            as_text = "'0x' || encode({}, 'hex')"
+        else:
+            as_text = "'0x' || lower(hex({}))"
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {TEXT_TABLE} (id bigint PRIMARY KEY, event_type varchar(50) NOT NULL, "
+                           f"timestamp timestamp NOT NULL, related_wallet_address varchar(42) NOT NULL, "
+                           f"related_patient_wallet_address varchar(42) NULL)")
+            cursor.execute(f"INSERT INTO {TEXT_TABLE} SELECT id, event_type, timestamp, "
+                           f"{as_text.format('related_wallet_address')}, "
+                           f"{as_text.format('related_patient_wallet_address')} FROM events_event")
+            for name, columns in INDEXES.items():
+                cursor.execute(f"CREATE INDEX {name}_text ON {TEXT_TABLE} ({columns})")
+            cursor.execute("ANALYZE")
+
+    def index_size(self, name):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_relation_size(%s)", [name])
+            else:
+                cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [name])
+            return cursor.fetchone()[0]
+
+    def sample(self, sql, samples, make_address):
+        watch = Stopwatch()
+        with connection.cursor() as cursor:
+            for _ in range(samples):
+                address = make_address()
+                with watch:
+                    cursor.execute(sql, [address])
+                    rows = cursor.fetchall()
+                assert rows, sql
+        return summarise(watch.samples)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from events.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = ("Recompute EventRollup counters from the raw events. Run without arguments to "
+            "backfill all history, or periodically with --since to compact recent days.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--until", help="Day to stop before (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        bounds = {}
+        for name in ("since", "until"):
+            if options[name]:
+                bounds[name] = parse_date(options[name])
+                if bounds[name] is None:
+                    raise CommandError(f"--{name} must be a date in YYYY-MM-DD form.")
+        written = rebuild_rollups(**bounds)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup buckets."))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.audit import audit_settings, seal_batches
+
+
+class Command(BaseCommand):
+    help = ("Seal every full EVENT_AUDIT['BATCH_SIZE'] run of new events into a Merkle-rooted, "
+            "hash-chained audit batch.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--follow", action="store_true", help="Keep sealing as events arrive.")
+        parser.add_argument("--interval", type=float, default=None,
+                            help="Seconds between passes with --follow (default: SETTLE_SECONDS).")
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or audit_settings()["SETTLE_SECONDS"]
+        while True:
+            sealed = seal_batches()
+            if sealed or not options["follow"]:
+                self.stdout.write(f"Sealed {sealed} batches.")
+            if not options["follow"]:
+                return
+            time.sleep(interval)
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.audit import verify_log
+
+
+class Command(BaseCommand):
+    help = ("Recompute the sealed audit batches from the stored events, starting after the last "
+            "verified checkpoint, and fail if any event or batch record was altered.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Start again from the first batch.")
+        parser.add_argument("--limit", type=int, default=None, help="Check at most this many batches.")
+
+    def handle(self, *args, **options):
+        summary = verify_log(full=options["full"], limit=options["limit"])
+        self.stdout.write(json.dumps(summary, indent=2))
+        if summary["failures"]:
+            raise CommandError(f"{len(summary['failures'])} audit batches failed verification; "
+                               f"verified through batch {summary['verified_through']}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Verified {summary['batches']} batches ({summary['events']} events) through batch "
+            f"{summary['verified_through']}."))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_event_related_patient_wallet_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['related_wallet_address', 'timestamp', 'id'], name='event_wallet_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['related_wallet_address', 'event_type', 'timestamp', 'id'], name='event_wallet_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['related_patient_wallet_address', 'timestamp', 'id'], name='event_patient_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['event_type', 'timestamp', 'id'], name='event_type_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['timestamp', 'id'], name='event_ts_idx'),
+        ),
+    ]
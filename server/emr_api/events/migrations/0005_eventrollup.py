@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_event_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('event_type', models.CharField(max_length=50)),
+                ('related_wallet_address', models.CharField(max_length=42)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['related_wallet_address', 'day'], name='event_rollup_wallet_day_idx'), models.Index(fields=['event_type', 'day'], name='event_rollup_type_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'event_type', 'related_wallet_address'), name='event_rollup_bucket_unique')],
+            },
+        ),
+    ]
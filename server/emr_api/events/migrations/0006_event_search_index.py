@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def install(apps, schema_editor):
+    from events.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for trigger in ("events_event_fts_ai", "events_event_fts_ad", "events_event_fts_au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute("DROP TABLE IF EXISTS events_event_fts")
+        elif connection.vendor == "postgresql":
+            cursor.execute("DROP INDEX IF EXISTS event_search_vector_idx")
+            cursor.execute("ALTER TABLE events_event DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_eventrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
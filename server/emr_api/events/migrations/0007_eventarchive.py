@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0006_event_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True)),
+                ('tier', models.CharField(choices=[('table', 'Archive table'), ('file', 'Compressed file')], max_length=8)),
+                ('location', models.CharField(max_length=255)),
+                ('events', models.PositiveBigIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
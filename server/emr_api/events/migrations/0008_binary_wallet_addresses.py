@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:05
+
+import emr_api.fields
+from django.db import migrations
+
+ADDRESS_COLUMNS = ['related_wallet_address', 'related_patient_wallet_address']
+
+
+def drop_search_triggers(apps, schema_editor):
+    # The triggers index addresses differently now; install_search_index
+    # recreates them and reindexes once the columns are converted.
+    from events.search import SQLITE_TRIGGERS
+    if schema_editor.connection.vendor == "sqlite":
+        with schema_editor.connection.cursor() as cursor:
+            for trigger in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+
+def install_search_index(apps, schema_editor):
+    from events.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def archive_tables(apps):
+    EventArchive = apps.get_model('events', 'EventArchive')
+    return list(EventArchive.objects.filter(tier='table').values_list('location', flat=True))
+
+
+def convert_archive_tables(apps, schema_editor):
+    # Archive tables aren't in the migration state, so convert them by hand.
+    connection = schema_editor.connection
+    for table in archive_tables(apps):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                for column in ADDRESS_COLUMNS:
+                    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE bytea "
+                                   f"USING decode(substr({column}, 3), 'hex')")
+        else:
+            emr_api.fields.convert_address_columns(table, ADDRESS_COLUMNS).code(apps, schema_editor)
+
+
+def unconvert_archive_tables(apps, schema_editor):
+    for table in archive_tables(apps):
+        emr_api.fields.convert_address_columns(table, ADDRESS_COLUMNS).reverse_code(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_eventarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, install_search_index),
+        migrations.AlterField(
+            model_name='event',
+            name='related_patient_wallet_address',
+            field=emr_api.fields.WalletAddressField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='related_wallet_address',
+            field=emr_api.fields.WalletAddressField(),
+        ),
+        migrations.AlterField(
+            model_name='eventrollup',
+            name='related_wallet_address',
+            field=emr_api.fields.WalletAddressField(),
+        ),
+        emr_api.fields.convert_address_columns('events_event', ADDRESS_COLUMNS),
+        emr_api.fields.convert_address_columns('events_eventrollup', ['related_wallet_address']),
+        migrations.RunPython(convert_archive_tables, unconvert_archive_tables),
+        migrations.RunPython(install_search_index, drop_search_triggers),
+    ]
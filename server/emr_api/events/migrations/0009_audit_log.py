@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0008_binary_wallet_addresses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditBatch',
+            fields=[
+                ('number', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('first_event_id', models.PositiveBigIntegerField()),
+                ('last_event_id', models.PositiveBigIntegerField(unique=True)),
+                ('size', models.PositiveIntegerField()),
+                ('first_timestamp', models.DateTimeField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('root', models.CharField(max_length=64)),
+                ('chain_hash', models.CharField(max_length=64)),
+                ('chunks', models.BinaryField()),
+                ('sealed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_number', models.PositiveBigIntegerField()),
+                ('chain_hash', models.CharField(max_length=64)),
+                ('verified_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuditExpiredLeaf',
+            fields=[
+                ('event_id', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('leaf_hash', models.CharField(max_length=64)),
+                ('expired_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0009_audit_log'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+
+from emr_api.fields import WalletAddressField
 
 # Create your models here.
 class Event(models.Model):
@@ -23,9 +26,107 @@ class Event(models.Model):
     id = models.AutoField(primary_key=True)
     event_type = models.CharField(max_length=50, choices=event_types)
     event_details = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
-    related_wallet_address = models.CharField(max_length=42)
-    related_patient_wallet_address = models.CharField(max_length=42, null=True, blank=True) 
+    # Stamped when the Event is built, not when it is saved, so events held by
+    # the write buffer (events/ingest.py) keep the time they were submitted.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    related_wallet_address = WalletAddressField()
+    related_patient_wallet_address = WalletAddressField(null=True, blank=True)
+
+    class Meta:
+        # Every listing is ordered by (timestamp, id), so each filter column
+        # leads a composite index ending in the keyset columns.
+        indexes = [
+            models.Index(fields=['related_wallet_address', 'timestamp', 'id'], name='event_wallet_ts_idx'),
+            models.Index(fields=['related_wallet_address', 'event_type', 'timestamp', 'id'],
+                         name='event_wallet_type_ts_idx'),
+            models.Index(fields=['related_patient_wallet_address', 'timestamp', 'id'], name='event_patient_ts_idx'),
+            models.Index(fields=['event_type', 'timestamp', 'id'], name='event_type_ts_idx'),
+            models.Index(fields=['timestamp', 'id'], name='event_ts_idx'),
+        ]
 
     def __str__(self):
         return f"Event {self.id} - {self.event_type} at {self.timestamp}"
+
+
+# Per-day event counters, kept up to date by events.rollups so that
+# statistics never have to scan the raw Event table.
+class EventRollup(models.Model):
+    day = models.DateField()
+    event_type = models.CharField(max_length=50)
+    related_wallet_address = WalletAddressField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'event_type', 'related_wallet_address'],
+                                    name='event_rollup_bucket_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['related_wallet_address', 'day'], name='event_rollup_wallet_day_idx'),
+            models.Index(fields=['event_type', 'day'], name='event_rollup_type_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.event_type} {self.related_wallet_address}: {self.count}"
+
+
+# Catalogue of months moved out of Event by events.archive: where each one
+# lives now and how many events it holds.
+class EventArchive(models.Model):
+    TABLE = 'table'
+    FILE = 'file'
+    tiers = [
+        (TABLE, 'Archive table'),
+        (FILE, 'Compressed file'),
+    ]
+
+    month = models.DateField(unique=True)
+    tier = models.CharField(max_length=8, choices=tiers)
+    location = models.CharField(max_length=255)
+    events = models.PositiveBigIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} ({self.tier}): {self.events} events"
+
+
+# A sealed run of BATCH_SIZE consecutive events (by id) in the audit log,
+# see events/audit.py. Hashes are hex.
+class AuditBatch(models.Model):
+    number = models.PositiveBigIntegerField(primary_key=True)
+    first_event_id = models.PositiveBigIntegerField()
+    last_event_id = models.PositiveBigIntegerField(unique=True)
+    size = models.PositiveIntegerField()
+    # Where the events were in time when sealed, to find their archive months.
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    root = models.CharField(max_length=64)
+    chain_hash = models.CharField(max_length=64)
+    # (first event id, subtree root) per chunk of events; lets a proof read
+    # one chunk instead of the whole batch.
+    chunks = models.BinaryField()
+    sealed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Batch {self.number}: events {self.first_event_id}-{self.last_event_id}"
+
+
+# Leaf hashes of sealed events deleted by the retention policy.
+class AuditExpiredLeaf(models.Model):
+    event_id = models.PositiveBigIntegerField(primary_key=True)
+    leaf_hash = models.CharField(max_length=64)
+    expired_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Expired event {self.event_id}"
+
+
+# The last batch verify_audit_log checked, and its chain hash, so the next
+# run only reads what was sealed since. A single row.
+class AuditCheckpoint(models.Model):
+    batch_number = models.PositiveBigIntegerField()
+    chain_hash = models.CharField(max_length=64)
+    verified_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Verified through batch {self.batch_number} at {self.verified_at}"
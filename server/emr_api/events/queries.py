@@ -0,0 +1,128 @@
+# Filtering and keyset pagination for the event audit trail. Pages are
+# ordered newest first on (timestamp, id) and the cursor carries the last
+# row's (timestamp, id), so every page is a bounded index range scan no
+# matter how deep into the history the client is.
+#
+# Months moved out of Event by `manage.py archive_events` are merged in by
+# events.archive.fan_out, which only touches the ones a page can reach.
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from emr_api.fields import normalize_address
+from emr_api.pagination import decode_cursor, encode_cursor, parse_int_param
+from .archive import fan_out
+from .models import Event
+from .rollups import GROUP_FIELDS
+
+EVENT_PAGE_SIZE = 100
+EVENT_MAX_PAGE_SIZE = 1000
+
+
+def _parse_time(value, name):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"{name} must be an ISO 8601 datetime.")
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def parse_event_filters(params):
+    """
+    Turn query params into filter keyword arguments for Event.objects.filter.
+
+    Wallet, patient, type and time filters are all ANDed together. event_type
+    accepts a comma separated list. Raises ValueError on bad input.
+    """
+    filters = {}
+    for field in ("related_wallet_address", "related_patient_wallet_address"):
+        if params.get(field):
+            filters[field] = normalize_address(params[field])
+
+    event_types = [t for t in (params.get("event_type") or "").split(",") if t]
+    if len(event_types) == 1:
+        filters["event_type"] = event_types[0]
+    elif event_types:
+        filters["event_type__in"] = event_types
+
+    since = _parse_time(params.get("since"), "since")
+    until = _parse_time(params.get("until"), "until")
+    if since:
+        filters["timestamp__gte"] = since
+    if until:
+        filters["timestamp__lt"] = until
+    return filters
+
+
+def parse_stats_params(params):
+    """Return (group_by, filters) for event_stats from query params; raises ValueError."""
+    group_by = [f for f in params.get("group_by", "day").split(",") if f]
+    if any(f not in GROUP_FIELDS for f in group_by):
+        raise ValueError(f"group_by must be made of {', '.join(GROUP_FIELDS)}.")
+
+    filters = {}
+    for param, lookup in (("since", "day__gte"), ("until", "day__lt")):
+        value = params.get(param)
+        if value:
+            try:
+                parsed = parse_date(value)
+            except ValueError:  # well formed but not a real date, e.g. 2024-13-40
+                parsed = None
+            if parsed is None:
+                raise ValueError(f"{param} must be an ISO date.")
+            filters[lookup] = parsed
+    if params.get("event_type"):
+        filters["event_type"] = params["event_type"]
+    if params.get("related_wallet_address"):
+        filters["related_wallet_address"] = normalize_address(params["related_wallet_address"])
+    return group_by, filters
+
+
+def parse_page_params(params):
+    """Return (cursor position, limit) from query params; raises ValueError."""
+    limit = parse_int_param(params.get("limit"), EVENT_PAGE_SIZE, minimum=1, maximum=EVENT_MAX_PAGE_SIZE)
+    if limit is None:
+        raise ValueError("limit must be a positive integer.")
+    position = None
+    if params.get("cursor"):
+        timestamp, event_id = decode_cursor(params["cursor"], 2)
+        position = (_parse_time(timestamp, "cursor"), int(event_id) if event_id.isdigit() else None)
+        if position[0] is None or position[1] is None:
+            raise ValueError("Malformed cursor.")
+    return position, limit
+
+
+def page_queryset(filters, position=None, limit=EVENT_PAGE_SIZE, model=Event):
+    """The query behind one page; it fetches limit + 1 rows to detect a next page."""
+    events = model.objects.filter(**filters)
+    if position is not None:
+        timestamp, event_id = position
+        events = events.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=event_id))
+    return events.order_by("-timestamp", "-id").values()[:limit + 1]
+
+
+def finish_page(rows, limit):
+    """Trim the look-ahead row and build the cursor: returns (rows, next_cursor)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last["timestamp"].isoformat(), last["id"])
+
+
+def event_page(filters, position=None, limit=EVENT_PAGE_SIZE):
+    """
+    Fetch one page of events as dicts, newest first.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rows = list(page_queryset(filters, position, limit))
+    return finish_page(fan_out(rows, filters, position, limit), limit)
+
+
+async def aevent_page(filters, position=None, limit=EVENT_PAGE_SIZE):
+    """Async counterpart of event_page."""
+    rows = [row async for row in page_queryset(filters, position, limit)]
+    return finish_page(await sync_to_async(fan_out)(rows, filters, position, limit), limit)
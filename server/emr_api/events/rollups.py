@@ -0,0 +1,95 @@
+# Incrementally maintained (day, event_type, related_wallet_address) counters.
+from collections import Counter
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from .archive import archived_until
+from .models import Event, EventRollup
+
+GROUP_FIELDS = ("day", "event_type", "related_wallet_address")
+
+
+def _bucket(event):
+    return (event.timestamp.astimezone(dt_timezone.utc).date(), event.event_type, event.related_wallet_address)
+
+
+def record_events(events):
+    """Add freshly inserted events to their rollup buckets. One statement per distinct bucket."""
+    for (day, event_type, wallet), count in Counter(_bucket(e) for e in events).items():
+        _increment(day, event_type, wallet, count)
+
+
+def _increment(day, event_type, wallet, count):
+    bucket = EventRollup.objects.filter(day=day, event_type=event_type, related_wallet_address=wallet)
+    if bucket.update(count=F("count") + count):
+        return
+    try:
+        # Savepoint so a concurrent insert of the same bucket doesn't break the outer transaction.
+        with transaction.atomic():
+            EventRollup.objects.create(day=day, event_type=event_type, related_wallet_address=wallet, count=count)
+    except IntegrityError:
+        bucket.update(count=F("count") + count)
+
+
+def rebuild_rollups(since=None, until=None, batch_size=1000):
+    """
+    Recompute the rollups for [since, until) (dates, either may be None) from
+    the raw events. Returns the number of buckets written.
+
+    Days in archived months (see events.archive) are never rebuilt: their
+    events have left the Event table, so their rollups are kept as they were
+    when the month was archived.
+    """
+    boundary = archived_until()
+    if boundary is not None and (since is None or since < boundary.date()):
+        since = boundary.date()
+        if until is not None and until <= since:
+            return 0
+    events = Event.objects.all()
+    rollups = EventRollup.objects.all()
+    if since:
+        events = events.filter(timestamp__date__gte=since)
+        rollups = rollups.filter(day__gte=since)
+    if until:
+        events = events.filter(timestamp__date__lt=until)
+        rollups = rollups.filter(day__lt=until)
+
+    buckets = (events
+               .annotate(day=TruncDate("timestamp", tzinfo=dt_timezone.utc))
+               .values(*GROUP_FIELDS)
+               .annotate(total=Count("id"))
+               .order_by())
+    with transaction.atomic():
+        rollups.delete()
+        written, batch = 0, []
+        for bucket in buckets.iterator(chunk_size=batch_size):
+            batch.append(EventRollup(day=bucket["day"], event_type=bucket["event_type"],
+                                     related_wallet_address=bucket["related_wallet_address"],
+                                     count=bucket["total"]))
+            if len(batch) == batch_size:
+                written += len(EventRollup.objects.bulk_create(batch))
+                batch = []
+        written += len(EventRollup.objects.bulk_create(batch))
+    return written
+
+
+def event_stats(group_by, filters):
+    """
+    Sum rollup counts grouped by any of GROUP_FIELDS. `filters` apply to the
+    rollup table (day__gte, event_type, related_wallet_address, ...).
+    """
+    rows = EventRollup.objects.filter(**filters)
+    if not group_by:
+        return [{"count": rows.aggregate(total=Sum("count"))["total"] or 0}]
+    return list(rows.values(*group_by).annotate(count=Sum("count")).order_by(*group_by))
+
+
+async def aevent_stats(group_by, filters):
+    """Async counterpart of event_stats."""
+    rows = EventRollup.objects.filter(**filters)
+    if not group_by:
+        return [{"count": (await rows.aaggregate(total=Sum("count")))["total"] or 0}]
+    return [row async for row in rows.values(*group_by).annotate(count=Sum("count")).order_by(*group_by)]
@@ -0,0 +1,241 @@
+# Full-text search over Event.event_details, combined with the usual
+# get_events filters.
+#
+# SQLite keeps an external-content FTS5 table, events_event_fts, in step
+# with events_event through triggers. PostgreSQL keeps a generated tsvector
+# column, events_event.search_vector, behind a GIN index. Either way the
+# database maintains the index itself, so bulk_create, the write-behind
+# buffer and raw SQL inserts are all searchable as soon as they commit.
+#
+# The text index finds the hits newest first, and only one page of ids is
+# fetched, so a query costs about the same at 10M events as at 10k.
+# sort=recent stops as soon as it has a page. sort=rank scores only the
+# newest SEARCH_RANK_WINDOW matches, so a word in half of all events costs
+# no more than a rare one. The catch is that ranked results never reach
+# past that window; add filters to look further back.
+#
+# Only events_event is indexed. Months moved out by archive_events (see
+# events/archive.py) are not searchable, so a search whose time range
+# reaches one is refused with SearchRangeArchived rather than answered
+# with a page that silently leaves them out.
+import re
+
+from django.db import connection
+from django.core.exceptions import EmptyResultSet, FullResultSet
+
+from emr_api.fields import address_to_bytes
+from emr_api.pagination import decode_cursor, encode_cursor, parse_int_param
+from .archive import archived_until
+from .models import Event
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 200
+# sort=rank scores this many of the newest matches and pages through them.
+SEARCH_RANK_WINDOW = 10000
+SEARCH_MAX_TERMS = 16
+SEARCH_SORTS = ("rank", "recent")
+
+_TERM = re.compile(r"(\w+)(\*?)")
+
+# The filter columns are indexed alongside the text so that "common word
+# for one wallet" is a doclist intersection inside FTS5 rather than a walk
+# over every event containing the word. Addresses are stored as 20 bytes
+# and indexed as lowercase hex.
+SQLITE_COLUMNS = "event_details, event_type, related_wallet_address, related_patient_wallet_address"
+SQLITE_FILTER_COLUMNS = ("event_type", "related_wallet_address", "related_patient_wallet_address")
+SQLITE_ADDRESS_COLUMNS = ("related_wallet_address", "related_patient_wallet_address")
+
+
+def _indexed(row):
+    return ", ".join(f"lower(hex({row}.{c}))" if c in SQLITE_ADDRESS_COLUMNS else f"{row}.{c}"
+                     for c in SQLITE_COLUMNS.split(", "))
+
+
+SQLITE_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS events_event_fts USING fts5(
+        {SQLITE_COLUMNS}, content='events_event', content_rowid='id', tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_event_fts_ai AFTER INSERT ON events_event BEGIN
+        INSERT INTO events_event_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {_indexed("new")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_event_fts_ad AFTER DELETE ON events_event BEGIN
+        INSERT INTO events_event_fts(events_event_fts, rowid, {SQLITE_COLUMNS})
+            VALUES ('delete', old.id, {_indexed("old")});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS events_event_fts_au AFTER UPDATE OF {SQLITE_COLUMNS} ON events_event BEGIN
+        INSERT INTO events_event_fts(events_event_fts, rowid, {SQLITE_COLUMNS})
+            VALUES ('delete', old.id, {_indexed("old")});
+        INSERT INTO events_event_fts(rowid, {SQLITE_COLUMNS}) VALUES (new.id, {_indexed("new")});
+    END""",
+]
+# FTS5's own 'rebuild' would copy the raw address bytes; index what the triggers do instead.
+SQLITE_REBUILD = [
+    "INSERT INTO events_event_fts(events_event_fts) VALUES ('delete-all')",
+    f"""INSERT INTO events_event_fts(rowid, {SQLITE_COLUMNS})
+        SELECT id, {_indexed("events_event")} FROM events_event""",
+]
+SQLITE_TRIGGERS = ("events_event_fts_ai", "events_event_fts_ad", "events_event_fts_au")
+
+POSTGRESQL_INDEX = [
+    """ALTER TABLE events_event ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(event_details, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS event_search_vector_idx ON events_event USING gin (search_vector)",
+]
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+class SearchRangeArchived(Exception):
+    def __init__(self, searchable_since):
+        super().__init__(f"Events before {searchable_since.isoformat()} are archived and not searchable; "
+                         f"pass since={searchable_since.isoformat()} or later, or use export_events.")
+        self.searchable_since = searchable_since
+
+
+def install_search_index(conn):
+    """
+    Create the full-text index for this backend if it is missing.
+
+    On SQLite, rebuilding events_event (as some ALTER TABLE migrations do)
+    drops its triggers. Missing triggers are recreated and the index is
+    rebuilt from the table, so this is also run after every migrate.
+    """
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+                           SQLITE_TRIGGERS)
+            missing = set(SQLITE_TRIGGERS) - {name for name, in cursor.fetchall()}
+            if missing:
+                for statement in SQLITE_INDEX + SQLITE_REBUILD:
+                    cursor.execute(statement)
+        elif conn.vendor == "postgresql":
+            for statement in POSTGRESQL_INDEX:
+                cursor.execute(statement)
+
+
+def parse_search_query(text):
+    """
+    Split a user query into (word, is_prefix) terms; raises ValueError.
+
+    Every term must match (AND). A trailing * makes a term a prefix match,
+    so "presc*" finds "prescription". Anything other than words and * is
+    ignored, so user input can never inject full-text query syntax.
+    """
+    terms = [(word.lower(), bool(star)) for word, star in _TERM.findall(text or "")]
+    if not terms:
+        raise ValueError("q must contain at least one word.")
+    if len(terms) > SEARCH_MAX_TERMS:
+        raise ValueError(f"q may contain at most {SEARCH_MAX_TERMS} words.")
+    return terms
+
+
+def parse_search_params(params):
+    """Return (terms, sort, position, limit) from query params; raises ValueError."""
+    terms = parse_search_query(params.get("q"))
+    sort = params.get("sort") or "rank"
+    if sort not in SEARCH_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SEARCH_SORTS)}.")
+    limit = parse_int_param(params.get("limit"), SEARCH_PAGE_SIZE, minimum=1, maximum=SEARCH_MAX_PAGE_SIZE)
+    if limit is None:
+        raise ValueError("limit must be a positive integer.")
+    position = None
+    if params.get("cursor"):
+        cursor_sort, value = decode_cursor(params["cursor"], 2)
+        if cursor_sort != sort or not value.isdigit():
+            raise ValueError("Malformed cursor.")
+        position = int(value)
+    return terms, sort, position, limit
+
+
+def _fts5_phrase(value):
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _fts5_query(terms, filters):
+    """
+    FTS5 query for the terms, narrowed by the equality filters. The filter
+    columns are tokenised (and so case-folded), so the exact filters are
+    still applied to events_event; these only shrink the candidate set.
+    """
+    parts = [f"event_details:{_fts5_phrase(word)}" + ("*" if prefix else "") for word, prefix in terms]
+    for column in SQLITE_FILTER_COLUMNS:
+        values = [filters[column]] if column in filters else filters.get(f"{column}__in", [])
+        if column in SQLITE_ADDRESS_COLUMNS:
+            values = [address_to_bytes(value).hex() for value in values]
+        if values:
+            parts.append("(" + " OR ".join(f"{column}:{_fts5_phrase(value)}" for value in values) + ")")
+    return " AND ".join(parts)
+
+
+def _tsquery(terms):
+    return " & ".join(word + (":*" if prefix else "") for word, prefix in terms)
+
+
+def _filter_sql(filters):
+    """WHERE fragment and params for get_events-style filters on events_event."""
+    query = Event.objects.filter(**filters).query
+    try:
+        sql, params = query.get_compiler(connection=connection).compile(query.where)
+    except FullResultSet:
+        return "", []
+    return f" AND {sql}", list(params)
+
+
+def _ranked_ids(terms, filters, sort, position, limit):
+    try:
+        where, params = _filter_sql(filters)
+    except EmptyResultSet:
+        return []
+    if connection.vendor == "sqlite":
+        match, text, newest_first = "events_event_fts MATCH %s", _fts5_query(terms, filters), "events_event_fts.rowid DESC"
+        # bm25() is lower for better matches; negate so both backends sort score DESC.
+        score = "-bm25(events_event_fts)"
+        source = "events_event_fts JOIN events_event ON events_event.id = events_event_fts.rowid"
+        before = "events_event_fts.rowid < %s"
+    elif connection.vendor == "postgresql":
+        match, text, newest_first = "events_event.search_vector @@ query", _tsquery(terms), "events_event.id DESC"
+        score = "ts_rank_cd(events_event.search_vector, query)"
+        source = "events_event, to_tsquery('english', %s) query"
+        before = "events_event.id < %s"
+    else:
+        raise SearchUnavailable(f"Full-text search is not supported on {connection.vendor}.")
+
+    head, head_params = f"FROM {source} WHERE {match}", [text]
+    if sort == "recent":
+        after, after_params = (f" AND {before}", [position]) if position else ("", [])
+        sql = f"SELECT events_event.id, NULL {head}{after}{where} ORDER BY {newest_first} LIMIT %s"
+        params = [*head_params, *after_params, *params, limit + 1]
+    else:
+        # Only the newest SEARCH_RANK_WINDOW matches are scored, so a word in
+        # half of all events costs the same as a rare one.
+        sql = (f"SELECT id, score FROM (SELECT events_event.id AS id, {score} AS score {head}{where} "
+               f"ORDER BY {newest_first} LIMIT %s) hits ORDER BY score DESC, id DESC LIMIT %s OFFSET %s")
+        params = [*head_params, *params, SEARCH_RANK_WINDOW, limit + 1, position or 0]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_events(terms, filters, sort="rank", position=None, limit=SEARCH_PAGE_SIZE):
+    """
+    One page of events matching every term in `terms` and the get_events
+    `filters`, best match first (sort="rank") or newest first
+    (sort="recent"). Returns (rows, next_cursor). Each row is an event dict
+    with a "score" (None for sort="recent"). Ranked pages stop at the end of
+    the SEARCH_RANK_WINDOW newest matches. Raises SearchRangeArchived if
+    the filters' time range reaches an archived month.
+    """
+    boundary = archived_until()
+    if boundary is not None and (filters.get("timestamp__gte") is None or filters["timestamp__gte"] < boundary):
+        raise SearchRangeArchived(boundary)
+    hits = _ranked_ids(terms, filters, sort, position, limit)
+    more, hits = len(hits) > limit, hits[:limit]
+    events = {row["id"]: row for row in Event.objects.filter(id__in=[pk for pk, _ in hits]).values()}
+    # A hit deleted between the two queries is dropped rather than failing the page.
+    rows = [{**events[pk], "score": score} for pk, score in hits if pk in events]
+    next_cursor = None
+    if more:
+        value = (position or 0) + limit if sort == "rank" else hits[-1][0]
+        next_cursor = encode_cursor(sort, value)
+    return rows, next_cursor
@@ -0,0 +1,260 @@
+# Live event push for the dashboards, as Server-Sent Events over the ASGI
+# entry point (see EventStreamView in events/async_views.py).
+#
+# Each process runs one EventBroker. Its tail task reads events_event for ids
+# above the last one it dispatched and hands every new row to the
+# subscribers whose wallet/patient filter it matches. insert_events wakes
+# the task as soon as a write in this process commits; writes from other
+# processes are picked up on the next POLL_INTERVAL. So the database is read
+# once per process, not once per dashboard.
+#
+# Each subscriber has a bounded queue. One that falls QUEUE_SIZE events
+# behind is sent a "resync" event and disconnected instead of buffering
+# without limit. Clients reconnect with Last-Event-ID and are replayed
+# what they missed from the table. Delivery is at least once; dedupe by id.
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db.models import Max, Q
+
+from emr_api.renderers import dumps
+
+from .models import Event
+
+DEFAULT_EVENT_STREAM = {
+    # Events buffered per subscriber before it is told to resync.
+    "QUEUE_SIZE": 256,
+    # Seconds between reads for events written by other processes.
+    "POLL_INTERVAL": 1.0,
+    # Seconds between keep-alive comments on an idle stream.
+    "HEARTBEAT": 15.0,
+    # Most events replayed on resume; further behind means resync.
+    "REPLAY_LIMIT": 1000,
+    # How long an id skipped by the tail (a transaction that hasn't
+    # committed yet, or rolled back) is looked for again.
+    "GAP_SECONDS": 10.0,
+    "MAX_SUBSCRIBERS": 20000,
+}
+
+TAIL_BATCH = 1000
+# Queued in place of an event when a subscriber overflows.
+RESYNC = None
+
+
+def stream_settings():
+    return {**DEFAULT_EVENT_STREAM, **getattr(settings, "EVENT_STREAM", {})}
+
+
+class BrokerFull(Exception):
+    pass
+
+
+class Subscriber:
+    """
+    One stream's filter and its bounded queue. A deque and a single waiter
+    future rather than an asyncio.Queue, which with its locks and the task
+    wait_for wraps each get in costs several times more per idle connection.
+    """
+    __slots__ = ("wallet", "patient", "limit", "rows", "waiter")
+
+    def __init__(self, wallet, patient, queue_size):
+        self.wallet = wallet
+        self.patient = patient
+        self.limit = queue_size
+        self.rows = deque()
+        self.waiter = None
+
+    def matches(self, row):
+        return ((self.wallet is None or row["related_wallet_address"] == self.wallet)
+                and (self.patient is None or row["related_patient_wallet_address"] == self.patient))
+
+    def offer(self, row):
+        """Queue a row; returns False if the subscriber overflowed and must resync."""
+        overflowed = len(self.rows) >= self.limit
+        if overflowed:
+            # Too far behind: drop what is queued and tell it to resume from the table.
+            self.rows.clear()
+            row = RESYNC
+        self.rows.append(row)
+        self._wake()
+        return not overflowed
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def get(self, timeout):
+        """The next queued row or RESYNC; raises TimeoutError after `timeout` idle seconds."""
+        if not self.rows:
+            loop = asyncio.get_running_loop()
+            self.waiter = loop.create_future()
+            timer = loop.call_later(timeout, self._wake)
+            try:
+                await self.waiter
+            finally:
+                timer.cancel()
+                self.waiter = None
+            if not self.rows:
+                raise TimeoutError
+        return self.rows.popleft()
+
+
+class EventBroker:
+    """Fans new Event rows out to the stream subscribers of one process."""
+
+    def __init__(self, queue_size=256, poll_interval=1.0, gap_seconds=10.0, max_subscribers=20000):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.gap_seconds = gap_seconds
+        self.max_subscribers = max_subscribers
+        self._reset(None)
+
+    def _reset(self, loop):
+        self.stats = {"subscribers": 0, "dispatched": 0, "delivered": 0, "resyncs": 0, "polls": 0}
+        self._loop = loop
+        self._wake = asyncio.Event() if loop is not None else None
+        self._task = None
+        self._by_wallet = defaultdict(set)
+        self._by_patient = defaultdict(set)
+        self._unfiltered = set()
+        # The last id dispatched; None while no tail task runs.
+        self._high_water = None
+        # id -> monotonic deadline, for ids the tail skipped over.
+        self._gaps = {}
+
+    def _index(self, subscriber):
+        # Each subscriber is filed under one key; the other filter is checked per row.
+        if subscriber.wallet is not None:
+            return self._by_wallet[subscriber.wallet]
+        if subscriber.patient is not None:
+            return self._by_patient[subscriber.patient]
+        return self._unfiltered
+
+    async def subscribe(self, wallet=None, patient=None):
+        """
+        Register a subscriber for events committed from now on. Raises
+        BrokerFull past MAX_SUBSCRIBERS.
+        """
+        from asgiref.sync import sync_to_async
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._loop is not None and not self._loop.is_closed() and self.stats["subscribers"]:
+                # Resetting would orphan the streams still open on the other loop.
+                raise RuntimeError("The event broker is serving streams on another event loop.")
+            # A new event loop (tests run one per case): start afresh on it.
+            self._reset(loop)
+        if self.stats["subscribers"] >= self.max_subscribers:
+            raise BrokerFull("Too many event stream subscribers, retry later.")
+        if self._high_water is None:
+            newest = await sync_to_async(self._newest, thread_sensitive=False)()
+            if self._high_water is None:
+                self._high_water = newest
+        subscriber = Subscriber(wallet, patient, self.queue_size)
+        self._index(subscriber).add(subscriber)
+        self.stats["subscribers"] += 1
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._tail())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        index = self._index(subscriber)
+        if subscriber in index:
+            index.discard(subscriber)
+            self.stats["subscribers"] -= 1
+            if not index and index is not self._unfiltered:
+                (self._by_wallet if subscriber.wallet is not None else self._by_patient).pop(
+                    subscriber.wallet if subscriber.wallet is not None else subscriber.patient, None)
+
+    def notify(self):
+        """Wake the tail task; safe to call from any thread."""
+        loop, wake = self._loop, self._wake
+        if loop is None or not self.stats["subscribers"]:
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # the loop has closed
+
+    def dispatch(self, rows):
+        """Offer rows (Event values() dicts) to every matching subscriber."""
+        for row in rows:
+            candidates = [self._unfiltered, self._by_wallet.get(row["related_wallet_address"], ())]
+            if row["related_patient_wallet_address"] is not None:
+                candidates.append(self._by_patient.get(row["related_patient_wallet_address"], ()))
+            for group in candidates:
+                for subscriber in group:
+                    if subscriber.matches(row):
+                        self.stats["delivered" if subscriber.offer(row) else "resyncs"] += 1
+            self.stats["dispatched"] += 1
+
+    @staticmethod
+    def _newest():
+        return Event.objects.aggregate(newest=Max("id"))["newest"] or 0
+
+    def _read(self):
+        # Runs in a worker thread.
+        now = time.monotonic()
+        self._gaps = {event_id: deadline for event_id, deadline in self._gaps.items() if deadline > now}
+        query = Q(id__gt=self._high_water)
+        if self._gaps:
+            query |= Q(id__in=list(self._gaps))
+        rows = list(Event.objects.filter(query).order_by("id").values()[:TAIL_BATCH])
+        for row in rows:
+            self._gaps.pop(row["id"], None)
+            if row["id"] > self._high_water:
+                for missing in range(self._high_water + 1, min(row["id"], self._high_water + TAIL_BATCH)):
+                    self._gaps[missing] = now + self.gap_seconds
+                self._high_water = row["id"]
+        return rows
+
+    async def _tail(self):
+        from asgiref.sync import sync_to_async
+
+        read = sync_to_async(self._read, thread_sensitive=False)
+        while self.stats["subscribers"]:
+            self._wake.clear()
+            rows = await read()
+            self.stats["polls"] += 1
+            self.dispatch(rows)
+            if len(rows) == TAIL_BATCH:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        # Nobody is listening: the next subscriber starts from the newest event.
+        self._high_water = None
+        self._gaps = {}
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            options = stream_settings()
+            _broker = EventBroker(options["QUEUE_SIZE"], options["POLL_INTERVAL"], options["GAP_SECONDS"],
+                                  options["MAX_SUBSCRIBERS"])
+        return _broker
+
+
+def notify_new_events():
+    """Called by insert_events once its transaction commits."""
+    if _broker is not None:
+        _broker.notify()
+
+
+def format_event(row):
+    return b"id: %d\nevent: event\ndata: %s\n\n" % (row["id"], dumps(row))
+
+
+def replay(filters, after_id, limit):
+    """Events after `after_id` matching `filters`, oldest first, at most limit + 1."""
+    return list(Event.objects.filter(id__gt=after_id, **filters).order_by("id").values()[:limit + 1])
@@ -1,3 +1,873 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from users.models import User
+from .archive import archive_events, archive_table_model, month_start, next_month
+from .audit import root_from_proof, seal_batches, verify_log
+from .export import EXPORT_FIELDS, columnar_stream, export_rows, read_columnar
+from .ingest import BufferFull, EventWriteBuffer, build_event, insert_events
+from .models import AuditBatch, AuditCheckpoint, Event, EventArchive, EventRollup
+from .queries import event_page
+from .rollups import rebuild_rollups
+from .search import SQLITE_TRIGGERS, install_search_index
+from .stream import RESYNC, EventBroker
+
+PROVIDER = '0x00000000000000000000000000000000000000aa'
+PATIENT = '0x00000000000000000000000000000000000000bb'
+OTHER_PATIENT = '0x00000000000000000000000000000000000000cc'
+
+
+class EventTestCase(TestCase):
+    def setUp(self):
+        """
+        Create an authenticated client.
+        """
+        self.client = APIClient()
+        user = User.objects.create(wallet_address=PROVIDER, role='provider')
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def make_events(self, count, **fields):
+        fields.setdefault('event_type', 'record_accessed')
+        fields.setdefault('related_wallet_address', PROVIDER)
+        return [Event.objects.create(**{'event_details': f'event {i}', **fields}) for i in range(count)]
+
+
+class GetEventsViewTests(EventTestCase):
+    def test_wallet_and_patient_filters_are_combined(self):
+        """
+        Test that the wallet and patient filters are ANDed instead of the second replacing the first.
+        """
+        wanted = self.make_events(2, related_patient_wallet_address=PATIENT)
+        self.make_events(2, related_patient_wallet_address=OTHER_PATIENT)
+        self.make_events(2, related_wallet_address='0x' + 'd' * 40, related_patient_wallet_address=PATIENT)
+
+        response = self.client.get('/api/events/get_events/', {
+            'related_wallet_address': PROVIDER,
+            'related_patient_wallet_address': PATIENT,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({e['id'] for e in response.data['events']}, {e.id for e in wanted})
+
+    def test_cursor_pagination_visits_every_event_once(self):
+        """
+        Test that following next_cursor returns every event newest first without repeats.
+        """
+        events = self.make_events(7)
+        seen, params = [], {'related_wallet_address': PROVIDER, 'limit': 3}
+        while True:
+            response = self.client.get('/api/events/get_events/', params)
+            seen += [e['id'] for e in response.data['events']]
+            if response.data['next_cursor'] is None:
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(seen, sorted((e.id for e in events), reverse=True))
+
+    def test_type_and_time_filters(self):
+        """
+        Test that event_type and the since/until window narrow the results.
+        """
+        old = self.make_events(1, event_type='note_added')[0]
+        Event.objects.filter(id=old.id).update(timestamp=timezone.now() - timedelta(days=10))
+        recent = self.make_events(1, event_type='note_added')[0]
+        self.make_events(1, event_type='access_granted')
+
+        response = self.client.get('/api/events/get_events/', {
+            'event_type': 'note_added',
+            'since': (timezone.now() - timedelta(days=1)).isoformat(),
+        })
+        self.assertEqual([e['id'] for e in response.data['events']], [recent.id])
+
+    def test_invalid_parameters(self):
+        """
+        Test that bad cursors, limits and dates are rejected with a 400.
+        """
+        for params in ({'cursor': 'not-a-cursor'}, {'limit': 0}, {'since': 'yesterday'}):
+            response = self.client.get('/api/events/get_events/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+class AddEventsBatchViewTests(EventTestCase):
+    def event(self, **fields):
+        data = {'event_type': 'note_added', 'event_details': 'note', 'related_wallet_address': PROVIDER}
+        data.update(fields)
+        return data
+
+    def test_batch_is_inserted(self):
+        """
+        Test that a batch of events is stored and every new id is returned.
+        """
+        response = self.client.post('/api/events/add_events/', {
+            'events': [self.event(), self.event(related_patient_wallet_address=PATIENT)],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['event_ids']), sorted(Event.objects.values_list('id', flat=True)))
+
+    def test_invalid_event_rejects_whole_batch(self):
+        """
+        Test that one invalid event fails the batch without inserting anything.
+        """
+        response = self.client.post('/api/events/add_events/', {
+            'events': [self.event(), self.event(event_details='')],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('1', {str(k) for k in response.data['details']})
+        self.assertFalse(Event.objects.exists())
+
+
+class SearchEventsViewTests(EventTestCase):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+
+    def search(self, **params):
+        response = self.client.get('/api/events/search_events/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_terms_are_stemmed_anded_and_ranked(self):
+        """
+        Test that every word must match, word forms match each other and the best match comes first.
+        """
+        weak = Event.objects.create(event_type='record_accessed', related_wallet_address=PROVIDER,
+                                    event_details='Provider accessed the allergy record during a long routine review')
+        strong = Event.objects.create(event_type='record_accessed', related_wallet_address=PROVIDER,
+                                      event_details='Allergy record access: allergy list')
+        Event.objects.create(event_type='record_accessed', related_wallet_address=PROVIDER,
+                             event_details='Provider accessed the medication record')
+
+        data = self.search(q='access allergy')
+        self.assertEqual([e['id'] for e in data['events']], [strong.id, weak.id])
+        self.assertGreater(data['events'][0]['score'], data['events'][1]['score'])
+        self.assertEqual([e['id'] for e in self.search(q='medic*')['events']], [weak.id + 2])
+
+    def test_filters_are_combined_with_text(self):
+        """
+        Test that wallet, type and time filters narrow the text matches.
+        """
+        wanted, = self.make_events(1, event_type='note_added', related_patient_wallet_address=PATIENT,
+                                   event_details='Note about insulin dosage')
+        self.make_events(1, event_type='note_added', related_patient_wallet_address=OTHER_PATIENT,
+                         event_details='Note about insulin dosage')
+        self.make_events(1, event_type='record_updated', related_patient_wallet_address=PATIENT,
+                         event_details='insulin dosage changed')
+
+        data = self.search(q='insulin', event_type='note_added', related_patient_wallet_address=PATIENT,
+                           since=(timezone.now() - timedelta(hours=1)).isoformat())
+        self.assertEqual([e['id'] for e in data['events']], [wanted.id])
+        self.assertEqual(self.search(q='insulin', until=(timezone.now() - timedelta(hours=1)).isoformat())['events'], [])
+        # Addresses match whatever case they are given in.
+        self.assertEqual(self.search(q='insulin', related_wallet_address='0x' + PROVIDER[2:].upper())['events'],
+                         self.search(q='insulin', related_wallet_address=PROVIDER)['events'])
+
+    def test_index_follows_bulk_inserts_updates_and_deletes(self):
+        """
+        Test that rows written with bulk_create, updated or deleted are searchable accordingly.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/events/add_events/', {'events': [
+                {'event_type': 'record_accessed', 'event_details': 'bulk imported cardiology note',
+                 'related_wallet_address': PROVIDER},
+            ]}, format='json')
+        event = Event.objects.get()
+        self.assertEqual(len(self.search(q='cardiology')['events']), 1)
+
+        event.event_details = 'renamed to dermatology'
+        with self.captureOnCommitCallbacks(execute=True):
+            event.save()
+        self.assertEqual(self.search(q='cardiology')['events'], [])
+        self.assertEqual(len(self.search(q='dermatology')['events']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            event.delete()
+        self.assertEqual(self.search(q='dermatology')['events'], [])
+
+    def test_pagination_visits_every_hit_once(self):
+        """
+        Test that following next_cursor walks all hits once, in rank and in recent order.
+        """
+        events = self.make_events(7, event_details='routine checkup')
+        for sort in ('rank', 'recent'):
+            seen, params = [], {'q': 'checkup', 'sort': sort, 'limit': 3}
+            while True:
+                data = self.search(**params)
+                seen += [e['id'] for e in data['events']]
+                if data['next_cursor'] is None:
+                    break
+                params['cursor'] = data['next_cursor']
+            self.assertEqual(sorted(seen), [e.id for e in events])
+            if sort == 'recent':
+                self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_query_syntax_is_not_interpreted(self):
+        """
+        Test that full-text operators and quotes in q are treated as plain words.
+        """
+        self.make_events(1, event_details='access NOT granted')
+        self.assertEqual(len(self.search(q='"access" NOT) OR (NEAR')['events']), 0)
+        self.assertEqual(len(self.search(q='access" not')['events']), 1)
+
+    def test_bad_params(self):
+        """
+        Test that an empty query, an unknown sort and a cursor from another sort are rejected.
+        """
+        self.make_events(3, event_details='routine checkup')
+        cursor = self.search(q='checkup', limit=1)['next_cursor']
+        for params in ({'q': '  '}, {'q': 'checkup', 'sort': 'oldest'},
+                       {'q': 'checkup', 'sort': 'recent', 'cursor': cursor}):
+            response = self.client.get('/api/events/search_events/', params)
+            self.assertEqual(response.status_code, 400)
+
+    def test_missing_triggers_are_restored(self):
+        """
+        Test that the index is rebuilt when a table rebuild has dropped its triggers.
+        """
+        self.make_events(1, event_details='before the rebuild')
+        with connection.cursor() as cursor:
+            for trigger in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER {trigger}')
+            cursor.execute("DELETE FROM events_event_fts")
+        self.make_events(1, event_details='during the rebuild')
+
+        install_search_index(connection)
+        self.assertEqual(len(self.search(q='rebuild')['events']), 2)
+
+
+class EventWriteBufferTests(TestCase):
+    def make_buffer(self, writer, **options):
+        buffer = EventWriteBuffer(writer=writer, **options)
+        self.addCleanup(buffer.close)
+        return buffer
+
+    def event(self, n=0):
+        return build_event({'event_type': 'note_added', 'event_details': f'note {n}', 'related_wallet_address': PROVIDER})
+
+    def test_flushes_by_size(self):
+        """
+        Test that a full batch is written without waiting for MAX_AGE.
+        """
+        batches, written = [], threading.Event()
+
+        def writer(events):
+            batches.append(len(events))
+            written.set()
+
+        buffer = self.make_buffer(writer, max_batch=5, max_age=60)
+        buffer.submit([self.event(i) for i in range(5)])
+        self.assertTrue(written.wait(5))
+        self.assertEqual(batches, [5])
+
+    def test_backpressure_when_full(self):
+        """
+        Test that a batch that doesn't fit is refused whole, so a retry can't duplicate events.
+        """
+        started, release = threading.Event(), threading.Event()
+
+        def writer(events):
+            started.set()
+            release.wait(5)
+
+        buffer = self.make_buffer(writer, max_batch=1, max_age=0.01, capacity=7, submit_timeout=0.01)
+        self.addCleanup(release.set)
+        buffer.submit([self.event(i) for i in range(3)])
+        self.assertTrue(started.wait(5))
+        buffer.submit([self.event(i) for i in range(3, 6)])
+        # Events being written still hold their room.
+        with self.assertRaises(BufferFull):
+            buffer.submit([self.event(i) for i in range(6, 8)])
+        self.assertEqual(buffer.pending(), 6)
+
+        release.set()
+        buffer.close()
+        self.assertEqual(buffer.stats, {'accepted': 6, 'rejected': 2, 'written': 6, 'flushes': 6,
+                                        'failed_flushes': 0})
+
+    def test_failing_writes_fill_the_buffer(self):
+        """
+        Test that events kept for retry count against capacity, so an outage ends in BufferFull.
+        """
+        def failing_writer(events):
+            raise RuntimeError('database unavailable')
+
+        buffer = EventWriteBuffer(writer=failing_writer, max_age=0.01, capacity=5, submit_timeout=0.01)
+        with self.assertLogs('events.ingest', 'ERROR'):
+            buffer.submit([self.event(i) for i in range(3)])
+            buffer.submit([self.event(i) for i in range(3, 5)])
+            deadline = time.monotonic() + 5
+            while not buffer.stats['failed_flushes'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            with self.assertRaises(BufferFull):
+                buffer.submit([self.event(5)])
+            self.assertEqual(buffer.pending(), 5)
+            buffer.close()
+
+    def test_buffered_events_keep_their_submission_time(self):
+        """
+        Test that a buffered event is stored with the time it was submitted, not the time it was flushed.
+        """
+        written, flushed = [], threading.Event()
+
+        def writer(events):
+            written.extend((e.timestamp, timezone.now()) for e in events)
+            flushed.set()
+
+        buffer = self.make_buffer(writer, max_age=0.1)
+        event = self.event()
+        event.timestamp = None
+        before = timezone.now()
+        buffer.submit([event])
+        self.assertTrue(flushed.wait(5))
+
+        (stamped, written_at), = written
+        self.assertGreaterEqual(stamped, before)
+        self.assertGreaterEqual(written_at - stamped, timedelta(seconds=0.1))
+
+    def test_unwritten_events_are_spooled_and_replayed(self):
+        """
+        Test that events which fail to write are spooled at close with their time, and replayed by the next buffer.
+        """
+        spool = Path(tempfile.mkdtemp()) / 'spool.ndjson'
+
+        def failing_writer(events):
+            raise RuntimeError('database unavailable')
+
+        buffer = EventWriteBuffer(writer=failing_writer, max_age=0.01, spool_path=spool)
+        events = [self.event(i) for i in range(3)]
+        with self.assertLogs('events.ingest', 'ERROR'):
+            buffer.submit(events)
+            buffer.close()
+        self.assertEqual(len(spool.read_text().splitlines()), 3)
+
+        # A replay while the database is still down keeps the spool for the next start.
+        with self.assertLogs('events.ingest', 'ERROR'):
+            self.make_buffer(failing_writer, spool_path=spool)
+        self.assertTrue(spool.exists())
+
+        replayed = []
+        with self.assertLogs('events.ingest', 'INFO'):
+            self.make_buffer(replayed.extend, spool_path=spool)
+        self.assertEqual([e.event_details for e in replayed], ['note 0', 'note 1', 'note 2'])
+        self.assertEqual([e.timestamp for e in replayed], [e.timestamp for e in events])
+        self.assertFalse(spool.exists())
+
+
+class ExportEventsViewTests(EventTestCase):
+    def setUp(self):
+        super().setUp()
+        self.events = self.make_events(5, related_patient_wallet_address=PATIENT)
+        self.make_events(3, related_patient_wallet_address=OTHER_PATIENT)
+
+    def export(self, **params):
+        params.setdefault('related_patient_wallet_address', PATIENT)
+        response = self.client.get('/api/events/export_events/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_export(self):
+        """
+        Test that the NDJSON export contains exactly the filtered events in id order.
+        """
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([r['id'] for r in rows], [e.id for e in self.events])
+
+    def test_csv_export(self):
+        """
+        Test that the CSV export has a header row followed by one row per event.
+        """
+        rows = list(csv.reader(io.StringIO(self.export(output='csv').decode())))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual([int(r[0]) for r in rows[1:]], [e.id for e in self.events])
+
+    def test_columnar_export_round_trips(self):
+        """
+        Test that the columnar export decodes back to the original rows, across several blocks.
+        """
+        body = b''.join(columnar_stream(export_rows({'related_patient_wallet_address': PATIENT}), block_rows=2))
+        rows = list(read_columnar(io.BytesIO(body)))
+        self.assertEqual([r['id'] for r in rows], [e.id for e in self.events])
+        self.assertEqual(rows[0]['timestamp'], self.events[0].timestamp)
+        self.assertEqual(rows[0]['related_patient_wallet_address'], PATIENT)
+
+    def test_gzip_on_request(self):
+        """
+        Test that the export is gzipped when the client accepts it.
+        """
+        response = self.client.get('/api/events/export_events/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 8)
+
+    def test_unknown_output(self):
+        """
+        Test that an unsupported output format is rejected.
+        """
+        response = self.client.get('/api/events/export_events/', {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class EventRollupTests(EventTestCase):
+    def add(self, **fields):
+        data = {'event_type': 'note_added', 'event_details': 'note', 'related_wallet_address': PROVIDER}
+        data.update(fields)
+        return self.client.post('/api/events/add_event/', data)
+
+    def stats(self, **params):
+        response = self.client.get('/api/events/event_stats/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['stats']
+
+    def test_rollups_follow_inserts(self):
+        """
+        Test that single and batch inserts both update the counters.
+        """
+        self.add()
+        self.add(event_type='access_granted')
+        self.client.post('/api/events/add_events/', {'events': [
+            {'event_type': 'note_added', 'event_details': 'n', 'related_wallet_address': PROVIDER},
+            {'event_type': 'note_added', 'event_details': 'n', 'related_wallet_address': OTHER_PATIENT},
+        ]}, format='json')
+
+        by_type = {row['event_type']: row['count'] for row in self.stats(group_by='event_type')}
+        self.assertEqual(by_type, {'note_added': 3, 'access_granted': 1})
+        mine = self.stats(group_by='', related_wallet_address=PROVIDER)
+        self.assertEqual(mine, [{'count': 3}])
+
+    def test_rebuild_matches_raw_events(self):
+        """
+        Test that the backfill command reproduces counts for events written behind the rollups' back.
+        """
+        self.add()
+        self.make_events(4, event_type='note_added')
+        call_command('rebuild_event_rollups', stdout=io.StringIO())
+
+        self.assertEqual(EventRollup.objects.get().count, 5)
+        self.assertEqual(self.stats(group_by='day')[0]['count'], 5)
+
+    def test_invalid_group_by(self):
+        """
+        Test that grouping by an unknown field is rejected.
+        """
+        response = self.client.get('/api/events/event_stats/', {'group_by': 'event_details'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_dates(self):
+        """
+        Test that malformed and impossible dates are rejected rather than failing.
+        """
+        for url in ('/api/events/event_stats/', '/api/async/events/event_stats/'):
+            for since in ('yesterday', '2024-13-40'):
+                response = self.client.get(url, {'since': since})
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(EVENT_AUDIT={'BATCH_SIZE': 4, 'SETTLE_SECONDS': 0})
+class AuditLogTests(EventTestCase):
+    def assertProves(self, proof):
+        leaf = hashlib.sha256(b'\x00' + proof['leaf'].encode()).digest()
+        self.assertEqual(leaf.hex(), proof['leaf_hash'])
+        siblings = [(step['side'], bytes.fromhex(step['hash'])) for step in proof['proof']]
+        self.assertEqual(root_from_proof(leaf, siblings).hex(), proof['root'])
+
+    def test_full_batches_are_sealed_and_proven(self):
+        """
+        Test that only full batches are sealed and that a proof leads from the event to its batch root.
+        """
+        events = self.make_events(10)
+        self.assertEqual(seal_batches(), 2)
+        self.assertEqual(list(AuditBatch.objects.values_list('first_event_id', 'last_event_id')),
+                         [(events[0].id, events[3].id), (events[4].id, events[7].id)])
+
+        response = self.client.get('/api/events/event_proof/', {'event_id': events[6].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['batch'], response.data['index']), (2, 2))
+        self.assertEqual(len(response.data['proof']), 2)
+        self.assertEqual(response.data['previous_chain_hash'], AuditBatch.objects.get(number=1).chain_hash)
+        self.assertIn('"event 6"', response.data['leaf'])
+        self.assertProves(response.data)
+
+        self.assertEqual(self.client.get('/api/events/event_proof/', {'event_id': events[9].id}).status_code, 409)
+        self.assertEqual(self.client.get('/api/events/event_proof/', {'event_id': 10 ** 6}).status_code, 404)
+        self.assertEqual(self.client.get('/api/events/event_proof/', {'event_id': 'x'}).status_code, 400)
+
+    @override_settings(EVENT_AUDIT={'BATCH_SIZE': 96, 'SETTLE_SECONDS': 0})
+    def test_proofs_span_chunks(self):
+        """
+        Test that proofs from every chunk of a multi-chunk batch lead to the batch root.
+        """
+        events = Event.objects.bulk_create(Event(event_type='note_added', event_details=f'note {i}',
+                                                 related_wallet_address=PROVIDER) for i in range(96))
+        seal_batches()
+        for position in (0, 31, 32, 70, 95):
+            response = self.client.get('/api/events/event_proof/', {'event_id': events[position].id})
+            self.assertEqual(response.data['index'], position)
+            # The third chunk's root has no sibling and moves up unchanged.
+            self.assertEqual(len(response.data['proof']), 7 if position < 64 else 6)
+            self.assertProves(response.data)
+
+    def test_verification_catches_edits_deletions_and_altered_batches(self):
+        """
+        Test that changing or deleting an event, or rewriting a batch record, fails verification.
+        """
+        events = self.make_events(12)
+        seal_batches()
+        self.assertEqual(verify_log()['failures'], [])
+
+        Event.objects.filter(pk=events[1].pk).update(event_details='rewritten')
+        Event.objects.filter(pk=events[6].pk).delete()
+        AuditBatch.objects.filter(number=3).update(chain_hash='00' * 32)
+        failures = verify_log(full=True)['failures']
+        self.assertEqual([f['batch'] for f in failures], [1, 2, 3])
+        self.assertIn('Merkle root', failures[0]['error'])
+        self.assertIn('holds 3 events', failures[1]['error'])
+        self.assertIn('chain hash', failures[2]['error'])
+        self.assertEqual(AuditCheckpoint.objects.get().batch_number, 0)
+        response = self.client.get('/api/events/event_proof/', {'event_id': events[0].id})
+        self.assertEqual(response.status_code, 409)
+
+    def test_verification_resumes_from_the_checkpoint(self):
+        """
+        Test that a verify run only reads batches sealed after the last verified one.
+        """
+        self.make_events(8)
+        seal_batches()
+        self.assertEqual(verify_log()['verified_through'], 2)
+
+        self.make_events(4)
+        seal_batches()
+        summary = verify_log()
+        self.assertEqual((summary['from_batch'], summary['batches'], summary['verified_through']), (3, 1, 3))
+        self.assertEqual(summary['chain_hash'], AuditBatch.objects.get(number=3).chain_hash)
+        self.assertEqual(verify_log()['batches'], 0)
+
+        # Older batches are only re-read with --full.
+        Event.objects.filter(pk=Event.objects.order_by('id').first().pk).update(event_type='note_added')
+        call_command('verify_audit_log', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('verify_audit_log', '--full', stdout=io.StringIO())
+
+
+class EventArchiveTests(TransactionTestCase):
+    # Archiving creates and drops tables, which SQLite won't do inside TestCase's transaction.
+    def setUp(self):
+        """
+        Create an authenticated client and point the archive at a temporary directory.
+        """
+        caches['default'].clear()
+        self.client = APIClient()
+        user = User.objects.create(wallet_address=PROVIDER, role='provider')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(RefreshToken.for_user(user).access_token)}')
+        self.now = timezone.now()
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.archive_settings = {'HOT_DAYS': 90, 'FILE_AFTER_DAYS': 365, 'PATH': self.archive_dir.name}
+        self.override = override_settings(EVENT_ARCHIVE=self.archive_settings)
+        self.override.enable()
+
+    def tearDown(self):
+        for archive in EventArchive.objects.filter(tier=EventArchive.TABLE):
+            with connection.schema_editor() as editor:
+                editor.delete_model(archive_table_model(archive.location))
+        self.override.disable()
+        self.archive_dir.cleanup()
+
+    def event(self, days_ago, **fields):
+        fields.setdefault('event_type', 'record_accessed')
+        fields.setdefault('related_wallet_address', PROVIDER)
+        event = Event.objects.create(event_details=f'{days_ago} days ago', **fields)
+        Event.objects.filter(pk=event.pk).update(timestamp=self.now - timedelta(days=days_ago))
+        return event
+
+    def all_pages(self, **params):
+        ids, params = [], {'limit': 1, **params}
+        while True:
+            response = self.client.get('/api/events/get_events/', params)
+            self.assertEqual(response.status_code, 200)
+            ids += [e['id'] for e in response.data['events']]
+            if not response.data['next_cursor']:
+                return ids
+            params['cursor'] = response.data['next_cursor']
+
+    def test_old_months_leave_the_hot_table_but_stay_readable(self):
+        """
+        Test that archived months disappear from events_event and are merged back into get_events pages.
+        """
+        events = [self.event(days) for days in (2, 40, 150, 200)]
+        summary = archive_events(self.now)
+
+        self.assertEqual(sum(summary['archived'].values()), 2)
+        self.assertEqual(set(Event.objects.values_list('id', flat=True)), {events[0].id, events[1].id})
+        self.assertEqual(self.all_pages(), [e.id for e in events])
+
+        since = (self.now - timedelta(days=175)).isoformat()
+        self.assertEqual(self.all_pages(since=since), [e.id for e in events[:3]])
+
+    def test_exports_include_archived_months(self):
+        """
+        Test that an export merges archive tables and files with the hot table in id order.
+        """
+        events = [self.event(days) for days in (400, 150, 2)]
+        self.event(150, event_type='note_added')
+        archive_events(self.now)
+        self.assertEqual(sorted(EventArchive.objects.values_list('tier', flat=True)),
+                         sorted([EventArchive.FILE, EventArchive.TABLE]))
+
+        response = self.client.get('/api/events/export_events/', {'event_type': 'record_accessed'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [e.id for e in events])
+
+        since = self.now - timedelta(days=175)
+        rows = list(export_rows({'timestamp__gte': since, 'event_type': 'record_accessed'}))
+        self.assertEqual([row[0] for row in rows], [e.id for e in events[1:]])
+
+    def test_search_refuses_ranges_reaching_archived_months(self):
+        """
+        Test that search answers 409 rather than an incomplete page once its range reaches archived months.
+        """
+        self.event(150)
+        recent = self.event(2)
+        archive_events(self.now)
+        boundary = EventArchive.objects.get().month
+
+        for params in ({}, {'since': (self.now - timedelta(days=175)).isoformat()}):
+            response = self.client.get('/api/events/search_events/', {'q': 'ago', **params})
+            self.assertEqual(response.status_code, 409)
+            self.assertTrue(response.data['searchable_since'].startswith(next_month(month_start(boundary)).date().isoformat()))
+
+        response = self.client.get('/api/events/search_events/',
+                                   {'q': 'ago', 'since': response.data['searchable_since']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([e['id'] for e in response.data['events']], [recent.id])
+
+    def test_pages_inside_the_hot_window_skip_the_archive(self):
+        """
+        Test that a page filled from the hot table never queries an archive table.
+        """
+        self.event(150)
+        archive_events(self.now)
+        recent = [self.event(days) for days in (1, 2, 3)]
+
+        with CaptureQueriesContext(connection) as queries:
+            rows, next_cursor = event_page({}, limit=2)
+        self.assertEqual([row['id'] for row in rows], [e.id for e in recent[:2]])
+        self.assertFalse(any('events_archive_' in q['sql'] for q in queries.captured_queries))
+
+    def test_old_archives_are_compressed_into_files(self):
+        """
+        Test that archive tables past FILE_AFTER_DAYS become files and are still filtered correctly.
+        """
+        kept = self.event(400, event_type='note_added')
+        self.event(400)
+        archive_events(self.now)
+
+        archive = EventArchive.objects.get()
+        self.assertEqual(archive.tier, EventArchive.FILE)
+        self.assertTrue(Path(archive.location).exists())
+        self.assertEqual(self.all_pages(event_type='note_added'), [kept.id])
+
+        # A late write into a compressed month is merged into its file.
+        late = self.event(400)
+        archive_events(self.now)
+        self.assertEqual(EventArchive.objects.get().events, 3)
+        self.assertIn(late.id, self.all_pages())
+
+    def test_retention_is_applied_per_event_type_in_every_tier(self):
+        """
+        Test that expired events are deleted from the hot table, archive tables and files alike.
+        """
+        survivors = [self.event(days, event_type='note_added') for days in (60, 200, 500)]
+        for days in (60, 200, 500):
+            self.event(days)
+        retention = {'record_accessed': 30, 'DEFAULT': None}
+        with self.settings(EVENT_ARCHIVE={**self.archive_settings, 'RETENTION': retention}):
+            summary = archive_events(self.now)
+
+        self.assertEqual(summary['expired'], 3)
+        self.assertEqual(self.all_pages(), [e.id for e in survivors])
+
+    def test_rollups_of_archived_days_survive_a_rebuild(self):
+        """
+        Test that rebuilding the rollups leaves days whose events were archived alone.
+        """
+        self.event(200)
+        self.event(2)
+        rebuild_rollups()
+        archive_events(self.now)
+        rebuild_rollups()
+
+        self.assertEqual(sum(EventRollup.objects.values_list('count', flat=True)), 2)
+
+    @override_settings(EVENT_AUDIT={'BATCH_SIZE': 4, 'SETTLE_SECONDS': 0})
+    def test_audit_log_verifies_across_tiers_and_retention(self):
+        """
+        Test that sealed events stay provable after archiving, compression and retention.
+        """
+        for days in (500, 500, 200, 200, 60, 60, 2, 2):
+            self.event(days, event_type='note_added' if days % 3 else 'record_accessed')
+        self.assertEqual(seal_batches(self.now), 2)
+        retention = {'record_accessed': 30, 'DEFAULT': None}
+        with self.settings(EVENT_ARCHIVE={**self.archive_settings, 'RETENTION': retention}):
+            summary = archive_events(self.now)
+        self.assertEqual(summary['expired'], 2)
+
+        result = verify_log()
+        self.assertEqual((result['failures'], result['events'], result['expired']), ([], 8, 2))
+        oldest = min(row['id'] for row in self.client.get('/api/events/get_events/').data['events'])
+        response = self.client.get('/api/events/event_proof/', {'event_id': oldest})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['batch'], 1)
+
+
+class AsyncEventViewTests(TestCase):
+    def setUp(self):
+        """
+        Create an async client with a login-style token.
+        """
+        user = User.objects.create(wallet_address=PROVIDER, role='provider')
+        refresh = RefreshToken.for_user(user)
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Bearer {str(refresh.access_token)}'}
+
+    async def test_add_and_page_events(self):
+        """
+        Test that events added through the async endpoints page back newest first.
+        """
+        event = {'event_type': 'note_added', 'event_details': 'n', 'related_wallet_address': PROVIDER}
+        single = await self.client.post('/api/async/events/add_event/', event,
+                                        content_type='application/json', headers=self.headers)
+        batch = await self.client.post('/api/async/events/add_events/', {'events': [event, event]},
+                                       content_type='application/json', headers=self.headers)
+        ids = [single.json()['event_id']] + batch.json()['event_ids']
+
+        response = await self.client.get('/api/async/events/get_events/',
+                                         {'related_wallet_address': PROVIDER, 'limit': 2}, headers=self.headers)
+        self.assertEqual([e['id'] for e in response.json()['events']], sorted(ids, reverse=True)[:2])
+        stats = await self.client.get('/api/async/events/event_stats/', {'group_by': 'event_type'},
+                                      headers=self.headers)
+        self.assertEqual(stats.json()['stats'], [{'event_type': 'note_added', 'count': 3}])
+
+
+class EventStreamTests(TransactionTestCase):
+    # The broker reads from a worker thread, which can't see TestCase's open transaction.
+    def setUp(self):
+        """
+        Create an async client with a login-style token.
+        """
+        user = User.objects.create(wallet_address=PROVIDER, role='provider')
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Bearer {str(RefreshToken.for_user(user).access_token)}'}
+
+    async def open_stream(self, headers=None, **params):
+        response = await self.client.get('/api/async/events/stream/', params,
+                                          headers={**self.headers, **(headers or {})})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response.streaming_content
+
+    async def next_message(self, stream):
+        while True:
+            chunk = await asyncio.wait_for(anext(stream), 5)
+            if not chunk.startswith((b'retry:', b':')):
+                return chunk
+
+    async def add_event(self, **fields):
+        event = Event(event_type='note_added', event_details='n', related_wallet_address=PROVIDER, **fields)
+        await sync_to_async(insert_events)([event])
+        return event.id
+
+    async def test_new_events_reach_matching_streams(self):
+        """
+        Test that a committed event is pushed to the streams whose filters it matches, and only those.
+        """
+        mine = await self.open_stream(related_patient_wallet_address=PATIENT)
+        others = await self.open_stream(related_patient_wallet_address=OTHER_PATIENT)
+        await asyncio.wait_for(anext(mine), 5)
+        await asyncio.wait_for(anext(others), 5)
+
+        first = await self.add_event(related_patient_wallet_address=PATIENT)
+        second = await self.add_event(related_patient_wallet_address=OTHER_PATIENT)
+
+        message = await self.next_message(mine)
+        self.assertTrue(message.startswith(b'id: %d\nevent: event\ndata: ' % first))
+        self.assertIn(PATIENT.encode(), message)
+        self.assertTrue((await self.next_message(others)).startswith(b'id: %d\n' % second))
+
+    async def test_resume_replays_missed_events(self):
+        """
+        Test that Last-Event-ID replays the events after it, and asks for a resync when too far behind.
+        """
+        ids = [await self.add_event() for _ in range(3)]
+        stream = await self.open_stream(headers={'Last-Event-ID': str(ids[0])})
+        self.assertTrue((await self.next_message(stream)).startswith(b'id: %d\n' % ids[1]))
+        self.assertTrue((await self.next_message(stream)).startswith(b'id: %d\n' % ids[2]))
+
+        with override_settings(EVENT_STREAM={'REPLAY_LIMIT': 1}):
+            stream = await self.open_stream(last_event_id=ids[0])
+            self.assertEqual(await self.next_message(stream), b'event: resync\ndata: {}\n\n')
+
+    def test_stream_needs_asgi(self):
+        """
+        Test that the stream answers 501 when served through WSGI instead of hanging.
+        """
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=self.headers['Authorization'])
+        response = client.get('/api/async/events/stream/')
+        self.assertEqual(response.status_code, 501)
+        self.assertIn('get_events', response.json()['error'])
+
+    def test_broker_keeps_streams_on_its_loop(self):
+        """
+        Test that a second running event loop can't reset the broker under open streams.
+        """
+        broker = EventBroker()
+
+        def close(loop):
+            broker._task.cancel()
+            loop.run_until_complete(asyncio.gather(broker._task, return_exceptions=True))
+            loop.close()
+
+        first, second = asyncio.new_event_loop(), asyncio.new_event_loop()
+        first.run_until_complete(broker.subscribe(wallet=PROVIDER))
+        with self.assertRaises(RuntimeError):
+            second.run_until_complete(broker.subscribe(wallet=PROVIDER))
+        self.assertEqual(broker.stats['subscribers'], 1)
+        close(first)
+
+        second.run_until_complete(broker.subscribe(wallet=PROVIDER))
+        self.assertEqual(broker.stats['subscribers'], 1)
+        close(second)
+
+    async def test_slow_subscriber_is_told_to_resync(self):
+        """
+        Test that a subscriber whose queue overflows gets only a resync marker, and an idle one times out.
+        """
+        broker = EventBroker(queue_size=2)
+        subscriber = await broker.subscribe(wallet=PROVIDER)
+        rows = [{'id': i, 'related_wallet_address': PROVIDER, 'related_patient_wallet_address': None}
+                for i in range(1, 4)]
+        broker.dispatch(rows)
+        self.assertEqual(list(subscriber.rows), [RESYNC])
+        self.assertIs(await subscriber.get(1), RESYNC)
+        with self.assertRaises(TimeoutError):
+            await subscriber.get(0.01)
+        self.assertEqual(broker.stats['resyncs'], 1)
+        broker.unsubscribe(subscriber)
+        self.assertEqual(broker.stats['subscribers'], 0)
@@ -1,7 +1,12 @@
 from django.urls import path
-from .views import AddEventView, GetEventsView
+from .views import AddEventView, AddEventsBatchView, GetEventsView, ExportEventsView, GetEventStatsView, SearchEventsView, EventProofView
 
 urlpatterns = [
     path('add_event/', AddEventView.as_view(), name='add-event'),
+    path('add_events/', AddEventsBatchView.as_view(), name='add-events'),
     path('get_events/', GetEventsView.as_view(), name='get-events'),
+    path('search_events/', SearchEventsView.as_view(), name='search-events'),
+    path('event_stats/', GetEventStatsView.as_view(), name='event-stats'),
+    path('event_proof/', EventProofView.as_view(), name='event-proof'),
+    path('export_events/', ExportEventsView.as_view(), name='export-events'),
 ]
\ No newline at end of file
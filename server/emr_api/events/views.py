@@ -1,48 +1,181 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import Event
+from .audit import NotSealed, ProofMismatch, inclusion_proof
+from .export import EXPORT_FORMATS, export_rows, gzip_stream
+from .ingest import BufferFull, InvalidEvents, build_event, get_write_buffer, insert_events, parse_event_batch
+from .rollups import event_stats
+from .queries import event_page, parse_event_filters, parse_page_params, parse_stats_params
+from .search import SearchRangeArchived, SearchUnavailable, parse_search_params, search_events
 from rest_framework.permissions import IsAuthenticated
+from django.http import StreamingHttpResponse
+from emr_api.pagination import parse_int_param
+from responsecache.decorators import cached_get
 
 class AddEventView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        event_type = request.data.get("event_type")
-        event_details = request.data.get("event_details")
-        related_wallet_address = request.data.get("related_wallet_address")
-        related_patient_wallet_address = request.data.get("related_patient_wallet_address")
-
-        if not event_type or not event_details or not related_wallet_address:
-            return Response({"error": "Missing required fields."}, status=400)
-
-        event = Event.objects.create(
-            event_type=event_type,
-            event_details=event_details,
-            related_wallet_address=related_wallet_address,
-            related_patient_wallet_address=related_patient_wallet_address
-        )
+        try:
+            event = build_event(request.data)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        event, = insert_events([event])
         return Response({"message": "Event added successfully.", "event_id": event.id})
-    
-    
+
+
+class AddEventsBatchView(APIView):
+    """
+    Accepts {"events": [...]} (or a bare list) and stores them all at once.
+
+    Without the write buffer the batch is inserted in one transaction and the
+    new ids are returned. With EVENT_WRITE_BUFFER enabled the events are
+    queued and the response is 202; pass "durable": true to write through
+    instead. A full buffer answers 503 so the client can retry later.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            events, durable = parse_event_batch(request.data)
+        except InvalidEvents as exc:
+            return Response({"error": str(exc), "details": exc.details}, status=400)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        buffer = None if durable else get_write_buffer()
+        if buffer is not None:
+            try:
+                buffer.submit(events)
+            except BufferFull:
+                return Response({"error": "Event buffer is full, retry later."}, status=503,
+                                headers={"Retry-After": "1"})
+            return Response({"message": "Events queued.", "accepted": len(events)}, status=202)
+
+        events = insert_events(events)
+        return Response({"message": "Events added successfully.", "event_ids": [e.id for e in events]})
+
+
 class GetEventsView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cached_get("events")
+    def get(self, request):
+        # Filters (related_wallet_address, related_patient_wallet_address,
+        # event_type, since, until) are ANDed; results come back newest
+        # first, one page at a time. Pass next_cursor back as ?cursor=.
+        try:
+            filters = parse_event_filters(request.query_params)
+            position, limit = parse_page_params(request.query_params)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        events, next_cursor = event_page(filters, position, limit)
+        return Response({"events": events, "next_cursor": next_cursor})
+
+
+class SearchEventsView(APIView):
+    """
+    Full-text search over event_details (see events/search.py).
+
+    Query params:
+        q: words that must all appear; a trailing * matches a prefix
+        sort: "rank" (best match first, default) or "recent" (newest first)
+        related_wallet_address, related_patient_wallet_address, event_type,
+        since, until: the get_events filters
+        cursor, limit: pagination, as for get_events
+
+    Archived months aren't indexed: once any exist, since must be at or
+    after "searchable_since", or the answer is 409 naming it.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @cached_get("events")
+    def get(self, request):
+        try:
+            filters = parse_event_filters(request.query_params)
+            terms, sort, position, limit = parse_search_params(request.query_params)
+            events, next_cursor = search_events(terms, filters, sort, position, limit)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        except SearchUnavailable as exc:
+            return Response({"error": str(exc)}, status=501)
+        except SearchRangeArchived as exc:
+            return Response({"error": str(exc), "searchable_since": exc.searchable_since.isoformat()}, status=409)
+        return Response({"events": events, "next_cursor": next_cursor})
+
+
+class ExportEventsView(APIView):
+    """
+    Streams every event matching the get_events filters, archived months
+    included, in id order (oldest first).
+
+    ?output= picks ndjson (default), csv or columnar. The body is gzipped on
+    the fly when the client sends Accept-Encoding: gzip.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORT_FORMATS:
+            return Response({"error": f"output must be one of {', '.join(EXPORT_FORMATS)}."}, status=400)
+        try:
+            filters = parse_event_filters(request.query_params)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        encode, content_type, extension = EXPORT_FORMATS[output]
+        body = encode(export_rows(filters))
+        gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = gzip_stream(body)
+
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="events.{extension}"'
+        response["Vary"] = "Accept-Encoding"
+        if gzipped:
+            response["Content-Encoding"] = "gzip"
+        return response
+
+
+class GetEventStatsView(APIView):
+    """
+    Event counts from the rollup table, so the cost depends on the number of
+    buckets rather than the number of events.
+
+    Query params:
+        group_by: comma separated subset of day, event_type, related_wallet_address
+        since, until: ISO dates, until exclusive
+        event_type, related_wallet_address: restrict to one bucket value
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            group_by, filters = parse_stats_params(request.query_params)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
+        return Response({"stats": event_stats(group_by, filters)})
+
+
+class EventProofView(APIView):
+    """
+    Inclusion proof for ?event_id= in its sealed audit batch (see
+    events/audit.py). Hash the leaf, fold in the proof's siblings and compare
+    with root; chain_hash links the root to every earlier batch. Answers 409
+    for an event that isn't sealed yet, or whose batch no longer verifies.
+    """
+    permission_classes = [IsAuthenticated]
+
     def get(self, request):
-        
-        # if parameters are provided, filter the events accordingly
-        events = None
-        # for provided related_wallet_address, filter the events
-        related_wallet_address = request.query_params.get("related_wallet_address")
-        print(related_wallet_address)
-        if related_wallet_address:
-            events = Event.objects.filter(related_wallet_address=related_wallet_address).values()
-            
-        related_patient_wallet_address = request.query_params.get("related_patient_wallet_address")
-        if related_patient_wallet_address:
-            events = Event.objects.filter(related_patient_wallet_address=related_patient_wallet_address).values()
-        
-        return Response({"events": list(events)})
-        
-       
-
-        
\ No newline at end of file
+        event_id = parse_int_param(request.query_params.get("event_id"), None, minimum=1)
+        if event_id is None:
+            return Response({"error": "event_id must be a positive integer."}, status=400)
+        try:
+            return Response(inclusion_proof(event_id))
+        except Event.DoesNotExist as exc:
+            return Response({"error": str(exc)}, status=404)
+        except (NotSealed, ProofMismatch) as exc:
+            return Response({"error": str(exc)}, status=409)
@@ -0,0 +1,146 @@
+# Read-through cache in front of an IPFS gateway: misses are fetched once,
+# however many requests ask for the same CID at the same time, checked
+# against the CID (see cids.py) and written to the BlobStore for every
+# later reader. A body that doesn't match its CID is refused; one that
+# can't be checked is passed through but not kept.
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+
+from .cids import content_matches
+from .store import BlobStore
+
+DEFAULT_IPFS_CACHE = {
+    # Blobs are fetched from GATEWAY_URL + cid.
+    "GATEWAY_URL": "https://gateway.pinata.cloud/ipfs/",
+    # Sent as x-pinata-gateway-token for private gateways.
+    "GATEWAY_TOKEN": None,
+    "PATH": None,
+    "MAX_BYTES": 1024 * 1024 * 1024,
+    # Larger blobs are refused rather than cached.
+    "MAX_OBJECT_BYTES": 20 * 1024 * 1024,
+    # Parallel gateway requests for a batch.
+    "WORKERS": 8,
+    "TIMEOUT": 10.0,
+}
+
+
+class BlobNotFound(Exception):
+    pass
+
+
+class GatewayError(Exception):
+    pass
+
+
+class CidCache:
+    def __init__(self, store, gateway_url, token=None, max_object_bytes=DEFAULT_IPFS_CACHE["MAX_OBJECT_BYTES"],
+                 workers=8, timeout=10.0):
+        self.store = store
+        self.gateway_url = gateway_url
+        self.token = token
+        self.max_object_bytes = max_object_bytes
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="ipfs-fetch")
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "unchecked": 0}
+
+    def _download(self, cid):
+        request = urllib.request.Request(self.gateway_url + cid)
+        if self.token:
+            request.add_header("x-pinata-gateway-token", self.token)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read(self.max_object_bytes + 1)
+        except urllib.error.HTTPError as exc:
+            if exc.code == 404:
+                raise BlobNotFound(cid) from exc
+            raise GatewayError(f"{cid}: gateway returned {exc.code}") from exc
+        except OSError as exc:
+            raise GatewayError(f"{cid}: {exc}") from exc
+        if len(data) > self.max_object_bytes:
+            raise GatewayError(f"{cid}: larger than {self.max_object_bytes} bytes")
+        return data
+
+    def get(self, cid):
+        """Return the blob's bytes, fetching it at most once; raises BlobNotFound or GatewayError."""
+        data = self.store.read(cid)
+        if data is not None:
+            self.stats["hits"] += 1
+            return data
+
+        with self.lock:
+            future = self.inflight.get(cid)
+            leader = future is None
+            if leader:
+                future = self.inflight[cid] = Future()
+            self.stats["misses" if leader else "coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            # Another leader may have finished between the miss and the lock.
+            data = self.store.read(cid)
+            if data is None:
+                data = self._download(cid)
+                matches = content_matches(cid, data)
+                if matches is False:
+                    raise GatewayError(f"{cid}: gateway returned content that does not match the CID")
+                if matches:
+                    self.store.put(cid, data)
+                else:
+                    self.stats["unchecked"] += 1
+            future.set_result(data)
+        except Exception as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[cid]
+        return data
+
+    def get_many(self, cids):
+        """Fetch CIDs in parallel; returns ({cid: bytes}, {cid: error message})."""
+        futures = {cid: self.pool.submit(self.get, cid) for cid in dict.fromkeys(cids)}
+        found, errors = {}, {}
+        for cid, future in futures.items():
+            try:
+                found[cid] = future.result()
+            except BlobNotFound:
+                errors[cid] = "not found"
+            except GatewayError as exc:
+                errors[cid] = str(exc)
+        return found, errors
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cid_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            config = {**DEFAULT_IPFS_CACHE, **getattr(settings, "IPFS_CACHE", {})}
+            _cache = CidCache(
+                BlobStore(config["PATH"], config["MAX_BYTES"]),
+                config["GATEWAY_URL"],
+                token=config["GATEWAY_TOKEN"],
+                max_object_bytes=config["MAX_OBJECT_BYTES"],
+                workers=config["WORKERS"],
+                timeout=config["TIMEOUT"],
+            )
+        return _cache
+
+
+def reset_cid_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is not None:
+            _cache.pool.shutdown(wait=False)
+        _cache = None
+
@@ -0,0 +1,125 @@
+# Checking gateway bodies against their CID. A CID names its content by
+# hash, so a body is only cached once it provably is that content:
+#
+#   CIDv1, raw codec        the digest is sha2-256 of the body itself
+#   CIDv0 ("Qm...") and     the digest covers the dag-pb node wrapping the
+#   CIDv1, dag-pb codec     body as a UnixFS file, rebuilt here; this holds
+#                           for files that fit in one block (CHUNK_SIZE)
+#
+# Anything else (chunked files, other hash functions or multibases) can't
+# be checked from the body alone; content_matches() returns None for it and
+# the cache passes such bodies through without keeping them.
+import base64
+import hashlib
+
+RAW = 0x55
+DAG_PB = 0x70
+SHA2_256 = 0x12
+# Kubo's default chunk size; bigger files are split into linked blocks.
+CHUNK_SIZE = 256 * 1024
+
+BASE58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+UNIXFS_FILE = 2
+
+
+def b58decode(text):
+    number = 0
+    for char in text:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    body = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return b"\x00" * (len(text) - len(text.lstrip("1"))) + body
+
+
+def b58encode(data):
+    number = int.from_bytes(data, "big")
+    chars = []
+    while number:
+        number, digit = divmod(number, 58)
+        chars.append(BASE58_ALPHABET[digit])
+    return "1" * (len(data) - len(data.lstrip(b"\x00"))) + "".join(reversed(chars))
+
+
+def varint(number):
+    out = bytearray()
+    while True:
+        byte, number = number & 0x7F, number >> 7
+        out.append(byte | (0x80 if number else 0))
+        if not number:
+            return bytes(out)
+
+
+def read_varint(data, pos):
+    number = shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated varint.")
+        byte = data[pos]
+        number |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return number, pos
+        shift += 7
+
+
+def parse_cid(cid):
+    """Return (codec, hash function code, digest); raises ValueError."""
+    try:
+        if len(cid) == 46 and cid.startswith("Qm"):
+            codec, multihash = DAG_PB, b58decode(cid)
+        elif cid.startswith("b"):
+            data = base64.b32decode(cid[1:].upper() + "=" * (-len(cid[1:]) % 8))
+            version, pos = read_varint(data, 0)
+            if version != 1:
+                raise ValueError(f"Unsupported CID version {version}.")
+            codec, pos = read_varint(data, pos)
+            multihash = data[pos:]
+        else:
+            raise ValueError("Only CIDv0 and base32 CIDv1 are supported.")
+    except ValueError as exc:  # binascii.Error included
+        raise ValueError(f"Malformed CID {cid}: {exc}") from exc
+    code, pos = read_varint(multihash, 0)
+    length, pos = read_varint(multihash, pos)
+    digest = multihash[pos:]
+    if len(digest) != length:
+        raise ValueError(f"Malformed CID {cid}: digest length mismatch.")
+    return codec, code, digest
+
+
+def _field(number, payload):
+    # A length-delimited protobuf field.
+    return varint(number << 3 | 2) + varint(len(payload)) + payload
+
+
+def unixfs_file_node(data):
+    """The dag-pb block of a single-block UnixFS file holding `data`."""
+    unixfs = varint(1 << 3) + varint(UNIXFS_FILE)
+    if data:
+        unixfs += _field(2, data)
+    unixfs += varint(3 << 3) + varint(len(data))
+    return _field(1, unixfs)
+
+
+def file_cid(data, version=0):
+    """The CID kubo gives `data` added as one block: CIDv0 dag-pb, or CIDv1 raw."""
+    if version == 0:
+        return b58encode(bytes([SHA2_256, 32]) + hashlib.sha256(unixfs_file_node(data)).digest())
+    cid = varint(1) + varint(RAW) + bytes([SHA2_256, 32]) + hashlib.sha256(data).digest()
+    return "b" + base64.b32encode(cid).decode().lower().rstrip("=")
+
+
+def content_matches(cid, data):
+    """True if `data` is the content `cid` names, False if it is not, None if that can't be told."""
+    try:
+        codec, code, digest = parse_cid(cid)
+    except ValueError:
+        return None
+    if code != SHA2_256:
+        return None
+    if codec == RAW:
+        return hashlib.sha256(data).digest() == digest
+    if codec == DAG_PB and len(data) <= CHUNK_SIZE:
+        if hashlib.sha256(unixfs_file_node(data)).digest() == digest:
+            return True
+        # Also what a directory or a file with non-default settings looks like.
+        return None
+    return None
@@ -0,0 +1,104 @@
+# Bounded on-disk store for IPFS blobs, keyed by CID.
+#
+# CIDs are content addresses, so a cached blob never goes stale and the only
+# policy needed is size: least recently used blobs are evicted once the
+# store passes max_bytes. Reads are memory-mapped. Patient records are
+# encrypted client-side, so only ciphertext ever lands on disk.
+import mmap
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# CIDv0 (base58btc "Qm...") and CIDv1 (base32 "b...") are both plain alphanumerics.
+CID_PATTERN = re.compile(r"^[A-Za-z0-9]{10,128}$")
+
+
+def is_valid_cid(cid):
+    return isinstance(cid, str) and bool(CID_PATTERN.match(cid))
+
+
+class BlobStore:
+    """
+    The LRU order is kept in memory and rebuilt from file mtimes on start
+    (hits touch the file), so each process sharing a directory enforces the
+    bound on what it has seen; the total can overshoot briefly until the
+    next writer evicts.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for file in self.path.glob("*/*"):
+            if is_valid_cid(file.name):
+                stat = file.stat()
+                found.append((stat.st_mtime, file.name, stat.st_size))
+        for _, cid, size in sorted(found):
+            self.entries[cid] = size
+            self.size += size
+
+    def file_for(self, cid):
+        return self.path / cid[-2:] / cid
+
+    def __contains__(self, cid):
+        with self.lock:
+            return cid in self.entries
+
+    def open(self, cid):
+        """Return a read-only mmap of the blob (b"" if empty), or None on a miss. Close it when done."""
+        with self.lock:
+            if cid not in self.entries:
+                return None
+            self.entries.move_to_end(cid)
+        file = self.file_for(cid)
+        try:
+            with open(file, "rb") as handle:
+                os.utime(file)
+                if os.fstat(handle.fileno()).st_size == 0:
+                    return b""
+                return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory.
+            self._forget(cid)
+            return None
+
+    def read(self, cid):
+        mapped = self.open(cid)
+        if mapped is None or isinstance(mapped, bytes):
+            return mapped
+        with mapped:
+            return mapped[:]
+
+    def put(self, cid, data):
+        if len(data) > self.max_bytes:
+            return
+        file = self.file_for(cid)
+        file.parent.mkdir(exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=file.parent, prefix=".tmp-")
+        with os.fdopen(handle, "wb") as out:
+            out.write(data)
+        os.replace(temp, file)
+        with self.lock:
+            self.size += len(data) - self.entries.pop(cid, 0)
+            self.entries[cid] = len(data)
+            evicted = []
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                old, size = self.entries.popitem(last=False)
+                self.size -= size
+                evicted.append(old)
+        for old in evicted:
+            self.file_for(old).unlink(missing_ok=True)
+
+    def _forget(self, cid):
+        with self.lock:
+            self.size -= self.entries.pop(cid, 0)
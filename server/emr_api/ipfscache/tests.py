@@ -0,0 +1,215 @@
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ipfscache.cache import BlobNotFound, CidCache, GatewayError, reset_cid_cache
+from ipfscache.cids import content_matches, file_cid
+from ipfscache.store import BlobStore
+from users.models import User
+
+RECORD = json.dumps({"ciphertext": "abc", "keys": {"0xaa": "k"}}).encode()
+BINARY = b"\x00\x01binary"
+CID = file_cid(RECORD)
+OTHER_CID = file_cid(BINARY, version=1)
+MISSING_CID = "QmNotOnTheGatewayNotOnTheGatewayNotOnTheGate"
+# Names a file too large for one block, which can't be checked from the body.
+CHUNKED_CID = file_cid(b"the root of a chunked file")
+
+
+class GatewayStub:
+    """Local HTTP server standing in for the Pinata gateway at /ipfs/<cid>."""
+
+    def __init__(self, blobs, delay=0.0):
+        self.blobs = blobs
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                cid = self.path.rsplit("/", 1)[-1]
+                stub.requests.append((cid, self.headers.get("x-pinata-gateway-token")))
+                time.sleep(delay)
+                body = stub.blobs.get(cid)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/ipfs/"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CacheTestCase(TestCase):
+    blobs = {
+        CID: RECORD,
+        OTHER_CID: BINARY,
+        CHUNKED_CID: b"x" * (300 * 1024),
+    }
+    delay = 0.0
+
+    def setUp(self):
+        self.gateway = GatewayStub(self.blobs, delay=self.delay)
+        self.addCleanup(self.gateway.close)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def make_cache(self, max_bytes=1024 * 1024, **kwargs):
+        return CidCache(BlobStore(self.directory.name, max_bytes), self.gateway.url, **kwargs)
+
+
+class CidCacheTests(CacheTestCase):
+    delay = 0.2
+
+    def test_fetches_each_cid_once(self):
+        """
+        Test that a CID is downloaded once and then served from disk, also after a restart.
+        """
+        cache = self.make_cache(token="secret")
+        self.assertEqual(cache.get(CID), self.blobs[CID])
+        self.assertEqual(cache.get(CID), self.blobs[CID])
+        self.assertEqual(self.make_cache().get(CID), self.blobs[CID])
+
+        self.assertEqual(self.gateway.requests, [(CID, "secret")])
+
+    def test_concurrent_misses_share_one_download(self):
+        """
+        Test that simultaneous requests for an uncached CID make a single gateway request.
+        """
+        cache = self.make_cache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get(CID))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [self.blobs[CID]] * 8)
+        self.assertEqual(len(self.gateway.requests), 1)
+
+    def test_get_many_fetches_in_parallel(self):
+        """
+        Test that a batch runs its downloads concurrently and reports missing CIDs.
+        """
+        cache = self.make_cache(workers=4)
+        start = time.monotonic()
+        found, errors = cache.get_many([CID, OTHER_CID, MISSING_CID, CID])
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(set(found), {CID, OTHER_CID})
+        self.assertEqual(errors, {MISSING_CID: "not found"})
+        with self.assertRaises(BlobNotFound):
+            cache.get(MISSING_CID)
+
+
+    def test_content_is_checked_against_the_cid(self):
+        """
+        Test that a body not matching its CID is refused, and an uncheckable one is served but not kept.
+        """
+        cache = self.make_cache()
+        self.gateway.blobs = {**self.blobs, OTHER_CID: BINARY + b" ", CID: RECORD + b" "}
+        with self.assertRaises(GatewayError):
+            cache.get(OTHER_CID)
+        # A dag-pb mismatch may be UnixFS metadata rather than tampering: passed through, never kept.
+        self.assertEqual(cache.get(CID), RECORD + b" ")
+        self.assertEqual(cache.get(CHUNKED_CID), self.blobs[CHUNKED_CID])
+        self.assertEqual(cache.get(CHUNKED_CID), self.blobs[CHUNKED_CID])
+
+        self.assertEqual(len(cache.store.entries), 0)
+        self.assertEqual(cache.stats["unchecked"], 3)
+
+    def test_known_cids(self):
+        """
+        Test the CID computations against CIDs kubo assigns to "hello world\\n".
+        """
+        self.assertEqual(file_cid(b"hello world\n"), "QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o")
+        self.assertEqual(file_cid(b"hello world\n", version=1),
+                         "bafkreifjjcie6lypi6ny7amxnfftagclbuxndqonfipmb64f2km2devei4")
+        self.assertTrue(content_matches("QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH", b""))
+        self.assertFalse(content_matches(OTHER_CID, b"tampered"))
+
+
+class BlobStoreTests(CacheTestCase):
+    def test_evicts_least_recently_used(self):
+        """
+        Test that going over max_bytes evicts the blob used longest ago.
+        """
+        store = BlobStore(self.directory.name, max_bytes=250)
+        store.put(CID, b"a" * 100)
+        store.put(OTHER_CID, b"b" * 100)
+        self.assertEqual(store.read(CID), b"a" * 100)
+
+        store.put(MISSING_CID, b"c" * 100)
+
+        self.assertIn(CID, store)
+        self.assertNotIn(OTHER_CID, store)
+        self.assertFalse(store.file_for(OTHER_CID).exists())
+        self.assertEqual(BlobStore(self.directory.name, max_bytes=250).size, 200)
+
+    def test_empty_blob(self):
+        """
+        Test that an empty blob round-trips (it cannot be memory-mapped).
+        """
+        store = BlobStore(self.directory.name, max_bytes=250)
+        store.put(CID, b"")
+
+        self.assertEqual(store.read(CID), b"")
+
+
+class BlobViewTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        override = override_settings(IPFS_CACHE={"GATEWAY_URL": self.gateway.url, "PATH": self.directory.name})
+        override.enable()
+        self.addCleanup(override.disable)
+        reset_cid_cache()
+        self.addCleanup(reset_cid_cache)
+
+        user = User.objects.create(wallet_address="0x" + "a" * 40, role="provider")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+
+    def test_get_blob_streams_immutable_bytes(self):
+        """
+        Test that a single CID comes back as raw bytes marked immutable.
+        """
+        response = self.client.get(f"/api/ipfs/{OTHER_CID}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.blobs[OTHER_CID])
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.client.get(f"/api/ipfs/{MISSING_CID}/").status_code, 404)
+        self.assertEqual(self.client.get("/api/ipfs/not-a-cid/").status_code, 400)
+
+        unchecked = self.client.get(f"/api/ipfs/{CHUNKED_CID}/")
+        self.assertEqual(unchecked.content, self.blobs[CHUNKED_CID])
+        self.assertNotIn("immutable", unchecked["Cache-Control"])
+
+    def test_batch_returns_records_and_errors(self):
+        """
+        Test that the batch endpoint decodes JSON records and lists CIDs it could not fetch.
+        """
+        response = self.client.post("/api/ipfs/batch/", {"cids": [CID, OTHER_CID, MISSING_CID]}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        records = {record["cid"]: record for record in response.data["records"]}
+        self.assertEqual(records[CID]["data"]["keys"], {"0xaa": "k"})
+        self.assertIn("data_base64", records[OTHER_CID])
+        self.assertEqual(response.data["errors"], {MISSING_CID: "not found"})
+        self.assertEqual(self.client.post("/api/ipfs/batch/", {"cids": []}, format="json").status_code, 400)
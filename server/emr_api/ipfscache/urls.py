@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import GetBlobView, GetBlobsBatchView
+
+urlpatterns = [
+    path('batch/', GetBlobsBatchView.as_view(), name='ipfs-batch'),
+    path('<str:cid>/', GetBlobView.as_view(), name='ipfs-blob'),
+]
@@ -0,0 +1,87 @@
+import base64
+import json
+
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cache import BlobNotFound, GatewayError, get_cid_cache
+from .store import is_valid_cid
+
+MAX_BATCH_CIDS = 200
+STREAM_CHUNK = 64 * 1024
+# A CID's content can never change.
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+def stream_mapped(mapped):
+    try:
+        for start in range(0, len(mapped), STREAM_CHUNK):
+            yield mapped[start:start + STREAM_CHUNK]
+    finally:
+        if hasattr(mapped, "close"):
+            mapped.close()
+
+
+def blob_payload(cid, data):
+    # Pinata records are JSON; anything else is passed through as base64.
+    try:
+        return {"cid": cid, "data": json.loads(data)}
+    except ValueError:
+        return {"cid": cid, "data_base64": base64.b64encode(data).decode()}
+
+
+class GetBlobView(APIView):
+    """Raw bytes of one CID, from the local cache when possible."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, cid):
+        if not is_valid_cid(cid):
+            return Response({"error": "Invalid CID."}, status=400)
+        cache = get_cid_cache()
+        mapped = cache.store.open(cid)
+        if mapped is None:
+            try:
+                data = cache.get(cid)
+            except BlobNotFound:
+                return Response({"error": "CID not found."}, status=404)
+            except GatewayError as exc:
+                return Response({"error": str(exc)}, status=502)
+            mapped = cache.store.open(cid)
+        if mapped is None:
+            # Fetched but not kept: too large to cache, or not checkable
+            # against the CID, so not promised to be immutable either.
+            response = HttpResponse(data, content_type="application/octet-stream")
+            response["Cache-Control"] = "private, no-cache"
+            return response
+
+        response = StreamingHttpResponse(stream_mapped(mapped), content_type="application/octet-stream")
+        response["Content-Length"] = len(mapped)
+        response["Cache-Control"] = IMMUTABLE
+        response["ETag"] = f'"{cid}"'
+        return response
+
+
+class GetBlobsBatchView(APIView):
+    """
+    POST {"cids": [...]}: fetches every uncached CID in parallel and returns
+    {"records": [{"cid", "data"}...], "errors": {cid: message}}.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        cids = request.data.get("cids")
+        if not isinstance(cids, list) or not cids:
+            return Response({"error": "cids must be a non-empty list."}, status=400)
+        if len(cids) > MAX_BATCH_CIDS:
+            return Response({"error": f"At most {MAX_BATCH_CIDS} cids per request."}, status=400)
+        invalid = [cid for cid in cids if not is_valid_cid(cid)]
+        if invalid:
+            return Response({"error": "Invalid CID.", "cids": invalid}, status=400)
+
+        found, errors = get_cid_cache().get_many(cids)
+        return Response({
+            "records": [blob_payload(cid, data) for cid, data in found.items()],
+            "errors": errors,
+        })
@@ -0,0 +1,10 @@
+from django.urls import path
+from .async_views import GetPatientCountView, AddPatientView, GetPatientWalletAddressView, GetPatientDirectoryView, ImportPatientsView
+
+urlpatterns = [
+    path('getPatientCount/', GetPatientCountView.as_view()),
+    path('addPatient/', AddPatientView.as_view()),
+    path('getPatientWalletAddress/', GetPatientWalletAddressView.as_view()),
+    path('getPatientDirectory/', GetPatientDirectoryView.as_view()),
+    path('importPatients/', ImportPatientsView.as_view()),
+]
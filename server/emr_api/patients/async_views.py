@@ -0,0 +1,88 @@
+# Async (ASGI) variants of patients.views; see emr_api/async_api.py.
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.db.models import Max
+
+from emr_api.async_api import AsyncAPIView, json_response
+from emr_api.pagination import parse_int_param
+from .bulk import (MAX_IMPORT_ROWS, NDJSON, import_patients, import_values, iter_ndjson, normalize_address,
+                   summarise_results)
+from .models import Patient
+from .views import DIRECTORY_MAX_PAGE_SIZE, DIRECTORY_PAGE_SIZE
+
+
+class GetPatientCountView(AsyncAPIView):
+    async def get(self, request):
+        return json_response({"patient_count": await Patient.objects.acount()})
+
+
+class AddPatientView(AsyncAPIView):
+    async def post(self, request):
+        wallet_address = request.data.get("wallet_address")
+        if not wallet_address:
+            return json_response({"error": "Wallet address is required."}, status=400)
+        try:
+            wallet_address = normalize_address(wallet_address)
+        except ValueError as exc:
+            return json_response({"error": str(exc)}, status=400)
+        if await Patient.objects.filter(wallet_address=wallet_address).aexists():
+            return json_response({"error": "Patient already exists."}, status=409)
+        try:
+            await Patient.objects.acreate(wallet_address=wallet_address)
+        except IntegrityError:  # lost a race with a concurrent insert
+            return json_response({"error": "Patient already exists."}, status=409)
+        return json_response({"message": "Patient added successfully."})
+
+
+class ImportPatientsView(AsyncAPIView):
+    async def post(self, request):
+        if request.content_type.startswith(NDJSON):
+            values = list(islice(iter_ndjson(request.body.splitlines()), MAX_IMPORT_ROWS + 1))
+        else:
+            try:
+                values = import_values(request.data)
+            except ValueError as exc:
+                return json_response({"error": str(exc)}, status=400)
+        if not values:
+            return json_response({"error": "No wallet addresses given."}, status=400)
+        if len(values) > MAX_IMPORT_ROWS:
+            return json_response({"error": f"At most {MAX_IMPORT_ROWS} patients per import."}, status=400)
+
+        results = await sync_to_async(import_patients)(values)
+        return json_response({"summary": summarise_results(results), "results": results})
+
+
+class GetPatientWalletAddressView(AsyncAPIView):
+    async def get(self, request):
+        index = parse_int_param(request.query_params.get("index"), None)
+        if index is None:
+            return json_response({"error": "Patient not found."}, status=404)
+        try:
+            patient = await Patient.objects.aget(id=index)
+        except Patient.DoesNotExist:
+            return json_response({"error": "Patient not found."}, status=404)
+        return json_response({"wallet_address": patient.wallet_address})
+
+
+class GetPatientDirectoryView(AsyncAPIView):
+    async def get(self, request):
+        after = parse_int_param(request.query_params.get("after"), 0)
+        limit = parse_int_param(request.query_params.get("limit"), DIRECTORY_PAGE_SIZE,
+                                minimum=1, maximum=DIRECTORY_MAX_PAGE_SIZE)
+        raw_snapshot = request.query_params.get("snapshot")
+        snapshot = parse_int_param(raw_snapshot, None)
+        if after is None or limit is None or (raw_snapshot and snapshot is None):
+            return json_response({"error": "after, limit and snapshot must be non-negative integers."}, status=400)
+
+        if snapshot is None:
+            snapshot = (await Patient.objects.aaggregate(last_id=Max("id")))["last_id"] or 0
+
+        patients = (Patient.objects
+                    .filter(id__gt=after, id__lte=snapshot)
+                    .order_by("id")
+                    .values_list("id", "wallet_address")[:limit])
+        page = [{"id": pk, "wallet_address": address} async for pk, address in patients]
+        next_cursor = page[-1]["id"] if len(page) == limit and page[-1]["id"] < snapshot else None
+        return json_response({"patients": page, "next_cursor": next_cursor, "snapshot_cursor": snapshot})
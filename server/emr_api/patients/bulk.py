@@ -0,0 +1,98 @@
+# Bulk patient registration. Addresses are normalised to their EIP-55
+# checksum form and inserted a chunk at a time with INSERT ... ON CONFLICT
+# DO NOTHING, so re-running an import is harmless and each chunk costs two
+# statements however many rows it holds.
+import json
+
+from django.db import transaction
+
+from emr_api.fields import normalize_address
+from responsecache.versions import bump
+
+from .models import Patient
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_IMPORT_ROWS = 200000
+
+
+NDJSON = "application/x-ndjson"
+
+
+def import_values(data):
+    """The address list from a JSON import body: {"wallet_addresses": [...]} or a bare list."""
+    values = data.get("wallet_addresses") if isinstance(data, dict) else data
+    if not isinstance(values, list):
+        raise ValueError("wallet_addresses must be a list.")
+    return values
+
+
+def iter_ndjson(lines):
+    """Wallet addresses from NDJSON lines: a JSON string or {"wallet_address": ...} per line."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        yield item.get("wallet_address") if isinstance(item, dict) else item
+
+
+def _insert_chunk(chunk):
+    """Insert (index, address) pairs; returns the set of addresses that were already stored."""
+    addresses = [address for _, address in chunk]
+    with transaction.atomic():
+        existing = set(Patient.objects.filter(wallet_address__in=addresses)
+                       .values_list("wallet_address", flat=True))
+        new = [Patient(wallet_address=address) for address in addresses if address not in existing]
+        if new:
+            Patient.objects.bulk_create(new, ignore_conflicts=True)
+            # bulk_create skips post_save, so cached patient reads are invalidated here.
+            bump("patients")
+    return existing
+
+
+def import_patients(values, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Register every wallet address in `values` (any iterable, consumed once).
+
+    Returns one result per input row, in order: {"index", "wallet_address",
+    "status"} where status is "created", "exists" (already registered),
+    "duplicate" (repeated earlier in this import) or "invalid" (with an
+    "error"). Each chunk commits on its own, so a failure part way through
+    keeps the chunks before it.
+    """
+    results, seen, chunk = [], set(), []
+
+    def flush():
+        existing = _insert_chunk(chunk)
+        for index, address in chunk:
+            results[index]["status"] = "exists" if address in existing else "created"
+        chunk.clear()
+
+    for index, value in enumerate(values):
+        try:
+            address = normalize_address(value)
+        except ValueError as exc:
+            results.append({"index": index, "wallet_address": value, "status": "invalid", "error": str(exc)})
+            continue
+        if address in seen:
+            results.append({"index": index, "wallet_address": address, "status": "duplicate"})
+            continue
+        seen.add(address)
+        results.append({"index": index, "wallet_address": address, "status": None})
+        chunk.append((index, address))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return results
+
+
+def summarise_results(results):
+    summary = {"created": 0, "exists": 0, "duplicate": 0, "invalid": 0}
+    for result in results:
+        summary[result["status"]] += 1
+    return summary
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from emr_api.benchmarking import access_token_for, dump, summarise
+from users.models import User
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Hold many concurrent keep-alive connections against running servers and report "
+            "p50/p99 latency, throughput and (given --pid) server RSS. Start the servers first, e.g. "
+            "gunicorn emr_api.wsgi --threads 32 and uvicorn emr_api.asgi:application.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", action="append", required=True, metavar="NAME=URL",
+                            help="Endpoint to load, e.g. asgi=http://127.0.0.1:8001/api/async/patients/getPatientCount/")
+        parser.add_argument("--pid", action="append", default=[], metavar="NAME=PID",
+                            help="Server process to sample VmRSS from while its target is loaded.")
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=20, help="Requests per client connection.")
+
+    def handle(self, *args, **options):
+        pids = dict(item.split("=", 1) for item in options["pid"])
+        # ClaimsJWTAuthentication never looks the user up, so an unsaved user is enough.
+        token = access_token_for(User(pk=1, wallet_address="0x" + "0" * 40, role="admin"))
+        report = {"clients": options["clients"], "requests_per_client": options["requests"], "targets": {}}
+        for item in options["target"]:
+            name, _, url = item.partition("=")
+            if not url:
+                raise CommandError(f"--target must look like NAME=URL, got {item!r}.")
+            report["targets"][name] = asyncio.run(
+                self.load(url, token, options["clients"], options["requests"], pids.get(name)))
+        dump(self.stdout, report)
+
+    async def load(self, url, token, clients, requests, pid):
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        request = (f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAuthorization: Bearer {token}\r\n"
+                   f"Connection: keep-alive\r\n\r\n").encode()
+        latencies, errors, rss = [], [], []
+
+        async def client():
+            writer = None
+            try:
+                for _ in range(requests):
+                    start = time.perf_counter()
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+                    writer.write(request)
+                    await writer.drain()
+                    status, keep_alive = await self.read_response(reader)
+                    latencies.append(time.perf_counter() - start)
+                    if status != 200:
+                        errors.append(status)
+                    if not keep_alive:
+                        # Servers without keep-alive (e.g. wsgiref) pay for a new connection.
+                        writer.close()
+                        writer = None
+            except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                errors.append(type(exc).__name__)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+        async def sample_rss():
+            while True:
+                value = _rss_kb(pid)
+                if value:
+                    rss.append(value)
+                await asyncio.sleep(0.2)
+
+        sampler = asyncio.create_task(sample_rss()) if pid else None
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        if sampler:
+            sampler.cancel()
+        return {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "requests_per_sec": len(latencies) / elapsed,
+            "latency": summarise(latencies),
+            "server_rss_peak_mb": max(rss) / 1024 if rss else None,
+        }
+
+    @staticmethod
+    async def read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ValueError("connection closed")
+        version, status = status_line.split()[:2]
+        keep_alive = version == b"HTTP/1.1"
+        length = None
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "connection":
+                keep_alive = value == "keep-alive" or (keep_alive and value != "close")
+        body = await (reader.readexactly(length) if length is not None else reader.read())
+        json.loads(body or b"null")
+        return int(status), keep_alive and length is not None
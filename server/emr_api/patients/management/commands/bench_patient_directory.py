@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from emr_api.benchmarking import Stopwatch, authenticated_client, benchmark_database, dump, summarise
+from patients.models import Patient
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Compare the per-index getPatientWalletAddress flow against getPatientDirectory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=5000)
+        parser.add_argument("--page-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create(wallet_address="0x" + "b" * 40, role="provider")
+            Patient.objects.bulk_create(
+                (Patient(wallet_address=f"0x{i:040x}") for i in range(1, options["patients"] + 1)),
+                batch_size=1000,
+            )
+            client = authenticated_client(user)
+            report = {
+                "patients": options["patients"],
+                "per_index": self.per_index(client),
+                "directory": self.directory(client, options["page_size"]),
+                "directory_ndjson": self.ndjson(client),
+            }
+        dump(self.stdout, report)
+
+    def per_index(self, client):
+        watch, requests = Stopwatch(), 0
+        with CaptureQueriesContext(connection) as queries:
+            with watch:
+                count = client.get("/api/patients/getPatientCount/").data["patient_count"]
+            requests += 1
+            for index in range(1, count + 1):
+                with watch:
+                    client.get("/api/patients/getPatientWalletAddress/", {"index": index})
+                requests += 1
+        return {"requests": requests, "queries": len(queries), "latency": summarise(watch.samples)}
+
+    def directory(self, client, page_size):
+        watch, requests, params = Stopwatch(), 0, {"limit": page_size}
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                with watch:
+                    data = client.get("/api/patients/getPatientDirectory/", params).data
+                requests += 1
+                if data["next_cursor"] is None:
+                    break
+                params = {"limit": page_size, "after": data["next_cursor"], "snapshot": data["snapshot_cursor"]}
+        return {"requests": requests, "queries": len(queries), "latency": summarise(watch.samples)}
+
+    def ndjson(self, client):
+        watch = Stopwatch()
+        with CaptureQueriesContext(connection) as queries:
+            with watch:
+                response = client.get("/api/patients/getPatientDirectory/", {"output": "ndjson"})
+                b"".join(response.streaming_content)
+        return {"requests": 1, "queries": len(queries), "latency": summarise(watch.samples)}
@@ -0,0 +1,82 @@
+import json
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from emr_api.benchmarking import Stopwatch, authenticated_client, benchmark_database, dump
+from patients.bulk import NDJSON
+from patients.models import Patient
+from users.models import User
+
+
+class QueryCounter:
+    # CaptureQueriesContext keeps at most 9000 queries, fewer than the baseline makes.
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def addresses(count, start=1):
+    return [f"0x{i:040x}" for i in range(start, start + count)]
+
+
+class Command(BaseCommand):
+    help = "Import patients through importPatients (JSON and NDJSON) and compare with one addPatient per row."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=100000)
+        parser.add_argument("--single", type=int, default=2000,
+                            help="Rows to add one request at a time for the baseline.")
+        parser.add_argument("--json-batch", type=int, default=20000,
+                            help="Rows per JSON request; JSON bodies are capped by DATA_UPLOAD_MAX_MEMORY_SIZE.")
+
+    def handle(self, *args, **options):
+        count = options["patients"]
+        with benchmark_database(on_disk=True):
+            user = User.objects.create(wallet_address="0x" + "b" * 40, role="admin")
+            client = authenticated_client(user)
+            report = {
+                "patients": count,
+                "single": self.single(client, addresses(options["single"], start=10 * count + 1)),
+                "json": self.bulk(client, addresses(count), "json", options["json_batch"]),
+                "ndjson": self.bulk(client, addresses(count, start=count + 1), NDJSON),
+                # Same rows again: everything is reported as "exists".
+                "ndjson_rerun": self.bulk(client, addresses(count, start=count + 1), NDJSON),
+            }
+            report["stored"] = Patient.objects.count()
+        dump(self.stdout, report)
+
+    def single(self, client, rows):
+        watch, queries = Stopwatch(), QueryCounter()
+        with connection.execute_wrapper(queries):
+            with watch:
+                for address in rows:
+                    client.post("/api/patients/addPatient/", {"wallet_address": address}, format="json")
+        return self.result(len(rows), watch, queries)
+
+    def bulk(self, client, rows, kind, batch=None):
+        batches = [rows[i:i + batch] for i in range(0, len(rows), batch)] if batch else [rows]
+        watch, summary, queries = Stopwatch(), Counter(), QueryCounter()
+        with connection.execute_wrapper(queries):
+            for rows_in_batch in batches:
+                with watch:
+                    if kind == NDJSON:
+                        body = "".join(json.dumps(address) + "\n" for address in rows_in_batch)
+                        response = client.post("/api/patients/importPatients/", body, content_type=NDJSON)
+                    else:
+                        response = client.post("/api/patients/importPatients/",
+                                               {"wallet_addresses": rows_in_batch}, format="json")
+                summary.update(response.data["summary"])
+        result = self.result(len(rows), watch, queries)
+        result.update(requests=len(batches), summary=dict(summary))
+        return result
+
+    @staticmethod
+    def result(rows, watch, queries):
+        seconds = sum(watch.samples)
+        return {"rows": rows, "seconds": round(seconds, 3), "rows_per_second": round(rows / seconds),
+                "queries": queries.count}
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:05
+
+import emr_api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_remove_patient_ip_alter_patient_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patient',
+            name='wallet_address',
+            field=emr_api.fields.WalletAddressField(unique=True),
+        ),
+        emr_api.fields.convert_address_columns('patients_patient', ['wallet_address']),
+    ]
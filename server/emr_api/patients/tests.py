@@ -1,3 +1,190 @@
-from django.test import TestCase
+import json
+from unittest.mock import patch
 
-# Create your tests here.
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from emr_api.fields import normalize_address
+from users.models import User
+from .models import Patient
+
+CHECKSUMMED = '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed'
+
+
+class PatientDirectoryViewTests(TestCase):
+    def setUp(self):
+        """
+        Create an authenticated client and a handful of patients.
+        """
+        self.client = APIClient()
+        user = User.objects.create(wallet_address='0x00000000000000000000000000000000000000aa', role='provider')
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+        self.addresses = [f'0x{i:040x}' for i in range(1, 8)]
+        Patient.objects.bulk_create(Patient(wallet_address=a) for a in self.addresses)
+
+    def test_pages_follow_cursor(self):
+        """
+        Test that following next_cursor walks every patient exactly once.
+        """
+        seen, after, snapshot = [], 0, None
+        while True:
+            params = {'after': after, 'limit': 3}
+            if snapshot is not None:
+                params['snapshot'] = snapshot
+            response = self.client.get('/api/patients/getPatientDirectory/', params)
+            self.assertEqual(response.status_code, 200)
+            snapshot = response.data['snapshot_cursor']
+            seen += [p['wallet_address'] for p in response.data['patients']]
+            if response.data['next_cursor'] is None:
+                break
+            after = response.data['next_cursor']
+        self.assertEqual(seen, self.addresses)
+
+    def test_snapshot_cursor_returns_only_new_patients(self):
+        """
+        Test that passing the snapshot cursor as `after` fetches only patients added since.
+        """
+        first = self.client.get('/api/patients/getPatientDirectory/')
+        Patient.objects.create(wallet_address='0x' + 'f' * 40)
+
+        response = self.client.get('/api/patients/getPatientDirectory/', {'after': first.data['snapshot_cursor']})
+        self.assertEqual([p['wallet_address'] for p in response.data['patients']],
+                         [normalize_address('0x' + 'f' * 40)])
+
+    def test_ndjson_stream(self):
+        """
+        Test that the NDJSON format streams one patient per line.
+        """
+        response = self.client.get('/api/patients/getPatientDirectory/', {'output': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['wallet_address'] for line in lines], self.addresses)
+
+    def test_invalid_cursor(self):
+        """
+        Test that a non-numeric cursor is rejected.
+        """
+        response = self.client.get('/api/patients/getPatientDirectory/', {'after': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportPatientsViewTests(TestCase):
+    def setUp(self):
+        """
+        Create an authenticated client.
+        """
+        self.client = APIClient()
+        user = User.objects.create(wallet_address='0x00000000000000000000000000000000000000aa', role='admin')
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def test_rows_are_normalised_and_reported(self):
+        """
+        Test that every row gets a status and stored addresses are in checksum form.
+        """
+        Patient.objects.create(wallet_address=CHECKSUMMED)
+        new = '0x' + '1' * 40
+        response = self.client.post('/api/patients/importPatients/', {'wallet_addresses': [
+            new, CHECKSUMMED.lower(), new.upper().replace('X', 'x'), 'not an address', '0x' + CHECKSUMMED[2:].swapcase(),
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'exists', 'duplicate', 'invalid', 'invalid'])
+        self.assertEqual(response.data['results'][4]['error'], 'Wallet address checksum does not match.')
+        self.assertEqual(response.data['summary'], {'created': 1, 'exists': 1, 'duplicate': 1, 'invalid': 2})
+        self.assertEqual(set(Patient.objects.values_list('wallet_address', flat=True)), {new, CHECKSUMMED})
+
+    def test_reimport_is_idempotent(self):
+        """
+        Test that sending the same import twice creates nothing the second time.
+        """
+        body = {'wallet_addresses': [f'0x{i:040x}' for i in range(1, 6)]}
+        self.client.post('/api/patients/importPatients/', body, format='json')
+        again = self.client.post('/api/patients/importPatients/', body, format='json')
+
+        self.assertEqual(again.data['summary']['exists'], 5)
+        self.assertEqual(Patient.objects.count(), 5)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        """
+        Test that a chunk costs the same number of queries for 3 or 300 rows.
+        """
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/patients/importPatients/', [f'0x{i:040x}' for i in range(1, 4)], format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post('/api/patients/importPatients/', [f'0x{i:040x}' for i in range(4, 304)], format='json')
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Patient.objects.count(), 303)
+
+    def test_ndjson_stream(self):
+        """
+        Test that an NDJSON body of strings or objects is imported line by line.
+        """
+        body = '"0x%s"\n\n{"wallet_address": "0x%s"}\nnot json\n' % ('1' * 40, '2' * 40)
+        response = self.client.post('/api/patients/importPatients/', body, content_type='application/x-ndjson')
+
+        self.assertEqual([r['status'] for r in response.data['results']], ['created', 'created', 'invalid'])
+        self.assertEqual(Patient.objects.count(), 2)
+
+    def test_rejects_empty_and_oversized_imports(self):
+        """
+        Test that an empty list, a non-list and too many rows are refused before anything is written.
+        """
+        for body in ([], {'wallet_addresses': 'x'}):
+            self.assertEqual(self.client.post('/api/patients/importPatients/', body, format='json').status_code, 400)
+        with patch('patients.views.MAX_IMPORT_ROWS', 2):
+            response = self.client.post('/api/patients/importPatients/', ['0x' + '1' * 40] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Patient.objects.count(), 0)
+
+    def test_add_patient_duplicate_is_a_conflict(self):
+        """
+        Test that adding an existing patient, in any letter case, answers 409 instead of failing.
+        """
+        first = self.client.post('/api/patients/addPatient/', {'wallet_address': CHECKSUMMED.lower()})
+        duplicate = self.client.post('/api/patients/addPatient/', {'wallet_address': CHECKSUMMED})
+
+        self.assertEqual((first.status_code, duplicate.status_code), (200, 409))
+        self.assertEqual(Patient.objects.get().wallet_address, CHECKSUMMED)
+
+
+class AsyncPatientViewTests(TestCase):
+    def setUp(self):
+        """
+        Create an async client with a login-style token.
+        """
+        user = User.objects.create(wallet_address='0x00000000000000000000000000000000000000aa', role='provider')
+        refresh = RefreshToken.for_user(user)
+        self.client = AsyncClient()
+        self.headers = {'Authorization': f'Bearer {str(refresh.access_token)}'}
+
+    async def test_add_count_and_page(self):
+        """
+        Test that the async endpoints add, count and list patients like the sync ones.
+        """
+        for address in ('0x' + '1' * 40, '0x' + '2' * 40):
+            response = await self.client.post('/api/async/patients/addPatient/', {'wallet_address': address},
+                                              content_type='application/json', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        duplicate = await self.client.post('/api/async/patients/addPatient/', {'wallet_address': '0x' + '1' * 40},
+                                           content_type='application/json', headers=self.headers)
+        self.assertEqual(duplicate.status_code, 409)
+
+        count = await self.client.get('/api/async/patients/getPatientCount/', headers=self.headers)
+        self.assertEqual(count.json(), {'patient_count': 2})
+        page = await self.client.get('/api/async/patients/getPatientDirectory/', {'limit': 1},
+                                     headers=self.headers)
+        self.assertEqual(len(page.json()['patients']), 1)
+        self.assertIsNotNone(page.json()['next_cursor'])
+
+    async def test_requires_token(self):
+        """
+        Test that async endpoints reject unauthenticated requests.
+        """
+        response = await AsyncClient().get('/api/async/patients/getPatientCount/')
+        self.assertEqual(response.status_code, 401)
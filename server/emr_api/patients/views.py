@@ -2,12 +2,28 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import Patient
 from rest_framework.permissions import IsAuthenticated
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from emr_api.pagination import parse_int_param
+from responsecache.decorators import cached_get
+from .bulk import (MAX_IMPORT_ROWS, NDJSON, import_patients, import_values, iter_ndjson, normalize_address,
+                   summarise_results)
+from itertools import islice
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY_PAGE_SIZE = 500
+DIRECTORY_MAX_PAGE_SIZE = 5000
 
 
 # Create your views here.
 class GetPatientCountView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @cached_get("patients")
     def get(self, request):
         # Get the count of patients in the database
         patient_count = Patient.objects.count()
@@ -24,21 +40,107 @@ class AddPatientView(APIView):
         if not wallet_address:
             return Response({"error": "Wallet address is required."}, status=400)
         
+        try:
+            wallet_address = normalize_address(wallet_address)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+
         # Create a new patient instance
-        patient = Patient(wallet_address=wallet_address)
-        patient.save()
-        
+        try:
+            with transaction.atomic():
+                Patient.objects.create(wallet_address=wallet_address)
+        except IntegrityError:
+            return Response({"error": "Patient already exists."}, status=409)
+
         return Response({"message": "Patient added successfully."})
 
+
+class ImportPatientsView(APIView):
+    """
+    Registers many patients in one request.
+
+    Body: {"wallet_addresses": [...]} (or a bare list) as JSON, or an
+    application/x-ndjson stream with one address (or {"wallet_address": ...})
+    per line. Each row comes back with a status, and addresses that are
+    already registered are reported as "exists", so a failed import can be
+    re-sent as is.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.content_type.startswith(NDJSON):
+            values = list(islice(iter_ndjson(request.stream or ()), MAX_IMPORT_ROWS + 1))
+        else:
+            try:
+                values = import_values(request.data)
+            except ValueError as exc:
+                return Response({"error": str(exc)}, status=400)
+        if not values:
+            return Response({"error": "No wallet addresses given."}, status=400)
+        if len(values) > MAX_IMPORT_ROWS:
+            return Response({"error": f"At most {MAX_IMPORT_ROWS} patients per import."}, status=400)
+
+        results = import_patients(values)
+        return Response({"summary": summarise_results(results), "results": results})
+
 class GetPatientWalletAddressView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         # Get the wallet address of the authenticated user
         index = request.GET.get("index")
-        print("index", index)
+        logger.debug("Wallet address lookup for index %s", index)
         try:
             patient = Patient.objects.get(id=index)
             return Response({"wallet_address": patient.wallet_address})
         except Patient.DoesNotExist:
-            return Response({"error": "Patient not found."}, status=404)
\ No newline at end of file
+            return Response({"error": "Patient not found."}, status=404)
+
+
+class GetPatientDirectoryView(APIView):
+    """
+    Returns patient wallet addresses in bulk, keyset-paginated by Patient.id.
+
+    Query params:
+        after: only return patients with id > after (default 0)
+        limit: page size (default 500, max 5000)
+        snapshot: only return patients with id <= snapshot. The first page
+            returns a snapshot_cursor; pass it back on the following pages so
+            rows added mid-sync don't shift the listing, and later pass it as
+            `after` to fetch only the patients added since the last sync.
+        output: "ndjson" streams every remaining row (one object per line)
+            instead of returning a single page.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        after = parse_int_param(request.query_params.get("after"), 0)
+        limit = parse_int_param(request.query_params.get("limit"), DIRECTORY_PAGE_SIZE,
+                                minimum=1, maximum=DIRECTORY_MAX_PAGE_SIZE)
+        raw_snapshot = request.query_params.get("snapshot")
+        snapshot = parse_int_param(raw_snapshot, None)
+        if after is None or limit is None or (raw_snapshot and snapshot is None):
+            return Response({"error": "after, limit and snapshot must be non-negative integers."}, status=400)
+
+        if snapshot is None:
+            snapshot = Patient.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+
+        patients = (Patient.objects
+                    .filter(id__gt=after, id__lte=snapshot)
+                    .order_by("id")
+                    .values_list("id", "wallet_address"))
+
+        if request.query_params.get("output") == "ndjson":
+            rows = (json.dumps({"id": pk, "wallet_address": address}) + "\n"
+                    for pk, address in patients.iterator(chunk_size=DIRECTORY_PAGE_SIZE))
+            response = StreamingHttpResponse(rows, content_type="application/x-ndjson")
+            response["X-Snapshot-Cursor"] = str(snapshot)
+            return response
+
+        page = [{"id": pk, "wallet_address": address} for pk, address in patients[:limit]]
+        next_cursor = page[-1]["id"] if len(page) == limit and page[-1]["id"] < snapshot else None
+        return Response({
+            "patients": page,
+            "next_cursor": next_cursor,
+            "snapshot_cursor": snapshot,
+        })
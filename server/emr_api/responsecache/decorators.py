@@ -0,0 +1,100 @@
+# Conditional GET and a shared response cache for read endpoints.
+#
+# A response is identified by the view, its query string, who is asking
+# (their role, or their user id for per-user views), the negotiated format
+# and the current version stamps of the resources it reads. That identity
+# is both the cache key and the ETag, so a client revalidating with
+# If-None-Match is answered with one small query, and any write to a
+# resource moves every key that depends on it.
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+from emr_api.instrumentation import RESPONSE_CACHE
+
+from .versions import current_versions
+
+DEFAULT_RESPONSE_CACHE = {
+    "ENABLED": True,
+    # Alias in CACHES holding response bodies.
+    "CACHE": "default",
+    # Seconds an entry may stay in the cache. Freshness comes from the
+    # version stamps; this only bounds memory held by dead keys.
+    "TIMEOUT": 300,
+}
+
+
+def response_cache_settings():
+    return {**DEFAULT_RESPONSE_CACHE, **getattr(settings, "RESPONSE_CACHE", {})}
+
+
+def _etag_matches(header, etag):
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2).
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def response_key(request, resources, per_user=False):
+    """(etag, cache key) for this request given its resources' current stamps."""
+    user = request.user
+    caller = f"user:{user.pk}" if per_user else f"role:{getattr(user, 'role', '')}"
+    renderer = getattr(request, "accepted_renderer", None)
+    identity = repr((
+        request.resolver_match.view_name if request.resolver_match else request.path,
+        sorted(request.query_params.lists()),
+        caller,
+        renderer.format if renderer else "",
+        current_versions(resources),
+    ))
+    digest = hashlib.sha256(identity.encode()).hexdigest()
+    return f'"{digest[:32]}"', f"response:{digest}"
+
+
+def cached_get(*resources, per_user=False):
+    """
+    Serve an APIView.get with strong ETags and a shared response cache.
+
+    `resources` are the names bumped by writes to the data the view reads
+    (see responsecache/signals.py). Pass per_user=True when the body depends
+    on the caller and not just their role. Only 200 responses are cached.
+    """
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            config = response_cache_settings()
+            if not config["ENABLED"]:
+                return get(self, request, *args, **kwargs)
+            etag, key = response_key(request, resources, per_user)
+            view = type(self).__name__
+            headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+            if _etag_matches(request.headers.get("If-None-Match", ""), etag):
+                RESPONSE_CACHE.inc(1, view, "not_modified")
+                response = Response(status=304, headers=headers)
+                patch_vary_headers(response, ["Authorization"])
+                return response
+
+            cache = caches[config["CACHE"]]
+            data = cache.get(key)
+            if data is None:
+                RESPONSE_CACHE.inc(1, view, "miss")
+                response = get(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, response.data, config["TIMEOUT"])
+            else:
+                RESPONSE_CACHE.inc(1, view, "hit")
+                response = Response(data)
+            for name, value in headers.items():
+                response[name] = value
+            patch_vary_headers(response, ["Authorization"])
+            return response
+        return wrapper
+    return decorator
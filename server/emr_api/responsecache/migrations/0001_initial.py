@@ -0,0 +1,32 @@
+import uuid
+
+from django.db import migrations, models
+
+RESOURCES = ("patients", "profiles", "events")
+
+
+def seed_versions(apps, schema_editor):
+    ResourceVersion = apps.get_model("responsecache", "ResourceVersion")
+    ResourceVersion.objects.bulk_create(
+        [ResourceVersion(name=name, version=uuid.uuid4().hex) for name in RESOURCES],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVersion',
+            fields=[
+                ('name', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+        migrations.RunPython(seed_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class ResourceVersion(models.Model):
+    """
+    Current version stamp of a cached resource ("patients", "profiles",
+    "events"). Every write to the rows behind a resource replaces its stamp
+    in the same transaction, so a stamp read before the data always
+    describes data at least that new.
+    """
+    name = models.CharField(max_length=32, primary_key=True)
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.name}@{self.version}"
@@ -0,0 +1,27 @@
+# Model writes that change what a cached endpoint returns. Bulk writes skip
+# these signals; code that uses bulk_create/update on these models calls
+# versions.bump() itself (see events/ingest.py).
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from events.models import Event
+from patients.models import Patient
+from users.models import User, UserProfile
+
+from .versions import bump
+
+
+@receiver([post_save, post_delete], sender=Patient)
+def bump_patients(sender, **kwargs):
+    bump("patients")
+
+
+@receiver([post_save, post_delete], sender=User)
+@receiver([post_save, post_delete], sender=UserProfile)
+def bump_profiles(sender, **kwargs):
+    bump("profiles")
+
+
+@receiver([post_save, post_delete], sender=Event)
+def bump_events(sender, **kwargs):
+    bump("events")
@@ -0,0 +1,205 @@
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from events.models import Event
+from patients.models import Patient
+from users.authentication import issue_tokens
+from users.models import User, UserProfile
+from .models import ResourceVersion
+from .versions import bump, current_versions
+
+PROVIDER = '0x00000000000000000000000000000000000000aa'
+OTHER_PROVIDER = '0x00000000000000000000000000000000000000dd'
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        """
+        Create an authenticated provider client and start from an empty response cache.
+        """
+        caches['default'].clear()
+        self.user = User.objects.create(wallet_address=PROVIDER, role='provider')
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_tokens(user).access_token}')
+        return client
+
+
+class VersionTests(ResponseCacheTestCase):
+    def test_writes_bump_their_resource(self):
+        """
+        Test that saving a model replaces only the stamp of the resource it backs.
+        """
+        before = current_versions(('patients', 'profiles', 'events'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.create(wallet_address='0x' + '1' * 40)
+        after = current_versions(('patients', 'profiles', 'events'))
+
+        self.assertNotEqual(before[0], after[0])
+        self.assertEqual(before[1:], after[1:])
+
+    def test_bump_creates_missing_rows(self):
+        """
+        Test that bumping a resource without a row creates one.
+        """
+        ResourceVersion.objects.filter(name='patients').delete()
+        self.assertEqual(current_versions(('patients',)), ('0',))
+        with self.captureOnCommitCallbacks(execute=True):
+            bump('patients')
+        self.assertNotEqual(current_versions(('patients',)), ('0',))
+
+    def test_bump_waits_for_the_commit(self):
+        """
+        Test that a bump inside a transaction only writes the stamp once the transaction commits.
+        """
+        before = current_versions(('events',))
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump('events')
+            self.assertEqual(current_versions(('events',)), before)
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertNotEqual(current_versions(('events',)), before)
+
+
+class ConditionalGetTests(ResponseCacheTestCase):
+    def test_if_none_match_returns_304_without_running_the_view(self):
+        """
+        Test that a matching If-None-Match is answered from the version stamps alone.
+        """
+        first = self.client.get('/api/patients/getPatientCount/')
+        etag = first['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/patients/getPatientCount/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        weak = self.client.get('/api/patients/getPatientCount/', HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(weak.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        """
+        Test that an ETag stops matching once the resource behind it is written.
+        """
+        etag = self.client.get('/api/patients/getPatientCount/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/patients/addPatient/', {'wallet_address': '0x' + '2' * 40})
+
+        response = self.client.get('/api/patients/getPatientCount/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['patient_count'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_depends_on_query_and_format(self):
+        """
+        Test that different query strings and renderers get different ETags.
+        """
+        User.objects.create(wallet_address=OTHER_PROVIDER, role='provider')
+        one = self.client.get('/api/auth/get_user_profile/', {'address': PROVIDER})
+        other = self.client.get('/api/auth/get_user_profile/', {'address': OTHER_PROVIDER})
+        browsable = self.client.get('/api/auth/get_user_profile/', {'address': PROVIDER}, HTTP_ACCEPT='text/html')
+
+        self.assertEqual(len({one['ETag'], other['ETag'], browsable['ETag']}), 3)
+
+
+class ResponseCacheTests(ResponseCacheTestCase):
+    def test_repeated_reads_are_served_from_the_cache(self):
+        """
+        Test that an unchanged resource is read from the cache after the first request.
+        """
+        Patient.objects.create(wallet_address='0x' + '1' * 40)
+        first = self.client.get('/api/patients/getPatientCount/')
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/patients/getPatientCount/')
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_patient_count_is_fresh_after_writes(self):
+        """
+        Test that adding and deleting patients is visible on the next read.
+        """
+        self.assertEqual(self.client.get('/api/patients/getPatientCount/').data['patient_count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/patients/addPatient/', {'wallet_address': '0x' + '1' * 40})
+        self.assertEqual(self.client.get('/api/patients/getPatientCount/').data['patient_count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.get().delete()
+        self.assertEqual(self.client.get('/api/patients/getPatientCount/').data['patient_count'], 0)
+
+    def test_profile_is_fresh_after_writes(self):
+        """
+        Test that creating and updating a profile is visible on the next read.
+        """
+        params = {'address': PROVIDER}
+        self.assertFalse(self.client.get('/api/auth/get_user_profile/', params).data['data']['profileExists'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/set_user_profile/', {'first_name': 'Ada'})
+        self.assertEqual(self.client.get('/api/auth/get_user_profile/', params).data['first_name'], 'Ada')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/auth/set_user_profile/', {'first_name': 'Grace'})
+        self.assertEqual(self.client.get('/api/auth/get_user_profile/', params).data['first_name'], 'Grace')
+
+    def test_all_profiles_are_cached_per_caller(self):
+        """
+        Test that get_all_profiles, which leaves out the caller, is never shared between callers.
+        """
+        other = User.objects.create(wallet_address=OTHER_PROVIDER, role='provider')
+        UserProfile.objects.create(user=self.user, first_name='Self')
+        UserProfile.objects.create(user=other, first_name='Other')
+
+        mine = self.client.get('/api/auth/get_all_profiles/')
+        theirs = self.client_for(other).get('/api/auth/get_all_profiles/')
+
+        self.assertEqual([p['first_name'] for p in mine.data], ['Other'])
+        self.assertEqual([p['first_name'] for p in theirs.data], ['Self'])
+        self.assertNotEqual(mine['ETag'], theirs['ETag'])
+
+    def test_events_are_fresh_after_single_and_batch_writes(self):
+        """
+        Test that events added one at a time or in a batch show up on the next read.
+        """
+        params = {'related_wallet_address': PROVIDER}
+        self.assertEqual(self.client.get('/api/events/get_events/', params).data['events'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/events/add_event/', {
+                'event_type': 'record_accessed', 'event_details': 'one', 'related_wallet_address': PROVIDER,
+            }, format='json')
+        self.assertEqual(len(self.client.get('/api/events/get_events/', params).data['events']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/events/add_events/', {'events': [
+                {'event_type': 'record_accessed', 'event_details': 'two', 'related_wallet_address': PROVIDER},
+                {'event_type': 'record_accessed', 'event_details': 'three', 'related_wallet_address': PROVIDER},
+            ]}, format='json')
+        self.assertEqual(len(self.client.get('/api/events/get_events/', params).data['events']), 3)
+        self.assertEqual(Event.objects.count(), 3)
+
+    def test_errors_are_not_cached(self):
+        """
+        Test that a 404 is not cached and a later 200 is served once the user exists.
+        """
+        params = {'address': OTHER_PROVIDER}
+        missing = self.client.get('/api/auth/get_user_profile/', params)
+        self.assertEqual(missing.status_code, 404)
+        self.assertNotIn('ETag', missing)
+
+        User.objects.create(wallet_address=OTHER_PROVIDER, role='patient')
+        self.assertEqual(self.client.get('/api/auth/get_user_profile/', params).status_code, 200)
+
+    @override_settings(RESPONSE_CACHE={'ENABLED': False})
+    def test_disabled(self):
+        """
+        Test that the cache and ETags can be switched off.
+        """
+        response = self.client.get('/api/patients/getPatientCount/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
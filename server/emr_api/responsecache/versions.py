@@ -0,0 +1,37 @@
+# Version stamps for cached resources, kept in the database so every worker
+# process sees a write as soon as it commits. Stamps are random rather than
+# incrementing: a rolled-back transaction or a restored database can never
+# bring back a stamp that already has cached responses under it.
+#
+# A bump inside a transaction is written once it commits, in its own short
+# transaction. Readers only need a new stamp once the data it covers is
+# visible, and writing it inside the caller's transaction would hold the
+# stamp's row lock until commit, serialising every writer of the resource.
+import uuid
+from functools import partial
+
+from django.db import transaction
+
+from .models import ResourceVersion
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def _write(names):
+    for name in names:
+        version = new_version()
+        if not ResourceVersion.objects.filter(name=name).update(version=version):
+            ResourceVersion.objects.update_or_create(name=name, defaults={"version": version})
+
+
+def bump(*names):
+    """Give each named resource a fresh version stamp, once the current transaction commits."""
+    transaction.on_commit(partial(_write, names))
+
+
+def current_versions(names):
+    """Stamps for `names`, in order, from one query. Unknown resources read as "0"."""
+    stamps = dict(ResourceVersion.objects.filter(name__in=names).values_list("name", "version"))
+    return tuple(stamps.get(name, "0") for name in names)
@@ -0,0 +1,12 @@
+from django.urls import path
+from .async_views import GetNonceView, WalletLoginView, SetUserRoleView, GetAccessTokenView, SetUserProfileView, GetUserProfileView, GetAllProfilesView
+
+urlpatterns = [
+    path('nonce/', GetNonceView.as_view(), name='async-get-nonce'),
+    path('login/', WalletLoginView.as_view(), name='async-wallet-login'),
+    path('set_role/', SetUserRoleView.as_view(), name='async-set-role'),
+    path('get_access_token/', GetAccessTokenView.as_view(), name='async-get-token'),
+    path('set_user_profile/', SetUserProfileView.as_view(), name='async-set-user-profile'),
+    path('get_user_profile/', GetUserProfileView.as_view(), name='async-get-user-profile'),
+    path('get_all_profiles/', GetAllProfilesView.as_view(), name='async-get-all-profiles'),
+]
@@ -0,0 +1,137 @@
+# Async (ASGI) variants of users.views; see emr_api/async_api.py. Nonce
+# stores and signature recovery are blocking calls, so they run in worker
+# threads; signature recovery itself is further offloaded to the
+# verification process pool when SIGNATURE_POOL is enabled.
+import random
+
+from asgiref.sync import sync_to_async
+
+from emr_api.async_api import AsyncAPIView, json_response
+from emr_api.fields import normalize_address
+from .authentication import issue_tokens
+from .models import User, UserProfile
+from .nonces import NONCE_TTL, get_nonce_store
+from .queries import PROFILE_FIELDS, PROFILE_MAX_PAGE_SIZE, profile_directory, serialize_profile
+from .verification import VerificationTimeout, VerifierBusy, get_signature_verifier
+from .views import ROLES
+
+
+def _tokens(user, **extra):
+    refresh = issue_tokens(user)
+    return dict({"refresh": str(refresh), "access": str(refresh.access_token), "role": user.role}, **extra)
+
+
+class GetNonceView(AsyncAPIView):
+    authenticated = False
+
+    async def post(self, request):
+        address = request.data.get("address")
+        if not address:
+            return json_response({"error": "Address is required."}, status=400)
+        try:
+            address = normalize_address(address)
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=400)
+        nonce = str(random.randint(100000, 999999))
+        await sync_to_async(get_nonce_store().issue, thread_sensitive=False)(address, nonce, ttl=NONCE_TTL)
+        return json_response({"nonce": nonce})
+
+
+class WalletLoginView(AsyncAPIView):
+    authenticated = False
+
+    async def post(self, request):
+        address = request.data.get("address")
+        signature = request.data.get("signature")
+        role = request.data.get("role")
+        try:
+            address = normalize_address(address) if address else None
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=400)
+
+        store = get_nonce_store()
+        nonce = await sync_to_async(store.peek, thread_sensitive=False)(address) if address else None
+        if not nonce:
+            return json_response({"error": "Nonce expired."}, status=400)
+
+        try:
+            recovered = await sync_to_async(get_signature_verifier().recover, thread_sensitive=False)(nonce, signature)
+        except (VerifierBusy, VerificationTimeout):
+            return json_response({"error": "Too many logins in progress, try again shortly."}, status=503,
+                                 headers={"Retry-After": "1"})
+        if not await sync_to_async(store.consume, thread_sensitive=False)(address, nonce):
+            return json_response({"error": "Nonce expired."}, status=400)
+        if recovered is None:
+            return json_response({"error": "Invalid signature."}, status=400)
+        if normalize_address(recovered) != address:
+            return json_response({"error": "Signature mismatch."}, status=400)
+
+        user, created = await User.objects.aget_or_create(wallet_address=address)
+        if role in ROLES:
+            user.role = role
+            await user.asave()
+        return json_response(_tokens(user, created=created))
+
+
+class GetAccessTokenView(AsyncAPIView):
+    async def post(self, request):
+        try:
+            address = normalize_address(request.data.get("address"))
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=400)
+        try:
+            user = await User.objects.aget(wallet_address=address)
+        except User.DoesNotExist:
+            return json_response({"error": "User not found"}, status=404)
+        return json_response(_tokens(user))
+
+
+class SetUserRoleView(AsyncAPIView):
+    async def post(self, request):
+        role = request.data.get("role")
+        if role not in ROLES:
+            return json_response({"error": "Invalid role"}, status=400)
+        try:
+            address = normalize_address(request.data.get("address"))
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=400)
+        try:
+            user = await User.objects.aget(wallet_address=address)
+        except User.DoesNotExist:
+            return json_response({"error": "User not found"}, status=404)
+        user.role = role
+        await user.asave()
+        return json_response({"success": True, "role": role})
+
+
+class SetUserProfileView(AsyncAPIView):
+    async def post(self, request):
+        defaults = {field: request.data.get(field, "") for field in PROFILE_FIELDS}
+        _, created = await UserProfile.objects.aupdate_or_create(user_id=request.user.pk, defaults=defaults)
+        return json_response({"success": True, "message": "Profile created" if created else "Profile updated"})
+
+
+class GetUserProfileView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            address = normalize_address(request.query_params.get("address"))
+        except ValueError as error:
+            return json_response({"error": str(error)}, status=400)
+        try:
+            user = await User.objects.aget(wallet_address=address)
+        except User.DoesNotExist:
+            return json_response({"error": "User not found"}, status=404)
+        try:
+            profile = await UserProfile.objects.aget(user_id=user.pk)
+        except UserProfile.DoesNotExist:
+            return json_response({"message": "User profile not found", "data": {"profileExists": False}})
+        data = {"profileExists": True}
+        data.update({field: getattr(profile, field) for field in PROFILE_FIELDS})
+        return json_response(data)
+
+
+class GetAllProfilesView(AsyncAPIView):
+    async def get(self, request):
+        profiles = profile_directory(exclude_user=request.user)
+        data = [serialize_profile(p) async for p in profiles.aiterator(chunk_size=PROFILE_MAX_PAGE_SIZE)]
+        return json_response(data)
@@ -0,0 +1,124 @@
+# Stateless JWT authentication. Access tokens issued by WalletLoginView and
+# GetAccessTokenView already carry wallet_address and role, so requests are
+# authenticated from the token alone; the users.User row is only loaded
+# (through a small per-process TTL/LRU cache) when a view actually touches
+# an attribute the token does not carry.
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from emr_api.instrumentation import timed
+
+from .models import User
+
+DEFAULT_USER_CACHE_SETTINGS = {
+    "MAX_SIZE": 1024,
+    # Seconds a cached row may be served. Writes in this process invalidate
+    # immediately; the TTL bounds staleness caused by other processes.
+    "TTL": 60,
+}
+
+
+class UserCache:
+    """Thread-safe LRU cache of User rows with a per-entry TTL."""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+        user = User.objects.filter(pk=user_id).first()
+        if user is not None:
+            with self._lock:
+                self._entries[key] = (now + self.ttl, user)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_config = {**DEFAULT_USER_CACHE_SETTINGS, **getattr(settings, "USER_CACHE", {})}
+user_cache = UserCache(max_size=_config["MAX_SIZE"], ttl=_config["TTL"])
+
+
+class WalletTokenUser(TokenUser):
+    """
+    Request user built from token claims.
+
+    wallet_address and role come straight from the token. Any other
+    attribute (created_at, profile, ...) is read from the cached User row,
+    which is also what `.user` returns for code that needs a real model
+    instance. Note that role reflects the token, so a role change takes
+    effect when the client fetches a new token.
+    """
+
+    def __str__(self):
+        return self.wallet_address or super().__str__()
+
+    @cached_property
+    def user(self):
+        return user_cache.get(self.id)
+
+    @cached_property
+    def wallet_address(self):
+        return self.token.get("wallet_address") or getattr(self.user, "wallet_address", None)
+
+    @cached_property
+    def role(self):
+        return self.token.get("role") or getattr(self.user, "role", None)
+
+    def __getattr__(self, attr):
+        if attr.startswith("_") or attr == "token":
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.user, attr)
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWTAuthentication without the per-request user query.
+
+    Tokens are only issued to active users, and the lookup that would catch a
+    deactivation since issue is what this class trades away; keep
+    ACCESS_TOKEN_LIFETIME short enough for that to be acceptable.
+    """
+
+    def authenticate(self, request):
+        with timed("auth"):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        super().get_user(validated_token)  # validates the user id claim
+        return WalletTokenUser(validated_token)
+
+
+def issue_tokens(user):
+    """Refresh/access token pair carrying the claims WalletTokenUser reads."""
+    refresh = RefreshToken.for_user(user)
+    refresh['wallet_address'] = user.wallet_address
+    refresh['role'] = user.role
+    return refresh
@@ -0,0 +1,59 @@
+import time
+import uuid
+
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jwt.algorithms import has_crypto
+from rest_framework_simplejwt.backends import TokenBackend
+
+from emr_api.benchmarking import dump, wallet
+from users.management.commands.generate_jwt_key import generate_private_key
+from users.signing import ASYMMETRIC_ALGORITHMS, KeyRing, KeyRingTokenBackend
+from users.verifier import JwksVerifier
+
+
+class Command(BaseCommand):
+    help = ("Measure access token issue and verify throughput for HS256 against ES256 and EdDSA, "
+            "through simplejwt's backend and through the standalone JWKS verifier.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tokens", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        now = int(time.time())
+        payloads = [{"token_type": "access", "exp": now + 86400, "iat": now, "jti": uuid.uuid4().hex,
+                     "user_id": str(n), "wallet_address": wallet(n, "a"), "role": "provider"}
+                    for n in range(options["tokens"])]
+
+        report = {"tokens": options["tokens"], "algorithms": {}}
+        report["algorithms"]["HS256"] = self.run(TokenBackend("HS256", settings.SECRET_KEY), payloads)
+        for algorithm in ASYMMETRIC_ALGORITHMS:
+            if not has_crypto:
+                report["algorithms"][algorithm] = {"skipped": "cryptography is not installed"}
+                continue
+            keyring = KeyRing(algorithm, [generate_private_key(algorithm)])
+            # Keys handed over as if already fetched from /.well-known/jwks.json.
+            verifier = JwksVerifier("http://unused.invalid/")
+            verifier.keys = {jwk["kid"]: jwt.PyJWK(jwk) for jwk in keyring.jwks()["keys"]}
+            verifier.expires = float("inf")
+            report["algorithms"][algorithm] = self.run(KeyRingTokenBackend(keyring), payloads, verifier)
+        dump(self.stdout, report)
+
+    def run(self, backend, payloads, verifier=None):
+        started = time.perf_counter()
+        tokens = [backend.encode(payload) for payload in payloads]
+        issued = time.perf_counter()
+        for token in tokens:
+            backend.decode(token)
+        verified = time.perf_counter()
+        result = {
+            "token_bytes": len(tokens[0]),
+            "issue_per_sec": len(tokens) / (issued - started),
+            "verify_per_sec": len(tokens) / (verified - issued),
+        }
+        if verifier is not None:
+            for token in tokens:
+                verifier.verify(token)
+            result["jwks_verify_per_sec"] = len(tokens) / (time.perf_counter() - verified)
+        return result
@@ -0,0 +1,41 @@
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from emr_api.benchmarking import dump
+from users.nonces import LocalNonceStore, RedisNonceStore, SQLiteNonceStore
+
+
+class Command(BaseCommand):
+    help = "Measure nonce issue/consume throughput for each nonce store backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=20000)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--redis-url", help="Also benchmark RedisNonceStore against this server.")
+
+    def handle(self, *args, **options):
+        stores = {
+            "local": LocalNonceStore(),
+            "sqlite": SQLiteNonceStore(Path(tempfile.mkdtemp()) / "nonces.sqlite3"),
+        }
+        if options["redis_url"]:
+            stores["redis"] = RedisNonceStore(url=options["redis_url"])
+
+        report = {"operations": options["operations"], "threads": options["threads"], "backends": {}}
+        addresses = [f"0x{i:040x}" for i in range(options["operations"])]
+        for name, store in stores.items():
+            report["backends"][name] = {
+                "issue_per_sec": self.rate(options["threads"], addresses, lambda a: store.issue(a, "123456")),
+                "consume_per_sec": self.rate(options["threads"], addresses, store.consume),
+            }
+        dump(self.stdout, report)
+
+    def rate(self, threads, addresses, operation):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(operation, addresses, chunksize=256))
+        return len(addresses) / (time.perf_counter() - start)
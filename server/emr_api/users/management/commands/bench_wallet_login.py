@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from emr_api.benchmarking import Stopwatch, benchmark_database, dump, http_json, live_server, summarise
+from users import verification
+from users.nonces import get_nonce_store
+
+
+class Command(BaseCommand):
+    help = "Drive concurrent wallet logins against a local server with and without the signature pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--workers", type=int, default=None, help="Pool size (default: one per core).")
+
+    def handle(self, *args, **options):
+        # Sign everything up front so the load generator doesn't compete with
+        # the server for CPU while the clock is running.
+        accounts = [Account.create() for _ in range(options["logins"])]
+        signed = [(a.address, Account.sign_message(encode_defunct(text=f"{i:06d}"), a.key).signature.hex(), f"{i:06d}")
+                  for i, a in enumerate(accounts)]
+
+        report = {"logins": options["logins"], "concurrency": options["concurrency"], "modes": {}}
+        with benchmark_database(on_disk=True), live_server() as base_url:
+            for mode, enabled in (("inline", False), ("pool", True)):
+                pool = {"ENABLED": enabled, "WORKERS": options["workers"],
+                        "MAX_PENDING": max(64, options["concurrency"] * 2), "TIMEOUT": 10.0}
+                with override_settings(SIGNATURE_POOL=pool):
+                    verification.reset_signature_verifier()
+                    if enabled:
+                        # Start the workers before timing.
+                        verification.get_signature_verifier().recover("000000", signed[0][1])
+                    report["modes"][mode] = self.run(base_url, signed, options["concurrency"])
+                    report["modes"][mode]["verifier"] = verification.get_signature_verifier().stats()
+                    verification.reset_signature_verifier()
+        dump(self.stdout, report)
+
+    def run(self, base_url, signed, concurrency):
+        for address, _, nonce in signed:
+            get_nonce_store().issue(address, nonce)
+        watch, failures = Stopwatch(), []
+
+        def login(entry):
+            address, signature, _ = entry
+            with Stopwatch() as one:
+                status, _ = http_json("POST", f"{base_url}/api/auth/login/",
+                                      {"address": address, "signature": signature, "role": "patient"})
+            watch.samples.append(one.samples[0])
+            if status != 200:
+                failures.append(status)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(login, signed))
+        elapsed = time.perf_counter() - start
+        return {
+            "seconds": elapsed,
+            "logins_per_sec": (len(signed) - len(failures)) / elapsed,
+            "failures": len(failures),
+            "latency": summarise(watch.samples),
+        }
@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.signing import ASYMMETRIC_ALGORITHMS, SigningKey
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+except ImportError:  # ES256/EdDSA signing is optional
+    serialization = None
+
+
+def generate_private_key(algorithm):
+    """A new PKCS#8 PEM private key for `algorithm`."""
+    if serialization is None:
+        raise CommandError(f"{algorithm} keys need the cryptography package.")
+    if algorithm == "ES256":
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = ed25519.Ed25519PrivateKey.generate()
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption())
+
+
+class Command(BaseCommand):
+    help = ("Write a new private key for JWT_KEYS['PRIVATE_KEY_FILES']. To rotate, list it first and keep "
+            "the old key until REFRESH_TOKEN_LIFETIME has passed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--algorithm", choices=ASYMMETRIC_ALGORITHMS, default="ES256")
+
+    def handle(self, *args, **options):
+        pem = generate_private_key(options["algorithm"])
+        # Created owner-only, and never over an existing key.
+        try:
+            fd = os.open(options["path"], os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError as exc:
+            raise CommandError(f"{options['path']} already exists.") from exc
+        with os.fdopen(fd, "wb") as key_file:
+            key_file.write(pem)
+        self.stdout.write(f"Wrote {options['algorithm']} key {SigningKey(options['algorithm'], pem).kid} "
+                          f"to {options['path']}")
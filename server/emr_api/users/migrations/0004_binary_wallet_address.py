@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:05
+
+import emr_api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_directory_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='wallet_address',
+            field=emr_api.fields.WalletAddressField(unique=True),
+        ),
+        emr_api.fields.convert_address_columns('users_user', ['wallet_address']),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:54
+
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_binary_wallet_address'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='userprofile',
+            name='profile_last_first_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='userprofile',
+            name='profile_first_name_idx',
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(users.models.NameKey('last_name'), name='profile_last_name_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(users.models.NameKey('first_name'), name='profile_first_name_key_idx'),
+        ),
+    ]
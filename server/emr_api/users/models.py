@@ -1,6 +1,25 @@
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.db import models
 
+from emr_api.fields import WalletAddressField
+
+
+class NameKey(models.Func):
+    """
+    LOWER(name), compared byte-wise. The profile directory matches a name
+    prefix as a range on this key, which a B-tree index on the same
+    expression can serve; LIKE and ILIKE can't use a plain index on either
+    backend. PostgreSQL needs COLLATE "C" for the range to hold exactly the
+    names with that prefix; SQLite compares byte-wise already.
+    """
+    function = 'LOWER'
+    output_field = models.CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = self.as_sql(compiler, connection, **extra_context)
+        return f'({sql}) COLLATE "C"', params
+
+
 class UserManager(BaseUserManager):
     def create_user(self, wallet_address, password=None, **extra_fields):
         if not wallet_address:
@@ -16,7 +35,7 @@ class UserManager(BaseUserManager):
         return self.create_user(wallet_address, password, **extra_fields)
 
 class User(AbstractBaseUser, PermissionsMixin):
-    wallet_address = models.CharField(max_length=42, unique=True)
+    wallet_address = WalletAddressField(unique=True)
     ROLE_CHOICES = [('admin', 'Admin'), ('provider', 'Provider'), ('patient', 'Patient')]
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='patient')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -28,6 +47,11 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'wallet_address'
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['role'], name='user_role_idx'),
+        ]
+
     def __str__(self):
         return self.wallet_address
     
@@ -40,5 +64,12 @@ class UserProfile(models.Model):
     job_title = models.CharField(max_length=50, blank=True)
     orgnisation_name = models.CharField(max_length=50, blank=True)
 
+    class Meta:
+        # Backs the name-prefix filter of the profile directory.
+        indexes = [
+            models.Index(NameKey('last_name'), name='profile_last_name_key_idx'),
+            models.Index(NameKey('first_name'), name='profile_first_name_key_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
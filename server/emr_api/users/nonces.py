@@ -0,0 +1,242 @@
+# Login nonce stores. A nonce is issued by GetNonceView and must be
+# consumed exactly once by WalletLoginView, possibly in a different worker
+# process, so the store is pluggable:
+#
+#   LocalNonceStore   in-process; fine for a single worker
+#   SQLiteNonceStore  a shared SQLite file; multiple workers on one host
+#   RedisNonceStore   any Redis-compatible server; multiple hosts
+#
+# Every backend treats addresses case-insensitively, consumes atomically
+# (two concurrent logins can never both get the nonce) and bounds memory.
+# WalletLoginView peeks at the nonce, recovers the signer, and only then
+# consumes that nonce, so a login turned away before the signature was
+# checked (503) can be retried with the same nonce.
+import itertools
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+NONCE_TTL = 300
+
+DEFAULT_NONCE_STORE = {
+    "BACKEND": "users.nonces.LocalNonceStore",
+    "OPTIONS": {},
+}
+
+
+class BaseNonceStore:
+    def issue(self, address, nonce, ttl=NONCE_TTL):
+        """Remember `nonce` for `address` for `ttl` seconds, replacing any earlier one."""
+        raise NotImplementedError
+
+    def peek(self, address):
+        """The live nonce for `address`, or None, without using it up."""
+        raise NotImplementedError
+
+    def consume(self, address, nonce=None):
+        """
+        Atomically remove and return the live nonce for `address`, or None.
+        With `nonce`, only remove it if it is still that nonce.
+        """
+        raise NotImplementedError
+
+    def sweep(self):
+        """Drop expired nonces; returns how many were removed."""
+        return 0
+
+    @staticmethod
+    def key(address):
+        return str(address).lower()
+
+
+class LocalNonceStore(BaseNonceStore):
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def issue(self, address, nonce, ttl=NONCE_TTL):
+        key = self.key(address)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + ttl, nonce)
+            if len(self._entries) > self.max_entries:
+                self._sweep_locked()
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def peek(self, address):
+        entry = self._entries.get(self.key(address))
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def consume(self, address, nonce=None):
+        key = self.key(address)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (nonce is not None and entry[1] != nonce):
+                return None
+            del self._entries[key]
+        if entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def sweep(self):
+        with self._lock:
+            return self._sweep_locked()
+
+    def _sweep_locked(self):
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteNonceStore(BaseNonceStore):
+    """
+    Nonces in a small SQLite file shared by every worker on the host. Each
+    thread keeps its own connection; WAL mode lets issue and consume from
+    different processes proceed without blocking each other's reads.
+    """
+
+    SWEEP_EVERY = 256
+
+    def __init__(self, path, max_entries=100000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        # Issues seen by this process; next() on a count is atomic across threads.
+        self._issued = itertools.count(1)
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS nonces ("
+                       "address TEXT PRIMARY KEY, nonce TEXT NOT NULL, expires REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS nonces_expires ON nonces (expires)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return _Transaction(db)
+
+    def issue(self, address, nonce, ttl=NONCE_TTL):
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO nonces (address, nonce, expires) VALUES (?, ?, ?)",
+                       (self.key(address), nonce, time.time() + ttl))
+        if next(self._issued) % self.SWEEP_EVERY == 0:
+            self.sweep()
+
+    def peek(self, address):
+        with self._connection() as db:
+            row = db.execute("SELECT nonce FROM nonces WHERE address = ? AND expires > ?",
+                             (self.key(address), time.time())).fetchone()
+        return row[0] if row else None
+
+    def consume(self, address, nonce=None):
+        with self._connection() as db:
+            row = db.execute("SELECT nonce, expires FROM nonces WHERE address = ?",
+                             (self.key(address),)).fetchone()
+            if row is None or (nonce is not None and row[0] != nonce):
+                return None
+            db.execute("DELETE FROM nonces WHERE address = ?", (self.key(address),))
+        return row[0] if row[1] > time.time() else None
+
+    def sweep(self):
+        with self._connection() as db:
+            removed = db.execute("DELETE FROM nonces WHERE expires <= ?", (time.time(),)).rowcount
+            # Still over the cap: drop the nonces closest to expiry.
+            db.execute("DELETE FROM nonces WHERE address IN (SELECT address FROM nonces ORDER BY expires "
+                       "LIMIT max(0, (SELECT count(*) FROM nonces) - ?))", (self.max_entries,))
+        return removed
+
+    def __len__(self):
+        with self._connection() as db:
+            return db.execute("SELECT count(*) FROM nonces").fetchone()[0]
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, which is what makes
+    # consume's read-then-delete atomic across processes.
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+class RedisNonceStore(BaseNonceStore):
+    """
+    Nonces in Redis (or anything speaking its protocol). Expiry and memory
+    bounds are Redis' own: keys carry a TTL and the server's maxmemory
+    policy applies. Pass `client` to reuse a connection, or `url` to have
+    one created with the optional `redis` package.
+    """
+
+    # Compare-and-delete, run atomically on the server.
+    CONSUME_IF_EQUAL = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                        "return redis.call('del', KEYS[1]) else return 0 end")
+
+    def __init__(self, url=None, client=None, prefix="emr:nonce:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise ImproperlyConfigured("RedisNonceStore needs the 'redis' package.") from exc
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.client = client
+        self.prefix = prefix
+
+    def issue(self, address, nonce, ttl=NONCE_TTL):
+        self.client.set(self.prefix + self.key(address), nonce, px=max(1, int(ttl * 1000)))
+
+    def peek(self, address):
+        return self._decode(self.client.get(self.prefix + self.key(address)))
+
+    def consume(self, address, nonce=None):
+        key = self.prefix + self.key(address)
+        if nonce is None:
+            # GETDEL is atomic on the server, so only one consumer sees the value.
+            return self._decode(self.client.getdel(key))
+        return nonce if self.client.eval(self.CONSUME_IF_EQUAL, 1, key, nonce) else None
+
+    @staticmethod
+    def _decode(value):
+        if value is None:
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_nonce_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            config = {**DEFAULT_NONCE_STORE, **getattr(settings, "NONCE_STORE", {})}
+            _store = import_string(config["BACKEND"])(**config["OPTIONS"])
+        return _store
+
+
+def reset_nonce_store():
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,61 @@
+# Profile directory queries. Everything is fetched in one joined query and
+# the requesting user is excluded in SQL rather than in Python.
+import string
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import NameKey, UserProfile
+
+PROFILE_PAGE_SIZE = 100
+PROFILE_MAX_PAGE_SIZE = 1000
+
+PROFILE_FIELDS = ("title", "first_name", "last_name", "email", "job_title", "orgnisation_name")
+
+# SQLite's LOWER() only folds ASCII letters.
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def name_prefix_range(prefix):
+    """
+    (low, high) bounds on NameKey for names starting with prefix, ignoring
+    case; high is None when no string sorts after every such name.
+    """
+    low = prefix.translate(ASCII_LOWER) if connection.vendor == "sqlite" else prefix.lower()
+    stem = low.rstrip(chr(0x10FFFF))
+    high = stem[:-1] + chr(ord(stem[-1]) + 1) if stem else None
+    return low, high
+
+
+def name_prefix_q(field, prefix):
+    low, high = name_prefix_range(prefix)
+    q = Q(**{f"{field}_key__gte": low})
+    if high is not None:
+        q &= Q(**{f"{field}_key__lt": high})
+    return q
+
+
+def profile_directory(exclude_user=None, role=None, name=None):
+    profiles = (UserProfile.objects
+                .select_related("user")
+                .only(*PROFILE_FIELDS, "user__wallet_address", "user__role", "user__created_at")
+                .order_by("id"))
+    if exclude_user is not None:
+        profiles = profiles.exclude(user_id=exclude_user.pk)
+    if role:
+        profiles = profiles.filter(user__role=role)
+    if name:
+        # Ranges on the indexed name keys, not istartswith, so each side of the OR is an index search.
+        profiles = (profiles
+                    .alias(last_name_key=NameKey("last_name"), first_name_key=NameKey("first_name"))
+                    .filter(name_prefix_q("last_name", name) | name_prefix_q("first_name", name)))
+    return profiles
+
+
+def serialize_profile(profile, include_role=False):
+    data = {"wallet_address": profile.user.wallet_address}
+    if include_role:
+        data["role"] = profile.user.role
+    data.update({field: getattr(profile, field) for field in PROFILE_FIELDS})
+    data["date_joined"] = profile.user.created_at
+    return data
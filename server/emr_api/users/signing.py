@@ -0,0 +1,162 @@
+# Token signing keys. With JWT_KEYS["ALGORITHM"] = "HS256" tokens are signed
+# with SECRET_KEY exactly as SIMPLE_JWT always did, and only this API can
+# check them. With ES256 or EdDSA they are signed with the first private key
+# in PRIVATE_KEY_FILES and carry its key id (the RFC 7638 thumbprint) in the
+# header; the public halves of every listed key are served as a JWK Set at
+# /.well-known/jwks.json, so other API nodes and sidecars verify tokens
+# locally (see users/verifier.py) without the secret or a call back here.
+#
+# Rotation: put the new key first and keep the old one listed until the
+# tokens it signed have expired (REFRESH_TOKEN_LIFETIME), then drop it.
+# Verifiers pick a new key id up on first sight.
+#
+# ES256 and EdDSA need the cryptography package; HS256 does not.
+import base64
+import hashlib
+import json
+import threading
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from jwt.algorithms import has_crypto
+from rest_framework_simplejwt import state
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+DEFAULT_JWT_KEYS = {
+    "ALGORITHM": "HS256",
+    # PEM private keys, newest first; ignored for HS256.
+    "PRIVATE_KEY_FILES": [],
+    # Seconds verifiers may cache the JWK Set.
+    "JWKS_MAX_AGE": 300,
+}
+
+ASYMMETRIC_ALGORITHMS = ("ES256", "EdDSA")
+# Members of each key type's public JWK that make up its RFC 7638 thumbprint.
+THUMBPRINT_MEMBERS = {"EC": ("crv", "kty", "x", "y"), "OKP": ("crv", "kty", "x")}
+
+
+def jwt_key_settings():
+    return {**DEFAULT_JWT_KEYS, **getattr(settings, "JWT_KEYS", {})}
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def thumbprint(jwk):
+    members = {name: jwk[name] for name in THUMBPRINT_MEMBERS[jwk["kty"]]}
+    return b64url(hashlib.sha256(json.dumps(members, sort_keys=True, separators=(",", ":")).encode()).digest())
+
+
+class SigningKey:
+    """A loaded private key with its public JWK and key id."""
+    __slots__ = ("kid", "private_key", "public_key", "jwk")
+
+    def __init__(self, algorithm, pem):
+        implementation = jwt.get_algorithm_by_name(algorithm)
+        try:
+            self.private_key = implementation.prepare_key(pem)
+        except (ValueError, jwt.InvalidKeyError) as exc:
+            raise ImproperlyConfigured(f"Not a {algorithm} private key: {exc}") from exc
+        if not hasattr(self.private_key, "sign"):
+            raise ImproperlyConfigured(f"{algorithm} keys in JWT_KEYS must be private keys.")
+        self.public_key = self.private_key.public_key()
+        jwk = implementation.to_jwk(self.public_key, as_dict=True)
+        self.kid = thumbprint(jwk)
+        self.jwk = {**jwk, "kid": self.kid, "alg": algorithm, "use": "sig"}
+
+
+class KeyRing:
+    def __init__(self, algorithm, pems=()):
+        self.algorithm = algorithm
+        self.keys = [SigningKey(algorithm, pem) for pem in pems]
+        self.by_kid = {key.kid: key for key in self.keys}
+
+    @property
+    def signing_key(self):
+        return self.keys[0]
+
+    def jwks(self):
+        return {"keys": [key.jwk for key in self.keys]}
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    simplejwt's TokenBackend signing with the keyring's first key, naming it
+    in the `kid` header, and verifying with whichever listed key a token names.
+    """
+
+    def __init__(self, keyring):
+        super().__init__(keyring.algorithm, None, "", api_settings.AUDIENCE, api_settings.ISSUER, None,
+                         api_settings.LEEWAY, api_settings.JSON_ENCODER)
+        self.keyring = keyring
+
+    def get_verifying_key(self, token):
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError as exc:
+            raise TokenBackendError("Token is invalid") from exc
+        key = self.keyring.by_kid.get(kid)
+        if key is None:
+            raise TokenBackendError("Token is invalid")
+        return key.public_key
+
+    def encode(self, payload):
+        payload = payload.copy()
+        if self.audience is not None:
+            payload["aud"] = self.audience
+        if self.issuer is not None:
+            payload["iss"] = self.issuer
+        signing_key = self.keyring.signing_key
+        return jwt.encode(payload, signing_key.private_key, algorithm=self.algorithm,
+                          headers={"kid": signing_key.kid}, json_encoder=self.json_encoder)
+
+
+def load_keyring(config):
+    algorithm = config["ALGORITHM"]
+    if algorithm == "HS256":
+        return KeyRing(algorithm)
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise ImproperlyConfigured(f"JWT_KEYS['ALGORITHM'] must be HS256 or one of {ASYMMETRIC_ALGORITHMS}.")
+    if not has_crypto:
+        raise ImproperlyConfigured(f"{algorithm} token signing needs the cryptography package.")
+    if not config["PRIVATE_KEY_FILES"]:
+        raise ImproperlyConfigured(f"{algorithm} token signing needs JWT_KEYS['PRIVATE_KEY_FILES'].")
+    pems = []
+    for path in config["PRIVATE_KEY_FILES"]:
+        with open(path, "rb") as key_file:
+            pems.append(key_file.read())
+    return KeyRing(algorithm, pems)
+
+
+_keyring = None
+_keyring_lock = threading.Lock()
+
+
+def get_keyring():
+    global _keyring
+    with _keyring_lock:
+        if _keyring is None:
+            _keyring = load_keyring(jwt_key_settings())
+        return _keyring
+
+
+def install_token_backend():
+    """
+    (Re)load JWT_KEYS and point simplejwt at the matching backend. Called
+    from UsersConfig.ready(); call again after changing JWT_KEYS.
+    """
+    global _keyring
+    with _keyring_lock:
+        _keyring = None
+    keyring = get_keyring()
+    if keyring.algorithm == "HS256":
+        state.token_backend = TokenBackend(
+            api_settings.ALGORITHM, api_settings.SIGNING_KEY, api_settings.VERIFYING_KEY, api_settings.AUDIENCE,
+            api_settings.ISSUER, api_settings.JWK_URL, api_settings.LEEWAY, api_settings.JSON_ENCODER)
+    else:
+        state.token_backend = KeyRingTokenBackend(keyring)
+    return state.token_backend
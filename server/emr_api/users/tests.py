@@ -1,11 +1,45 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
 from rest_framework.test import APIClient
-from django.core.cache import cache
 from django.urls import reverse
 from eth_account import Account
 from eth_account.messages import encode_defunct
-from rest_framework_simplejwt.tokens import RefreshToken
-from users.models import User  
+from jwt import get_unverified_header
+from jwt.algorithms import has_crypto
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from users.authentication import ClaimsJWTAuthentication, issue_tokens, user_cache
+from users.management.commands.generate_jwt_key import generate_private_key
+from users.queries import profile_directory
+from users.nonces import LocalNonceStore, RedisNonceStore, SQLiteNonceStore, get_nonce_store, reset_nonce_store
+from users.signing import install_token_backend
+from emr_api.instrumentation import render_metrics, reset_metrics
+from users.verification import SignatureVerifier, VerificationTimeout, VerifierBusy
+from users.verifier import JwksVerifier, VerificationError
+from users.models import User, UserProfile
+
+# The login views use an in-process nonce store here, not the SQLite file
+# the settings share between workers.
+_local_nonces = override_settings(NONCE_STORE={"BACKEND": "users.nonces.LocalNonceStore", "OPTIONS": {}})
+
+
+def setUpModule():
+    _local_nonces.enable()
+    reset_nonce_store()
+
+
+def tearDownModule():
+    _local_nonces.disable()
+    reset_nonce_store()
+
 
 class AuthViewTests(TestCase):
     def setUp(self):
@@ -17,13 +51,13 @@ class AuthViewTests(TestCase):
 
     def test_get_nonce(self):
         """
-        Test that a nonce is generated and cached for the given address.
+        Test that a nonce is generated and stored for the given address.
         """
         response = self.client.post('/api/auth/nonce/', {'address': self.test_address})
         self.assertEqual(response.status_code, 200)
         self.assertIn('nonce', response.data)
-        cached_nonce = cache.get(self.test_address)
-        self.assertEqual(cached_nonce, response.data['nonce'])
+        stored_nonce = get_nonce_store().consume(self.test_address)
+        self.assertEqual(stored_nonce, response.data['nonce'])
 
 
     def test_wallet_login_success(self):
@@ -33,7 +67,7 @@ class AuthViewTests(TestCase):
         acct = Account.create()
         address = acct.address
         nonce = '123456'
-        cache.set(address, nonce, timeout=300)
+        get_nonce_store().issue(address, nonce)
 
         message = encode_defunct(text=nonce)
         signature = Account.sign_message(message, acct.key).signature.hex()
@@ -47,6 +81,25 @@ class AuthViewTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('access', response.data)
 
+    def test_wallet_login_ignores_address_case(self):
+        """
+        Test that logging in with a lowercase address finds the user registered under its checksum form.
+        """
+        acct = Account.create()
+        User.objects.create(wallet_address=acct.address, role='doctor')
+        nonce = self.client.post('/api/auth/nonce/', {'address': acct.address.lower()}).data['nonce']
+        signature = Account.sign_message(encode_defunct(text=nonce), acct.key).signature.hex()
+
+        response = self.client.post('/api/auth/login/', {
+            'address': acct.address.lower(),
+            'signature': signature,
+            'role': 'patient'
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['created'])
+        self.assertEqual(User.objects.count(), 1)
+
 
     def test_get_access_token(self):
         """
@@ -78,3 +131,491 @@ class AuthViewTests(TestCase):
         user.refresh_from_db()
         self.assertEqual(user.role, 'admin')
 
+
+
+class ProfileDirectoryTests(TestCase):
+    def setUp(self):
+        """
+        Create an authenticated user with a profile of their own.
+        """
+        self.client = APIClient()
+        self.user = User.objects.create(wallet_address='0x' + '0' * 40, role='admin')
+        UserProfile.objects.create(user=self.user, first_name='Self', last_name='User')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def make_profiles(self, count, role='provider', start=1):
+        # The "profiles" version stamp is written on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(start, start + count):
+                user = User.objects.create(wallet_address=f'0x{i:040x}', role=role)
+                UserProfile.objects.create(user=user, first_name=f'First{i}', last_name=f'Last{i}')
+
+    def test_query_count_is_constant(self):
+        """
+        Test that listing profiles costs the same number of queries for 3 or 30 profiles.
+        """
+        # get_all_profiles also reads the "profiles" version stamp (see responsecache).
+        self.make_profiles(3)
+        with self.assertNumQueries(2):
+            small = self.client.get('/api/auth/get_all_profiles/')
+        self.make_profiles(27, start=4)
+        with self.assertNumQueries(2):
+            large = self.client.get('/api/auth/get_all_profiles/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/auth/profiles/', {'limit': 10})
+
+        self.assertEqual((len(small.data), len(large.data)), (3, 30))
+        self.assertNotIn(self.user.wallet_address, [p['wallet_address'] for p in large.data])
+
+    def test_directory_pages_and_filters(self):
+        """
+        Test that the directory pages with next_cursor and filters by role and name prefix.
+        """
+        self.make_profiles(5)
+        self.make_profiles(2, role='patient', start=10)
+
+        seen, params = [], {'role': 'provider', 'limit': 2}
+        while True:
+            response = self.client.get('/api/auth/profiles/', params)
+            self.assertEqual(response.status_code, 200)
+            seen += [p['first_name'] for p in response.data['profiles']]
+            if response.data['next_cursor'] is None:
+                break
+            params['after'] = response.data['next_cursor']
+        self.assertEqual(seen, [f'First{i}' for i in range(1, 6)])
+
+        response = self.client.get('/api/auth/profiles/', {'name': 'last1'})
+        self.assertEqual([p['last_name'] for p in response.data['profiles']], ['Last1', 'Last10', 'Last11'])
+        response = self.client.get('/api/auth/profiles/', {'name': 'FIRST2'})
+        self.assertEqual([(p['first_name'], p['role']) for p in response.data['profiles']], [('First2', 'provider')])
+
+    def test_all_profiles_shape_is_unchanged(self):
+        """
+        Test that get_all_profiles returns the same keys as before the directory was added.
+        """
+        self.make_profiles(1)
+        profile, = self.client.get('/api/auth/get_all_profiles/').data
+        self.assertEqual(set(profile), {'wallet_address', 'title', 'first_name', 'last_name', 'email', 'job_title',
+                                        'orgnisation_name', 'date_joined'})
+
+    def test_name_filter_uses_name_indexes(self):
+        """
+        Test that both sides of the name-prefix filter are index searches.
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('checks the SQLite query plan')
+        plan = profile_directory(exclude_user=self.user, name='Las').explain()
+        self.assertIn('profile_last_name_key_idx', plan)
+        self.assertIn('profile_first_name_key_idx', plan)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        """
+        Issue a login-style token carrying wallet_address and role claims.
+        """
+        user_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(wallet_address='0x' + '1' * 40, role='provider')
+        refresh = RefreshToken.for_user(self.user)
+        refresh['wallet_address'] = self.user.wallet_address
+        refresh['role'] = self.user.role
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {str(refresh.access_token)}')
+
+    def test_authentication_does_not_query_users(self):
+        """
+        Test that an authenticated request only runs the view's own queries.
+        """
+        caches['default'].clear()
+        # The "patients" version stamp, then the count.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/patients/getPatientCount/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_full_model_is_loaded_once_and_invalidated_on_write(self):
+        """
+        Test that model attributes come from the cache and that role changes invalidate it.
+        """
+        token_user = ClaimsJWTAuthentication().get_user(
+            AccessToken(self.client._credentials['HTTP_AUTHORIZATION'].split()[1]))
+        self.assertEqual(token_user.created_at, self.user.created_at)
+        with self.assertNumQueries(0):
+            self.assertEqual(user_cache.get(self.user.pk).role, 'provider')
+
+        self.client.post('/api/auth/set_role/', {'address': self.user.wallet_address, 'role': 'admin'})
+        with self.assertNumQueries(1):
+            self.assertEqual(user_cache.get(self.user.pk).role, 'admin')
+
+    def test_profile_can_be_saved_with_token_user(self):
+        """
+        Test that profile writes work when request.user is built from claims.
+        """
+        response = self.client.post('/api/auth/set_user_profile/', {'first_name': 'Ada'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserProfile.objects.get(user=self.user).first_name, 'Ada')
+
+
+class TokenSigningTests(TestCase):
+    def setUp(self):
+        """
+        Create a user and a directory for signing keys.
+        """
+        self.user = User.objects.create(wallet_address='0x' + '1' * 40, role='provider')
+        key_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(key_dir.cleanup)
+        self.key_dir = Path(key_dir.name)
+        self.addCleanup(install_token_backend)
+
+    def use_keys(self, algorithm, *names):
+        """
+        Sign with the named keys, creating any that don't exist yet.
+        """
+        if not has_crypto:
+            self.skipTest('cryptography is not installed')
+        paths = []
+        for name in names:
+            path = self.key_dir / f'{name}.pem'
+            if not path.exists():
+                path.write_bytes(generate_private_key(algorithm))
+            paths.append(str(path))
+        override = override_settings(JWT_KEYS={'ALGORITHM': algorithm, 'PRIVATE_KEY_FILES': paths})
+        override.enable()
+        self.addCleanup(override.disable)
+        install_token_backend()
+
+    def access_token(self):
+        return str(issue_tokens(self.user).access_token)
+
+    def get_count(self, token):
+        return APIClient().get('/api/patients/getPatientCount/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_hs256_publishes_no_keys(self):
+        """
+        Test that the JWK Set is empty while tokens are signed with SECRET_KEY.
+        """
+        response = self.client.get('/.well-known/jwks.json')
+
+        self.assertEqual(response.json(), {'keys': []})
+        self.assertEqual(get_unverified_header(self.access_token())['alg'], 'HS256')
+
+    def test_asymmetric_tokens_verify_with_published_keys(self):
+        """
+        Test that ES256 tokens name their key, authenticate, and the JWK Set holds only public halves.
+        """
+        self.use_keys('ES256', 'current')
+        token = self.access_token()
+        response = self.client.get('/.well-known/jwks.json')
+
+        header = get_unverified_header(token)
+        self.assertEqual(header['alg'], 'ES256')
+        [jwk] = response.json()['keys']
+        self.assertEqual(jwk['kid'], header['kid'])
+        self.assertNotIn('d', jwk)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        self.assertEqual(self.get_count(token).status_code, 200)
+
+    def test_rotation_keeps_listed_keys_valid(self):
+        """
+        Test that tokens from a rotated-out key verify while it is listed, and not after.
+        """
+        self.use_keys('ES256', 'old')
+        old_token = self.access_token()
+        self.use_keys('ES256', 'new', 'old')
+        new_token = self.access_token()
+
+        self.assertNotEqual(get_unverified_header(new_token)['kid'], get_unverified_header(old_token)['kid'])
+        self.assertEqual(self.get_count(old_token).status_code, 200)
+        self.use_keys('ES256', 'new')
+        self.assertEqual(self.get_count(old_token).status_code, 401)
+        self.assertEqual(self.get_count(new_token).status_code, 200)
+
+    def test_jwks_verifier_caches_keys_and_follows_rotation(self):
+        """
+        Test that the standalone verifier fetches keys once, refetches for a new key id, and rejects the rest.
+        """
+        self.use_keys('EdDSA', 'first')
+        verifier = JwksVerifier('http://testserver/.well-known/jwks.json', min_refresh=3600)
+        verifier.fetch_document = lambda: self.client.get('/.well-known/jwks.json').json()
+
+        first = self.access_token()
+        self.assertEqual(verifier.verify(first)['wallet_address'], self.user.wallet_address)
+        verifier.verify(first)
+        self.assertEqual(verifier.stats['fetches'], 1)
+
+        self.use_keys('EdDSA', 'second', 'first')
+        verifier.next_fetch = 0  # min_refresh has passed
+        self.assertEqual(verifier.verify(self.access_token())['role'], 'provider')
+        self.assertEqual(verifier.stats['fetches'], 2)
+
+        # A key nobody published: rejected, and no third fetch inside min_refresh.
+        self.use_keys('EdDSA', 'unpublished')
+        for _ in range(2):
+            with self.assertRaises(VerificationError):
+                verifier.verify(self.access_token())
+        self.assertEqual(verifier.stats['fetches'], 2)
+        with self.assertRaises(VerificationError):
+            verifier.verify(str(issue_tokens(self.user)))
+
+
+class SignatureVerifierTests(TestCase):
+    def setUp(self):
+        """
+        Sign a nonce with a fresh account.
+        """
+        self.account = Account.create()
+        self.signature = Account.sign_message(encode_defunct(text='654321'), self.account.key).signature.hex()
+
+    def test_pool_and_inline_recover_the_same_signer(self):
+        """
+        Test that the process pool recovers the same address as inline verification.
+        """
+        pooled = SignatureVerifier(use_pool=True, workers=1)
+        self.addCleanup(pooled.shutdown)
+        inline = SignatureVerifier(use_pool=False)
+        for verifier in (pooled, inline):
+            self.assertEqual(verifier.recover('654321', self.signature), self.account.address)
+            self.assertIsNone(verifier.recover('654321', '0xdeadbeef'))
+        self.assertEqual(pooled.stats()['completed'], 2)
+        self.assertIn('latency_p99_ms', pooled.stats())
+
+    def test_busy_when_queue_is_full(self):
+        """
+        Test that verification is refused once max_pending verifications are in flight.
+        """
+        verifier = SignatureVerifier(use_pool=False, max_pending=1)
+        verifier._slots.acquire()
+        with self.assertRaises(VerifierBusy), self.assertLogs('users.verification', 'WARNING'):
+            verifier.recover('654321', self.signature)
+        self.assertEqual(verifier.stats()['rejected'], 1)
+
+    def test_timed_out_verification_keeps_its_slot(self):
+        """
+        Test that a verification the caller gave up on still counts against max_pending until it finishes.
+        """
+        release = threading.Event()
+
+        def slow_recover(nonce, signature):
+            release.wait(5)
+            return self.account.address
+
+        reset_metrics()
+        verifier = SignatureVerifier(use_pool=True, max_pending=1, timeout=0.01)
+        self.addCleanup(verifier.shutdown)
+        self.addCleanup(release.set)
+        with patch('users.verification.recover_signer', slow_recover), \
+                patch.object(SignatureVerifier, '_new_pool', lambda self: ThreadPoolExecutor(1)):
+            with self.assertRaises(VerificationTimeout):
+                verifier.recover('654321', self.signature)
+            with self.assertRaises(VerifierBusy), self.assertLogs('users.verification', 'WARNING'):
+                verifier.recover('654321', self.signature)
+            self.assertIn('emr_signature_verifications_pending 1', render_metrics())
+
+            release.set()
+            deadline = time.monotonic() + 5
+            while verifier.stats()['pending'] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            verifier.timeout = 5
+            self.assertEqual(verifier.recover('654321', self.signature), self.account.address)
+        self.assertEqual(verifier.stats()['pending'], 0)
+        metrics = render_metrics()
+        self.assertIn('emr_signature_verification_seconds_count{outcome="completed"} 1', metrics)
+        self.assertIn('emr_signature_verifications_rejected_total 1', metrics)
+
+    def test_dead_worker_is_reported_busy(self):
+        """
+        Test that a worker dying mid-task answers VerifierBusy and the pool is replaced.
+        """
+        class DeadPool:
+            def submit(self, *args):
+                future = Future()
+                future.set_exception(BrokenProcessPool('worker died'))
+                return future
+
+            def shutdown(self, **kwargs):
+                pass
+
+        verifier = SignatureVerifier(use_pool=True, max_pending=1)
+        with patch.object(SignatureVerifier, '_new_pool', lambda self: DeadPool()):
+            verifier._pool = broken = DeadPool()
+            with self.assertRaises(VerifierBusy), self.assertLogs('users.verification', 'WARNING'):
+                verifier.recover('654321', self.signature)
+        self.assertIsNot(verifier._pool, broken)
+        self.assertEqual((verifier.stats()['failed'], verifier.stats()['pending']), (1, 0))
+
+    def test_login_returns_503_when_busy(self):
+        """
+        Test that WalletLoginView sheds load instead of queueing when the verifier is saturated.
+        """
+        get_nonce_store().issue(self.account.address, '654321')
+        with patch('users.views.get_signature_verifier') as get_verifier:
+            get_verifier.return_value.recover.side_effect = VerifierBusy()
+            response = APIClient().post('/api/auth/login/', {
+                'address': self.account.address, 'signature': self.signature})
+        self.assertEqual(response.status_code, 503)
+
+        # The nonce survives the 503, so retrying as Retry-After says succeeds, once.
+        retry = APIClient().post('/api/auth/login/', {'address': self.account.address, 'signature': self.signature})
+        self.assertEqual(retry.status_code, 200)
+        again = APIClient().post('/api/auth/login/', {'address': self.account.address, 'signature': self.signature})
+        self.assertEqual(again.data['error'], 'Nonce expired.')
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the few Redis commands RedisNonceStore uses.
+    """
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.RLock()
+
+    def set(self, name, value, px=None):
+        with self.lock:
+            self.data[name] = (time.monotonic() + px / 1000 if px else None, str(value).encode())
+
+    def get(self, name):
+        with self.lock:
+            expires, value = self.data.get(name, (None, None))
+        if value is None or (expires is not None and expires <= time.monotonic()):
+            return None
+        return value
+
+    def getdel(self, name):
+        with self.lock:
+            value = self.get(name)
+            self.data.pop(name, None)
+        return value
+
+    def eval(self, script, numkeys, name, expected):
+        # Only RedisNonceStore.CONSUME_IF_EQUAL is ever run.
+        with self.lock:
+            if self.get(name) != str(expected).encode():
+                return 0
+            del self.data[name]
+            return 1
+
+
+class NonceStoreContract:
+    """
+    Behaviour every nonce store backend must share.
+    """
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_consume_is_single_use_and_case_insensitive(self):
+        """
+        Test that a nonce can be consumed once, under any address casing.
+        """
+        self.store.issue('0xAbC', '111111')
+        self.assertEqual(self.store.consume('0xabc'), '111111')
+        self.assertIsNone(self.store.consume('0xABC'))
+
+    def test_peek_then_consume_only_that_nonce(self):
+        """
+        Test that peeking leaves the nonce, and consuming a nonce that was replaced fails.
+        """
+        self.store.issue('0xabc', '111111')
+        self.assertEqual(self.store.peek('0xABC'), '111111')
+        self.store.issue('0xabc', '222222')
+        self.assertIsNone(self.store.consume('0xabc', '111111'))
+        self.assertEqual(self.store.consume('0xabc', '222222'), '222222')
+        self.assertIsNone(self.store.peek('0xabc'))
+
+    def test_expired_nonce_is_not_returned(self):
+        """
+        Test that nonces past their ttl are not handed out.
+        """
+        self.store.issue('0xabc', '111111', ttl=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.store.consume('0xabc'))
+
+    def test_concurrent_consumers_get_the_nonce_once(self):
+        """
+        Test that when many threads race to consume a nonce only one wins.
+        """
+        self.store.issue('0xabc', '111111')
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.store.consume('0xabc'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([r for r in results if r], ['111111'])
+
+
+class LocalNonceStoreTests(NonceStoreContract, TestCase):
+    def make_store(self):
+        return LocalNonceStore(max_entries=3)
+
+    def test_memory_is_bounded(self):
+        """
+        Test that the oldest nonces are evicted beyond max_entries.
+        """
+        for i in range(5):
+            self.store.issue(f'0x{i}', str(i))
+        self.assertEqual(len(self.store), 3)
+        self.assertIsNone(self.store.consume('0x0'))
+        self.assertEqual(self.store.consume('0x4'), '4')
+
+
+class SQLiteNonceStoreTests(NonceStoreContract, TestCase):
+    def make_store(self):
+        return SQLiteNonceStore(Path(tempfile.mkdtemp()) / 'nonces.sqlite3', max_entries=3)
+
+    def test_concurrent_issues_sweep_on_schedule(self):
+        """
+        Test that every SWEEP_EVERY-th issue sweeps, however many threads are issuing.
+        """
+        self.store.SWEEP_EVERY = 10
+        with patch.object(self.store, 'sweep') as sweep:
+            with ThreadPoolExecutor(8) as pool:
+                list(pool.map(lambda i: self.store.issue(f'0x{i:x}', str(i)), range(200)))
+        self.assertEqual(sweep.call_count, 20)
+
+    def test_sweep_removes_expired_and_caps_size(self):
+        """
+        Test that sweeping drops expired nonces and trims the table to max_entries.
+        """
+        self.store.issue('0xdead', '0', ttl=0)
+        for i in range(5):
+            self.store.issue(f'0x{i}', str(i))
+        self.assertEqual(self.store.sweep(), 1)
+        self.assertEqual(len(self.store), 3)
+
+    def test_shared_between_store_instances(self):
+        """
+        Test that a nonce issued through one instance can be consumed through another, as in another worker.
+        """
+        other = SQLiteNonceStore(self.store.path)
+        self.store.issue('0xabc', '222222')
+        self.assertEqual(other.consume('0xabc'), '222222')
+
+
+class RedisNonceStoreTests(NonceStoreContract, TestCase):
+    def make_store(self):
+        return RedisNonceStore(client=FakeRedis())
+
+
+class AsyncAuthViewTests(TestCase):
+    async def test_nonce_login_and_profile(self):
+        """
+        Test the async login flow end to end, then a profile round trip with the issued token.
+        """
+        acct = Account.create()
+        client = AsyncClient()
+        nonce = (await client.post('/api/async/auth/nonce/', {'address': acct.address},
+                                   content_type='application/json')).json()['nonce']
+        signature = Account.sign_message(encode_defunct(text=nonce), acct.key).signature.hex()
+        login = await client.post('/api/async/auth/login/', {
+            'address': acct.address, 'signature': signature, 'role': 'provider'}, content_type='application/json')
+        self.assertEqual(login.status_code, 200)
+        self.assertEqual(login.json()['role'], 'provider')
+
+        headers = {'Authorization': f"Bearer {login.json()['access']}"}
+        await client.post('/api/async/auth/set_user_profile/', {'first_name': 'Ada'},
+                          content_type='application/json', headers=headers)
+        profile = await client.get('/api/async/auth/get_user_profile/', {'address': acct.address}, headers=headers)
+        self.assertEqual(profile.json()['first_name'], 'Ada')
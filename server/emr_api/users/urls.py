@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import GetNonceView, WalletLoginView, SetUserRoleView, GetAccessTokenView, SetUserProfileView, GetUserProfileView, GetAllProfilesView
+from .views import GetNonceView, WalletLoginView, SetUserRoleView, GetAccessTokenView, SetUserProfileView, GetUserProfileView, GetAllProfilesView, GetProfileDirectoryView
 
 urlpatterns = [
     path('nonce/', GetNonceView.as_view(), name='get-nonce'),
@@ -9,4 +9,5 @@ urlpatterns = [
     path('set_user_profile/', SetUserProfileView.as_view(), name='set-user-profile'), 
     path('get_user_profile/', GetUserProfileView.as_view(), name='get-user-profile'),
     path('get_all_profiles/', GetAllProfilesView.as_view(), name='get-all-profiles'),
+    path('profiles/', GetProfileDirectoryView.as_view(), name='profile-directory'),
 ]
\ No newline at end of file
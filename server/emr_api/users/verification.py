@@ -0,0 +1,196 @@
+# Wallet signature verification off the request thread. Recovering the
+# signer (secp256k1 recovery + keccak in pure Python) is CPU bound, so it
+# runs on a process pool sized to the machine's cores. The number of
+# verifications in flight is capped; past the cap callers are turned away
+# immediately instead of queueing without bound.
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+from emr_api.instrumentation import SIGNATURE_DURATION, SIGNATURE_PENDING, SIGNATURE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIGNATURE_POOL_SETTINGS = {
+    "ENABLED": False,
+    # Worker processes; None means one per core.
+    "WORKERS": None,
+    # Verifications allowed in flight (running or queued) at once.
+    "MAX_PENDING": 64,
+    # Seconds to wait for a result before giving up on the login.
+    "TIMEOUT": 2.0,
+}
+
+
+class VerifierBusy(Exception):
+    pass
+
+
+class VerificationTimeout(Exception):
+    pass
+
+
+def recover_signer(nonce, signature):
+    """Return the address that signed `nonce`, or None if the signature is invalid."""
+    try:
+        return Account.recover_message(encode_defunct(text=nonce), signature=signature)
+    except Exception:
+        return None
+
+
+class SignatureVerifier:
+    """
+    Runs recover_signer inline or on a process pool and keeps simple stats:
+    completed/rejected/timed out/failed counts, current queue depth and a
+    window of recent latencies. The same figures are exported at /metrics.
+    """
+
+    def __init__(self, use_pool=True, workers=None, max_pending=64, timeout=2.0, window=1024):
+        self.use_pool = use_pool
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self._pending = 0
+        self._counts = {"completed": 0, "rejected": 0, "timeouts": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
+    def recover(self, nonce, signature):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected")
+            SIGNATURE_REJECTED.inc(1)
+            logger.warning("Signature verification queue full (%d pending).", self.max_pending)
+            raise VerifierBusy("Too many signature verifications in progress.")
+        start = time.perf_counter()
+        self._add_pending(1)
+        if not self.use_pool:
+            try:
+                signer = recover_signer(nonce, signature)
+            finally:
+                self._release()
+            self._finish(start, "completed")
+            return signer
+
+        try:
+            pool, future = self._submit(nonce, signature)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the worker is done with the task, not just
+        # until this caller stops waiting, so a timed-out verification still
+        # counts against MAX_PENDING while it occupies the pool.
+        future.add_done_callback(lambda _: self._release())
+        try:
+            signer = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self._finish(start, "timeouts")
+            raise VerificationTimeout("Signature verification timed out.") from None
+        except BrokenProcessPool:
+            # A worker died mid-task; the next login gets a fresh pool.
+            self._replace_pool(pool)
+            self._finish(start, "failed")
+            logger.warning("Signature worker died; restarting the pool.")
+            raise VerifierBusy("Signature verification failed, retry.") from None
+        self._finish(start, "completed")
+        return signer
+
+    def _submit(self, nonce, signature):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+            pool = self._pool
+        try:
+            return pool, pool.submit(recover_signer, nonce, signature)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool and retry once.
+            pool = self._replace_pool(pool)
+            return pool, pool.submit(recover_signer, nonce, signature)
+
+    def _replace_pool(self, broken):
+        with self._pool_lock:
+            if self._pool is broken:
+                self._pool = self._new_pool()
+            return self._pool
+
+    def _new_pool(self):
+        # Spawned, not forked: the pool starts from a request thread of a
+        # process that already runs other threads (the log writer, server
+        # workers), and a fork would copy whatever locks they hold.
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counts[name] += 1
+
+    def _add_pending(self, delta):
+        with self._stats_lock:
+            self._pending += delta
+            SIGNATURE_PENDING.set(self._pending)
+
+    def _release(self):
+        self._add_pending(-1)
+        self._slots.release()
+
+    def _finish(self, start, outcome):
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._counts[outcome] += 1
+            self._latencies.append(elapsed)
+        SIGNATURE_DURATION.observe(elapsed, outcome)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self._counts, pending=self._pending, max_pending=self.max_pending,
+                         workers=self.workers if self.use_pool else 0)
+        if latencies:
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+            stats.update(latency_p50_ms=pct(50), latency_p99_ms=pct(99), latency_max_ms=latencies[-1] * 1000)
+        return stats
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_signature_verifier():
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            config = {**DEFAULT_SIGNATURE_POOL_SETTINGS, **getattr(settings, "SIGNATURE_POOL", {})}
+            _verifier = SignatureVerifier(
+                use_pool=config["ENABLED"],
+                workers=config["WORKERS"],
+                max_pending=config["MAX_PENDING"],
+                timeout=config["TIMEOUT"],
+            )
+        return _verifier
+
+
+def reset_signature_verifier():
+    """Drop the process-wide verifier so the next call picks up new settings."""
+    global _verifier
+    with _verifier_lock:
+        if _verifier is not None:
+            _verifier.shutdown()
+        _verifier = None
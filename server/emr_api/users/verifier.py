@@ -0,0 +1,86 @@
+# Verifies this API's access tokens anywhere, without its database or
+# secret: public keys come from its /.well-known/jwks.json and are cached.
+# A key id not seen yet (a rotation) triggers a refetch, at most once per
+# min_refresh seconds, so tokens with made-up key ids can't turn every
+# request into a JWKS fetch. If the API is unreachable, the keys already
+# fetched stay in use.
+#
+# Depends on PyJWT (with cryptography, for ES256/EdDSA) and nothing from
+# Django, so other services and sidecars can import or copy it as is:
+#
+#     verifier = JwksVerifier("https://emr.example/.well-known/jwks.json")
+#     claims = verifier.verify(token)  # or raises VerificationError
+import json
+import threading
+import time
+import urllib.request
+
+import jwt
+
+
+class VerificationError(Exception):
+    pass
+
+
+class JwksVerifier:
+    def __init__(self, jwks_url, max_age=300, min_refresh=30, timeout=5.0, leeway=0, audience=None, issuer=None):
+        self.jwks_url = jwks_url
+        self.max_age = max_age
+        self.min_refresh = min_refresh
+        self.timeout = timeout
+        self.leeway = leeway
+        self.audience = audience
+        self.issuer = issuer
+        self.lock = threading.Lock()
+        self.keys = {}
+        # Monotonic times: when the cached set goes stale, and the earliest next fetch.
+        self.expires = 0.0
+        self.next_fetch = 0.0
+        self.stats = {"verified": 0, "rejected": 0, "fetches": 0}
+
+    def fetch_document(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def fetch(self):
+        """The JWK Set's signing keys by key id."""
+        document = self.fetch_document()
+        return {jwk["kid"]: jwt.PyJWK(jwk) for jwk in document["keys"] if jwk.get("use", "sig") == "sig"}
+
+    def key(self, kid):
+        now = time.monotonic()
+        with self.lock:
+            if kid in self.keys and now < self.expires:
+                return self.keys[kid]
+            if now >= self.next_fetch:
+                self.next_fetch = now + self.min_refresh
+                self.stats["fetches"] += 1
+                try:
+                    self.keys = self.fetch()
+                    self.expires = now + self.max_age
+                except (OSError, ValueError, KeyError, jwt.PyJWTError) as exc:
+                    if not self.keys:
+                        raise VerificationError(f"Could not fetch signing keys: {exc}") from exc
+            key = self.keys.get(kid)
+        if key is None:
+            raise VerificationError("Token signed with an unknown key.")
+        return key
+
+    def verify(self, token):
+        """The claims of a valid, unexpired access token; raises VerificationError otherwise."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = self.key(kid)
+            claims = jwt.decode(token, key.key, algorithms=[key.algorithm_name], audience=self.audience,
+                                issuer=self.issuer, leeway=self.leeway,
+                                options={"verify_aud": self.audience is not None})
+            if claims.get("token_type") != "access":
+                raise VerificationError("Not an access token.")
+        except jwt.InvalidTokenError as exc:
+            self.stats["rejected"] += 1
+            raise VerificationError(str(exc)) from exc
+        except VerificationError:
+            self.stats["rejected"] += 1
+            raise
+        self.stats["verified"] += 1
+        return claims
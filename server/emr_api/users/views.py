@@ -1,20 +1,34 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.core.cache import cache
 from .models import User, UserProfile
-from rest_framework_simplejwt.tokens import RefreshToken
-from eth_account.messages import encode_defunct
-from eth_account import Account
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from .authentication import ClaimsJWTAuthentication, issue_tokens
+from .nonces import NONCE_TTL, get_nonce_store
+from .verification import VerificationTimeout, VerifierBusy, get_signature_verifier
 from django.core.exceptions import ObjectDoesNotExist
+import logging
 import random
+from emr_api.fields import normalize_address
+from emr_api.pagination import parse_int_param
+from responsecache.decorators import cached_get
+from .queries import PROFILE_MAX_PAGE_SIZE, PROFILE_PAGE_SIZE, profile_directory, serialize_profile
+from .signing import get_keyring, jwt_key_settings
+
+logger = logging.getLogger(__name__)
+
+ROLES = ['patient', 'provider', 'admin']
 
 class GetNonceView(APIView):
     def post(self, request):
         address = request.data.get("address")
+        if not address:
+            return Response({"error": "Address is required."}, status=400)
+        try:
+            address = normalize_address(address)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
         nonce = str(random.randint(100000, 999999))
-        cache.set(address, nonce, timeout=300)
+        get_nonce_store().issue(address, nonce, ttl=NONCE_TTL)
         return Response({"nonce": nonce})
 
 class WalletLoginView(APIView):
@@ -22,28 +36,38 @@ class WalletLoginView(APIView):
         address = request.data.get("address")
         signature = request.data.get("signature")
         role = request.data.get("role")  
+        try:
+            address = normalize_address(address) if address else None
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
 
-        nonce = cache.get(address)
+        store = get_nonce_store()
+        nonce = store.peek(address) if address else None
         if not nonce:
             return Response({"error": "Nonce expired."}, status=400)
 
-        message = encode_defunct(text=nonce)
         try:
-            recovered = Account.recover_message(message, signature=signature)
-        except:
+            recovered = get_signature_verifier().recover(nonce, signature)
+        except (VerifierBusy, VerificationTimeout):
+            # The nonce is left in place for the retry.
+            return Response({"error": "Too many logins in progress, try again shortly."}, status=503,
+                            headers={"Retry-After": "1"})
+        # Single use: a checked signature uses the nonce up, and of concurrent
+        # attempts with the same nonce only one gets past here.
+        if not store.consume(address, nonce):
+            return Response({"error": "Nonce expired."}, status=400)
+        if recovered is None:
             return Response({"error": "Invalid signature."}, status=400)
 
-        if recovered.lower() != address.lower():
+        if normalize_address(recovered) != address:
             return Response({"error": "Signature mismatch."}, status=400)
 
         user, created = User.objects.get_or_create(wallet_address=address)
-        if role in ['patient', 'provider', 'admin']:
+        if role in ROLES:
             user.role = role
             user.save()
 
-        refresh = RefreshToken.for_user(user)
-        refresh['wallet_address'] = user.wallet_address
-        refresh['role'] = user.role
+        refresh = issue_tokens(user)
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token),
@@ -52,13 +76,15 @@ class WalletLoginView(APIView):
         })
                 
 class GetAccessTokenView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def post(self, request):
-        user = User.objects.get(wallet_address=request.data.get("address"))
-        refresh = RefreshToken.for_user(user)
-        refresh['wallet_address'] = user.wallet_address
-        refresh['role'] = user.role
+        try:
+            address = normalize_address(request.data.get("address"))
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
+        user = User.objects.get(wallet_address=address)
+        refresh = issue_tokens(user)
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token),
@@ -66,14 +92,18 @@ class GetAccessTokenView(APIView):
         })
         
 class SetUserRoleView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
     def post(self, request):
-        print("User:", request.data)
+        logger.debug("Set role: %s", request.data)
         address = request.data.get("address")
         role = request.data.get("role")
-        if role not in ['patient', 'provider', 'admin']:
+        if role not in ROLES:
             return Response({"error": "Invalid role"}, status=400)
+        try:
+            address = normalize_address(address)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
         try:
             user = User.objects.get(wallet_address=address)
             user.role = role
@@ -83,14 +113,14 @@ class SetUserRoleView(APIView):
             return Response({"error": "User not founddd"}, status=404)
 
 class SetUserProfileView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
         user = request.user  # Authenticated user from JWT
         data = request.data
 
-        print("User Profile Data:", data)
+        logger.debug("Profile data for user %s: %s", user.pk, data)
         
         user_profile_data = {
             "title": data.get("title", ""),
@@ -103,12 +133,12 @@ class SetUserProfileView(APIView):
 
         # Create or update the user profile
         profile, created = UserProfile.objects.update_or_create(
-            user=user,
+            user_id=user.pk,
             defaults=user_profile_data
         )
 
         if created:
-            print("Profile created:", profile)
+            logger.debug("Profile created for user %s", user.pk)
         return Response({
             "success": True,
             "message": "Profile created" if created else "Profile updated"
@@ -116,13 +146,18 @@ class SetUserProfileView(APIView):
     
 
 class GetUserProfileView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cached_get("profiles")
     def get(self, request):
         address = request.GET.get("address")
-        print("Address:", address)
+        logger.debug("Profile lookup: %s", address)
 
+        try:
+            address = normalize_address(address)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=400)
         try:
             user = User.objects.get(wallet_address=address)
         except User.DoesNotExist:
@@ -151,25 +186,58 @@ class GetUserProfileView(APIView):
         return Response(data, status=200)
 
 class GetAllProfilesView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @cached_get("profiles", per_user=True)
+    def get(self, request):
+        # Every profile except the caller's, as a plain list.
+        profiles = profile_directory(exclude_user=request.user)
+        data = [serialize_profile(profile) for profile in profiles.iterator(chunk_size=PROFILE_MAX_PAGE_SIZE)]
+        return Response(data, status=200)
+
+
+class GetProfileDirectoryView(APIView):
+    """
+    Paginated profile directory.
+
+    Query params:
+        role: only profiles of users with this role
+        name: case-insensitive prefix of first or last name
+        after: keyset cursor, pass back the previous page's next_cursor
+        limit: page size (default 100, max 1000)
+    """
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        role = request.query_params.get("role")
+        if role and role not in ROLES:
+            return Response({"error": "Invalid role"}, status=400)
+        after = parse_int_param(request.query_params.get("after"), 0)
+        limit = parse_int_param(request.query_params.get("limit"), PROFILE_PAGE_SIZE,
+                                minimum=1, maximum=PROFILE_MAX_PAGE_SIZE)
+        if after is None or limit is None:
+            return Response({"error": "after and limit must be positive integers."}, status=400)
+
+        profiles = profile_directory(exclude_user=request.user, role=role,
+                                     name=request.query_params.get("name"))
+        page = list(profiles.filter(id__gt=after)[:limit + 1])
+        next_cursor = page[limit - 1].id if len(page) > limit else None
+        return Response({
+            "profiles": [serialize_profile(profile, include_role=True) for profile in page[:limit]],
+            "next_cursor": next_cursor,
+        }, status=200)
+
+
+class JwksView(APIView):
+    """
+    Public keys that verify this API's tokens, as a JWK Set (see
+    users/signing.py). Empty while tokens are signed with HS256.
+    """
+    authentication_classes = []
+
     def get(self, request):
-        user_profiles = UserProfile.objects.all()
-        data = []
-        print(request.user.wallet_address)
-        for profile in user_profiles:
-            # Skip the current user's profile
-            if profile.user.wallet_address == request.user.wallet_address:
-                continue
-            data.append({
-                "wallet_address": profile.user.wallet_address,
-                "title": profile.title,
-                "first_name": profile.first_name,
-                "last_name": profile.last_name,
-                "email": profile.email,
-                "job_title": profile.job_title,
-                "orgnisation_name": profile.orgnisation_name,
-                "date_joined": profile.user.created_at
-            })
-        return Response(data, status=200)
\ No newline at end of file
+        response = Response(get_keyring().jwks())
+        response["Cache-Control"] = f"public, max-age={jwt_key_settings()['JWKS_MAX_AGE']}"
+        return response